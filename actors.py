@@ -0,0 +1,180 @@
+import asyncio
+import inspect
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Mapping, NamedTuple, Optional, Tuple
+from types import MappingProxyType
+
+from game_logic import game_manager
+from models import GamePhase, GameState, PlayerRole
+
+
+class PlayerView(NamedTuple):
+    user_id: int
+    username: str
+    first_name: str
+    role: Optional[PlayerRole]
+    is_alive: bool
+    has_voted: bool
+    label: str
+
+
+@dataclass(frozen=True, slots=True)
+class GameSnapshot:
+    """Неизменяемый срез игры для чтения вне почтового ящика актора"""
+    chat_key: str
+    revision: int
+    phase: GamePhase
+    current_round: int
+    roster_version: int
+    players: Tuple[PlayerView, ...]
+    votes: Mapping[int, int]
+    skipped_voters: frozenset
+    current_voting_message_id: Optional[int]
+
+    def get_alive_players(self) -> Tuple[PlayerView, ...]:
+        return tuple(p for p in self.players if p.is_alive)
+
+    def get_player(self, user_id: int) -> Optional[PlayerView]:
+        for p in self.players:
+            if p.user_id == user_id:
+                return p
+        return None
+
+
+def take_snapshot(chat_key: str, game: GameState) -> GameSnapshot:
+    return GameSnapshot(
+        chat_key=chat_key,
+        revision=game_manager.revision(chat_key),
+        phase=game.phase,
+        current_round=game.current_round,
+        roster_version=game.players.version,
+        players=tuple(
+            PlayerView(p.user_id, p.username, p.first_name, p.role, p.is_alive, p.has_voted, p.label)
+            for p in game.players.values()
+        ),
+        votes=MappingProxyType(dict(game.votes)) if game.is_allocated("votes") else MappingProxyType({}),
+        skipped_voters=frozenset(game.skipped_voters) if game.is_allocated("skipped_voters") else frozenset(),
+        current_voting_message_id=game.current_voting_message_id,
+    )
+
+
+class GameActor:
+    """Почтовый ящик одной игры: команды применяются строго по очереди.
+
+    Команда — обычная функция (или корутина), которая читает и меняет
+    GameState; пока она выполняется, следующие команды этой игры ждут в
+    очереди, поэтому проверка и изменение состояния внутри команды не
+    перемешиваются с чужими. Разные игры друг друга не ждут. Потребитель
+    запускается по первой команде и завершается, когда ящик опустел, так что
+    тысячи простаивающих игр не держат задач.
+    """
+
+    __slots__ = ("chat_key", "_mailbox", "_consumer", "_snapshot", "_snapshot_key")
+
+    def __init__(self, chat_key: str):
+        self.chat_key = chat_key
+        self._mailbox: Deque[Tuple[Callable, tuple, asyncio.Future]] = deque()
+        self._consumer: Optional[asyncio.Task] = None
+        self._snapshot: Optional[GameSnapshot] = None
+        self._snapshot_key: Optional[tuple] = None
+
+    @property
+    def idle(self) -> bool:
+        return not self._mailbox and self._consumer is None
+
+    def queue_depth(self) -> int:
+        return len(self._mailbox)
+
+    async def call(self, command: Callable, *args) -> Any:
+        """Ставит команду в очередь игры и возвращает её результат"""
+        if self._consumer is not None and asyncio.current_task() is self._consumer:
+            # Команда вызвала другую команду той же игры — выполняем сразу, иначе взаимоблокировка
+            return await self._apply(command, args)
+        future = asyncio.get_running_loop().create_future()
+        self._mailbox.append((command, args, future))
+        if self._consumer is None:
+            self._consumer = asyncio.create_task(self._drain())
+        return await future
+
+    def snapshot(self) -> Optional[GameSnapshot]:
+        """Согласованный срез игры; пересобирается, только если игра изменилась"""
+        game = game_manager.get_game(self.chat_key)
+        if game is None:
+            return None
+        key = (id(game), game_manager.revision(self.chat_key), game.players.version)
+        if self._snapshot_key != key:
+            self._snapshot = take_snapshot(self.chat_key, game)
+            self._snapshot_key = key
+        return self._snapshot
+
+    async def _apply(self, command: Callable, args: tuple) -> Any:
+        result = command(*args)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def _drain(self) -> None:
+        try:
+            while self._mailbox:
+                command, args, future = self._mailbox.popleft()
+                if future.done():
+                    # Вызвавший уже отменил ожидание — команду не применяем
+                    continue
+                try:
+                    result = await self._apply(command, args)
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            self._consumer = None
+            # При отмене (остановка бота) не оставляем ожидающих висеть
+            while self._mailbox:
+                self._mailbox.popleft()[2].cancel()
+
+
+class GameActors:
+    """Реестр акторов игр: chat_key -> GameActor, создаются по требованию"""
+
+    def __init__(self):
+        self._actors: Dict[str, GameActor] = {}
+
+    def get(self, chat_key: str) -> GameActor:
+        actor = self._actors.get(chat_key)
+        if actor is None:
+            actor = self._actors[chat_key] = GameActor(chat_key)
+        return actor
+
+    async def call(self, chat_key: str, command: Callable, *args) -> Any:
+        actor = self.get(chat_key)
+        try:
+            return await actor.call(command, *args)
+        finally:
+            # Игра закончилась и очередь пуста — актор больше не нужен
+            if actor.idle and game_manager.get_game(chat_key) is None:
+                if self._actors.get(chat_key) is actor:
+                    del self._actors[chat_key]
+
+    def snapshot(self, chat_key: str) -> Optional[GameSnapshot]:
+        if game_manager.get_game(chat_key) is None:
+            actor = self._actors.get(chat_key)
+            if actor is not None and actor.idle:
+                del self._actors[chat_key]
+            return None
+        return self.get(chat_key).snapshot()
+
+    def queue_depth(self) -> int:
+        return sum(actor.queue_depth() for actor in self._actors.values())
+
+    def __len__(self) -> int:
+        return len(self._actors)
+
+
+# Глобальный реестр акторов игр
+game_actors = GameActors()
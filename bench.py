@@ -0,0 +1,177 @@
+"""Микробенчмарки горячих мест бота.
+
+    python bench.py memory   # память на игру: пустое лобби и игра на 10 человек
+    python bench.py memory --baseline 17af917^  # то же рядом с models.py из ревизии git
+    python bench.py logging  # CPU на тик и callback при INFO; f-строки против шаблонов логов
+    python bench.py keyboards  # сборка ночных клавиатур и табло: заново и из кеша
+"""
+import argparse
+import functools
+import gc
+import io
+import logging
+import os
+import subprocess
+import sys
+import timeit
+import tracemalloc
+import types
+
+import models
+from models import GameState, Player, PlayerRole
+
+
+def _load_models(revision: str) -> types.ModuleType:
+    """models.py из ревизии git — чтобы мерить память до и после на одной машине"""
+    source = subprocess.run(
+        ["git", "show", f"{revision}:models.py"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+    ).stdout
+    module = types.ModuleType(f"models_{revision}")
+    # dataclasses ищут модуль класса в sys.modules
+    sys.modules[module.__name__] = module
+    exec(compile(source, f"{revision}:models.py", "exec"), module.__dict__)
+    return module
+
+
+def _make_lobby(index: int, m: types.ModuleType = models) -> GameState:
+    game = m.GameState(chat_id=f"-100{index}_0")
+    game.players[index] = m.Player(user_id=index, username=f"u{index}", first_name=f"U{index}")
+    return game
+
+
+def _make_game(index: int, size: int = 10, m: types.ModuleType = models) -> GameState:
+    game = m.GameState(chat_id=f"-100{index}_0")
+    roles = [m.PlayerRole.MAFIA, m.PlayerRole.MAFIA, m.PlayerRole.DOCTOR, m.PlayerRole.COMMISSIONER, m.PlayerRole.BUTTERFLY]
+    for i in range(size):
+        uid = index * 100 + i
+        game.players[uid] = m.Player(user_id=uid, username=f"u{uid}", first_name=f"U{uid}")
+        game.players[uid].role = roles[i] if i < len(roles) else m.PlayerRole.CIVILIAN
+    return game
+
+
+def _bytes_per_item(factory, count: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = [factory(i) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del items
+    return (after - before) / count
+
+
+def bench_memory(count: int, baseline: str = None) -> None:
+    old = _load_models(baseline) if baseline else None
+    for name, factory in (("лобби с 1 игроком", _make_lobby), ("игра на 10 игроков", _make_game)):
+        current = _bytes_per_item(factory, count)
+        line = f"memory: {name}: {current:.0f} байт/игра ({count} игр)"
+        if old is not None:
+            before = _bytes_per_item(functools.partial(factory, m=old), count)
+            line += f"; в {baseline}: {before:.0f} байт/игра ({(current - before) / before:+.0%})"
+        print(line)
+
+
+def bench_logging(count: int) -> None:
+    # Записи уходят в память, а не в stdout: вывод других бенчмарков не засоряется
+    root = logging.getLogger()
+    handler = logging.StreamHandler(io.StringIO())
+    saved_level = root.level
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    try:
+        _bench_logging(count)
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(saved_level)
+
+
+def _bench_logging(count: int) -> None:
+    # Импорт здесь: game_logic тянет config, которому нужен BOT_TOKEN
+    from game_logic import game_manager
+    from keyboards import get_player_selection_keyboard, get_voting_keyboard
+    from models import GamePhase
+
+    chat_key = "-100_0"
+    game_manager.create_game(chat_key)
+    for i in range(1, 11):
+        game_manager.add_player(chat_key, i, f"u{i}", f"U{i}")
+    game_manager.start_game(chat_key)
+    game = game_manager.get_game(chat_key)
+
+    def tick():
+        # То, что автопилот и хендлеры дёргают на каждом событии фазы
+        g = game_manager.get_game(chat_key)
+        game_manager.all_night_actions_completed(chat_key)
+        g.is_game_over()
+        g.get_alive_players()
+
+    def callback():
+        # Ночной выбор + голос: клавиатуры и проверка голосования
+        alive = game.get_alive_players()
+        get_player_selection_keyboard(alive, "mafia_kill", chat_key, exclude_user_id=1)
+        game.phase = GamePhase.VOTING
+        game.votes.clear()
+        for p in alive:
+            p.has_voted = False
+        game_manager.process_vote(chat_key, alive[0].user_id, alive[1].user_id)
+        get_voting_keyboard(alive)
+        game_manager.all_votes_received(chat_key)
+
+    for name, func in (("тик", tick), ("callback", callback)):
+        seconds = min(timeit.repeat(func, number=count, repeat=5))
+        print(f"logging: {name}: {seconds / count * 1e6:.1f} мкс (уровень INFO, {count} повторов)")
+
+    # Одна и та же строка лога горячего пути: f-строка (как было) и шаблон с аргументами
+    log = logging.getLogger("bench")
+    players = game.players
+    styles = {
+        "debug (выключен)": (
+            lambda: log.debug(f"get_game: чат {chat_key}, фаза {game.phase}, игроков {len(players)}"),
+            lambda: log.debug("get_game: чат %s, фаза %s, игроков %s", chat_key, game.phase, len(players)),
+        ),
+        "info (пишется)": (
+            lambda: log.info(f"process_vote: игрок {1} голосует против {2} в чате {chat_key}"),
+            lambda: log.info("process_vote: игрок %s голосует против %s в чате %s", 1, 2, chat_key),
+        ),
+    }
+    for name, (f_string, template) in styles.items():
+        before = min(timeit.repeat(f_string, number=count, repeat=5)) / count * 1e6
+        after = min(timeit.repeat(template, number=count, repeat=5)) / count * 1e6
+        print(f"logging: {name}: f-строка {before:.2f} мкс, шаблон {after:.2f} мкс (x{before / after:.1f})")
+
+
+def bench_keyboards(count: int) -> None:
+    from keyboards import get_player_selection_keyboard, get_voting_keyboard
+
+    game = _make_game(1)
+    chat_key = game.chat_id
+    alive = game.get_alive_players()
+
+    def night_and_vote(version):
+        # Ночь: клавиатура каждой роли; день: перерисовка табло после голоса
+        for player in alive[:5]:
+            get_player_selection_keyboard(alive, "mafia_kill", chat_key, exclude_user_id=player.user_id, roster_version=version)
+        get_voting_keyboard(alive, chat_key, version)
+
+    for name, version in (("заново", None), ("из кеша", game.players.version)):
+        seconds = min(timeit.repeat(lambda: night_and_vote(version), number=count, repeat=5))
+        print(f"keyboards: {name}: {seconds / count * 1e6:.1f} мкс на 5 ночных клавиатур и табло ({count} повторов)")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Микробенчмарки бота «Мафия»")
+    parser.add_argument("name", choices=["memory", "logging", "keyboards"], help="какой бенчмарк запустить")
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--baseline", help="memory: сравнить с models.py из этой ревизии git (например, 17af917^)")
+    args = parser.parse_args(argv)
+    if args.name == "memory":
+        bench_memory(args.count, args.baseline)
+    elif args.name == "logging":
+        bench_logging(args.count)
+    elif args.name == "keyboards":
+        bench_keyboards(args.count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Компактный callback_data игровых кнопок и его единый декодер.
+
+Кнопка ночного хода или голоса кодируется как "~" + base64url от байтов:
+код действия (старший бит — «пропустить»), varint токена игры и varint
+user_id цели. Токен короткий и выдаётся GameManager на игру; chat_key по
+нему ищется в таблице за O(1), поэтому длинные id чатов и тем в
+callback_data больше не попадают и 64-байтный лимит Telegram не грозит.
+
+Старые текстовые форматы ({action}:{chat_key}:{target|skip} и vote_<id>)
+тоже понимаются: кнопки, отправленные до обновления, продолжают работать.
+"""
+import base64
+import functools
+from typing import Any, Dict, NamedTuple, Optional, Tuple, Union
+
+from aiogram.filters import BaseFilter
+from aiogram.types import CallbackQuery
+
+from game_logic import game_manager
+
+PREFIX = "~"
+_SKIP = 0x80
+ACTION_CODES = {
+    "mafia_kill": 1,
+    "doctor_save": 2,
+    "commissioner_check": 3,
+    "butterfly_distract": 4,
+    "vote": 5,
+}
+_ACTIONS = {code: action for action, code in ACTION_CODES.items()}
+
+
+class GameCallback(NamedTuple):
+    action: str
+    # chat_key игры; None — в кнопке его нет (старый vote_<id>) или игра уже закончилась
+    chat_key: Optional[str]
+    # None — «пропустить»
+    target_id: Optional[int]
+    # Токен не найден: кнопка от завершённой игры
+    stale: bool = False
+
+
+def _varint(value: int, out: bytearray) -> None:
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(raw: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = raw[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _legacy(action: str, chat_key: Optional[str], target_id: Optional[int]) -> str:
+    if action == "vote":
+        return "vote_skip" if target_id is None else f"vote_{target_id}"
+    return f"{action}:{chat_key}:{'skip' if target_id is None else target_id}"
+
+
+def encode_callback(action: str, chat_key: Optional[str], target_id: Optional[int]) -> str:
+    """callback_data кнопки игры; без токена (игры нет) — прежний текстовый формат"""
+    token = game_manager.callback_token(chat_key) if chat_key else 0
+    if not token:
+        return _legacy(action, chat_key, target_id)
+    raw = bytearray((ACTION_CODES[action] | (_SKIP if target_id is None else 0),))
+    _varint(token, raw)
+    if target_id is not None:
+        _varint(target_id, raw)
+    return PREFIX + base64.urlsafe_b64encode(bytes(raw)).rstrip(b"=").decode("ascii")
+
+
+@functools.lru_cache(maxsize=4096)
+def unpack_callback(data: str) -> Optional[Tuple[str, int, Optional[str], Optional[int]]]:
+    """(действие, токен, chat_key из старого формата, цель) без обращения к таблице токенов"""
+    try:
+        if data.startswith(PREFIX):
+            encoded = data[len(PREFIX):]
+            raw = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+            action = _ACTIONS.get(raw[0] & ~_SKIP)
+            if action is None:
+                return None
+            token, pos = _read_varint(raw, 1)
+            target_id = None if raw[0] & _SKIP else _read_varint(raw, pos)[0]
+            return action, token, None, target_id
+        if data.startswith("vote_"):
+            rest = data[len("vote_"):]
+            return "vote", 0, None, None if rest == "skip" else int(rest)
+        action, chat_key, target = data.split(":")
+        if action not in ACTION_CODES:
+            return None
+        return action, 0, chat_key, None if target == "skip" else int(target)
+    except (ValueError, IndexError):
+        return None
+
+
+def decode_callback(data: Optional[str]) -> Optional[GameCallback]:
+    """Разбирает callback_data игровой кнопки; None — это не игровая кнопка"""
+    unpacked = unpack_callback(data or "")
+    if unpacked is None:
+        return None
+    action, token, chat_key, target_id = unpacked
+    if token:
+        chat_key = game_manager.chat_key_for_token(token)
+        return GameCallback(action, chat_key, target_id, stale=chat_key is None)
+    return GameCallback(action, chat_key, target_id)
+
+
+def token_of(data: Optional[str]) -> int:
+    """Токен игры из компактной кнопки (0 — его нет); нужен фронту шардов"""
+    unpacked = unpack_callback(data or "")
+    return unpacked[1] if unpacked else 0
+
+
+class GameAction(BaseFilter):
+    """Фильтр хендлера по действию игровой кнопки; передаёт хендлеру game_callback"""
+
+    def __init__(self, action: str):
+        self.action = action
+
+    async def __call__(self, callback: CallbackQuery) -> Union[bool, Dict[str, Any]]:
+        decoded = decode_callback(callback.data)
+        if decoded is None or decoded.action != self.action:
+            return False
+        return {"game_callback": decoded}
@@ -0,0 +1,105 @@
+"""Часы таймеров фаз.
+
+Все таймеры автопилотов и планировщика фаз берут время и ждут через
+глобальный clock. В проде это обычные часы: время цикла событий, time.time()
+и asyncio.sleep. Для тестов и нагрузочных прогонов есть VirtualTimeLoop —
+цикл событий, который вместо простоя сразу переводит время к ближайшему
+таймеру, — и run_virtual(), который запускает в нём корутину и переключает
+clock на виртуальное «настенное» время. Тогда целая игра с теми же фазами,
+напоминаниями и паузами проходит за миллисекунды.
+"""
+import asyncio
+import selectors
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """Селектор, который вместо ожидания переводит виртуальные часы вперёд"""
+
+    def __init__(self):
+        super().__init__()
+        self.now = 0.0
+
+    def select(self, timeout=None):
+        if timeout is not None and timeout > 0:
+            self.now += timeout
+        return super().select(0)
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Цикл событий на виртуальном времени: простаивать ему некогда.
+
+    run_in_executor выполняет функцию сразу, в потоке цикла. Синхронные фильтры
+    и хендлеры aiogram отправляет в пул потоков, и на время их работы часы
+    перепрыгивали бы к следующему таймеру — на сколько, зависело бы от скорости
+    потока. Без пула прогон с тем же зерном повторяется один в один.
+    """
+
+    def __init__(self):
+        self._virtual_selector = _VirtualSelector()
+        super().__init__(selector=self._virtual_selector)
+
+    def time(self) -> float:
+        return self._virtual_selector.now
+
+    def run_in_executor(self, executor, func, *args):
+        future = self.create_future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class Clock:
+    """Время и ожидание для таймеров фаз.
+
+    monotonic() — время цикла событий (по нему ставятся таймеры), wall() —
+    «настенное» время для дедлайнов, которые сохраняются и переживают перезапуск.
+    В виртуальном режиме wall() идёт от epoch вместе с виртуальным временем цикла.
+    """
+
+    def __init__(self):
+        # Начало виртуального времени в time.time(); None — реальные часы
+        self._virtual_epoch: Optional[float] = None
+
+    @property
+    def virtual(self) -> bool:
+        return self._virtual_epoch is not None
+
+    def monotonic(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def wall(self) -> float:
+        if self._virtual_epoch is None:
+            return time.time()
+        return self._virtual_epoch + asyncio.get_running_loop().time()
+
+    async def sleep(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+
+    def use_virtual(self, epoch: Optional[float] = None) -> None:
+        self._virtual_epoch = time.time() if epoch is None else epoch
+
+    def use_real(self) -> None:
+        self._virtual_epoch = None
+
+
+def run_virtual(main: Callable[[], Awaitable[T]], epoch: Optional[float] = None) -> T:
+    """Выполняет main() в VirtualTimeLoop с виртуальными часами и возвращает результат"""
+    loop = VirtualTimeLoop()
+    asyncio.set_event_loop(loop)
+    clock.use_virtual(epoch)
+    try:
+        return loop.run_until_complete(main())
+    finally:
+        clock.use_real()
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+# Глобальные часы таймеров фаз
+clock = Clock()
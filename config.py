@@ -18,6 +18,8 @@ NIGHT_TIMEOUT_SECS = 90
 DAY_DISCUSS_TIMEOUT_SECS = 90
 # Голосование длится до голосов всех живых или до VOTING_TIMEOUT_SECS
 VOTING_TIMEOUT_SECS = 60
+# Табло голосования правится не чаще раза в столько секунд (голоса внутри окна объединяются)
+SCOREBOARD_EDIT_DEBOUNCE_SECS = 1.5
 
 # Настройки работы бота
 # Можно переопределить через переменную окружения BOT_WORK_TIMEOUT_HOURS.
@@ -41,6 +43,90 @@ def _parse_int(value: str, default: int = 0) -> int:
 BROADCAST_CHAT_ID = _parse_int(os.getenv('BROADCAST_CHAT_ID', '0'), 0)
 BROADCAST_THREAD_ID = _parse_int(os.getenv('BROADCAST_THREAD_ID', '0'), 0)
 
+def _parse_float(value: str, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except Exception:
+        return default
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling').strip().lower()
+# Публичный адрес бота (https://example.com), к нему добавляется WEBHOOK_PATH
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+# Секрет, который Telegram присылает в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+# Render и подобные платформы передают порт в PORT
+WEBHOOK_PORT = _parse_int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8080')), 8080)
+# Сколько обновлений может ждать обработки; сверх этого отвечаем 503 и Telegram повторит
+WEBHOOK_QUEUE_SIZE = _parse_int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'), 1000)
+WEBHOOK_WORKERS = _parse_int(os.getenv('WEBHOOK_WORKERS', '16'), 16)
+WEBHOOK_MAX_CONNECTIONS = _parse_int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'), 40)
+WEBHOOK_KEEPALIVE_SECS = _parse_float(os.getenv('WEBHOOK_KEEPALIVE_SECS', '75'), 75.0)
+# Альтернативный адрес Bot API (локальный telegram-bot-api или фейковый сервер для тестов)
+TELEGRAM_API_BASE = os.getenv('TELEGRAM_API_BASE', '')
+
+# Сохранение состояния игр на диск (журнал + периодические снапшоты в SQLite),
+# чтобы игры переживали перезапуск бота. Пустой STATE_DB_PATH отключает сохранение.
+STATE_DB_PATH = os.getenv('STATE_DB_PATH', 'mafia_state.db')
+# Как часто сбрасывать изменённые игры в журнал (сек.)
+STATE_FLUSH_INTERVAL_SECS = _parse_float(os.getenv('STATE_FLUSH_INTERVAL_SECS', '1'), 1.0)
+# Как часто сворачивать журнал в компактный снапшот (сек.)
+STATE_SNAPSHOT_INTERVAL_SECS = _parse_float(os.getenv('STATE_SNAPSHOT_INTERVAL_SECS', '300'), 300.0)
+# Журнал событий игр (вход, роли, фазы, ночные действия, голоса, смерти) в STATE_DB_PATH; 0 — не вести
+GAME_LOG_ENABLED = _parse_int(os.getenv('GAME_LOG_ENABLED', '1'), 1) != 0
+# Статистика игроков (/stats, таблица лидеров) в STATE_DB_PATH; 0 — не вести
+STATS_ENABLED = _parse_int(os.getenv('STATS_ENABLED', '1'), 1) != 0
+
+# Исходящая очередь к Bot API (лимиты Telegram: ~30 сообщений/сек. на бота,
+# ~1/сек. в личный чат, ~20/мин. в группу). Скорость — токенов в секунду, burst — запас.
+OUTBOUND_GLOBAL_RATE = _parse_float(os.getenv('OUTBOUND_GLOBAL_RATE', '25'), 25.0)
+OUTBOUND_GLOBAL_BURST = _parse_float(os.getenv('OUTBOUND_GLOBAL_BURST', '30'), 30.0)
+OUTBOUND_PRIVATE_RATE = _parse_float(os.getenv('OUTBOUND_PRIVATE_RATE', '1'), 1.0)
+OUTBOUND_PRIVATE_BURST = _parse_float(os.getenv('OUTBOUND_PRIVATE_BURST', '3'), 3.0)
+OUTBOUND_GROUP_RATE = _parse_float(os.getenv('OUTBOUND_GROUP_RATE', '0.33'), 0.33)
+OUTBOUND_GROUP_BURST = _parse_float(os.getenv('OUTBOUND_GROUP_BURST', '20'), 20.0)
+# Сколько раз повторять запрос после TelegramRetryAfter
+OUTBOUND_MAX_RETRIES = _parse_int(os.getenv('OUTBOUND_MAX_RETRIES', '3'), 3)
+# Сколько личных сообщений (роли, ночные клавиатуры) отправлять одновременно
+DM_FANOUT_CONCURRENCY = _parse_int(os.getenv('DM_FANOUT_CONCURRENCY', '10'), 10)
+# Окно склейки ЛС мафии: сообщения одного мафиози за это время уходят сообщникам одной пачкой
+MAFIA_RELAY_COALESCE_SECS = _parse_float(os.getenv('MAFIA_RELAY_COALESCE_SECS', '0.3'), 0.3)
+
+# Плавная остановка: сколько ждать, пока автопилоты всех игр дойдут до ожидания
+# таймера фазы, прежде чем остановить их и передать остатки таймеров следующему запуску
+DRAIN_TIMEOUT_SECS = _parse_float(os.getenv('DRAIN_TIMEOUT_SECS', '20'), 20.0)
+
+# Общее зерно жребия игр: при GAME_RNG_SEED != 0 зерно каждой игры выводится из него и
+# chat_key, и прогон (бенчмарк, нагрузочный тест) повторяется один в один; 0 — случайные зерна
+GAME_RNG_SEED = _parse_int(os.getenv('GAME_RNG_SEED', '0'), 0)
+
+# Шардирование: при SHARD_COUNT > 1 фронт-процесс принимает обновления и раздаёт их
+# по chat_key на SHARD_COUNT процессов-воркеров (нужен общий STATE_DB_PATH)
+SHARD_COUNT = _parse_int(os.getenv('SHARD_COUNT', '0'), 0)
+# Как часто воркеры присылают фронту метрики
+SHARD_METRICS_INTERVAL_SECS = _parse_float(os.getenv('SHARD_METRICS_INTERVAL_SECS', '5'), 5.0)
+# Пауза перед перезапуском упавшего воркера
+SHARD_RESTART_DELAY_SECS = _parse_float(os.getenv('SHARD_RESTART_DELAY_SECS', '1'), 1.0)
+
+# Эндпоинт /metrics в формате Prometheus; METRICS_PORT=0 — выключен.
+# В шардированном режиме воркер i слушает METRICS_PORT + 1 + i
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = _parse_int(os.getenv('METRICS_PORT', '0'), 0)
+
+# Сторож цикла событий: тик раз в LOOP_WATCHDOG_INTERVAL_SECS меряет задержку цикла,
+# зависания дольше LOOP_STALL_THRESHOLD_SECS записываются со стеком (0 — не записывать)
+LOOP_WATCHDOG_INTERVAL_SECS = _parse_float(os.getenv('LOOP_WATCHDOG_INTERVAL_SECS', '0.25'), 0.25)
+LOOP_STALL_THRESHOLD_SECS = _parse_float(os.getenv('LOOP_STALL_THRESHOLD_SECS', '0.1'), 0.1)
+# Сколько последних зависаний хранить для /loop_lag
+LOOP_STALL_HISTORY = _parse_int(os.getenv('LOOP_STALL_HISTORY', '20'), 20)
+
+# Логирование: уровень (DEBUG/INFO/WARNING...) и выборка отладочных записей
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').strip().upper()
+# При DEBUG писать только каждую N-ю запись одного шаблона (логи тиков и клавиатур); 1 — писать все
+LOG_SAMPLE_EVERY = _parse_int(os.getenv('LOG_SAMPLE_EVERY', '1'), 1)
+
 # Роли и их количество (в зависимости от количества игроков)
 ROLE_DISTRIBUTION = {
     4:  {"мафия": 1, "мирный": 2, "доктор": 1},
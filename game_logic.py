@@ -1,17 +1,130 @@
 import random
-from typing import Dict, List, Tuple, Optional
+import time
+from typing import Callable, Dict, List, Set, Tuple, Optional
 import asyncio
 import logging
 from models import GameState, Player, PlayerRole, GamePhase
-from config import ROLE_DISTRIBUTION, MIN_PLAYERS, MAX_PLAYERS
+from config import ROLE_DISTRIBUTION, MIN_PLAYERS, MAX_PLAYERS, GAME_RNG_SEED
+from scheduler import phase_scheduler
+from clock import clock
+from metrics import games_active
+from gamelog import GameLog, DIED_NIGHT, DIED_VOTE, DIED_LEFT
+from stats import PlayerStats
 
 logger = logging.getLogger(__name__)
 
+# Какое ночное действие ждём от живой роли (ключи game.night_actions_completed)
+NIGHT_ACTION_BY_ROLE = {
+    PlayerRole.MAFIA: "mafia",
+    PlayerRole.DOCTOR: "doctor",
+    PlayerRole.COMMISSIONER: "commissioner",
+    PlayerRole.BUTTERFLY: "butterfly",
+}
+
 class GameManager:
     def __init__(self):
         self.active_games: Dict[str, GameState] = {}
         # user_id мафии -> chat_key игры
         self.mafia_user_to_chat_key: Dict[int, str] = {}
+        # Слушатель изменений этого маппинга: (user_id, chat_key, добавлен ли); нужен фронту шардов
+        self.on_mafia_route: Optional[Callable[[int, str, bool], None]] = None
+        # Игры, изменённые с последнего сохранения (забирает storage.StatePersister)
+        self.dirty_games: Set[str] = set()
+        # Счётчик изменений игры: по нему акторы понимают, что срез для чтения устарел
+        self._revisions: Dict[str, int] = {}
+        # Токены игр для компактного callback_data: токен -> chat_key
+        self._tokens: Dict[int, str] = {}
+        # Токен = номер * число шардов + номер шарда: фронт шардов находит воркер без таблицы.
+        # Номера начинаются с текущего времени, чтобы после перезапуска не выдать токен
+        # кнопок уже закончившейся игры
+        self._token_seq = int(time.time())
+        self._token_shard = (0, 1)
+        # Плавная остановка: новые лобби и старты игр не принимаются
+        self.draining = False
+        # Общее зерно жребия (None — зерна игр случайные) и число игр, получивших зерно от него
+        self._rng_master: Optional[int] = GAME_RNG_SEED or None
+        self._rng_games = 0
+        # Журнал событий игр; None — не ведётся (симулятор, пакетные переигровки)
+        self.log: Optional[GameLog] = None
+        # Статистика игроков по итогам игр; None — не ведётся
+        self.stats: Optional[PlayerStats] = None
+
+    def touch(self, chat_key: str) -> None:
+        """Помечает игру изменённой, чтобы её состояние попало в журнал"""
+        self.dirty_games.add(chat_key)
+        self._revisions[chat_key] = self._revisions.get(chat_key, 0) + 1
+        if self.log is not None:
+            game = self.active_games.get(chat_key)
+            if game is not None:
+                self.log.sync(game)
+
+    def set_rng_seed(self, seed: Optional[int]) -> None:
+        """Выводить зерна новых игр из seed (None — случайные зерна)"""
+        self._rng_master = seed
+        self._rng_games = 0
+
+    def _new_rng_seed(self, chat_key: str) -> int:
+        """Зерно жребия новой игры: от общего зерна, чата и номера игры либо случайное"""
+        if self._rng_master is None:
+            return random.getrandbits(63)
+        self._rng_games += 1
+        return random.Random(f"{self._rng_master}:{chat_key}:{self._rng_games}").getrandbits(63)
+
+    def revision(self, chat_key: str) -> int:
+        return self._revisions.get(chat_key, 0)
+
+    def set_token_shard(self, index: int, count: int) -> None:
+        """Выдавать токены игр шарда index из count (до восстановления игр)"""
+        self._token_shard = (index, count)
+
+    def callback_token(self, chat_key: str) -> int:
+        """Токен игры для callback_data; 0 — игры нет"""
+        game = self.active_games.get(chat_key)
+        return game.callback_token if game else 0
+
+    def chat_key_for_token(self, token: int) -> Optional[str]:
+        return self._tokens.get(token)
+
+    def _register_token(self, game: GameState) -> None:
+        index, count = self._token_shard
+        token = game.callback_token
+        if token and token % count == index and token not in self._tokens:
+            # Восстановленная игра сохраняет токен — её старые кнопки продолжают работать
+            self._token_seq = max(self._token_seq, token // count)
+        else:
+            self._token_seq += 1
+            token = game.callback_token = self._token_seq * count + index
+        self._tokens[token] = game.chat_id
+
+    def _drop_token(self, game: GameState) -> None:
+        if self._tokens.get(game.callback_token) == game.chat_id:
+            del self._tokens[game.callback_token]
+
+    def restore_games(self, games: Dict[str, GameState]) -> None:
+        """Подхватывает игры, восстановленные из хранилища после перезапуска"""
+        self.active_games.update(games)
+        for chat_key, game in games.items():
+            self._register_token(game)
+            self._refresh_mafia_mapping(chat_key)
+        logger.info("restore_games: восстановлено игр: %s, мафиози в ЛС-маппинге: %s", len(games), len(self.mafia_user_to_chat_key))
+
+    def resume_phase_timers(self, remaining: Dict[str, float]) -> int:
+        """Переносит таймеры фаз, переданные прошлым запуском, на текущее время.
+
+        Пока бот был остановлен, игроки не могли нажать кнопки, поэтому
+        простой не съедает время фазы: дедлайн = сейчас + остаток.
+        """
+        now = clock.wall()
+        resumed = 0
+        for chat_key, seconds in remaining.items():
+            game = self.active_games.get(chat_key)
+            if not game or not game.phase_deadline_for:
+                continue
+            game.phase_deadline_ts = now + seconds
+            self.touch(chat_key)
+            resumed += 1
+        logger.info("resume_phase_timers: перенесено таймеров фаз: %s", resumed)
+        return resumed
 
     def _refresh_mafia_mapping(self, chat_key: str) -> None:
         game = self.get_game(chat_key)
@@ -22,8 +135,15 @@ class GameManager:
         for uid in to_delete:
             del self.mafia_user_to_chat_key[uid]
         # Регистрируем живых мафий
-        for p in game.get_players_by_role(PlayerRole.MAFIA):
+        alive_mafia = game.get_players_by_role(PlayerRole.MAFIA)
+        for p in alive_mafia:
             self.mafia_user_to_chat_key[p.user_id] = chat_key
+        if self.on_mafia_route is not None:
+            added = {p.user_id for p in alive_mafia}
+            for uid in set(to_delete) - added:
+                self.on_mafia_route(uid, chat_key, False)
+            for uid in added - set(to_delete):
+                self.on_mafia_route(uid, chat_key, True)
 
     def get_chat_id_for_mafia_user(self, user_id: int) -> Optional[int]:
         chat_key = self.mafia_user_to_chat_key.get(user_id)
@@ -46,31 +166,37 @@ class GameManager:
     
     def create_game(self, chat_key: str) -> GameState:
         """Создает новую игру"""
-        logger.debug(f"create_game: попытка создать игру для чата {chat_key}")
+        logger.debug("create_game: попытка создать игру для чата %s", chat_key)
         
         if chat_key in self.active_games:
-            logger.debug(f"create_game: игра для чата {chat_key} уже существует")
+            logger.debug("create_game: игра для чата %s уже существует", chat_key)
             return self.active_games[chat_key]
         
-        game = GameState(chat_id=chat_key)
+        game = GameState(chat_id=chat_key, rng_seed=self._new_rng_seed(chat_key))
+        if self.log is not None:
+            self.log.created(game)
         self.active_games[chat_key] = game
-        logger.info(f"create_game: создана новая игра для чата {chat_key}")
+        self._register_token(game)
+        self.touch(chat_key)
+        logger.info("create_game: создана новая игра для чата %s", chat_key)
         return game
     
     def create_test_game(self, chat_key: str) -> GameState:
         """Создает тестовую игру с 10 виртуальными игроками"""
-        logger.debug(f"create_test_game: попытка создать тестовую игру для чата {chat_key}")
+        logger.debug("create_test_game: попытка создать тестовую игру для чата %s", chat_key)
         
         # Всегда удаляем существующую игру перед созданием тестовой
         if chat_key in self.active_games:
-            logger.info(f"create_test_game: удаляем существующую игру для чата {chat_key}")
-            del self.active_games[chat_key]
+            logger.info("create_test_game: удаляем существующую игру для чата %s", chat_key)
+            self._drop_token(self.active_games.pop(chat_key))
         
-        logger.info(f"create_test_game: создание новой тестовой игры для чата {chat_key}")
-        game = GameState(chat_id=chat_key, is_test_game=True)
+        logger.info("create_test_game: создание новой тестовой игры для чата %s", chat_key)
+        game = GameState(chat_id=chat_key, is_test_game=True, rng_seed=self._new_rng_seed(chat_key))
+        if self.log is not None:
+            self.log.created(game)
         
-        logger.debug(f"create_test_game: создан объект GameState, is_test_game: {game.is_test_game}")
-        logger.debug(f"create_test_game: изначально игроков в game.players: {len(game.players)}")
+        logger.debug("create_test_game: создан объект GameState, is_test_game: %s", game.is_test_game)
+        logger.debug("create_test_game: изначально игроков в game.players: %s", len(game.players))
         
         # Создаем 10 виртуальных игроков с разными ролями
         test_players = [
@@ -91,11 +217,11 @@ class GameManager:
             {"name": "Тестовый Мирный 5", "role": PlayerRole.CIVILIAN}
         ]
         
-        logger.debug(f"create_test_game: подготовлен список из {len(test_players)} шаблонов игроков")
+        logger.debug("create_test_game: подготовлен список из %s шаблонов игроков", len(test_players))
         
         # Перемешиваем роли для разнообразия
-        random.shuffle(test_players)
-        logger.debug(f"create_test_game: роли перемешаны для чата {chat_key}")
+        game.rng().shuffle(test_players)
+        logger.debug("create_test_game: роли перемешаны для чата %s", chat_key)
         
         # Проверим, что можем создать игрока
         try:
@@ -106,17 +232,17 @@ class GameManager:
                 role=PlayerRole.CIVILIAN,
                 role_info_sent=True
             )
-            logger.debug(f"create_test_game: тестовое создание игрока прошло успешно")
+            logger.debug("create_test_game: тестовое создание игрока прошло успешно")
         except Exception as e:
-            logger.exception(f"create_test_game: ОШИБКА создания тестового игрока: {e}")
+            logger.exception("create_test_game: ОШИБКА создания тестового игрока: %s", e)
             return game  # Возвращаем пустую игру
         
         # Создаем игроков
-        logger.debug(f"create_test_game: начинаем создание {len(test_players)} игроков")
+        logger.debug("create_test_game: начинаем создание %s игроков", len(test_players))
         for i, player_data in enumerate(test_players):
             try:
                 player_id = -(i + 1)
-                logger.debug(f"create_test_game: создаем игрока {i+1}: {player_data['name']} с ролью {player_data['role'].value}")
+                logger.debug("create_test_game: создаем игрока %s: %s с ролью %s", i+1, player_data['name'], player_data['role'].value)
                 
                 player = Player(
                     user_id=player_id,  # Отрицательные ID для виртуальных игроков
@@ -127,50 +253,55 @@ class GameManager:
                 )
                 
                 game.players[player_id] = player
-                logger.debug(f"create_test_game: игрок {player.first_name} с ID {player_id} добавлен в игру")
+                if self.log is not None:
+                    self.log.joined(game, player)
+                    self.log.role(game, player_id, player.role)
+                logger.debug("create_test_game: игрок %s с ID %s добавлен в игру", player.first_name, player_id)
             except Exception as e:
-                logger.exception(f"create_test_game: ошибка создания игрока {i+1}: {e}")
+                logger.exception("create_test_game: ошибка создания игрока %s: %s", i+1, e)
         
         self.active_games[chat_key] = game
-        logger.info(f"create_test_game: создана тестовая игра для чата {chat_key} с {len(game.players)} виртуальными игроками")
+        self._register_token(game)
+        self.touch(chat_key)
+        logger.info("create_test_game: создана тестовая игра для чата %s с %s виртуальными игроками", chat_key, len(game.players))
         
         # Дополнительная проверка
         if len(game.players) == 0:
-            logger.error(f"create_test_game: ОШИБКА! Игроки не были созданы для чата {chat_key}")
+            logger.error("create_test_game: ОШИБКА! Игроки не были созданы для чата %s", chat_key)
         else:
-            logger.info(f"create_test_game: УСПЕХ! Создано {len(game.players)} игроков")
+            logger.info("create_test_game: УСПЕХ! Создано %s игроков", len(game.players))
             for player_id, player in game.players.items():
-                logger.debug(f"create_test_game: игрок {player_id}: {player.first_name} ({player.role.value})")
+                logger.debug("create_test_game: игрок %s: %s (%s)", player_id, player.first_name, player.role.value)
         
         return game
     
     def execute_test_night_actions(self, chat_key: str) -> None:
         """Автоматически выполняет ночные действия для тестовой игры"""
-        logger.info(f"execute_test_night_actions: выполнение ночных действий для тестовой игры {chat_key}")
+        logger.info("execute_test_night_actions: выполнение ночных действий для тестовой игры %s", chat_key)
         
         game = self.get_game(chat_key)
         if not game or not game.is_test_game:
-            logger.warning(f"execute_test_night_actions: игра не найдена или не является тестовой")
+            logger.warning("execute_test_night_actions: игра не найдена или не является тестовой")
             return
         
         alive_players = game.get_alive_players()
-        logger.info(f"execute_test_night_actions: найдено {len(alive_players)} живых игроков")
+        logger.info("execute_test_night_actions: найдено %s живых игроков", len(alive_players))
         
         # Логируем состав живых игроков
         for player in alive_players:
-            logger.debug(f"execute_test_night_actions: живой игрок: {player.first_name} (ID: {player.user_id}, роль: {player.role.value})")
+            logger.debug("execute_test_night_actions: живой игрок: %s (ID: %s, роль: %s)", player.first_name, player.user_id, player.role.value)
         
         # Мафия выбирает случайную жертву (имитируем коллективное голосование)
         mafia_players = [p for p in alive_players if p.role == PlayerRole.MAFIA]
         if mafia_players:
-            logger.info(f"execute_test_night_actions: найдено {len(mafia_players)} мафиози")
+            logger.info("execute_test_night_actions: найдено %s мафиози", len(mafia_players))
             potential_victims = [p for p in alive_players if p.role != PlayerRole.MAFIA]
             if potential_victims:
                 # Имитируем коллективное голосование мафии
                 for mafia in mafia_players:
-                    victim = random.choice(potential_victims)
+                    victim = game.rng().choice(potential_victims)
                     game.mafia_votes[mafia.user_id] = victim.user_id
-                    logger.debug(f"execute_test_night_actions: мафия {mafia.first_name} голосует за {victim.first_name}")
+                    logger.debug("execute_test_night_actions: мафия %s голосует за %s", mafia.first_name, victim.first_name)
                 
                 # Выбираем цель по большинству голосов
                 vote_tally = {}
@@ -179,99 +310,117 @@ class GameManager:
                 
                 max_votes = max(vote_tally.values())
                 top_targets = [tid for tid, votes in vote_tally.items() if votes == max_votes]
-                chosen_victim_id = random.choice(top_targets)
+                chosen_victim_id = game.rng().choice(top_targets)
                 game.night_kill_target = chosen_victim_id
                 
                 chosen_victim = next((p for p in alive_players if p.user_id == chosen_victim_id), None)
                 if chosen_victim:
-                    logger.info(f"execute_test_night_actions: 🗡️ МАФИЯ выбрала жертву: {chosen_victim.first_name} (ID: {chosen_victim.user_id}, роль: {chosen_victim.role.value})")
+                    logger.info("execute_test_night_actions: 🗡️ МАФИЯ выбрала жертву: %s (ID: %s, роль: %s)", chosen_victim.first_name, chosen_victim.user_id, chosen_victim.role.value)
             else:
-                logger.warning(f"execute_test_night_actions: нет потенциальных жертв для мафии")
+                logger.warning("execute_test_night_actions: нет потенциальных жертв для мафии")
         else:
-            logger.warning(f"execute_test_night_actions: мафиози не найдены среди живых игроков")
+            logger.warning("execute_test_night_actions: мафиози не найдены среди живых игроков")
         
         # Доктор пытается спасти случайного игрока
         doctor_players = [p for p in alive_players if p.role == PlayerRole.DOCTOR]
         if doctor_players:
-            logger.info(f"execute_test_night_actions: найден доктор: {doctor_players[0].first_name}")
+            logger.info("execute_test_night_actions: найден доктор: %s", doctor_players[0].first_name)
             if game.night_kill_target:
                 # 50% шанс успешного спасения
-                if random.random() < 0.5:
+                if game.rng().random() < 0.5:
                     game.doctor_saves[doctor_players[0].user_id] = game.night_kill_target
                     target_name = next((p.first_name for p in alive_players if p.user_id == game.night_kill_target), "неизвестный")
-                    logger.info(f"execute_test_night_actions: 💉 ДОКТОР УСПЕШНО спас: {target_name} (ID: {game.night_kill_target})")
+                    logger.info("execute_test_night_actions: 💉 ДОКТОР УСПЕШНО спас: %s (ID: %s)", target_name, game.night_kill_target)
                 else:
                     game.doctor_saves[doctor_players[0].user_id] = None
                     target_name = next((p.first_name for p in alive_players if p.user_id == game.night_kill_target), "неизвестный")
-                    logger.info(f"execute_test_night_actions: 💉 ДОКТОР НЕ СМОГ спасти: {target_name} (ID: {game.night_kill_target})")
+                    logger.info("execute_test_night_actions: 💉 ДОКТОР НЕ СМОГ спасти: %s (ID: %s)", target_name, game.night_kill_target)
             else:
-                logger.info(f"execute_test_night_actions: доктор не может спасти - нет цели мафии")
+                logger.info("execute_test_night_actions: доктор не может спасти - нет цели мафии")
         else:
-            logger.info(f"execute_test_night_actions: доктор не найден среди живых игроков")
+            logger.info("execute_test_night_actions: доктор не найден среди живых игроков")
         
         # Комиссар проверяет случайного игрока
         commissioner_players = [p for p in alive_players if p.role == PlayerRole.COMMISSIONER]
         if commissioner_players:
-            logger.info(f"execute_test_night_actions: найден комиссар: {commissioner_players[0].first_name}")
-            target = random.choice(alive_players)
+            logger.info("execute_test_night_actions: найден комиссар: %s", commissioner_players[0].first_name)
+            target = game.rng().choice(alive_players)
             if target.role == PlayerRole.MAFIA:
                 game.commissioner_check_results[commissioner_players[0].user_id] = True
-                logger.info(f"execute_test_night_actions: 👮 КОМИССАР обнаружил МАФИЮ: {target.first_name} (ID: {target.user_id})")
+                logger.info("execute_test_night_actions: 👮 КОМИССАР обнаружил МАФИЮ: %s (ID: %s)", target.first_name, target.user_id)
             else:
                 game.commissioner_check_results[commissioner_players[0].user_id] = False
-                logger.info(f"execute_test_night_actions: 👮 КОМИССАР проверил МИРНОГО: {target.first_name} (ID: {target.user_id}, роль: {target.role.value})")
+                logger.info("execute_test_night_actions: 👮 КОМИССАР проверил МИРНОГО: %s (ID: %s, роль: %s)", target.first_name, target.user_id, target.role.value)
 
             # Записываем проверку комиссара
             game.commissioner_checks[commissioner_players[0].user_id] = target.user_id
 
         else:
-            logger.info(f"execute_test_night_actions: комиссар не найден среди живых игроков")
+            logger.info("execute_test_night_actions: комиссар не найден среди живых игроков")
         
         # Ночная бабочка отвлекает случайного игрока
         butterfly_players = [p for p in alive_players if p.role == PlayerRole.BUTTERFLY]
         if butterfly_players:
-            logger.info(f"execute_test_night_actions: найдена ночная бабочка: {butterfly_players[0].first_name}")
+            logger.info("execute_test_night_actions: найдена ночная бабочка: %s", butterfly_players[0].first_name)
             # Бабочка не может отвлечь саму себя
             potential_targets = [p for p in alive_players if p.user_id != butterfly_players[0].user_id]
             if potential_targets:
-                target = random.choice(potential_targets)
+                target = game.rng().choice(potential_targets)
                 game.butterfly_distract_target = target.user_id
                 game.butterfly_distracted_players.add(target.user_id)
-                logger.info(f"execute_test_night_actions: 💃 БАБОЧКА отвлекла: {target.first_name} (ID: {target.user_id}, роль: {target.role.value})")
+                logger.info("execute_test_night_actions: 💃 БАБОЧКА отвлекла: %s (ID: %s, роль: %s)", target.first_name, target.user_id, target.role.value)
             else:
-                logger.info(f"execute_test_night_actions: бабочка не может отвлечь никого (нет других живых игроков)")
+                logger.info("execute_test_night_actions: бабочка не может отвлечь никого (нет других живых игроков)")
         else:
-            logger.info(f"execute_test_night_actions: ночная бабочка не найдена среди живых игроков")
+            logger.info("execute_test_night_actions: ночная бабочка не найдена среди живых игроков")
         
         # Итоговая сводка ночных действий
-        logger.info(f"execute_test_night_actions: === ИТОГИ НОЧНЫХ ДЕЙСТВИЙ ===")
-        logger.info(f"execute_test_night_actions: Цель мафии: {game.night_kill_target}")
-        logger.info(f"execute_test_night_actions: Спасения доктора: {game.doctor_saves}")
-        logger.info(f"execute_test_night_actions: Проверки комиссара: {game.commissioner_check_results}")
-        logger.info(f"execute_test_night_actions: Отвлечения бабочки: {game.butterfly_distract_target}")
-        logger.info(f"execute_test_night_actions: ================================")
-        
-        logger.info(f"execute_test_night_actions: ночные действия для тестовой игры {chat_key} выполнены")
+        logger.info("execute_test_night_actions: === ИТОГИ НОЧНЫХ ДЕЙСТВИЙ ===")
+        logger.info("execute_test_night_actions: Цель мафии: %s", game.night_kill_target)
+        logger.info("execute_test_night_actions: Спасения доктора: %s", game.doctor_saves)
+        logger.info("execute_test_night_actions: Проверки комиссара: %s", game.commissioner_check_results)
+        logger.info("execute_test_night_actions: Отвлечения бабочки: %s", game.butterfly_distract_target)
+        logger.info("execute_test_night_actions: ================================")
+        
+        if self.log is not None:
+            self._log_night_actions(game)
+        self.touch(chat_key)
+        logger.info("execute_test_night_actions: ночные действия для тестовой игры %s выполнены", chat_key)
     
+    def finish_test_night(self, chat_key: str) -> None:
+        """Переводит тестовую игру из ночи в день следующего раунда.
+
+        В тестовой игре ночь никого не убивает: действия ботов только показываются
+        в логах, а затем сбрасываются, как после настоящей ночи.
+        """
+        game = self.get_game(chat_key)
+        if not game or not game.is_test_game:
+            logger.warning("finish_test_night: игра не найдена или не является тестовой")
+            return
+        self._clear_night_actions(game)
+        game.phase = GamePhase.DAY
+        game.current_round += 1
+        self.touch(chat_key)
+
     def execute_test_voting(self, chat_key: str) -> None:
         """Автоматически выполняет голосование для тестовой игры"""
-        logger.info(f"execute_test_voting: выполнение голосования для тестовой игры {chat_key}")
+        logger.info("execute_test_voting: выполнение голосования для тестовой игры %s", chat_key)
         
         game = self.get_game(chat_key)
         if not game or not game.is_test_game:
-            logger.warning(f"execute_test_voting: игра не найдена или не является тестовой")
+            logger.warning("execute_test_voting: игра не найдена или не является тестовой")
             return
         
         alive_players = game.get_alive_players()
         if not alive_players:
-            logger.warning(f"execute_test_voting: нет живых игроков для голосования")
+            logger.warning("execute_test_voting: нет живых игроков для голосования")
             return
         
-        logger.info(f"execute_test_voting: найдено {len(alive_players)} живых игроков для голосования")
+        logger.info("execute_test_voting: найдено %s живых игроков для голосования", len(alive_players))
         
         # Логируем состав голосующих
         for player in alive_players:
-            logger.debug(f"execute_test_voting: голосует: {player.first_name} (ID: {player.user_id}, роль: {player.role.value})")
+            logger.debug("execute_test_voting: голосует: %s (ID: %s, роль: %s)", player.first_name, player.user_id, player.role.value)
         
         # Сбрасываем голоса
         game.votes.clear()
@@ -279,7 +428,7 @@ class GameManager:
             player.has_voted = False
             player.vote_target = None
         
-        logger.info(f"execute_test_voting: голоса сброшены, начинаем голосование")
+        logger.info("execute_test_voting: голоса сброшены, начинаем голосование")
         
         # Каждый живой игрок голосует случайным образом
         for player in alive_players:
@@ -287,66 +436,79 @@ class GameManager:
                 # Мафия голосует за случайного мирного
                 peaceful_targets = [p for p in alive_players if p.role != PlayerRole.MAFIA]
                 if peaceful_targets:
-                    target = random.choice(peaceful_targets)
+                    target = game.rng().choice(peaceful_targets)
                     game.votes[player.user_id] = target.user_id
                     player.has_voted = True
                     player.vote_target = target.user_id
-                    logger.info(f"execute_test_voting: 😈 МАФИЯ {player.first_name} голосует за {target.first_name} (мирный)")
+                    logger.info("execute_test_voting: 😈 МАФИЯ %s голосует за %s (мирный)", player.first_name, target.first_name)
                 else:
-                    logger.warning(f"execute_test_voting: мафия {player.first_name} не может голосовать - нет мирных целей")
+                    logger.warning("execute_test_voting: мафия %s не может голосовать - нет мирных целей", player.first_name)
             else:
                 # Мирные голосуют случайным образом
                 potential_targets = [p for p in alive_players if p.user_id != player.user_id]
                 if potential_targets:
-                    target = random.choice(potential_targets)
+                    target = game.rng().choice(potential_targets)
                     game.votes[player.user_id] = target.user_id
                     player.has_voted = True
                     player.vote_target = target.user_id
-                    logger.info(f"execute_test_voting: 👔 МИРНЫЙ {player.first_name} ({player.role.value}) голосует за {target.first_name}")
+                    logger.info("execute_test_voting: 👔 МИРНЫЙ %s (%s) голосует за %s", player.first_name, player.role.value, target.first_name)
                 else:
-                    logger.warning(f"execute_test_voting: мирный {player.first_name} не может голосовать - нет других целей")
+                    logger.warning("execute_test_voting: мирный %s не может голосовать - нет других целей", player.first_name)
         
         # Итоговая сводка голосования
-        logger.info(f"execute_test_voting: === ИТОГИ ГОЛОСОВАНИЯ ===")
-        logger.info(f"execute_test_voting: Всего голосов: {len(game.votes)}")
+        logger.info("execute_test_voting: === ИТОГИ ГОЛОСОВАНИЯ ===")
+        logger.info("execute_test_voting: Всего голосов: %s", len(game.votes))
         for voter_id, target_id in game.votes.items():
             voter = game.players.get(voter_id)
             target = game.players.get(target_id)
             if voter and target:
-                logger.info(f"execute_test_voting: {voter.first_name} ({voter.role.value}) → {target.first_name} ({target.role.value})")
-        logger.info(f"execute_test_voting: ==========================")
-        
-        logger.info(f"execute_test_voting: голосование для тестовой игры {chat_key} выполнено")
+                logger.info("execute_test_voting: %s (%s) → %s (%s)", voter.first_name, voter.role.value, target.first_name, target.role.value)
+        logger.info("execute_test_voting: ==========================")
+        
+        if self.log is not None:
+            for voter_id, target_id in game.votes.items():
+                self.log.vote(game, voter_id, target_id)
+        self.touch(chat_key)
+        logger.info("execute_test_voting: голосование для тестовой игры %s выполнено", chat_key)
     
+    def count_by_phase(self) -> Dict[Tuple[str], int]:
+        """Число активных игр по фазам (все фазы, включая пустые) — для /metrics"""
+        counts = {(phase.value,): 0 for phase in GamePhase}
+        for game in self.active_games.values():
+            counts[(game.phase.value,)] += 1
+        return counts
+
     def get_game(self, chat_key: str) -> GameState:
         """Получает активную игру"""
         game = self.active_games.get(chat_key)
-        if game:
-            logger.debug(f"get_game: игра найдена для чата {chat_key}, фаза: {game.phase}, игроков: {len(game.players)}")
-        else:
-            logger.debug(f"get_game: игра не найдена для чата {chat_key}")
+        # Вызывается на каждом апдейте и тике автопилота — не собираем аргументы лога зря
+        if logger.isEnabledFor(logging.DEBUG):
+            if game:
+                logger.debug("get_game: игра найдена для чата %s, фаза: %s, игроков: %s", chat_key, game.phase, len(game.players))
+            else:
+                logger.debug("get_game: игра не найдена для чата %s", chat_key)
         return game
     
     def add_player(self, chat_key: str, user_id: int, username: str, first_name: str) -> bool:
         """Добавляет игрока в игру"""
-        logger.debug(f"add_player: попытка добавить игрока {user_id} ({first_name}) в чат {chat_key}")
+        logger.debug("add_player: попытка добавить игрока %s (%s) в чат %s", user_id, first_name, chat_key)
         
         game = self.get_game(chat_key)
         if not game:
-            logger.error(f"add_player: игра не найдена для чата {chat_key}")
+            logger.error("add_player: игра не найдена для чата %s", chat_key)
             return False
         
-        logger.debug(f"add_player: текущая фаза игры: {game.phase}")
+        logger.debug("add_player: текущая фаза игры: %s", game.phase)
         if game.phase != GamePhase.LOBBY:
-            logger.warning(f"add_player: игра в чате {chat_key} не в фазе лобби (текущая фаза: {game.phase})")
+            logger.warning("add_player: игра в чате %s не в фазе лобби (текущая фаза: %s)", chat_key, game.phase)
             return False
         
         if user_id in game.players:
-            logger.warning(f"add_player: игрок {user_id} уже в игре в чате {chat_key}")
+            logger.warning("add_player: игрок %s уже в игре в чате %s", user_id, chat_key)
             return False
         
         if len(game.players) >= MAX_PLAYERS:
-            logger.warning(f"add_player: достигнут максимум игроков в чате {chat_key}")
+            logger.warning("add_player: достигнут максимум игроков в чате %s", chat_key)
             return False
         
         player = Player(
@@ -355,12 +517,15 @@ class GameManager:
             first_name=first_name
         )
         game.players[user_id] = player
-        logger.info(f"add_player: игрок {first_name} добавлен в игру в чате {chat_key}. Всего игроков: {len(game.players)}")
+        if self.log is not None:
+            self.log.joined(game, player)
+        self.touch(chat_key)
+        logger.info("add_player: игрок %s добавлен в игру в чате %s. Всего игроков: %s", first_name, chat_key, len(game.players))
         return True
     
     def remove_player(self, chat_key: str, user_id: int) -> bool:
         """Удаляет игрока из игры"""
-        logger.debug(f"remove_player: попытка удалить игрока {user_id} из чата {chat_key}")
+        logger.debug("remove_player: попытка удалить игрока %s из чата %s", user_id, chat_key)
         
         game = self.get_game(chat_key)
         if not game:
@@ -368,20 +533,23 @@ class GameManager:
             return False
         
         if game.phase != GamePhase.LOBBY:
-            logger.warning(f"remove_player: игра не в фазе лобби, текущая фаза: {game.phase}")
+            logger.warning("remove_player: игра не в фазе лобби, текущая фаза: %s", game.phase)
             return False
         
         if user_id in game.players:
             del game.players[user_id]
-            logger.info(f"remove_player: игрок {user_id} удален из игры")
+            if self.log is not None:
+                self.log.left(game, user_id)
+            self.touch(chat_key)
+            logger.info("remove_player: игрок %s удален из игры", user_id)
             return True
         else:
-            logger.warning(f"remove_player: игрок {user_id} не найден в игре")
+            logger.warning("remove_player: игрок %s не найден в игре", user_id)
             return False
     
     def remove_players_without_start(self, chat_key: str, player_ids: List[int]) -> None:
         """Удаляет игроков, которые не начали диалог с ботом"""
-        logger.debug(f"remove_players_without_start: удаление игроков {player_ids} из чата {chat_key}")
+        logger.debug("remove_players_without_start: удаление игроков %s из чата %s", player_ids, chat_key)
         
         game = self.get_game(chat_key)
         if not game:
@@ -393,15 +561,49 @@ class GameManager:
             if player_id in game.players:
                 player_name = game.players[player_id].first_name
                 del game.players[player_id]
+                if self.log is not None:
+                    self.log.left(game, player_id)
                 removed_count += 1
-                logger.info(f"remove_players_without_start: удален игрок {player_name} (ID: {player_id}) - не начал диалог с ботом")
+                logger.info("remove_players_without_start: удален игрок %s (ID: %s) - не начал диалог с ботом", player_name, player_id)
         
         if removed_count > 0:
-            logger.info(f"remove_players_without_start: удалено {removed_count} игроков из чата {chat_key}")
+            self._refresh_mafia_mapping(chat_key)
+            self.touch(chat_key)
+            logger.info("remove_players_without_start: удалено %s игроков из чата %s", removed_count, chat_key)
     
+    def eliminate_players(self, chat_key: str, player_ids: List[int]) -> List[Player]:
+        """Выводит из идущей игры игроков, до которых бот не может достучаться.
+
+        Игрок не удаляется, а выбывает как погибший: роль и итоги остаются в игре,
+        его несделанные ночные ходы не засчитываются. Победу после этого проверяет
+        вызывающий (check_game_over). Возвращает выбывших.
+        """
+        game = self.get_game(chat_key)
+        if not game:
+            logger.error("eliminate_players: игра не найдена")
+            return []
+        eliminated = []
+        for player_id in player_ids:
+            player = game.players.get(player_id)
+            if player is None or not player.is_alive:
+                continue
+            player.is_alive = False
+            self._record_death(game, player, DIED_LEFT)
+            game.mafia_votes.pop(player_id, None)
+            game.doctor_saves.pop(player_id, None)
+            game.commissioner_checks.pop(player_id, None)
+            if player.role == PlayerRole.BUTTERFLY:
+                game.butterfly_distract_target = None
+            eliminated.append(player)
+            logger.info("eliminate_players: игрок %s (ID: %s) выбыл из игры в чате %s", player.first_name, player_id, chat_key)
+        if eliminated:
+            self._refresh_mafia_mapping(chat_key)
+            self.touch(chat_key)
+        return eliminated
+
     def can_start_game(self, chat_key: str) -> bool:
         """Проверяет, можно ли начать игру"""
-        logger.debug(f"can_start_game: проверка для чата {chat_key}")
+        logger.debug("can_start_game: проверка для чата %s", chat_key)
         
         game = self.get_game(chat_key)
         if not game:
@@ -411,17 +613,17 @@ class GameManager:
         player_count = len(game.players)
         current_phase = game.phase
         
-        logger.debug(f"can_start_game: игроков: {player_count}, фаза: {current_phase}")
+        logger.debug("can_start_game: игроков: %s, фаза: %s", player_count, current_phase)
         
         # Разрешаем начать игру даже с 1 игроком (для тестирования)
         can_start = player_count >= 1 and current_phase == GamePhase.LOBBY
         
-        logger.debug(f"can_start_game: результат: {can_start}")
+        logger.debug("can_start_game: результат: %s", can_start)
         return can_start
     
     def start_game(self, chat_key: str) -> bool:
         """Начинает игру и раздает роли"""
-        logger.debug(f"start_game вызвана для чата {chat_key}")
+        logger.debug("start_game вызвана для чата %s", chat_key)
         
         game = self.get_game(chat_key)
         if not game:
@@ -432,12 +634,12 @@ class GameManager:
             logger.warning("Игра не может быть начата")
             return False
         
-        logger.debug(f"Игра может быть начата, текущая фаза: {game.phase}")
+        logger.debug("Игра может быть начата, текущая фаза: %s", game.phase)
         
         # Проверяем количество игроков
         player_count = len(game.players)
         if player_count < MIN_PLAYERS:
-            logger.warning(f"Игра начинается с {player_count} игроками (рекомендуется минимум {MIN_PLAYERS})")
+            logger.warning("Игра начинается с %s игроками (рекомендуется минимум %s)", player_count, MIN_PLAYERS)
         
         # Раздаем роли
         self._distribute_roles(game)
@@ -452,15 +654,15 @@ class GameManager:
         game.butterfly_distracted_players.clear()
         # Обновляем привязку мафии к игре для приватного чата
         self._refresh_mafia_mapping(chat_key)
+        self.touch(chat_key)
         
-        logger.info(f"Фаза изменена с {old_phase} на {game.phase}")
-        logger.info(f"Игра началась в чате {chat_key} с {player_count} игроками")
+        logger.info("Фаза изменена с %s на %s", old_phase, game.phase)
+        logger.info("Игра началась в чате %s с %s игроками", chat_key, player_count)
         
         # Выводим информацию о ролях игроков
         for player_id, player in game.players.items():
             logger.info(
-                f"Роль назначена: id={player_id}, name={player.first_name}, "
-                f"username=@{player.username if player.username else '—'}, role={player.role}"
+                "Роль назначена: id=%s, name=%s, username=@%s, role=%s", player_id, player.first_name, player.username if player.username else '—', player.role
             )
         
         return True
@@ -513,12 +715,12 @@ class GameManager:
 
     def _distribute_roles(self, game: GameState):
         """Раздает роли игрокам"""
-        logger.debug(f"_distribute_roles: начинаем раздачу ролей для {len(game.players)} игроков")
+        logger.debug("_distribute_roles: начинаем раздачу ролей для %s игроков", len(game.players))
         
         player_count = len(game.players)
         role_dist = ROLE_DISTRIBUTION.get(player_count, ROLE_DISTRIBUTION[12])
         
-        logger.debug(f"_distribute_roles: распределение ролей: {role_dist}")
+        logger.debug("_distribute_roles: распределение ролей: %s", role_dist)
         
         # Создаем список всех ролей
         roles = []
@@ -534,54 +736,100 @@ class GameManager:
             elif role_name == "ночная_бабочка":
                 roles.extend([PlayerRole.BUTTERFLY] * count)
         
-        logger.debug(f"_distribute_roles: созданный список ролей: {roles}")
+        logger.debug("_distribute_roles: созданный список ролей: %s", roles)
         
         # Перемешиваем роли
-        random.shuffle(roles)
+        rng = game.rng()
+        rng.shuffle(roles)
         
         # Назначаем роли игрокам
         player_ids = list(game.players.keys())
-        random.shuffle(player_ids)
+        rng.shuffle(player_ids)
         
-        logger.debug(f"_distribute_roles: перемешанные ID игроков: {player_ids}")
+        logger.debug("_distribute_roles: перемешанные ID игроков: %s", player_ids)
         
         for i, player_id in enumerate(player_ids):
             if i < len(roles):
                 assigned_role = roles[i]
                 game.players[player_id].role = assigned_role
-                logger.debug(f"_distribute_roles: игрок {player_id} получил роль {assigned_role}")
+                if self.log is not None:
+                    self.log.role(game, player_id, assigned_role)
+                logger.debug("_distribute_roles: игрок %s получил роль %s", player_id, assigned_role)
             else:
-                logger.warning(f"_distribute_roles: для игрока {player_id} не хватило роли")
+                logger.warning("_distribute_roles: для игрока %s не хватило роли", player_id)
         
-        logger.debug(f"_distribute_roles: раздача ролей завершена")
+        logger.debug("_distribute_roles: раздача ролей завершена")
     
     def process_night_action(self, chat_key: str, player_id: int, action_type: str, target_id: int = None) -> bool:
         """Обрабатывает ночное действие игрока"""
-        logger.debug(f"process_night_action: чат {chat_key}, игрок {player_id}, действие {action_type}, цель {target_id}")
+        accepted = self._apply_night_action(chat_key, player_id, action_type, target_id)
+        if accepted:
+            if self.log is not None:
+                self._log_night_actions(self.active_games[chat_key], player_id, action_type)
+            self.touch(chat_key)
+        # Все роли походили — будим автопилот, чтобы ночь закончилась досрочно
+        if accepted and self.all_night_actions_completed(chat_key):
+            phase_scheduler.wake(chat_key)
+        return accepted
+
+    def _log_night_actions(self, game: GameState, actor_id: Optional[int] = None, action_type: Optional[str] = None) -> None:
+        """Пишет в журнал ночные действия так, как они записаны в игре.
+
+        С actor_id — одно только что принятое действие, без него — все действия
+        ночи (тестовая игра выставляет их сразу, минуя process_night_action).
+        """
+        if actor_id is not None:
+            recorded = {
+                "mafia_kill": game.mafia_votes,
+                "doctor_save": game.doctor_saves,
+                "commissioner_check": game.commissioner_checks,
+            }.get(action_type)
+            target = recorded.get(actor_id) if recorded is not None else game.butterfly_distract_target
+            self.log.night_action(game, actor_id, action_type, target)
+            return
+        for uid, target in game.mafia_votes.items():
+            self.log.night_action(game, uid, "mafia_kill", target)
+        for uid, target in game.doctor_saves.items():
+            self.log.night_action(game, uid, "doctor_save", target)
+        for uid, target in game.commissioner_checks.items():
+            self.log.night_action(game, uid, "commissioner_check", target)
+        if game.butterfly_distract_target is not None:
+            butterflies = game.get_players_by_role(PlayerRole.BUTTERFLY)
+            butterfly_id = butterflies[0].user_id if butterflies else 0
+            self.log.night_action(game, butterfly_id, "butterfly_distract", game.butterfly_distract_target)
+
+    def _record_death(self, game: GameState, player: Player, cause: int) -> None:
+        """Запоминает раунд гибели игрока (для статистики) и пишет смерть в журнал"""
+        player.died_round = game.current_round
+        if self.log is not None:
+            self.log.died(game, player.user_id, cause)
+
+    def _apply_night_action(self, chat_key: str, player_id: int, action_type: str, target_id: int = None) -> bool:
+        logger.debug("process_night_action: чат %s, игрок %s, действие %s, цель %s", chat_key, player_id, action_type, target_id)
         
         game = self.get_game(chat_key)
         if not game:
-            logger.error(f"process_night_action: игра не найдена для чата {chat_key}")
+            logger.error("process_night_action: игра не найдена для чата %s", chat_key)
             return False
         
-        logger.debug(f"process_night_action: фаза игры: {game.phase}")
+        logger.debug("process_night_action: фаза игры: %s", game.phase)
         if game.phase != GamePhase.NIGHT:
-            logger.warning(f"process_night_action: игра не в ночной фазе. Текущая фаза: {game.phase}")
+            logger.warning("process_night_action: игра не в ночной фазе. Текущая фаза: %s", game.phase)
             return False
         
         player = game.players.get(player_id)
         if not player:
-            logger.error(f"process_night_action: игрок {player_id} не найден в игре")
+            logger.error("process_night_action: игрок %s не найден в игре", player_id)
             return False
         
         if not player.is_alive:
-            logger.warning(f"process_night_action: игрок {player_id} мертв")
+            logger.warning("process_night_action: игрок %s мертв", player_id)
             return False
         
-        logger.debug(f"process_night_action: игрок {player_id} найден, роль: {player.role}, жив: {player.is_alive}")
+        logger.debug("process_night_action: игрок %s найден, роль: %s, жив: %s", player_id, player.role, player.is_alive)
         # Если игрок отвлечён бабочкой этой ночью — блокируем любое ночное действие
         if game.butterfly_distract_target is not None and player_id == game.butterfly_distract_target:
-            logger.warning(f"process_night_action: игрок {player_id} отвлечен бабочкой и не может совершить действие")
+            logger.warning("process_night_action: игрок %s отвлечен бабочкой и не может совершить действие", player_id)
             return False
         
         if action_type == "mafia_kill":
@@ -591,13 +839,13 @@ class GameManager:
             # Проверяем, что цель жива
             target_player = game.players.get(target_id)
             if target_player and not target_player.is_alive:
-                logger.warning(f"process_night_action: нельзя убить уже мертвого игрока {target_id}")
+                logger.warning("process_night_action: нельзя убить уже мертвого игрока %s", target_id)
                 return False
             if player.role == PlayerRole.MAFIA:
-                logger.debug(f"process_night_action: мафия {player_id} выбирает жертву {target_id}")
+                logger.debug("process_night_action: мафия %s выбирает жертву %s", player_id, target_id)
                 # Коллективное голосование мафии
                 game.mafia_votes[player_id] = target_id
-                logger.debug(f"process_night_action: мафия {player_id} проголосовала за {target_id}")
+                logger.debug("process_night_action: мафия %s проголосовала за %s", player_id, target_id)
                 
                 # Проверяем, все ли живые мафии проголосовали
                 alive_mafias = [p.user_id for p in game.get_players_by_role(PlayerRole.MAFIA)]
@@ -610,41 +858,41 @@ class GameManager:
                     if tally:
                         max_votes = max(tally.values())
                         top = [tid for tid, c in tally.items() if c == max_votes]
-                        chosen = random.choice(top)
+                        chosen = game.rng().choice(top)
                         game.night_kill_target = chosen
-                        logger.info(f"process_night_action: мафия выбрала коллективную цель: {chosen} (голоса: {tally})")
+                        logger.info("process_night_action: мафия выбрала коллективную цель: %s (голоса: %s)", chosen, tally)
                     else:
-                        logger.warning(f"process_night_action: нет голосов мафии для подсчета")
+                        logger.warning("process_night_action: нет голосов мафии для подсчета")
                 else:
                     # Не все мафии проголосовали
                     remaining = [mid for mid in alive_mafias if mid not in game.mafia_votes]
-                    logger.debug(f"process_night_action: мафия {player_id} проголосовала за {target_id}, ждем остальных: {remaining}")
+                    logger.debug("process_night_action: мафия %s проголосовала за %s, ждем остальных: %s", player_id, target_id, remaining)
                 
                 game.night_actions_completed.add("mafia")
                 return True
             else:
-                logger.warning(f"process_night_action: игрок {player_id} не мафия, роль: {player.role}")
+                logger.warning("process_night_action: игрок %s не мафия, роль: %s", player_id, player.role)
                 return False
         
         elif action_type == "doctor_save":
             if player.role != PlayerRole.DOCTOR:
-                logger.warning(f"process_night_action: игрок {player_id} не доктор, роль: {player.role}")
+                logger.warning("process_night_action: игрок %s не доктор, роль: %s", player_id, player.role)
                 return False
 
             # Пропуск лечения
             if target_id is None:
                 game.doctor_saves[player_id] = None
                 game.night_actions_completed.add("doctor")
-                logger.debug(f"process_night_action: доктор {player_id} пропускает лечение")
+                logger.debug("process_night_action: доктор %s пропускает лечение", player_id)
                 return True
 
             # Самолечение: разрешено один раз за игру
             if target_id == player_id:
                 if getattr(player, "doctor_self_save_used", False):
-                    logger.warning(f"process_night_action: доктор {player_id} уже использовал самолечение")
+                    logger.warning("process_night_action: доктор %s уже использовал самолечение", player_id)
                     return False
                 player.doctor_self_save_used = True
-                logger.debug(f"process_night_action: доктор {player_id} использует самолечение")
+                logger.debug("process_night_action: доктор %s использует самолечение", player_id)
                 game.doctor_saves[player_id] = target_id
                 game.night_actions_completed.add("doctor")
                 return True
@@ -652,15 +900,15 @@ class GameManager:
             # Лечение другого игрока: цель должна быть жива и не совпадать с прошлой целью подряд
             target_player = game.players.get(target_id)
             if target_player and not target_player.is_alive:
-                logger.warning(f"process_night_action: нельзя лечить уже мертвого игрока {target_id}")
+                logger.warning("process_night_action: нельзя лечить уже мертвого игрока %s", target_id)
                 return False
 
             last_saved_target = game.doctor_last_save_target.get(player_id)
             if last_saved_target is not None and target_id == last_saved_target:
-                logger.warning(f"process_night_action: доктор {player_id} не может два раза подряд лечить одну и ту же цель {target_id}")
+                logger.warning("process_night_action: доктор %s не может два раза подряд лечить одну и ту же цель %s", player_id, target_id)
                 return False
 
-            logger.debug(f"process_night_action: доктор {player_id} выбирает пациента {target_id}")
+            logger.debug("process_night_action: доктор %s выбирает пациента %s", player_id, target_id)
             game.doctor_saves[player_id] = target_id
             game.doctor_last_save_target[player_id] = target_id
             game.night_actions_completed.add("doctor")
@@ -674,22 +922,22 @@ class GameManager:
             if target_id is not None:
                 target_player = game.players.get(target_id)
                 if target_player and not target_player.is_alive:
-                    logger.warning(f"process_night_action: нельзя отвлекать уже мертвого игрока {target_id}")
+                    logger.warning("process_night_action: нельзя отвлекать уже мертвого игрока %s", target_id)
                     return False
             if player.role == PlayerRole.BUTTERFLY:
-                logger.debug(f"process_night_action: ночная бабочка {player_id} отвлекает {target_id}")
+                logger.debug("process_night_action: ночная бабочка %s отвлекает %s", player_id, target_id)
                 game.butterfly_distract_target = target_id
                 # Добавляем игрока в список отвлеченных (если цель была выбрана)
                 if target_id is not None:
                     try:
                         game.butterfly_distracted_players.add(target_id)
-                        logger.debug(f"process_night_action: игрок {target_id} добавлен в список отвлеченных бабочкой")
+                        logger.debug("process_night_action: игрок %s добавлен в список отвлеченных бабочкой", target_id)
                     except Exception as e:
-                        logger.exception(f"process_night_action: ошибка добавления в список отвлеченных: {e}")
+                        logger.exception("process_night_action: ошибка добавления в список отвлеченных: %s", e)
                 game.night_actions_completed.add("butterfly")
                 return True
             else:
-                logger.warning(f"process_night_action: игрок {player_id} не ночная бабочка, роль: {player.role}")
+                logger.warning("process_night_action: игрок %s не ночная бабочка, роль: %s", player_id, player.role)
                 return False
         
         elif action_type == "commissioner_check":
@@ -699,66 +947,74 @@ class GameManager:
             # Проверяем, что цель жива
             target_player = game.players.get(target_id)
             if target_player and not target_player.is_alive:
-                logger.warning(f"process_night_action: нельзя проверять уже мертвого игрока {target_id}")
+                logger.warning("process_night_action: нельзя проверять уже мертвого игрока %s", target_id)
                 return False
             if player.role == PlayerRole.COMMISSIONER:
                 # Проверяем, что комиссар еще не делал проверку этой ночью
                 if player_id in game.commissioner_checks:
-                    logger.warning(f"process_night_action: комиссар {player_id} уже делал проверку этой ночью")
+                    logger.warning("process_night_action: комиссар %s уже делал проверку этой ночью", player_id)
                     return False
                 # Проверяем, что цель еще не проверялась этой ночью
                 if target_id in game.commissioner_checks.values():
-                    logger.warning(f"process_night_action: игрок {target_id} уже проверялся комиссаром этой ночью")
+                    logger.warning("process_night_action: игрок %s уже проверялся комиссаром этой ночью", target_id)
                     return False
 
                 target_player = game.players.get(target_id)
                 if target_player:
-                    logger.debug(f"process_night_action: комиссар {player_id} проверяет {target_id}")
+                    logger.debug("process_night_action: комиссар %s проверяет %s", player_id, target_id)
                     game.commissioner_checks[player_id] = target_id
                     game.commissioner_check_results[player_id] = (target_player.role == PlayerRole.MAFIA)
                     game.night_actions_completed.add("commissioner")
                     return True
                 else:
-                    logger.error(f"process_night_action: цель {target_id} не найдена для проверки комиссаром")
+                    logger.error("process_night_action: цель %s не найдена для проверки комиссаром", target_id)
             else:
-                logger.warning(f"process_night_action: игрок {player_id} не комиссар, роль: {player.role}")
+                logger.warning("process_night_action: игрок %s не комиссар, роль: %s", player_id, player.role)
                 return False
         
-        logger.warning(f"process_night_action: действие {action_type} не выполнено для игрока {player_id}")
+        logger.warning("process_night_action: действие %s не выполнено для игрока %s", action_type, player_id)
         return False
     
     def all_night_actions_completed(self, chat_key: str) -> bool:
         """Проверяет, завершены ли все ночные действия"""
-        logger.debug(f"all_night_actions_completed: проверка для чата {chat_key}")
+        logger.debug("all_night_actions_completed: проверка для чата %s", chat_key)
         
         game = self.get_game(chat_key)
         if not game:
             logger.error("all_night_actions_completed: игра не найдена")
             return False
         
-        required_actions = set()
-        for player in game.players.values():
-            if player.is_alive:
-                if player.role == PlayerRole.MAFIA:
-                    required_actions.add("mafia")
-                elif player.role == PlayerRole.DOCTOR:
-                    required_actions.add("doctor")
-                elif player.role == PlayerRole.COMMISSIONER:
-                    required_actions.add("commissioner")
-                elif player.role == PlayerRole.BUTTERFLY:
-                    required_actions.add("butterfly")
-        
-        logger.debug(f"all_night_actions_completed: требуемые действия: {required_actions}")
-        logger.debug(f"all_night_actions_completed: завершенные действия: {game.night_actions_completed}")
+        required_actions = {
+            NIGHT_ACTION_BY_ROLE[role] for role in game.players.alive_roles() if role in NIGHT_ACTION_BY_ROLE
+        }
+        
+        logger.debug("all_night_actions_completed: требуемые действия: %s", required_actions)
+        logger.debug("all_night_actions_completed: завершенные действия: %s", game.night_actions_completed)
         
         result = required_actions.issubset(game.night_actions_completed)
-        logger.debug(f"all_night_actions_completed: результат: {result}")
+        logger.debug("all_night_actions_completed: результат: %s", result)
         
         return result
     
+    def _clear_night_actions(self, game: GameState) -> None:
+        """Очищает ночные действия перед днём (так же их сбрасывает gamelog.replay)"""
+        game.doctor_saves.clear()
+        game.butterfly_distract_target = None
+        game.commissioner_checks.clear()
+        game.commissioner_check_results.clear()
+        game.night_kill_target = None
+        game.mafia_votes.clear()  # Очищаем голоса мафии для следующей ночи
+        game.night_actions_completed.clear()
+        game.all_actions_notified = False
+        # Сбрасываем маркер разосланных ночных клавиатур, чтобы в следующую ночь снова отправить ЛС
+        try:
+            game.night_prompts_sent = False
+        except Exception:
+            pass
+
     def process_night_results(self, chat_key: str) -> Tuple[str, Optional[int]]:
         """Обрабатывает результаты ночи и возвращает сообщение и ID убитого игрока"""
-        logger.info(f"process_night_results: обработка результатов ночи для чата {chat_key}")
+        logger.info("process_night_results: обработка результатов ночи для чата %s", chat_key)
         
         game = self.get_game(chat_key)
         if not game:
@@ -774,7 +1030,7 @@ class GameManager:
             if target_player:
                 is_mafia = target_player.role == PlayerRole.MAFIA
                 game.last_commissioner_checks.append((commissioner_id, target_id, is_mafia))
-                logger.info(f"process_night_results: комиссар {commissioner_id} проверил игрока {target_id} - {'мафия' if is_mafia else 'не мафия'}")
+                logger.info("process_night_results: комиссар %s проверил игрока %s - %s", commissioner_id, target_id, 'мафия' if is_mafia else 'не мафия')
         
         # Обрабатываем убийство мафии
         killed_player = None
@@ -789,20 +1045,20 @@ class GameManager:
                 for doctor_id, save_target in game.doctor_saves.items():
                     if save_target == target_id:
                         was_saved = True
-                        logger.info(f"process_night_results: игрок {target_id} спасен доктором {doctor_id}")
+                        logger.info("process_night_results: игрок %s спасен доктором %s", target_id, doctor_id)
                         break
                 
                 if not was_saved:
                     target_player.is_alive = False
                     killed_player = target_player
-                    logger.info(f"process_night_results: игрок {target_id} ({target_player.first_name}) убит мафией")
+                    logger.info("process_night_results: игрок %s (%s) убит мафией", target_id, target_player.first_name)
                     # На случай смерти мафии — обновляем маппинг мафии
                     self._refresh_mafia_mapping(chat_key)
                 else:
-                    logger.info(f"process_night_results: игрок {target_id} спасен от убийства")
+                    logger.info("process_night_results: игрок %s спасен от убийства", target_id)
         
         # Если цель не была выбрана, но есть голоса мафии - обрабатываем их
-        elif game.mafia_votes and any(p.role == PlayerRole.MAFIA for p in game.get_alive_players()):
+        elif game.mafia_votes and game.count_alive_by_role(PlayerRole.MAFIA) > 0:
             # Есть голоса мафии, но итоговая цель не зафиксирована — считаем большинство
             vote_tally: Dict[int, int] = {}
             for tid in game.mafia_votes.values():
@@ -811,7 +1067,7 @@ class GameManager:
             if vote_tally:
                 max_votes = max(vote_tally.values())
                 top_targets = [tid for tid, cnt in vote_tally.items() if cnt == max_votes]
-                chosen_target = random.choice(top_targets)
+                chosen_target = game.rng().choice(top_targets)
                 target_player = game.players.get(chosen_target)
                 
                 if target_player and target_player.is_alive:
@@ -820,7 +1076,7 @@ class GameManager:
                     for doctor_id, save_target in game.doctor_saves.items():
                         if save_target == chosen_target:
                             was_saved = True
-                            logger.info(f"process_night_results: игрок {chosen_target} спасен доктором {doctor_id}")
+                            logger.info("process_night_results: игрок %s спасен доктором %s", chosen_target, doctor_id)
                             break
                     
                     if not was_saved:
@@ -829,20 +1085,20 @@ class GameManager:
                         game.night_kill_target = chosen_target
                         
                         if len(top_targets) > 1:
-                            logger.info(f"process_night_results: ничья среди целей мафии {top_targets}, случайно убит {chosen_target} ({target_player.first_name})")
+                            logger.info("process_night_results: ничья среди целей мафии %s, случайно убит %s (%s)", top_targets, chosen_target, target_player.first_name)
                         else:
-                            logger.info(f"process_night_results: игрок {chosen_target} ({target_player.first_name}) убит мафией по большинству голосов")
+                            logger.info("process_night_results: игрок %s (%s) убит мафией по большинству голосов", chosen_target, target_player.first_name)
                         
                         # На случай смерти мафии — обновляем маппинг мафии
                         self._refresh_mafia_mapping(chat_key)
                     else:
-                        logger.info(f"process_night_results: игрок {chosen_target} спасен от убийства")
+                        logger.info("process_night_results: игрок %s спасен от убийства", chosen_target)
                         game.night_kill_target = chosen_target
             else:
                 # Мафия голосовала, но голоса не засчитаны - выбираем случайную цель
                 alive_players = [p for p in game.get_alive_players() if p.role != PlayerRole.MAFIA]
                 if alive_players:
-                    chosen_target = random.choice(alive_players).user_id
+                    chosen_target = game.rng().choice(alive_players).user_id
                     target_player = game.players.get(chosen_target)
                     
                     if target_player and target_player.is_alive:
@@ -851,19 +1107,19 @@ class GameManager:
                         for doctor_id, save_target in game.doctor_saves.items():
                             if save_target == chosen_target:
                                 was_saved = True
-                                logger.info(f"process_night_results: игрок {chosen_target} спасен доктором {doctor_id}")
+                                logger.info("process_night_results: игрок %s спасен доктором %s", chosen_target, doctor_id)
                                 break
                         
                         if not was_saved:
                             target_player.is_alive = False
                             killed_player = target_player
                             game.night_kill_target = chosen_target
-                            logger.info(f"process_night_results: игрок {chosen_target} ({target_player.first_name}) убит мафией (случайный выбор)")
+                            logger.info("process_night_results: игрок %s (%s) убит мафией (случайный выбор)", chosen_target, target_player.first_name)
                             
                             # На случай смерти мафии — обновляем маппинг мафии
                             self._refresh_mafia_mapping(chat_key)
                         else:
-                            logger.info(f"process_night_results: игрок {chosen_target} спасен от убийства")
+                            logger.info("process_night_results: игрок %s спасен от убийства", chosen_target)
                             game.night_kill_target = chosen_target
         
         # Формируем сообщение о результатах ночи
@@ -881,7 +1137,7 @@ class GameManager:
                 f"🕯️ {killed_player.first_name} погас как свеча. Мафия торжествует.",
                 f"⚡ {killed_player.first_name} получил смертельный удар. Ночь была жестокой."
             ]
-            kill_msg = random.choice(kill_messages)
+            kill_msg = game.rng().choice(kill_messages)
             role_name = {
                 PlayerRole.MAFIA: "Мафия",
                 PlayerRole.CIVILIAN: "Мирный житель", 
@@ -890,7 +1146,7 @@ class GameManager:
                 PlayerRole.BUTTERFLY: "Ночная бабочка"
             }.get(killed_player.role, "Неизвестная роль")
             summary_lines.append(f"{kill_msg}\nОн был {role_name}!")
-        elif any(p.role == PlayerRole.MAFIA for p in game.get_alive_players()):
+        elif game.count_alive_by_role(PlayerRole.MAFIA) > 0:
             # Мафия есть
             if game.mafia_votes:
                 # Мафия голосовала — итог (убийство по большинству или случайно среди лидеров)
@@ -900,7 +1156,7 @@ class GameManager:
                 # Мафия не голосовала вообще — выбираем случайную цель
                 alive_players = [p for p in game.get_alive_players() if p.role != PlayerRole.MAFIA]
                 if alive_players:
-                    chosen_target = random.choice(alive_players).user_id
+                    chosen_target = game.rng().choice(alive_players).user_id
                     target_player = game.players.get(chosen_target)
                     
                     if target_player and target_player.is_alive:
@@ -909,19 +1165,19 @@ class GameManager:
                         for doctor_id, save_target in game.doctor_saves.items():
                             if save_target == chosen_target:
                                 was_saved = True
-                                logger.info(f"process_night_results: игрок {chosen_target} спасен доктором {doctor_id}")
+                                logger.info("process_night_results: игрок %s спасен доктором %s", chosen_target, doctor_id)
                                 break
                         
                         if not was_saved:
                             target_player.is_alive = False
                             killed_player = target_player
                             game.night_kill_target = chosen_target
-                            logger.info(f"process_night_results: игрок {chosen_target} ({target_player.first_name}) убит мафией (автоматический выбор)")
+                            logger.info("process_night_results: игрок %s (%s) убит мафией (автоматический выбор)", chosen_target, target_player.first_name)
                             
                             # На случай смерти мафии — обновляем маппинг мафии
                             self._refresh_mafia_mapping(chat_key)
                         else:
-                            logger.info(f"process_night_results: игрок {chosen_target} спасен от убийства")
+                            logger.info("process_night_results: игрок %s спасен от убийства", chosen_target)
                             game.night_kill_target = chosen_target
                 else:
                     # Нет мирных игроков для убийства
@@ -929,6 +1185,8 @@ class GameManager:
         else:
             # Мафии нет — действительно спокойная ночь
             summary_lines.append("🌅 Ночь прошла спокойно. Никто не пострадал.")
+        if killed_player:
+            self._record_death(game, killed_player, DIED_NIGHT)
         
         # Результаты доктора
         doctor_saves = [save for save in game.doctor_saves.values() if save is not None]
@@ -955,31 +1213,19 @@ class GameManager:
         # Объединяем все результаты
         full_message = "\n\n".join(summary_lines)
         
-        # Очищаем ночные действия
-        game.doctor_saves.clear()
-        game.butterfly_distract_target = None
-        game.commissioner_checks.clear()
-        game.commissioner_check_results.clear()
-        game.night_kill_target = None
-        game.mafia_votes.clear()  # Очищаем голоса мафии для следующей ночи
-        game.night_actions_completed.clear()
-        game.all_actions_notified = False
-        # Сбрасываем маркер разосланных ночных клавиатур, чтобы в следующую ночь снова отправить ЛС
-        try:
-            game.night_prompts_sent = False
-        except Exception:
-            pass
+        self._clear_night_actions(game)
         
         # Переходим к дневной фазе
         game.phase = GamePhase.DAY
+        self.touch(chat_key)
         
-        logger.info(f"process_night_results: ночная фаза завершена, переход к дневной фазе в чате {chat_key}")
+        logger.info("process_night_results: ночная фаза завершена, переход к дневной фазе в чате %s", chat_key)
         
         return full_message, killed_player.user_id if killed_player else None
     
     def start_voting(self, chat_key: str) -> bool:
         """Начинает голосование"""
-        logger.debug(f"start_voting: попытка начать голосование для чата {chat_key}")
+        logger.debug("start_voting: попытка начать голосование для чата %s", chat_key)
         
         game = self.get_game(chat_key)
         if not game:
@@ -987,7 +1233,7 @@ class GameManager:
             return False
         
         if game.phase != GamePhase.DAY:
-            logger.warning(f"start_voting: игра не в дневной фазе, текущая фаза: {game.phase}")
+            logger.warning("start_voting: игра не в дневной фазе, текущая фаза: %s", game.phase)
             return False
         
         logger.info("start_voting: начинаем голосование")
@@ -1010,15 +1256,16 @@ class GameManager:
             if distracted_player and distracted_player.is_alive:
                 distracted_player.has_voted = True
                 distracted_player.vote_target = None
-                logger.info(f"start_voting: игрок {distracted_id} не может голосовать (отвлечен бабочкой прошлой ночью)")
+                logger.info("start_voting: игрок %s не может голосовать (отвлечен бабочкой прошлой ночью)", distracted_id)
         
-        logger.debug(f"start_voting: фаза изменена на {game.phase}, голоса сброшены")
+        self.touch(chat_key)
+        logger.debug("start_voting: фаза изменена на %s, голоса сброшены", game.phase)
         
         return True
     
     def process_vote(self, chat_key: str, voter_id: int, target_id: int) -> bool:
         """Обрабатывает голос игрока"""
-        logger.debug(f"process_vote: попытка обработать голос игрока {voter_id} за {target_id} в чате {chat_key}")
+        logger.debug("process_vote: попытка обработать голос игрока %s за %s в чате %s", voter_id, target_id, chat_key)
         
         game = self.get_game(chat_key)
         if not game:
@@ -1026,32 +1273,32 @@ class GameManager:
             return False
         
         if game.phase != GamePhase.VOTING:
-            logger.warning(f"process_vote: игра не в фазе голосования, текущая фаза: {game.phase}")
+            logger.warning("process_vote: игра не в фазе голосования, текущая фаза: %s", game.phase)
             return False
         
         voter = game.players.get(voter_id)
         target = game.players.get(target_id)
         
         if not voter:
-            logger.error(f"process_vote: голосующий {voter_id} не найден")
+            logger.error("process_vote: голосующий %s не найден", voter_id)
             return False
         
         if not target:
-            logger.error(f"process_vote: цель {target_id} не найдена")
+            logger.error("process_vote: цель %s не найдена", target_id)
             return False
         
         if not voter.is_alive:
-            logger.warning(f"process_vote: голосующий {voter_id} мертв")
+            logger.warning("process_vote: голосующий %s мертв", voter_id)
             return False
         
         if not target.is_alive:
-            logger.warning(f"process_vote: цель {target_id} мертва")
+            logger.warning("process_vote: цель %s мертва", target_id)
             return False
         
         # Переголосование отключено: никаких дополнительных ограничений по целям
         
         if voter.has_voted:
-            logger.warning(f"process_vote: игрок {voter_id} уже проголосовал")
+            logger.warning("process_vote: игрок %s уже проголосовал", voter_id)
             return False
 
         # Нельзя голосовать за себя
@@ -1063,19 +1310,35 @@ class GameManager:
         game.votes[voter_id] = target_id
         voter.has_voted = True
         voter.vote_target = target_id
+        if self.log is not None:
+            self.log.vote(game, voter_id, target_id)
         
-        logger.debug(f"process_vote: голос игрока {voter_id} за {target_id} записан")
+        self.touch(chat_key)
+        logger.debug("process_vote: голос игрока %s за %s записан", voter_id, target_id)
+        
+        # Проголосовали все — будим автопилот, чтобы завершить голосование досрочно
+        if self.all_votes_received(chat_key):
+            phase_scheduler.wake(chat_key)
         
         return True
     
+    def all_votes_received(self, chat_key: str) -> bool:
+        """Проверяет, сделали ли выбор все живые игроки (голос или пропуск)"""
+        game = self.get_game(chat_key)
+        if not game or game.phase != GamePhase.VOTING:
+            return False
+        eligible = game.get_alive_players()
+        return bool(eligible) and all(p.has_voted for p in eligible)
+    
     def get_voting_results(self, chat_key: str) -> Tuple[str, int]:
         """Подсчитывает результаты голосования и возвращает сообщение и ID казненного игрока"""
-        logger.info(f"get_voting_results: подсчет результатов голосования для чата {chat_key}")
+        logger.info("get_voting_results: подсчет результатов голосования для чата %s", chat_key)
         
         game = self.get_game(chat_key)
         if not game:
             logger.error("get_voting_results: игра не найдена")
             return "Ошибка: игра не найдена", 0
+        self.touch(chat_key)
         
         # Подсчитываем голоса
         vote_counts = {}
@@ -1083,7 +1346,7 @@ class GameManager:
             vote_counts[target_id] = vote_counts.get(target_id, 0) + 1
         
         if not vote_counts:
-            logger.info(f"get_voting_results: никто не проголосовал в чате {chat_key}")
+            logger.info("get_voting_results: никто не проголосовал в чате %s", chat_key)
             # Сбрасываем состояние голосования и переводим игру в ночь
             game.votes.clear()
             for player in game.players.values():
@@ -1102,17 +1365,18 @@ class GameManager:
         
         if len(most_voted) > 1:
             # Ничья — выбираем случайно одного казнимого, без переголосования
-            executed_id = random.choice(most_voted)
+            executed_id = game.rng().choice(most_voted)
             executed_player = game.players.get(executed_id)
             if executed_player:
                 executed_player.is_alive = False
+                self._record_death(game, executed_player, DIED_VOTE)
                 tied_names = []
                 for pid in most_voted:
                     pl = game.players.get(pid)
                     if pl:
                         tied_names.append(pl.first_name)
                 logger.info(
-                    f"get_voting_results: ничья между {most_voted} ({', '.join(tied_names)}), случайно казнен {executed_id} в чате {chat_key}"
+                    "get_voting_results: ничья между %s (%s), случайно казнен %s в чате %s", most_voted, ', '.join(tied_names), executed_id, chat_key
                 )
                 execution_messages = [
                     f"⚖️ {executed_player.first_name if executed_player else executed_id} приговорен случайным выбором при ничьей.",
@@ -1127,7 +1391,7 @@ class GameManager:
                     PlayerRole.COMMISSIONER: "Комиссар",
                     PlayerRole.BUTTERFLY: "Ночная бабочка"
                 }.get(executed_player.role if executed_player else None, "Неизвестная роль")
-                message = f"{random.choice(execution_messages)}\nОн был {role_name}!"
+                message = f"{game.rng().choice(execution_messages)}\nОн был {role_name}!"
                 # Сброс состояния голосования и переход в ночь
                 try:
                     game.revote_active = False
@@ -1149,11 +1413,12 @@ class GameManager:
         executed_id = most_voted[0]
         executed_player = game.players.get(executed_id)
         if not executed_player:
-            logger.error(f"get_voting_results: игрок {executed_id} не найден в игре")
+            logger.error("get_voting_results: игрок %s не найден в игре", executed_id)
             return "Ошибка: игрок не найден", 0
 
         # Помечаем игрока мёртвым
         executed_player.is_alive = False
+        self._record_death(game, executed_player, DIED_VOTE)
         
         # Случайные сообщения о казни
         execution_messages = [
@@ -1175,8 +1440,8 @@ class GameManager:
             PlayerRole.BUTTERFLY: "Ночная бабочка"
         }.get(executed_player.role, "Неизвестная роль")
         
-        message = f"{random.choice(execution_messages)}\nОн был {role_name}!"
-        logger.info(f"get_voting_results: игрок {executed_id} ({executed_player.first_name}) казнен в чате {chat_key}")
+        message = f"{game.rng().choice(execution_messages)}\nОн был {role_name}!"
+        logger.info("get_voting_results: игрок %s (%s) казнен в чате %s", executed_id, executed_player.first_name, chat_key)
 
         # Сбрасываем состояние голосования/переголосования и переводим игру в ночь
         try:
@@ -1199,7 +1464,7 @@ class GameManager:
     
     def check_game_over(self, chat_key: str) -> Tuple[bool, str]:
         """Проверяет, закончилась ли игра"""
-        logger.debug(f"check_game_over: проверка окончания игры для чата {chat_key}")
+        logger.debug("check_game_over: проверка окончания игры для чата %s", chat_key)
         
         game = self.get_game(chat_key)
         if not game:
@@ -1207,10 +1472,17 @@ class GameManager:
             return False, ""
         
         is_over, winner = game.is_game_over()
-        logger.debug(f"check_game_over: игра окончена: {is_over}, победитель: {winner}")
+        logger.debug("check_game_over: игра окончена: %s, победитель: %s", is_over, winner)
         
         if is_over:
-            game.phase = GamePhase.ENDED
+            # Итог записываем один раз, даже если окончание проверят повторно
+            if game.phase != GamePhase.ENDED:
+                game.phase = GamePhase.ENDED
+                if self.log is not None:
+                    self.log.game_over(game, winner)
+                if self.stats is not None and not game.is_test_game:
+                    self.stats.record(game, winner)
+            self.touch(chat_key)
             if winner == "mafia":
                 message = "Мафия захватила город. Теперь тут правим мы!"
                 # Раскрываем состав мафии
@@ -1223,22 +1495,29 @@ class GameManager:
             else:
                 message = "Город очистился от мафии. Браво, синьоры!"
             
-            logger.info(f"check_game_over: игра завершена, сообщение: {message}")
+            logger.info("check_game_over: игра завершена, сообщение: %s", message)
             return True, message
         
         return False, ""
     
     def end_game(self, chat_key: str) -> bool:
         """Принудительно завершает игру"""
-        logger.debug(f"end_game: попытка завершить игру для чата {chat_key}")
+        logger.debug("end_game: попытка завершить игру для чата %s", chat_key)
         
         if chat_key in self.active_games:
-            del self.active_games[chat_key]
-            logger.info(f"end_game: игра для чата {chat_key} завершена")
+            game = self.active_games.pop(chat_key)
+            self._drop_token(game)
+            if self.log is not None:
+                self.log.closed(game)
+            # Отсутствие игры при сохранении превращается в запись об удалении
+            self.touch(chat_key)
+            self._revisions.pop(chat_key, None)
+            logger.info("end_game: игра для чата %s завершена", chat_key)
             return True
         else:
-            logger.warning(f"end_game: игра для чата {chat_key} не найдена")
+            logger.warning("end_game: игра для чата %s не найдена", chat_key)
             return False
 
 # Глобальный экземпляр менеджера игр
 game_manager = GameManager()
+games_active.set_function(game_manager.count_by_phase)
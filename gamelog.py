@@ -0,0 +1,423 @@
+"""Журнал событий игр и его проигрывание.
+
+Каждое изменение игры, важное для её хода, — вход и выход игрока, раздача
+ролей, смена фазы, ночное действие, голос, смерть, итог — пишется типизированным
+событием в append-only журнал этой игры. Событие — несколько байт struct
+в bytearray игры: на горячем пути нет ни JSON, ни ввода-вывода. Накопленные
+куски забирает StatePersister и дописывает в SQLite (таблица game_events)
+той же транзакцией, что и состояние игр.
+
+replay() собирает GameState из журнала на любом событии: состав, роли, живые,
+фаза и раунд, ночные действия и голоса текущей фазы. Служебное состояние
+(сообщения, флаги рассылок, таймеры) в журнал не попадает. Игру в журнале
+определяют chat_key и зерно жребия rng_seed: оба задаются при создании игры
+и не меняются, в том числе после перезапуска.
+
+Сверка журнала с настоящими играми и замер скорости проигрывания:
+
+    BOT_TOKEN=1:x python gamelog.py --games 20000
+    BOT_TOKEN=1:x python gamelog.py --db mafia_state.db --chat -1001234567890_39431
+"""
+import argparse
+import itertools
+import struct
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from models import GamePhase, GameState, Player, PlayerRole
+
+# Типы событий (первый байт записи)
+CREATED = 1
+JOINED = 2
+LEFT = 3
+ROLE = 4
+PHASE = 5
+NIGHT_ACTION = 6
+VOTE = 7
+DIED = 8
+GAME_OVER = 9
+
+EVENT_NAMES = {
+    CREATED: "created", JOINED: "joined", LEFT: "left", ROLE: "role", PHASE: "phase",
+    NIGHT_ACTION: "night_action", VOTE: "vote", DIED: "died", GAME_OVER: "game_over",
+}
+
+# Ночные действия: код в журнале <-> action_type GameManager.process_night_action
+NIGHT_ACTIONS = ("mafia_kill", "doctor_save", "commissioner_check", "butterfly_distract")
+_ACTION_CODES = {name: code for code, name in enumerate(NIGHT_ACTIONS)}
+
+# Причины смерти
+DIED_NIGHT = 0
+DIED_VOTE = 1
+DIED_LEFT = 2  # выбыл посреди игры (бот не может написать ему в ЛС)
+
+# Итог игры
+WINNERS = ("civilians", "mafia")
+
+_ROLES = tuple(PlayerRole)
+_ROLE_CODES = {role: code for code, role in enumerate(_ROLES)}
+_PHASES = tuple(GamePhase)
+_PHASE_CODES = {phase: code for code, phase in enumerate(_PHASES)}
+
+# Пустая цель (пропуск, лечение без цели): id пользователей сюда не попадают
+_NO_TARGET = -(1 << 63)
+
+_CREATED = struct.Struct("<BQ?")
+_JOINED = struct.Struct("<BqHH")
+_LEFT = struct.Struct("<Bq")
+_ROLE = struct.Struct("<BqB")
+_PHASE = struct.Struct("<BBH")
+_NIGHT_ACTION = struct.Struct("<BqBq")
+_VOTE = struct.Struct("<Bqq")
+_DIED = struct.Struct("<BqB")
+_GAME_OVER = struct.Struct("<BB")
+
+
+def _target(value: Optional[int]) -> int:
+    return _NO_TARGET if value is None else value
+
+
+class _GameEvents:
+    """Незаписанный хвост журнала одной игры и последняя записанная фаза"""
+
+    __slots__ = ("seed", "data", "phase", "round", "closed")
+
+    def __init__(self, seed: int, phase: GamePhase, round_: int):
+        self.seed = seed
+        self.data = bytearray()
+        self.phase = phase
+        self.round = round_
+        self.closed = False
+
+
+class GameLog:
+    """Буфер журналов событий всех игр процесса.
+
+    Методы вызывает GameManager в тот момент, когда меняет игру. Смена фазы
+    ловится сверкой с последней записанной фазой перед каждым событием и при
+    GameManager.touch() — так в журнал попадают и переходы, которые делают
+    хендлеры и автопилот напрямую.
+    """
+
+    def __init__(self):
+        self._games: Dict[str, _GameEvents] = {}
+        # Незаписанные куски игр, которых в буфере уже нет (игру в чате заменили новой)
+        self._retired: List[Tuple[str, int, bytes]] = []
+
+    def _start(self, game: GameState) -> _GameEvents:
+        previous = self._games.get(game.chat_id)
+        if previous is not None and previous.data:
+            self._retired.append((game.chat_id, previous.seed, bytes(previous.data)))
+        events = self._games[game.chat_id] = _GameEvents(game.rng_seed, game.phase, game.current_round)
+        return events
+
+    def _events(self, game: GameState) -> _GameEvents:
+        events = self._games.get(game.chat_id)
+        if events is None or events.seed != game.rng_seed:
+            # Игра, восстановленная после перезапуска: её начало уже в базе
+            events = self._start(game)
+        elif events.phase is not game.phase or events.round != game.current_round:
+            events.phase = game.phase
+            events.round = game.current_round
+            events.data += _PHASE.pack(PHASE, _PHASE_CODES[game.phase], game.current_round)
+        return events
+
+    def sync(self, game: GameState) -> None:
+        """Записывает смену фазы или раунда, если она ещё не записана"""
+        self._events(game)
+
+    def created(self, game: GameState) -> None:
+        events = self._start(game)
+        events.data += _CREATED.pack(CREATED, game.rng_seed, game.is_test_game)
+
+    def joined(self, game: GameState, player: Player) -> None:
+        username = (player.username or "").encode("utf-8")
+        first_name = (player.first_name or "").encode("utf-8")
+        events = self._events(game)
+        events.data += _JOINED.pack(JOINED, player.user_id, len(username), len(first_name))
+        events.data += username
+        events.data += first_name
+
+    def left(self, game: GameState, user_id: int) -> None:
+        self._events(game).data += _LEFT.pack(LEFT, user_id)
+
+    def role(self, game: GameState, user_id: int, role: PlayerRole) -> None:
+        self._events(game).data += _ROLE.pack(ROLE, user_id, _ROLE_CODES[role])
+
+    def night_action(self, game: GameState, actor_id: int, action_type: str, target_id: Optional[int]) -> None:
+        self._events(game).data += _NIGHT_ACTION.pack(NIGHT_ACTION, actor_id, _ACTION_CODES[action_type], _target(target_id))
+
+    def vote(self, game: GameState, voter_id: int, target_id: Optional[int]) -> None:
+        """Голос; target_id=None — пропуск голоса"""
+        self._events(game).data += _VOTE.pack(VOTE, voter_id, _target(target_id))
+
+    def died(self, game: GameState, user_id: int, cause: int) -> None:
+        self._events(game).data += _DIED.pack(DIED, user_id, cause)
+
+    def game_over(self, game: GameState, winner: str) -> None:
+        self._events(game).data += _GAME_OVER.pack(GAME_OVER, WINNERS.index(winner))
+
+    def closed(self, game: GameState) -> None:
+        """Игра удалена из GameManager: её журнал уйдёт при следующем drain()"""
+        events = self._games.get(game.chat_id)
+        if events is not None and events.seed == game.rng_seed:
+            events.closed = True
+
+    def drain(self) -> List[Tuple[str, int, bytes]]:
+        """Забирает накопленные куски журналов: (chat_key, rng_seed, байты)"""
+        chunks, self._retired = self._retired, []
+        for chat_key, events in list(self._games.items()):
+            if events.data:
+                chunks.append((chat_key, events.seed, bytes(events.data)))
+                events.data = bytearray()
+            if events.closed:
+                del self._games[chat_key]
+        return chunks
+
+    def requeue(self, chunks: List[Tuple[str, int, bytes]]) -> None:
+        """Возвращает куски, которые не удалось записать, в начало журналов"""
+        retired = []
+        for chat_key, seed, data in chunks:
+            events = self._games.get(chat_key)
+            if events is not None and events.seed == seed:
+                events.data[:0] = data
+            else:
+                retired.append((chat_key, seed, data))
+        self._retired[:0] = retired
+
+    def pending_bytes(self) -> int:
+        retired = sum(len(data) for _, _, data in self._retired)
+        return retired + sum(len(events.data) for events in self._games.values())
+
+
+def iter_events(data: bytes) -> Iterator[Tuple]:
+    """Разбирает журнал игры: кортежи (тип события, поля...)"""
+    offset = 0
+    end = len(data)
+    while offset < end:
+        kind = data[offset]
+        if kind == JOINED:
+            _, user_id, username_len, first_name_len = _JOINED.unpack_from(data, offset)
+            offset += _JOINED.size
+            username = data[offset:offset + username_len].decode("utf-8")
+            offset += username_len
+            first_name = data[offset:offset + first_name_len].decode("utf-8")
+            offset += first_name_len
+            yield JOINED, user_id, username, first_name
+            continue
+        layout = _LAYOUTS.get(kind)
+        if layout is None:
+            raise ValueError(f"неизвестный тип события {kind} на смещении {offset}")
+        yield layout.unpack_from(data, offset)
+        offset += layout.size
+
+
+_LAYOUTS = {
+    CREATED: _CREATED, LEFT: _LEFT, ROLE: _ROLE, PHASE: _PHASE, NIGHT_ACTION: _NIGHT_ACTION,
+    VOTE: _VOTE, DIED: _DIED, GAME_OVER: _GAME_OVER,
+}
+
+
+def _drop_night_actions(game: GameState, player: Player) -> None:
+    """Убирает несделанные ночные ходы выбывшего игрока (как GameManager.eliminate_players)"""
+    game.mafia_votes.pop(player.user_id, None)
+    game.doctor_saves.pop(player.user_id, None)
+    game.commissioner_checks.pop(player.user_id, None)
+    if player.role == PlayerRole.BUTTERFLY:
+        game.butterfly_distract_target = None
+
+
+def replay(data: bytes, chat_key: str = "", upto: Optional[int] = None) -> GameState:
+    """Собирает состояние игры из журнала; upto — сколько событий применить"""
+    game = GameState(chat_id=chat_key)
+    players = game.players
+    for event in itertools.islice(iter_events(data), upto):
+        kind = event[0]
+        if kind == NIGHT_ACTION:
+            _, actor_id, action, target_id = event
+            target = None if target_id == _NO_TARGET else target_id
+            if action == 0:
+                game.mafia_votes[actor_id] = target
+            elif action == 1:
+                game.doctor_saves[actor_id] = target
+            elif action == 2:
+                game.commissioner_checks[actor_id] = target
+            else:
+                game.butterfly_distract_target = target
+        elif kind == VOTE:
+            _, voter_id, target_id = event
+            if target_id == _NO_TARGET:
+                game.skipped_voters.add(voter_id)
+            else:
+                game.votes[voter_id] = target_id
+        elif kind == PHASE:
+            phase = _PHASES[event[1]]
+            game.current_round = event[2]
+            # Контейнеры фаз очищаются там же, где их очищает GameManager
+            if phase is not GamePhase.NIGHT and game.phase is GamePhase.NIGHT:
+                game.mafia_votes.clear()
+                game.doctor_saves.clear()
+                game.commissioner_checks.clear()
+                game.butterfly_distract_target = None
+            if phase is GamePhase.VOTING:
+                game.votes.clear()
+                game.skipped_voters.clear()
+            elif game.phase is GamePhase.VOTING:
+                game.votes.clear()
+            game.phase = phase
+        elif kind == DIED:
+            player = players.get(event[1])
+            if player is not None:
+                player.is_alive = False
+                player.died_round = game.current_round
+                if event[2] == DIED_LEFT:
+                    _drop_night_actions(game, player)
+        elif kind == JOINED:
+            _, user_id, username, first_name = event
+            players[user_id] = Player(user_id=user_id, username=username, first_name=first_name)
+        elif kind == ROLE:
+            player = players.get(event[1])
+            if player is not None:
+                player.role = _ROLES[event[2]]
+        elif kind == LEFT:
+            players.pop(event[1], None)
+        elif kind == CREATED:
+            game.rng_seed = event[1]
+            game.is_test_game = event[2]
+    return game
+
+
+def state_digest(game: GameState) -> tuple:
+    """Часть состояния игры, которую восстанавливает replay() — для сверки"""
+    return (
+        tuple((p.user_id, p.username or "", p.first_name or "", p.role, p.is_alive, p.died_round) for p in game.players.values()),
+        game.phase, game.current_round,
+        sorted(game.mafia_votes.items()), sorted(game.doctor_saves.items()),
+        sorted(game.commissioner_checks.items()), game.butterfly_distract_target,
+        sorted(game.votes.items()), sorted(game.skipped_voters),
+    )
+
+
+class VerifyingGameLog(GameLog):
+    """Журнал, который при удалении игры сверяет её с проигранным журналом.
+
+    Для регрессионных прогонов без базы (loadtest --game-log, gamelog.py):
+    журналы закрытых игр остаются в памяти до drain().
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.checked = 0
+        self.mismatches: List[str] = []
+
+    def closed(self, game: GameState) -> None:
+        events = self._games.get(game.chat_id)
+        if events is not None and events.seed == game.rng_seed:
+            self.sync(game)
+            self.checked += 1
+            if state_digest(replay(bytes(events.data), game.chat_id)) != state_digest(game):
+                self.mismatches.append(game.chat_id)
+        super().closed(game)
+
+
+def _bench(args) -> None:
+    import logging
+    import random
+
+    import simulate
+    from game_logic import GameManager
+
+    logging.disable(logging.CRITICAL)
+    manager = GameManager()
+    manager.set_rng_seed(args.seed)
+    log = manager.log = VerifyingGameLog()
+    rng = random.Random(args.seed)
+    strategy_cls = simulate.load_strategy("random")
+    chunks = []
+    started = time.perf_counter()
+    for index in range(args.games):
+        simulate.play_game(manager, rng.randint(4, 20), strategy_cls(rng), rng)
+        chunks.extend(log.drain())
+    played = time.perf_counter() - started
+    size = sum(len(data) for _, _, data in chunks)
+    print(f"сверка с настоящими играми: {log.checked} игр, расхождений {len(log.mismatches)}")
+    print(f"журнал: {size / max(1, len(chunks)):.0f} байт на игру, игры с журналом: {args.games / played:.0f} игр/с")
+    if args.test_games:
+        checked, mismatches = _check_test_games(args.test_games, args.seed)
+        print(f"сверка с тестовыми играми (create_test_game): {checked} игр, расхождений {mismatches}")
+
+    started = time.perf_counter()
+    for chat_key, _, data in chunks:
+        replay(data, chat_key)
+    elapsed = time.perf_counter() - started
+    print(f"проигрывание: {len(chunks) / elapsed:.0f} игр/с ({len(chunks)} игр)")
+
+
+def _check_test_games(games: int, seed: int) -> Tuple[int, int]:
+    """Играет тестовые игры настоящим тестовым автопилотом на виртуальных часах
+    и сверяет их журналы; возвращает (сверено игр, расхождений)"""
+    import handlers
+    from clock import run_virtual
+    from game_logic import game_manager
+
+    class _SilentBot:
+        async def send_message(self, *args, **kwargs) -> None:
+            pass
+
+    async def play() -> None:
+        for index in range(games):
+            chat_key = f"-{10 ** 12 + index}_0"
+            game_manager.create_test_game(chat_key)
+            try:
+                await handlers._test_autopilot_loop(chat_key, _SilentBot())
+            finally:
+                game_manager.end_game(chat_key)
+
+    game_manager.set_rng_seed(seed)
+    log = game_manager.log = VerifyingGameLog()
+    try:
+        run_virtual(play)
+    finally:
+        game_manager.log = None
+    return log.checked, len(log.mismatches)
+
+
+def _show(args) -> None:
+    import sqlite3
+
+    conn = sqlite3.connect(args.db)
+    query = "SELECT chat_key, game_seed, data FROM game_events"
+    params: tuple = ()
+    if args.chat:
+        query += " WHERE chat_key = ?"
+        params = (args.chat,)
+    games: Dict[Tuple[str, int], bytearray] = {}
+    for chat_key, seed, data in conn.execute(query + " ORDER BY seq", params):
+        games.setdefault((chat_key, seed), bytearray()).extend(data)
+    conn.close()
+    for (chat_key, seed), data in games.items():
+        print(f"== {chat_key} (зерно {seed})")
+        if args.chat:
+            for event in iter_events(bytes(data)):
+                print("  ", EVENT_NAMES[event[0]], *event[1:])
+        game = replay(bytes(data), chat_key)
+        alive = sum(p.is_alive for p in game.players.values())
+        print(f"   фаза {game.phase.value}, раунд {game.current_round}, игроков {len(game.players)}, живых {alive}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--games", type=int, default=10000, help="сколько игр сыграть, сверить и проиграть")
+    parser.add_argument("--test-games", type=int, default=100, help="сколько тестовых игр (create_test_game) сверить вдобавок")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="вместо прогона показать журналы из базы STATE_DB_PATH")
+    parser.add_argument("--chat", help="только игры этого chat_key, с перечнем событий")
+    args = parser.parse_args(argv)
+    if args.db:
+        _show(args)
+    else:
+        _bench(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,36 @@
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
 from aiogram.filters import Command
 from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
 import asyncio
+import functools
 import os
 import json
 import logging
 import random
+import time
+from typing import List, Optional, Tuple
 
 from keyboards import get_main_menu_keyboard, get_back_keyboard, get_new_game_keyboard, get_test_game_control_keyboard, get_lobby_keyboard, get_player_selection_keyboard, get_voting_keyboard, get_game_control_keyboard
 from game_logic import game_manager
+from scheduler import phase_scheduler
+from clock import clock
+from outbound import Priority, fan_out, send_priority, with_priority
+from scoreboard import voting_scoreboard
+from relay import mafia_relay
+from stats import LEADERBOARD_SIZE, player_stats
+from metrics import handler_metrics
+from loopwatch import loop_watchdog
+from actors import GameSnapshot, game_actors, take_snapshot
+from callbacks import GameAction, GameCallback
 from models import GamePhase, PlayerRole
 from config import MAX_PLAYERS, NIGHT_TIMEOUT_SECS, DAY_DISCUSS_TIMEOUT_SECS, VOTING_TIMEOUT_SECS
-from config import BROADCAST_CHAT_ID, BROADCAST_THREAD_ID
+from config import BROADCAST_CHAT_ID, BROADCAST_THREAD_ID, DRAIN_TIMEOUT_SECS
 
 router = Router()
+# Гистограммы времени хендлеров для /metrics
+router.message.middleware(handler_metrics)
+router.callback_query.middleware(handler_metrics)
 
 # Фоновые задачи автопилота по chat_key
 _autopilot_tasks: dict[str, asyncio.Task] = {}
@@ -24,8 +40,14 @@ logger = logging.getLogger(__name__)
 # ID администратора/разработчика для специальных команд
 ADMIN_USER_ID = 833357704
 
-# Ожидание текста рассылки в ЛС: user_id -> True
-_broadcast_waiting: dict[int, bool] = {}
+# Ответ на нажатие кнопки игры, которая уже закончилась
+STALE_BUTTON_TEXT = "⌛ Эта кнопка от завершённой игры."
+
+# Ответ на попытку начать игру, пока бот плавно останавливается
+DRAINING_TEXT = "🔧 Бот перезапускается. Новую игру можно будет начать через минуту — текущие игры продолжатся."
+
+# Ожидание текста рассылки в ЛС: user_id -> True (/broadcast) или "all" (/broadcast_all)
+_broadcast_waiting: dict[int, object] = {}
 
 # Текущая цель рассылки (читается из файла/окружения): {"chat_id": int, "thread_id": int}
 _broadcast_target: dict[str, int] = {"chat_id": 0, "thread_id": 0}
@@ -37,21 +59,21 @@ def _load_broadcast_target_from_file() -> None:
                 data = json.load(f)
                 _broadcast_target["chat_id"] = int(data.get("chat_id", 0))
                 _broadcast_target["thread_id"] = int(data.get("thread_id", 0))
-                logger.info(f"broadcast: загружена цель из файла: chat_id={_broadcast_target['chat_id']}, thread_id={_broadcast_target['thread_id']}")
+                logger.info("broadcast: загружена цель из файла: chat_id=%s, thread_id=%s", _broadcast_target['chat_id'], _broadcast_target['thread_id'])
         else:
             # Фолбэк на переменные окружения
             _broadcast_target["chat_id"] = int(BROADCAST_CHAT_ID or 0)
             _broadcast_target["thread_id"] = int(BROADCAST_THREAD_ID or 0)
-            logger.info(f"broadcast: цель по умолчанию из ENV: chat_id={_broadcast_target['chat_id']}, thread_id={_broadcast_target['thread_id']}")
+            logger.info("broadcast: цель по умолчанию из ENV: chat_id=%s, thread_id=%s", _broadcast_target['chat_id'], _broadcast_target['thread_id'])
     except Exception as e:
-        logger.warning(f"broadcast: ошибка загрузки цели: {e}")
+        logger.warning("broadcast: ошибка загрузки цели: %s", e)
 
 def _save_broadcast_target_to_file() -> None:
     try:
         with open("broadcast_target.json", "w", encoding="utf-8") as f:
             json.dump({"chat_id": _broadcast_target["chat_id"], "thread_id": _broadcast_target["thread_id"]}, f, ensure_ascii=False, indent=2)
     except Exception as e:
-        logger.warning(f"broadcast: ошибка сохранения цели: {e}")
+        logger.warning("broadcast: ошибка сохранения цели: %s", e)
 
 _load_broadcast_target_from_file()
 
@@ -89,7 +111,8 @@ async def cmd_set_broadcast_target(message: Message):
         return
     _broadcast_target["chat_id"] = chat_id
     _broadcast_target["thread_id"] = thread_id
-    _save_broadcast_target_to_file()
+    # Файловый ввод-вывод — в потоке, чтобы не останавливать цикл событий всех игр
+    await asyncio.to_thread(_save_broadcast_target_to_file)
     await message.answer(f"✅ Цель рассылки сохранена. chat_id={chat_id}, thread_id={thread_id}")
 
 # Показать текущую цель
@@ -101,6 +124,30 @@ async def cmd_get_broadcast_target(message: Message):
         return
     await message.answer(f"Текущая цель: chat_id={_broadcast_target['chat_id']}, thread_id={_broadcast_target['thread_id']}")
 
+# Задержка цикла событий и последние зависания со стеками (см. loopwatch.py)
+@router.message(Command("loop_lag"))
+async def cmd_loop_lag(message: Message):
+    if message.chat.type != "private":
+        return
+    if message.from_user.id != ADMIN_USER_ID:
+        return
+    data = loop_watchdog.snapshot()
+    lines = [
+        "⏱ Цикл событий",
+        f"Последняя задержка: {data['last_lag'] * 1000:.0f} мс, максимум: {data['max_lag'] * 1000:.0f} мс",
+        f"Зависаний дольше {data['threshold'] * 1000:.0f} мс: {data['stalls']}",
+    ]
+    recent = data["recent"][-5:]
+    if recent:
+        lines.append("")
+        lines.append("Последние:")
+    for stall in reversed(recent):
+        at = time.strftime("%H:%M:%S", time.localtime(stall.at))
+        lines.append(f"• {at} — {stall.lag * 1000:.0f} мс, {stall.where}")
+        if stall.stack:
+            lines.append("  " + " ← ".join(reversed(stall.stack[-3:])))
+    await message.answer("\n".join(lines))
+
 # Отмена режима рассылки
 @router.message(Command("cancel"))
 async def cmd_cancel_broadcast(message: Message):
@@ -113,23 +160,8 @@ async def cmd_cancel_broadcast(message: Message):
     else:
         await message.answer("ℹ️ Нечего отменять: режим рассылки не активен")
 
-# Обработка ЛС в режиме ожидания текста рассылки (ставим раньше общего приватного перехватчика)
-@router.message(F.chat.type == "private")
-async def handle_broadcast_input(message: Message):
-    # Игнорируем команды здесь, ими занимаются соответствующие хендлеры
-    if not message.text or message.text.startswith("/"):
-        return
-    user_id = message.from_user.id
-    if user_id != ADMIN_USER_ID:
-        return
-    if not _broadcast_waiting.get(user_id):
-        return
-
-    # Получили текст рассылки
-    content = message.text
-    # Выходим из режима ожидания до начала отправки
-    _broadcast_waiting.pop(user_id, None)
-
+# Текст рассылки из ЛС администратора: отправка в выбранную тему
+async def _send_broadcast(message: Message, content: str) -> None:
     # Отправляем в выбранную админом цель независимо от активных игр
     target_chat = _broadcast_target.get("chat_id", 0)
     target_thread = _broadcast_target.get("thread_id", 0)
@@ -146,13 +178,13 @@ async def handle_broadcast_input(message: Message):
         await message.answer("✅ Сообщение отправлено в выбранную тему")
     except TelegramForbiddenError as e:
         await message.answer("❌ Нет прав отправлять в целевой чат/тему. Проверьте, что бот админ и тема существует.")
-        logger.warning(f"broadcast: forbidden: {e}")
+        logger.warning("broadcast: forbidden: %s", e)
     except TelegramBadRequest as e:
         await message.answer("❌ Некорректный chat_id/thread_id или тема отключена.")
-        logger.warning(f"broadcast: bad request: {e}")
+        logger.warning("broadcast: bad request: %s", e)
     except Exception as e:
         await message.answer("❌ Ошибка отправки. Подробности в логах.")
-        logger.warning(f"broadcast: unexpected: {e}")
+        logger.warning("broadcast: unexpected: %s", e)
 
 # Дополнительная команда: рассылка по всем активным играм (по желанию)
 @router.message(Command("broadcast_all"))
@@ -162,18 +194,8 @@ async def cmd_broadcast_all(message: Message):
     _broadcast_waiting[message.from_user.id] = "all"
     await message.answer("✍️ Отправьте текст рассылки. Будет выслано во все активные игры. Для отмены — /cancel")
 
-# Обработка ЛС для broadcast_all
-@router.message(F.chat.type == "private")
-async def handle_broadcast_all_input(message: Message):
-    if not message.text or message.text.startswith("/"):
-        return
-    user_id = message.from_user.id
-    if user_id != ADMIN_USER_ID:
-        return
-    if _broadcast_waiting.get(user_id) != "all":
-        return
-    content = message.text
-    _broadcast_waiting.pop(user_id, None)
+# Текст рассылки из ЛС администратора: во все активные игры
+async def _send_broadcast_all(message: Message, content: str) -> None:
     try:
         active_keys = list(game_manager.active_games.keys())
     except Exception:
@@ -183,17 +205,18 @@ async def handle_broadcast_all_input(message: Message):
         return
     sent = 0
     failed = 0
-    for chat_key in active_keys:
-        try:
-            chat_id = get_chat_id_from_key(chat_key)
-            thread_id = get_thread_id_from_key(chat_key)
-            message_thread_id = None if thread_id == 0 else thread_id
-            await message.bot.send_message(chat_id, content, message_thread_id=message_thread_id)
-            sent += 1
-            await asyncio.sleep(0.05)
-        except Exception as e:
-            failed += 1
-            logger.warning(f"broadcast_all: ошибка отправки в {chat_key}: {e}")
+    # Темп рассылки задаёт исходящая очередь; низкий приоритет — чтобы не тормозить игры
+    with send_priority(Priority.LOW):
+        for chat_key in active_keys:
+            try:
+                chat_id = get_chat_id_from_key(chat_key)
+                thread_id = get_thread_id_from_key(chat_key)
+                message_thread_id = None if thread_id == 0 else thread_id
+                await message.bot.send_message(chat_id, content, message_thread_id=message_thread_id)
+                sent += 1
+            except Exception as e:
+                failed += 1
+                logger.warning("broadcast_all: ошибка отправки в %s: %s", chat_key, e)
     await message.answer(f"✅ Разослано: {sent}. Ошибок: {failed}.")
 
 # Обработчик команды /start
@@ -203,7 +226,7 @@ async def start_command(message: Message):
     user_id = message.from_user.id
     first_name = message.from_user.first_name or "Игрок"
     
-    logger.info(f"start_command: пользователь {first_name} (ID: {user_id}) написал /start")
+    logger.info("start_command: пользователь %s (ID: %s) написал /start", first_name, user_id)
     
     # Команда /start работает ТОЛЬКО в ЛС
     if message.chat.type != "private":
@@ -224,42 +247,59 @@ async def start_command(message: Message):
     
     await message.answer(role_message)
 
-# Пересылка ЛС мафии их сообщникам во время ночи
-@router.message(F.chat.type == "private")
-async def relay_mafia_private_chat(message: Message):
+def _read_stats(store, user_id: int, chat_key: Optional[str]):
+    """Все запросы /stats одним заходом в поток: (по ролям, (игр в чате, побед мафии), лидеры)"""
+    by_role = store.player_stats(user_id, chat_key)
+    if chat_key is None:
+        return by_role, (0, 0), []
+    return by_role, store.chat_games(chat_key), store.leaderboard(chat_key, LEADERBOARD_SIZE)
+
+# Статистика игрока и таблица лидеров: в группе — по этому чату, в ЛС — по всем чатам
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    store = player_stats.store
+    if store is None:
+        await message.answer("📊 Статистика игр не ведётся")
+        return
+    user = message.from_user
+    private = message.chat.type == "private"
+    chat_key = None if private else get_chat_key(message)
+    # Запросы читают несколько строк по индексу, но SQLite может ждать блокировку
+    # файла (timeout=30) — выполняем их в потоке, не останавливая цикл событий
+    by_role, chat_totals, leaders = await asyncio.to_thread(_read_stats, store, user.id, chat_key)
+    lines = [f"📊 {user.first_name or 'Игрок'}: статистика {'по всем чатам' if private else 'в этом чате'}"]
+    if by_role:
+        games, wins, survived, rounds = (sum(values) for values in zip(*by_role.values()))
+        lines.append(
+            f"Игр: {games}, побед: {wins} ({wins * 100 // games}%), дожил до конца: {survived}, "
+            f"раундов в среднем: {rounds / games:.1f}"
+        )
+        for role in PlayerRole:
+            values = by_role.get(role.value)
+            if values:
+                lines.append(f"{ROLE_EMOJI[role]} {ROLE_NAMES[role]}: игр {values[0]}, побед {values[1]}")
+    else:
+        lines.append("Сыгранных игр пока нет")
+    if leaders:
+        total, mafia_wins = chat_totals
+        lines.append("")
+        lines.append(f"🏆 Лучшие игроки (всего игр: {total}, побед мафии: {mafia_wins}):")
+        for place, (_, username, first_name, games, wins) in enumerate(leaders, 1):
+            name = f"{first_name}{f' (@{username})' if username else ''}"
+            lines.append(f"{place}. {name} — побед {wins} из {games}")
+    await message.answer("\n".join(lines))
+
+# Пересылка ЛС мафии их сообщникам во время ночи: подойдёт любое сообщение
+# (текст, голосовое, фото, стикер), отправку и склейку делает mafia_relay
+async def _relay_mafia_message(message: Message, chat_key: str) -> None:
     user_id = message.from_user.id
-    text = message.text or ""
-    # Игнорируем команды
-    if not text or text.startswith("/"):
-        return
-    chat_key = game_manager.get_chat_key_for_mafia_user(user_id)
-    if not chat_key:
-        return
     game = game_manager.get_game(chat_key)
     if not game or game.phase != GamePhase.NIGHT:
         return
     player = game.players.get(user_id)
     if not player or not player.is_alive or player.role != PlayerRole.MAFIA:
         return
-    peers = game_manager.get_mafia_peers(chat_key, exclude_user_id=user_id)
-    if not peers:
-        return
-    try:
-        sender_name = message.from_user.first_name or "Мафия"
-        forwarded = 0
-        for peer in peers:
-            try:
-                await message.bot.send_message(peer.user_id, f"😈 {sender_name}: {text}")
-                forwarded += 1
-            except Exception as e:
-                logger.debug(f"relay_mafia_private_chat: не удалось переслать мафии {peer.user_id}: {e}")
-        if forwarded:
-            try:
-                await message.reply("📨 Сообщение отправлено сообщникам")
-            except Exception:
-                pass
-    except Exception as e:
-        logger.exception(f"relay_mafia_private_chat: ошибка пересылки: {e}")
+    mafia_relay.add(message, chat_key)
 
 # Рандомные фразы в духе мафиози
 DON_VITTE_GREETINGS = [
@@ -563,12 +603,12 @@ def check_topic_permission(message_or_callback) -> bool:
         thread_id = message_or_callback.message_thread_id
         chat = message_or_callback.chat
     
-    logger.debug(f"check_topic_permission: chat.is_forum={chat.is_forum}, thread_id={thread_id}")
+    logger.debug("check_topic_permission: chat.is_forum=%s, thread_id=%s", chat.is_forum, thread_id)
     
     if chat.is_forum:
         # В форумах разрешаем только в теме "Игра в «Мафию»" (ID: 39431)
         result = thread_id == 39431
-        logger.debug(f"check_topic_permission: thread_id={thread_id}, разрешенный=39431, результат={result}")
+        logger.debug("check_topic_permission: thread_id=%s, разрешенный=39431, результат=%s", thread_id, result)
         return result
     else:
         # В обычных группах запрещаем
@@ -623,14 +663,18 @@ def build_role_prompt(role: PlayerRole, action_line: str) -> str:
         f"{action_line}"
     )
 
-async def _send_night_action_keyboards(chat_key: str, bot):
+@with_priority(Priority.HIGH)
+async def _send_night_action_keyboards(chat_key: str, bot) -> bool:
+    """Рассылает ночные клавиатуры ролям; True — игра окончилась из-за выбывших"""
     game = game_manager.get_game(chat_key)
     if not game:
-        return
+        return False
     # Не дублируем, если уже отправляли в этой ночи
     if getattr(game, "night_prompts_sent", False):
-        return
+        return False
     alive_players = game.get_alive_players()
+    # Версия состава, из которой собран alive_players: по ней клавиатуры берутся из кеша
+    roster_version = game.players.version
     # Если бабочка отвлекла цель прошлой ночью — запретим её выбирать в текущей
     # Исключения для разных ролей
     mafia_excluded_targets = set()
@@ -645,57 +689,236 @@ async def _send_night_action_keyboards(chat_key: str, bot):
     
     # НЕ добавляем всех ранее отвлеченных игроков - они должны быть доступны для выбора
     # Отвлечение действует только на одну ночь
-    for player in alive_players:
-        try:
-            # Если игрок отвлечен этой ночью — не отправляем ему клавиатуру действий
-            if game.butterfly_distract_target is not None and player.user_id == game.butterfly_distract_target:
-                logger.debug(f"_send_night_action_keyboards: пропускаем отправку для отвлеченного игрока {player.user_id}")
-                continue
-            if player.role == PlayerRole.MAFIA:
-                # Выбираем случайную фразу для мафии
-                mafia_message = random.choice(NIGHT_ACTION_MESSAGES[PlayerRole.MAFIA])
-                await bot.send_message(
-                    player.user_id,
-                    build_role_prompt(PlayerRole.MAFIA, mafia_message),
-                    reply_markup=get_player_selection_keyboard(alive_players, "mafia_kill", chat_key, exclude_user_id=player.user_id, exclude_target_ids=mafia_excluded_targets)
-                )
-                # Показать состав мафии для координации
-                peers = game_manager.get_mafia_peers(chat_key, exclude_user_id=player.user_id)
-                if peers:
-                    mafia_list = ", ".join([f"@{p.username}" if p.username else p.first_name for p in peers])
-                    await bot.send_message(player.user_id, f"🤫 Твои сообщники: {mafia_list}. Можете обсуждать прямо здесь в ЛС — я передам им твои сообщения.")
-            elif player.role == PlayerRole.DOCTOR:
-                # Выбираем случайную фразу для доктора
-                doctor_message = random.choice(NIGHT_ACTION_MESSAGES[PlayerRole.DOCTOR])
-                await bot.send_message(
-                    player.user_id,
-                    build_role_prompt(PlayerRole.DOCTOR, doctor_message),
-                    # Разрешаем самолечение — не исключаем себя
-                    reply_markup=get_player_selection_keyboard(alive_players, "doctor_save", chat_key, exclude_target_ids=doctor_excluded_targets)
-                )
-            elif player.role == PlayerRole.COMMISSIONER:
-                # Выбираем случайную фразу для комиссара
-                commissioner_message = random.choice(NIGHT_ACTION_MESSAGES[PlayerRole.COMMISSIONER])
-                await bot.send_message(
-                    player.user_id,
-                    build_role_prompt(PlayerRole.COMMISSIONER, commissioner_message),
-                    reply_markup=get_player_selection_keyboard(alive_players, "commissioner_check", chat_key, exclude_user_id=player.user_id, exclude_target_ids=commissioner_excluded_targets)
-                )
-            elif player.role == PlayerRole.BUTTERFLY:
-                # Выбираем случайную фразу для ночной бабочки
-                butterfly_message = random.choice(NIGHT_ACTION_MESSAGES[PlayerRole.BUTTERFLY])
-                await bot.send_message(
-                    player.user_id,
-                    build_role_prompt(PlayerRole.BUTTERFLY, butterfly_message),
-                    reply_markup=get_player_selection_keyboard(alive_players, "butterfly_distract", chat_key, exclude_user_id=player.user_id)
-                )
-        except Exception as e:
-            logger.exception(f"_send_night_action_keyboards: ошибка отправки игроку {player.user_id}: {e}")
+
+    # Фразы ролей выбираем заранее и по порядку игроков: рассылка параллельная,
+    # а жребий игры должен идти в одном и том же порядке
+    rng = game.rng()
+    role_phrases = {
+        p.user_id: rng.choice(NIGHT_ACTION_MESSAGES[p.role])
+        for p in alive_players if p.role in NIGHT_ACTION_MESSAGES
+    }
+
+    async def send_prompt(player) -> None:
+        # Если игрок отвлечен этой ночью — не отправляем ему клавиатуру действий
+        if game.butterfly_distract_target is not None and player.user_id == game.butterfly_distract_target:
+            logger.debug("_send_night_action_keyboards: пропускаем отправку для отвлеченного игрока %s", player.user_id)
+            return
+        if player.role == PlayerRole.MAFIA:
+            # Выбираем случайную фразу для мафии
+            mafia_message = role_phrases[player.user_id]
+            await bot.send_message(
+                player.user_id,
+                build_role_prompt(PlayerRole.MAFIA, mafia_message),
+                reply_markup=get_player_selection_keyboard(alive_players, "mafia_kill", chat_key, exclude_user_id=player.user_id, exclude_target_ids=mafia_excluded_targets, roster_version=roster_version)
+            )
+            # Показать состав мафии для координации
+            peers = game_manager.get_mafia_peers(chat_key, exclude_user_id=player.user_id)
+            if peers:
+                mafia_list = ", ".join([f"@{p.username}" if p.username else p.first_name for p in peers])
+                await bot.send_message(player.user_id, f"🤫 Твои сообщники: {mafia_list}. Можете обсуждать прямо здесь в ЛС — я передам им твои сообщения.")
+        elif player.role == PlayerRole.DOCTOR:
+            # Выбираем случайную фразу для доктора
+            doctor_message = role_phrases[player.user_id]
+            await bot.send_message(
+                player.user_id,
+                build_role_prompt(PlayerRole.DOCTOR, doctor_message),
+                # Разрешаем самолечение — не исключаем себя
+                reply_markup=get_player_selection_keyboard(alive_players, "doctor_save", chat_key, exclude_target_ids=doctor_excluded_targets, roster_version=roster_version)
+            )
+        elif player.role == PlayerRole.COMMISSIONER:
+            # Выбираем случайную фразу для комиссара
+            commissioner_message = role_phrases[player.user_id]
+            await bot.send_message(
+                player.user_id,
+                build_role_prompt(PlayerRole.COMMISSIONER, commissioner_message),
+                reply_markup=get_player_selection_keyboard(alive_players, "commissioner_check", chat_key, exclude_user_id=player.user_id, exclude_target_ids=commissioner_excluded_targets, roster_version=roster_version)
+            )
+        elif player.role == PlayerRole.BUTTERFLY:
+            # Выбираем случайную фразу для ночной бабочки
+            butterfly_message = role_phrases[player.user_id]
+            await bot.send_message(
+                player.user_id,
+                build_role_prompt(PlayerRole.BUTTERFLY, butterfly_message),
+                reply_markup=get_player_selection_keyboard(alive_players, "butterfly_distract", chat_key, exclude_user_id=player.user_id, roster_version=roster_version)
+            )
+
+    # Рассылаем клавиатуры всем ролям параллельно (с ограничением одновременных запросов)
+    failures = await fan_out(alive_players, send_prompt)
+    blocked_ids = []
+    for player, e in failures:
+        if isinstance(e, TelegramForbiddenError):
+            blocked_ids.append(player.user_id)
+            logger.warning("_send_night_action_keyboards: игрок %s заблокировал бота: %s", player.user_id, e)
+        else:
+            logger.error("_send_night_action_keyboards: ошибка отправки игроку %s: %s", player.user_id, e, exc_info=e)
     # Помечаем, что ночные клавиатуры разосланы
     game.night_prompts_sent = True
+    game_manager.touch(chat_key)
+    if not blocked_ids:
+        return False
+    # До игрока без ЛС не достучаться — он выбывает из игры как погибший
+    over, announcements = await game_actors.call(chat_key, _eliminate_command, chat_key, blocked_ids)
+    try:
+        await _announce(bot, get_chat_id_from_key(chat_key), get_thread_id_from_key(chat_key) or None, announcements)
+    except Exception as e:
+        logger.warning("_send_night_action_keyboards: не удалось сообщить о выбывших: %s", e)
+    return over
+
+@with_priority(Priority.LOW)
+async def _send_phase_reminder(bot, chat_key: str, phase_name: str, remaining: int) -> None:
+    """Напоминание о времени фазы (вызывается планировщиком на отметках 30/15/5 сек.)"""
+    thread_id = get_thread_id_from_key(chat_key)
+    game = game_manager.get_game(chat_key)
+    if not game:
+        return
+    try:
+        # Выбираем случайную фразу для напоминания о фазе
+        reminder = game.rng().choice(TIME_REMINDER_MESSAGES[phase_name]).format(time=remaining)
+        await bot.send_message(
+            get_chat_id_from_key(chat_key),
+            reminder,
+            message_thread_id=None if thread_id == 0 else thread_id,
+        )
+        logger.debug("отправлено напоминание (%s): %s сек. осталось", phase_name, remaining)
+    except Exception as e:
+        logger.exception("ошибка отправки напоминания (%s): %s", phase_name, e)
+
+# --- Команды актора игры для переходов фаз автопилота ---
+# Выполняются через game_actors.call и только меняют состояние: переход фазы
+# применяется целиком, между его шагами нажатия игроков не вклиниваются.
+# Объявления команда возвращает, а отправляет их автопилот уже после call —
+# пока запросы ждут лимитов Bot API, очередь игры свободна для голосов.
+
+Announcement = Tuple[str, Optional[InlineKeyboardMarkup]]
+
+async def _announce(bot, chat_id: int, thread_id, announcements: List[Announcement]) -> None:
+    """Отправляет в чат игры объявления, подготовленные командой актора, по порядку"""
+    for text, markup in announcements:
+        await bot.send_message(chat_id, text, message_thread_id=thread_id, reply_markup=markup)
+
+def _end_if_over(chat_key: str, announcements: List[Announcement]) -> bool:
+    """Завершает игру, если она окончена, и добавляет объявление победителя"""
+    over, winner_msg = game_manager.check_game_over(chat_key)
+    if not over:
+        return False
+    logger.info("автопилот: игра завершена в чате %s - победа %s", chat_key, 'мафии' if 'мафия' in winner_msg else 'мирных')
+    announcements.append((winner_msg, get_new_game_keyboard()))
+    game_manager.end_game(chat_key)
+    return True
+
+def _eliminate_command(chat_key: str, player_ids: List[int]) -> Tuple[bool, List[Announcement]]:
+    """Выводит из игры недоступных в ЛС; True — после этого игра окончена"""
+    announcements: List[Announcement] = []
+    eliminated = game_manager.eliminate_players(chat_key, player_ids)
+    if not eliminated:
+        return False, announcements
+    names = ", ".join(p.first_name for p in eliminated)
+    announcements.append((f"🚪 {names} выбывает из игры: бот не может написать в ЛС.", None))
+    # Без выбывшего (например, последнего мафиози) игра может быть уже решена
+    return _end_if_over(chat_key, announcements), announcements
+
+def _finish_night_command(chat_key: str) -> Tuple[bool, List[Announcement]]:
+    """Подводит итоги ночи; True — игра окончена"""
+    announcements: List[Announcement] = []
+    msg, _ = game_manager.process_night_results(chat_key)
+    if msg:
+        announcements.append((msg, None))
+        logger.info("ночная фаза: итоги: %s...", msg[:100])
+    else:
+        logger.warning("ночная фаза: не получено сообщение о результатах")
+    return _end_if_over(chat_key, announcements), announcements
+
+def _skip_first_voting_command(chat_key: str) -> str:
+    """Переводит игру в ночь без первого голосования; возвращает списки живых и мёртвых"""
+    game = game_manager.get_game(chat_key)
+    alive = []
+    dead = []
+    for p in game.players.values():
+        uname = f"@{p.username}" if p.username else None
+        disp = f"{p.first_name}{f' ({uname})' if uname else ''}"
+        (alive if p.is_alive else dead).append(disp)
+    # Выбираем случайное сообщение об отсутствии голосования
+    no_voting_message = game.rng().choice(NO_VOTING_FIRST_DAY_MESSAGES)
+    msg = (
+        no_voting_message + "\n\n" +
+        f"👥 Живые ({len(alive)}):\n" + ("\n".join([f"• {n}" for n in alive]) if alive else "—") + "\n" +
+        f"💀 Мертвые ({len(dead)}):\n" + ("\n".join([f"• {n}" for n in dead]) if dead else "—")
+    )
+    # Переходим к ночи
+    game.phase = GamePhase.NIGHT
+    game.current_round += 1
+    game.all_actions_notified = False
+    game.first_voting_skipped = True
+    game_manager.touch(chat_key)
+    return msg
+
+def _begin_voting_command(chat_key: str) -> Optional[Announcement]:
+    """Открывает голосование; возвращает его сообщение с клавиатурой или None"""
+    if not game_manager.start_voting(chat_key):
+        return None
+    game = game_manager.get_game(chat_key)
+    # Переголосование отключено — кандидатов не фильтруем;
+    # право голоса у отвлеченного прошлой ночью блокирует start_voting
+    title = game.rng().choice(VOTING_START_MESSAGES)
+    return title, get_voting_keyboard(game.get_alive_players(), chat_key, game.players.version)
+
+def _finish_voting_command(chat_key: str) -> Tuple[bool, Optional[GameSnapshot], List[Announcement]]:
+    """Подводит итоги голосования и переводит игру в ночь; True — игра окончена.
+
+    Вместе с объявлениями возвращает срез игры с окончательными голосами — его
+    рисует табло перед объявлением итогов.
+    """
+    announcements: List[Announcement] = []
+    game = game_manager.get_game(chat_key)
+    final = take_snapshot(chat_key, game) if game else None
+    result_msg, _ = game_manager.get_voting_results(chat_key)
+    announcements.append((result_msg, None))
+    if _end_if_over(chat_key, announcements):
+        return True, final, announcements
+
+    game = game_manager.get_game(chat_key)
+    if not game:
+        return True, final, announcements
+    game.revote_active = False
+    game.revote_candidates.clear()
+    if game.phase == GamePhase.NIGHT:
+        logger.info("автопилот: голосование завершено, переход к ночной фазе, раунд %s", game.current_round)
+    else:
+        # get_voting_results всегда уводит в ночь; на всякий случай не оставляем игру зависшей
+        logger.warning("автопилот: после голосования игра не перешла в ночную фазу, фаза: %s", game.phase)
+        game.phase = GamePhase.NIGHT
+        game.current_round += 1
+        logger.info("автопилот: принудительно переведена в ночную фазу, раунд %s", game.current_round)
+    # Сбрасываем флаги для следующей ночи
+    game.night_prompts_sent = False
+    game.all_actions_notified = False
+    game_manager.touch(chat_key)
+    return False, final, announcements
+
+def _phase_mark(game) -> str:
+    return f"{game.phase.value}:{game.current_round}"
+
+def _resumed_deadline(game) -> Optional[float]:
+    """Дедлайн уже запущенного таймера текущей фазы (после перезапуска) или None"""
+    if game.phase_deadline_ts and game.phase_deadline_for == _phase_mark(game):
+        return game.phase_deadline_ts
+    return None
+
+def _arm_phase_timer(chat_key: str, game, duration: float) -> float:
+    """Заводит таймер фазы или продолжает сохранённый; возвращает, сколько ждать"""
+    deadline = _resumed_deadline(game)
+    now = clock.wall()
+    if deadline is None:
+        game.phase_deadline_ts = now + duration
+        game.phase_deadline_for = _phase_mark(game)
+        game_manager.touch(chat_key)
+        return duration
+    remaining = max(0.0, min(duration, deadline - now))
+    logger.info("автопилот: фаза %s в чате %s продолжается, осталось %.0f сек.", game.phase_deadline_for, chat_key, remaining)
+    return remaining
 
 async def _autopilot_loop(chat_key: str, bot):
-    logger.info(f"старт автопилота для чата {chat_key}")
+    logger.info("старт автопилота для чата %s", chat_key)
     try:
         # Получаем chat_id и thread_id из chat_key один раз в начале
         # Делаем их глобальными для всей функции
@@ -706,104 +929,54 @@ async def _autopilot_loop(chat_key: str, bot):
         # Но для главной темы нужно передавать None, а не 0
         global_message_thread_id = None if global_thread_id == 0 else global_thread_id
         
-        logger.debug(f"автопилот: chat_id={global_chat_id}, thread_id={global_thread_id}, message_thread_id={global_message_thread_id}")
+        logger.debug("автопилот: chat_id=%s, thread_id=%s, message_thread_id=%s", global_chat_id, global_thread_id, global_message_thread_id)
         
         while True:
             game = game_manager.get_game(chat_key)
             if not game or game.phase == GamePhase.ENDED:
-                logger.info(f"автопилот завершен для чата {chat_key} (игра отсутствует или закончена)")
+                logger.info("автопилот завершен для чата %s (игра отсутствует или закончена)", chat_key)
                 break
 
             # Ночь
-            logger.debug(f"автопилот: проверяем ночную фазу, текущая фаза: {game.phase}, раунд: {game.current_round}")
+            logger.debug("автопилот: проверяем ночную фазу, текущая фаза: %s, раунд: %s", game.phase, game.current_round)
             if game.phase == GamePhase.NIGHT:
-                logger.info(f"автопилот: начинается ночная фаза в чате {chat_key}")
-                # Выбираем случайное сообщение о начале ночи
-                night_message = random.choice(NIGHT_PHASE_MESSAGES)
-                await bot.send_message(global_chat_id, night_message, message_thread_id=global_message_thread_id)
-                await _send_night_action_keyboards(chat_key, bot)
-
-                # Ждем строго фиксированное время ночи, независимо от того, завершили ли все действия, с напоминаниями
-                waited = 0
-                interval = 1  # Уменьшаем интервал для более точного отслеживания
-                notified_night = set()
-                logger.debug(f"ночная фаза: начинаем таймер, длительность: {NIGHT_TIMEOUT_SECS} сек.")
-                while waited < NIGHT_TIMEOUT_SECS:
-                    remaining = NIGHT_TIMEOUT_SECS - waited
-                    logger.debug(f"ночная фаза: прошло {waited} сек., осталось {remaining} сек.")
-                    
-                    # Проверяем, завершили ли все ночные действия
-                    try:
-                        current_game = game_manager.get_game(chat_key)
-                        if current_game and current_game.phase == GamePhase.NIGHT:
-                            # Проверяем, все ли роли выполнили действия
-                            required_roles = set()
-                            if any(p.role == PlayerRole.MAFIA for p in current_game.get_alive_players()):
-                                required_roles.add("mafia")
-                            if any(p.role == PlayerRole.DOCTOR for p in current_game.get_alive_players()):
-                                required_roles.add("doctor")
-                            if any(p.role == PlayerRole.COMMISSIONER for p in current_game.get_alive_players()):
-                                required_roles.add("commissioner")
-                            if any(p.role == PlayerRole.BUTTERFLY for p in current_game.get_alive_players()):
-                                required_roles.add("butterfly")
-                            
-                            completed_actions = current_game.night_actions_completed
-                            if required_roles.issubset(completed_actions):
-                                logger.info(f"ночная фаза: все действия завершены, завершаем досрочно")
-                                break
-                            
-                            # Дополнительная проверка: если мафия не может договориться, ждем еще немного
-                            if "mafia" in required_roles and "mafia" not in completed_actions:
-                                # Проверяем, голосовала ли мафия, но не выбрала цель
-                                if current_game.mafia_votes and len(current_game.mafia_votes) > 0:
-                                    alive_mafias = [p.user_id for p in current_game.get_players_by_role(PlayerRole.MAFIA)]
-                                    if len(current_game.mafia_votes) == len(alive_mafias):
-                                        # Все мафии проголосовали, но цель не выбрана (ничья)
-                                        logger.info(f"ночная фаза: мафия проголосовала, но не выбрала цель - ждем еще немного")
-                                        # Не завершаем досрочно, даем время на обдумывание
-                    except Exception as e:
-                        logger.debug(f"ночная фаза: ошибка при проверке завершения действий: {e}")
-                    
-                    if remaining in {30, 15, 5} and remaining not in notified_night:
-                        try:
-                            # Выбираем случайную фразу для напоминания о ночи
-                            night_reminder = random.choice(TIME_REMINDER_MESSAGES["night"]).format(time=remaining)
-                            await bot.send_message(
-                                global_chat_id,
-                                night_reminder,
-                                message_thread_id=global_message_thread_id,
-                            )
-                            notified_night.add(remaining)
-                            logger.debug(f"отправлено напоминание о ночи: {remaining} сек. осталось")
-                        except Exception as e:
-                            logger.exception(f"ошибка отправки напоминания о ночи: {e}")
-                    await asyncio.sleep(interval)
-                    waited += interval
-
-                msg, _ = game_manager.process_night_results(chat_key)
-                if msg:
-                    await bot.send_message(global_chat_id, msg, message_thread_id=global_message_thread_id)
-                    logger.info(f"ночная фаза: отправлено сообщение о результатах: {msg[:100]}...")
-                else:
-                    logger.warning(f"ночная фаза: не получено сообщение о результатах")
-                
-                over, winner_msg = game_manager.check_game_over(chat_key)
+                # После перезапуска ночь продолжается: сообщение и клавиатуры уже у игроков
+                if _resumed_deadline(game) is None:
+                    logger.info("автопилот: начинается ночная фаза в чате %s", chat_key)
+                    # Выбираем случайное сообщение о начале ночи
+                    night_message = game.rng().choice(NIGHT_PHASE_MESSAGES)
+                    await bot.send_message(global_chat_id, night_message, message_thread_id=global_message_thread_id)
+                    if await _send_night_action_keyboards(chat_key, bot):
+                        break
+
+                # Ждем до конца ночи с напоминаниями; планировщик разбудит автопилот,
+                # как только process_night_action зафиксирует ходы всех ролей
+                logger.debug("ночная фаза: начинаем таймер, длительность: %s сек.", NIGHT_TIMEOUT_SECS)
+                finished_early = await phase_scheduler.run_phase(
+                    chat_key,
+                    _arm_phase_timer(chat_key, game, NIGHT_TIMEOUT_SECS),
+                    can_finish=lambda: game_manager.all_night_actions_completed(chat_key),
+                    on_reminder=functools.partial(_send_phase_reminder, bot, chat_key, "night"),
+                )
+                if finished_early:
+                    logger.info("ночная фаза: все действия завершены, завершаем досрочно")
+
+                over, announcements = await game_actors.call(chat_key, _finish_night_command, chat_key)
+                await _announce(bot, global_chat_id, global_message_thread_id, announcements)
                 if over:
-                    logger.info(f"автопилот: игра завершена в чате {chat_key} - победа {'мафии' if 'мафия' in winner_msg else 'мирных'}")
-                    await bot.send_message(global_chat_id, winner_msg, message_thread_id=global_message_thread_id, reply_markup=get_new_game_keyboard())
-                    game_manager.end_game(chat_key)
                     break
 
             # День
             current_game = game_manager.get_game(chat_key)
-            logger.debug(f"автопилот: проверяем дневную фазу, текущая фаза: {current_game.phase if current_game else 'None'}, раунд: {current_game.current_round if current_game else 'None'}")
+            logger.debug("автопилот: проверяем дневную фазу, текущая фаза: %s, раунд: %s", current_game.phase if current_game else 'None', current_game.current_round if current_game else 'None')
             if current_game and current_game.phase == GamePhase.DAY:
-                logger.info(f"автопилот: начинается дневная фаза в чате {chat_key}")
+                logger.info("автопилот: начинается дневная фаза в чате %s", chat_key)
                 # Сообщение про итоги действий ролей ночью
                 game = game_manager.get_game(chat_key)
+                day_resumed = _resumed_deadline(game) is not None
                 
                 # Отправляем результаты комиссара в ЛС (без дублирования в общий чат)
-                if game.last_commissioner_checks:
+                if game.last_commissioner_checks and not day_resumed:
                     for _cid, _target_id, is_mafia in game.last_commissioner_checks:
                         commissioner = game.players.get(_cid)
                         target = game.players.get(_target_id)
@@ -820,186 +993,150 @@ async def _autopilot_loop(chat_key: str, bot):
                                     f"👮 Результат проверки: {disp} — {'МАФИЯ' if is_mafia else 'не мафия'}."
                                 )
                             except Exception as e:
-                                logger.exception(f"не удалось отправить результат проверки комиссару {_cid}: {e}")
+                                logger.exception("не удалось отправить результат проверки комиссару %s: %s", _cid, e)
 
                 # Отправляем дневное приветствие
-                day_message = random.choice(DAY_PHASE_MESSAGES)
-                await bot.send_message(global_chat_id, day_message, message_thread_id=global_message_thread_id)
+                if not day_resumed:
+                    day_message = game.rng().choice(DAY_PHASE_MESSAGES)
+                    await bot.send_message(global_chat_id, day_message, message_thread_id=global_message_thread_id)
                 
                 # Не дублируем: после ночи уже отправлена единая сводка. Публичная сводка комиссара опускается.
 
                 # Таймер дня с напоминаниями за 30/15/5 секунд
-                waited_day = 0
-                interval = 1  # Уменьшаем интервал для более точного отслеживания
-                notified = set()
-                logger.debug(f"дневная фаза: начинаем таймер, длительность: {DAY_DISCUSS_TIMEOUT_SECS} сек.")
-                while waited_day < DAY_DISCUSS_TIMEOUT_SECS:
-                    remaining = DAY_DISCUSS_TIMEOUT_SECS - waited_day
-                    logger.debug(f"дневная фаза: прошло {waited_day} сек., осталось {remaining} сек.")
-                    if remaining in {30, 15, 5} and remaining not in notified:
-                        try:
-                            # Выбираем случайную фразу для напоминания о дне
-                            day_reminder = random.choice(TIME_REMINDER_MESSAGES["day"]).format(time=remaining)
-                            await bot.send_message(
-                                global_chat_id,
-                                day_reminder,
-                                message_thread_id=global_message_thread_id,
-                            )
-                            notified.add(remaining)
-                            logger.debug(f"отправлено напоминание о дне: {remaining} сек. осталось")
-                        except Exception as e:
-                            logger.exception(f"ошибка отправки напоминания о дне: {e}")
-                    await asyncio.sleep(interval)
-                    waited_day += interval
+                logger.debug("дневная фаза: начинаем таймер, длительность: %s сек.", DAY_DISCUSS_TIMEOUT_SECS)
+                await phase_scheduler.run_phase(
+                    chat_key,
+                    _arm_phase_timer(chat_key, game, DAY_DISCUSS_TIMEOUT_SECS),
+                    on_reminder=functools.partial(_send_phase_reminder, bot, chat_key, "day"),
+                )
 
                 # Особое правило: после самой первой ночи пропускаем первое голосование
                 if not getattr(game, "first_voting_skipped", False) and game.current_round <= 1:
                     # Публикуем списки живых/мертвых и сразу уходим в ночь без голосования
-                    alive = []
-                    dead = []
-                    for p in game.players.values():
-                        uname = f"@{p.username}" if p.username else None
-                        disp = f"{p.first_name}{f' ({uname})' if uname else ''}"
-                        (alive if p.is_alive else dead).append(disp)
-                    # Выбираем случайное сообщение об отсутствии голосования
-                    no_voting_message = random.choice(NO_VOTING_FIRST_DAY_MESSAGES)
-                    msg = (
-                        no_voting_message + "\n\n" +
-                        f"👥 Живые ({len(alive)}):\n" + ("\n".join([f"• {n}" for n in alive]) if alive else "—") + "\n" +
-                        f"💀 Мертвые ({len(dead)}):\n" + ("\n".join([f"• {n}" for n in dead]) if dead else "—")
-                    )
+                    msg = await game_actors.call(chat_key, _skip_first_voting_command, chat_key)
                     await bot.send_message(global_chat_id, msg, message_thread_id=global_message_thread_id)
-                    # Переходим к ночи
-                    game.phase = GamePhase.NIGHT
-                    game.current_round += 1
-                    game.all_actions_notified = False
-                    game.first_voting_skipped = True
                     continue
 
-                if game_manager.start_voting(chat_key):
-                    logger.info(f"автопилот: начинается голосование в чате {chat_key}")
+                voting = await game_actors.call(chat_key, _begin_voting_command, chat_key)
+                if voting is not None:
+                    logger.info("автопилот: начинается голосование в чате %s", chat_key)
+                    title, keyboard = voting
+                    sent = await bot.send_message(global_chat_id, title, reply_markup=keyboard, message_thread_id=global_message_thread_id)
+                    # Присваивание без await между ответом API и записью: голос по кнопкам
+                    # этого сообщения не может обработаться раньше, чем табло узнает его id
                     game = game_manager.get_game(chat_key)
-                    alive = game.get_alive_players()
-                    # Переголосование отключено — кандидатов не фильтруем
-                    # Блокируем право голоса у отвлеченного прошлой ночью
-                    if game.last_butterfly_distract_target is not None:
-                        for p in alive:
-                            if p.user_id == game.last_butterfly_distract_target:
-                                p.has_voted = True
-                                break
-                    # Выбираем случайное сообщение о начале голосования
-                    title = random.choice(VOTING_START_MESSAGES)
-                    sent = await bot.send_message(global_chat_id, title, reply_markup=get_voting_keyboard(alive), message_thread_id=global_message_thread_id)
-                    try:
+                    if game:
                         game.current_voting_message_id = sent.message_id
-                    except Exception:
-                        pass
-
-                    # Ждем строго фиксированное время голосования с напоминаниями
-                    waited_vote = 0
-                    interval = 1  # Уменьшаем интервал для более точного отслеживания
-                    notified_vote = set()
-                    logger.debug(f"голосование: начинаем таймер, длительность: {VOTING_TIMEOUT_SECS} сек.")
-                    while waited_vote < VOTING_TIMEOUT_SECS:
-                        # Раннее завершение: все живые (и допущенные) проголосовали
-                        try:
-                            game = game_manager.get_game(chat_key)
-                            if game and game.phase == GamePhase.VOTING:
-                                eligible = game.get_alive_players()
-                                if eligible and all(p.has_voted for p in eligible):
-                                    logger.info("голосование: все голоса получены — завершаем досрочно")
-                                    break
-                        except Exception as e:
-                            logger.debug(f"голосование: ошибка при проверке раннего завершения: {e}")
-                        remaining = VOTING_TIMEOUT_SECS - waited_vote
-                        logger.debug(f"голосование: прошло {waited_vote} сек., осталось {remaining} сек.")
-                        if remaining in {30, 15, 5} and remaining not in notified_vote:
-                            try:
-                                # Выбираем случайную фразу для напоминания о голосовании
-                                vote_reminder = random.choice(TIME_REMINDER_MESSAGES["voting"]).format(time=remaining)
-                                await bot.send_message(
-                                    global_chat_id,
-                                    vote_reminder,
-                                    message_thread_id=global_message_thread_id,
-                                )
-                                notified_vote.add(remaining)
-                                logger.debug(f"отправлено напоминание о голосовании: {remaining} сек. осталось")
-                            except Exception as e:
-                                logger.exception(f"ошибка отправки напоминания о голосовании: {e}")
-                        await asyncio.sleep(interval)
-                        waited_vote += interval
-
-                    result_msg, executed_id = game_manager.get_voting_results(chat_key)
-                    await bot.send_message(global_chat_id, result_msg, message_thread_id=global_message_thread_id)
-
-                    # executed_id может быть 0 только когда никто не проголосовал — ничья теперь не требует переголосования
-                    
-                    # Проверяем окончание игры только если кого-то казнили
-                    over, winner_msg = game_manager.check_game_over(chat_key)
-                    if over:
-                        logger.info(f"автопилот: игра завершена в чате {chat_key} - победа {'мафии' if 'мафия' in winner_msg else 'мирных'}")
-                        await bot.send_message(global_chat_id, winner_msg, message_thread_id=global_message_thread_id, reply_markup=get_new_game_keyboard())
-                        game_manager.end_game(chat_key)
-                        break
-                    else:
-                        # Сбрасываем флаги переголосования, если казнь состоялась
-                        game = game_manager.get_game(chat_key)
-                        if game:
-                            game.revote_active = False
-                            try:
-                                game.revote_candidates.clear()
-                            except Exception:
-                                game.revote_candidates = set()
-                        
-                        # Проверяем, что игра действительно перешла в ночную фазу
-                        game = game_manager.get_game(chat_key)
-                        if game and game.phase == GamePhase.NIGHT:
-                            logger.info(f"автопилот: голосование завершено, переход к ночной фазе, раунд {game.current_round}")
-                            # Сбрасываем флаги для следующей ночи
-                            game.night_prompts_sent = False
-                            game.all_actions_notified = False
-                            # Продолжаем цикл для обработки ночной фазы
-                            continue
-                        else:
-                            logger.warning(f"автопилот: после голосования игра не перешла в ночную фазу, фаза: {game.phase if game else 'None'}")
-                            # Принудительно переводим в ночь
-                            if game:
-                                game.phase = GamePhase.NIGHT
-                                game.current_round += 1
-                                game.night_prompts_sent = False
-                                game.all_actions_notified = False
-                                logger.info(f"автопилот: принудительно переведена в ночную фазу, раунд {game.current_round}")
-                                continue
+                        game_manager.touch(chat_key)
                 else:
                     # Если не удалось начать голосование, маленькая пауза и попытка снова
-                    await asyncio.sleep(3)
+                    await clock.sleep(3)
+                    continue
+
+            # Голосование (сюда же попадаем, если бот перезапустился посреди голосования)
+            game = game_manager.get_game(chat_key)
+            if game and game.phase == GamePhase.VOTING:
+                # Ждем до конца голосования с напоминаниями; раннее завершение —
+                # когда все живые (и допущенные) проголосовали, об этом сообщит process_vote
+                logger.debug("голосование: начинаем таймер, длительность: %s сек.", VOTING_TIMEOUT_SECS)
+                finished_early = await phase_scheduler.run_phase(
+                    chat_key,
+                    _arm_phase_timer(chat_key, game, VOTING_TIMEOUT_SECS),
+                    can_finish=lambda: game_manager.all_votes_received(chat_key),
+                    on_reminder=functools.partial(_send_phase_reminder, bot, chat_key, "voting"),
+                )
+                if finished_early:
+                    logger.info("голосование: все голоса получены — завершаем досрочно")
+
+                # Голоса, пришедшие во время подсчёта, встанут в очередь игры после него и будут отклонены
+                over, final, announcements = await game_actors.call(chat_key, _finish_voting_command, chat_key)
+                # Окончательный счёт должен оказаться в табло до объявления итогов
+                await voting_scoreboard.flush(chat_key, final)
+                await _announce(bot, global_chat_id, global_message_thread_id, announcements)
+                if over:
+                    break
 
     except asyncio.CancelledError:
-        logger.info(f"автопилот отменен для чата {chat_key}")
+        logger.info("автопилот отменен для чата %s", chat_key)
         raise
     except Exception as e:
-        logger.exception(f"ошибка автопилота в чате {chat_key}: {e}")
-        logger.debug(f"global_chat_id={global_chat_id if 'global_chat_id' in locals() else 'не определен'}, global_message_thread_id={global_message_thread_id if 'global_message_thread_id' in locals() else 'не определен'}")
+        logger.exception("ошибка автопилота в чате %s: %s", chat_key, e)
+        logger.debug("global_chat_id=%s, global_message_thread_id=%s", global_chat_id if 'global_chat_id' in locals() else 'не определен', global_message_thread_id if 'global_message_thread_id' in locals() else 'не определен')
+
+async def drain_autopilots(timeout: float = DRAIN_TIMEOUT_SECS) -> dict[str, float]:
+    """Плавная остановка автопилотов перед перезапуском бота.
+
+    Ждёт (не дольше timeout), пока каждый автопилот дойдёт до контрольной точки —
+    ожидания таймера фазы — и очереди игр опустеют, затем отменяет автопилоты.
+    Возвращает остатки таймеров фаз по chat_key для следующего запуска.
+    """
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + timeout
+    while True:
+        busy = [
+            chat_key for chat_key, task in _autopilot_tasks.items()
+            if not task.done() and not phase_scheduler.is_waiting(chat_key)
+        ]
+        if not busy and not game_actors.queue_depth():
+            break
+        if loop.time() >= give_up_at:
+            logger.warning("drain_autopilots: не дошли до контрольной точки за %s сек.: %s", timeout, busy)
+            break
+        await asyncio.sleep(0.1)
+
+    now = clock.wall()
+    remaining = {}
+    for chat_key, game in game_manager.active_games.items():
+        deadline = _resumed_deadline(game)
+        if deadline is not None:
+            remaining[chat_key] = max(0.0, deadline - now)
+    tasks = [task for task in _autopilot_tasks.values() if not task.done()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    logger.info("drain_autopilots: остановлено автопилотов: %s, таймеров фаз к передаче: %s", len(tasks), len(remaining))
+    return remaining
+
+def resume_autopilots(bot) -> int:
+    """Перезапускает автопилоты игр, восстановленных из хранилища после рестарта бота"""
+    resumed = 0
+    for chat_key, game in list(game_manager.active_games.items()):
+        # Лобби автопилот не нужен — игра стартует по кнопке
+        if game.phase not in (GamePhase.NIGHT, GamePhase.DAY, GamePhase.VOTING):
+            continue
+        if _autopilot_tasks.get(chat_key) and not _autopilot_tasks[chat_key].done():
+            continue
+        if game.is_test_game:
+            loop_coro = _test_autopilot_loop(chat_key, bot, resume=True)
+        else:
+            loop_coro = _autopilot_loop(chat_key, bot)
+        _autopilot_tasks[chat_key] = asyncio.create_task(loop_coro)
+        resumed += 1
+    logger.info("resume_autopilots: возобновлено автопилотов: %s", resumed)
+    return resumed
 
 @router.message(Command("mafia"))
 async def cmd_mafia(message: Message):
     """Обработчик команды /mafia"""
-    logger.debug(f"cmd_mafia: команда /mafia вызвана в чате {message.chat.id}, thread_id={message.message_thread_id}")
+    logger.debug("cmd_mafia: команда /mafia вызвана в чате %s, thread_id=%s", message.chat.id, message.message_thread_id)
     
     # Строгая проверка темы - бот работает ТОЛЬКО в теме "Игра в «Мафию»" (ID: 39431)
     if not check_topic_permission(message):
         await message.answer("⚠️ Команда /mafia должна быть вызвана в теме «Игра в «Мафию»!")
         return
     
-    logger.debug(f"cmd_mafia: доступ разрешен, команда в теме {message.message_thread_id}")
+    logger.debug("cmd_mafia: доступ разрешен, команда в теме %s", message.message_thread_id)
     
     # Создаем игру для этого чата (с учётом темы)
     chat_key = f"{message.chat.id}_{message.message_thread_id or 0}"
+    if game_manager.draining and not game_manager.get_game(chat_key):
+        await message.answer(DRAINING_TEXT)
+        return
     game = game_manager.create_game(chat_key)
-    logger.debug(f"cmd_mafia: создана игра для чата {chat_key}")
+    logger.debug("cmd_mafia: создана игра для чата %s", chat_key)
     
-    # Выбираем случайное приветствие от Дона Витте
-    greeting = random.choice(DON_VITTE_GREETINGS)
+    # Выбираем случайное приветствие от Дона Витте — из жребия новой игры
+    greeting = game.rng().choice(DON_VITTE_GREETINGS)
     
     await message.answer(
         greeting,
@@ -1009,37 +1146,37 @@ async def cmd_mafia(message: Message):
 @router.callback_query(F.data == "test_game")
 async def show_test_game_menu(callback: CallbackQuery):
     """Показывает меню тестовой игры"""
-    logger.debug(f"show_test_game_menu: показано меню тестовой игры для чата {callback.message.chat.id}")
+    logger.debug("show_test_game_menu: показано меню тестовой игры для чата %s", callback.message.chat.id)
     
     # Проверяем права доступа - в теме "Игра в «Мафию»" разрешаем всем админам
     is_admin = False
     is_creator = False
     chat_type = callback.message.chat.type
     
-    logger.debug(f"show_test_game_menu: тип чата: {chat_type}, user_id: {callback.from_user.id}")
+    logger.debug("show_test_game_menu: тип чата: %s, user_id: %s", chat_type, callback.from_user.id)
     
     try:
         member = await callback.message.bot.get_chat_member(callback.message.chat.id, callback.from_user.id)
         is_admin = member.status in {"administrator", "creator"}
         is_creator = member.status == "creator"
-        logger.debug(f"show_test_game_menu: проверка прав - статус: {member.status}, is_admin: {is_admin}, is_creator: {is_creator}")
+        logger.debug("show_test_game_menu: проверка прав - статус: %s, is_admin: %s, is_creator: %s", member.status, is_admin, is_creator)
     except Exception as e:
-        logger.warning(f"show_test_game_menu: не удалось проверить права пользователя: {e}")
+        logger.warning("show_test_game_menu: не удалось проверить права пользователя: %s", e)
         # Если не удалось проверить права в форуме, разрешаем доступ
         if chat_type == "supergroup":
             is_admin = True
-            logger.debug(f"show_test_game_menu: разрешен доступ из-за невозможности проверки прав в супергруппе")
+            logger.debug("show_test_game_menu: разрешен доступ из-за невозможности проверки прав в супергруппе")
     
     # Дополнительная проверка: если это тема "Игра в «Мафию»", то разрешаем доступ
     if not (is_admin or is_creator):
         if check_topic_permission(callback.message):
             is_admin = True
-            logger.debug(f"show_test_game_menu: разрешен доступ в теме «Игра в «Мафию»»")
+            logger.debug("show_test_game_menu: разрешен доступ в теме «Игра в «Мафию»»")
     
     # ВРЕМЕННО: для разработки разрешаем всем в теме "Игра в «Мафию»"
     if not (is_admin or is_creator):
         if check_topic_permission(callback.message):
-            logger.warning(f"show_test_game_menu: ВРЕМЕННЫЙ доступ к тестовой игре для разработки")
+            logger.warning("show_test_game_menu: ВРЕМЕННЫЙ доступ к тестовой игре для разработки")
             # Разрешаем доступ для разработки
         else:
             await callback.answer("⚠️ Тестовая игра доступна только в теме «Игра в «Мафию»»!", show_alert=True)
@@ -1064,7 +1201,10 @@ async def show_test_game_menu(callback: CallbackQuery):
 @router.callback_query(F.data == "start_test_game")
 async def start_test_game(callback: CallbackQuery):
     """Запускает тестовую игру"""
-    logger.debug(f"start_test_game: попытка запуска тестовой игры в чате {callback.message.chat.id}")
+    logger.debug("start_test_game: попытка запуска тестовой игры в чате %s", callback.message.chat.id)
+    if game_manager.draining:
+        await callback.answer(DRAINING_TEXT, show_alert=True)
+        return
     
     # Проверяем права доступа - более гибкая проверка
     is_admin = False
@@ -1075,24 +1215,24 @@ async def start_test_game(callback: CallbackQuery):
         member = await callback.message.bot.get_chat_member(callback.message.chat.id, callback.from_user.id)
         is_admin = member.status in {"administrator", "creator"}
         is_creator = member.status == "creator"
-        logger.debug(f"start_test_game: статус пользователя: {member.status}")
+        logger.debug("start_test_game: статус пользователя: %s", member.status)
     except Exception as e:
-        logger.warning(f"start_test_game: не удалось проверить права пользователя: {e}")
+        logger.warning("start_test_game: не удалось проверить права пользователя: %s", e)
         # Если не удалось проверить права, разрешаем доступ в супергруппе
         if chat_type == "supergroup":
             is_admin = True
-            logger.debug(f"start_test_game: разрешен доступ в супергруппе")
+            logger.debug("start_test_game: разрешен доступ в супергруппе")
     
     # Дополнительная проверка: если это тема "Игра в «Мафию»", то разрешаем доступ
     if not (is_admin or is_creator):
         if check_topic_permission(callback.message):
             is_admin = True
-            logger.debug(f"start_test_game: разрешен доступ в теме «Игра в «Мафию»»")
+            logger.debug("start_test_game: разрешен доступ в теме «Игра в «Мафию»»")
     
     # ВРЕМЕННО: для разработки разрешаем всем в теме "Игра в «Мафию»"
     if not (is_admin or is_creator):
         if check_topic_permission(callback.message):
-            logger.warning(f"start_test_game: ВРЕМЕННЫЙ доступ к тестовой игре для разработки")
+            logger.warning("start_test_game: ВРЕМЕННЫЙ доступ к тестовой игре для разработки")
             # Разрешаем доступ для разработки
         else:
             await callback.answer("⚠️ Тестовая игра доступна только в теме «Игра в «Мафию»»!", show_alert=True)
@@ -1102,7 +1242,7 @@ async def start_test_game(callback: CallbackQuery):
     
     # Останавливаем предыдущий автопилот если есть
     if _autopilot_tasks.get(chat_key) and not _autopilot_tasks[chat_key].done():
-        logger.info(f"start_test_game: остановка предыдущего автопилота для чата {chat_key}")
+        logger.info("start_test_game: остановка предыдущего автопилота для чата %s", chat_key)
         _autopilot_tasks[chat_key].cancel()
         await asyncio.sleep(1)  # Ждем завершения
     
@@ -1110,27 +1250,28 @@ async def start_test_game(callback: CallbackQuery):
     game_manager.end_game(chat_key)
     
     # Создаем тестовую игру
-    logger.info(f"start_test_game: создание тестовой игры для чата {chat_key}")
+    logger.info("start_test_game: создание тестовой игры для чата %s", chat_key)
     game = game_manager.create_test_game(chat_key)
     
     if game:
         # Устанавливаем начальную фазу игры
         game.phase = GamePhase.NIGHT
         game.current_round = 1
-        logger.info(f"start_test_game: игра создана, фаза: {game.phase}, раунд: {game.current_round}, игроков: {len(game.players)}")
+        game_manager.touch(chat_key)
+        logger.info("start_test_game: игра создана, фаза: %s, раунд: %s, игроков: %s", game.phase, game.current_round, len(game.players))
         
         # Дополнительная диагностика
         if len(game.players) == 0:
-            logger.error(f"start_test_game: КРИТИЧЕСКАЯ ОШИБКА! Игроки не созданы!")
+            logger.error("start_test_game: КРИТИЧЕСКАЯ ОШИБКА! Игроки не созданы!")
             await callback.message.answer(
                 "❌ ОШИБКА СОЗДАНИЯ ТЕСТОВОЙ ИГРЫ!\n\n"
                 "Игроки не были созданы. Проверьте логи для диагностики.",
                 reply_markup=get_test_game_control_keyboard()
             )
         else:
-            logger.info(f"start_test_game: успешно создано {len(game.players)} игроков")
+            logger.info("start_test_game: успешно создано %s игроков", len(game.players))
             for player_id, player in game.players.items():
-                logger.debug(f"start_test_game: игрок {player_id}: {player.first_name} ({player.role.value})")
+                logger.debug("start_test_game: игрок %s: %s (%s)", player_id, player.first_name, player.role.value)
         
             await callback.message.answer(
                 "🧪 ТЕСТОВАЯ ИГРА ЗАПУЩЕНА! 🧪\n\n"
@@ -1142,15 +1283,15 @@ async def start_test_game(callback: CallbackQuery):
             )
         
         # Запускаем автопилот для тестовой игры
-        logger.info(f"start_test_game: запуск тестового автопилота для чата {chat_key}")
+        logger.info("start_test_game: запуск тестового автопилота для чата %s", chat_key)
         if _autopilot_tasks.get(chat_key) and not _autopilot_tasks[chat_key].done():
-            logger.info(f"start_test_game: отмена предыдущего автопилота для чата {chat_key}")
+            logger.info("start_test_game: отмена предыдущего автопилота для чата %s", chat_key)
             _autopilot_tasks[chat_key].cancel()
         
         _autopilot_tasks[chat_key] = asyncio.create_task(_test_autopilot_loop(chat_key, callback.bot))
-        logger.info(f"start_test_game: тестовый автопилот создан как задача для чата {chat_key}")
+        logger.info("start_test_game: тестовый автопилот создан как задача для чата %s", chat_key)
         
-        logger.info(f"start_test_game: тестовая игра запущена в чате {chat_key}")
+        logger.info("start_test_game: тестовая игра запущена в чате %s", chat_key)
     else:
         await callback.answer("❌ Не удалось запустить тестовую игру!", show_alert=True)
     
@@ -1159,7 +1300,7 @@ async def start_test_game(callback: CallbackQuery):
 @router.callback_query(F.data == "stop_test_game")
 async def stop_test_game(callback: CallbackQuery):
     """Останавливает тестовую игру"""
-    logger.debug(f"stop_test_game: попытка остановки тестовой игры в чате {callback.message.chat.id}")
+    logger.debug("stop_test_game: попытка остановки тестовой игры в чате %s", callback.message.chat.id)
     
     # Проверяем права доступа - более гибкая проверка
     is_admin = False
@@ -1170,24 +1311,24 @@ async def stop_test_game(callback: CallbackQuery):
         member = await callback.message.bot.get_chat_member(callback.message.chat.id, callback.from_user.id)
         is_admin = member.status in {"administrator", "creator"}
         is_creator = member.status == "creator"
-        logger.debug(f"stop_test_game: статус пользователя: {member.status}")
+        logger.debug("stop_test_game: статус пользователя: %s", member.status)
     except Exception as e:
-        logger.warning(f"stop_test_game: не удалось проверить права пользователя: {e}")
+        logger.warning("stop_test_game: не удалось проверить права пользователя: %s", e)
         # Если не удалось проверить права, разрешаем доступ в супергруппе
         if chat_type == "supergroup":
             is_admin = True
-            logger.debug(f"stop_test_game: разрешен доступ в супергруппе")
+            logger.debug("stop_test_game: разрешен доступ в супергруппе")
     
     # Дополнительная проверка: если это тема "Игра в «Мафию»", то разрешаем доступ
     if not (is_admin or is_creator):
         if check_topic_permission(callback.message):
             is_admin = True
-            logger.debug(f"stop_test_game: разрешен доступ в теме «Игра в «Мафию»»")
+            logger.debug("stop_test_game: разрешен доступ в теме «Игра в «Мафию»»")
     
     # ВРЕМЕННО: для разработки разрешаем всем в теме "Игра в «Мафию»"
     if not (is_admin or is_creator):
         if check_topic_permission(callback.message):
-            logger.warning(f"stop_test_game: ВРЕМЕННЫЙ доступ к тестовой игре для разработки")
+            logger.warning("stop_test_game: ВРЕМЕННЫЙ доступ к тестовой игре для разработки")
             # Разрешаем доступ для разработки
         else:
             await callback.answer("⚠️ Тестовая игра доступна только в теме «Игра в «Мафию»»!", show_alert=True)
@@ -1210,135 +1351,141 @@ async def stop_test_game(callback: CallbackQuery):
         reply_markup=get_main_menu_keyboard()
     )
     
-    logger.info(f"stop_test_game: тестовая игра остановлена в чате {chat_key}")
+    logger.info("stop_test_game: тестовая игра остановлена в чате %s", chat_key)
     await callback.answer()
 
-async def _test_autopilot_loop(chat_key: str, bot):
-    """Автопилот для тестовой игры"""
-    logger.info(f"старт тестового автопилота для чата {chat_key}")
+async def _test_pause(chat_key: str, seconds: float) -> None:
+    """Пауза тестового автопилота — как и ожидание фазы, это контрольная точка drain_autopilots"""
+    await phase_scheduler.run_phase(chat_key, seconds, reminders=())
+
+async def _test_autopilot_loop(chat_key: str, bot, resume: bool = False):
+    """Автопилот для тестовой игры (resume=True — продолжить восстановленную игру с текущей фазы)"""
+    logger.info("старт тестового автопилота для чата %s", chat_key)
     try:
         global_chat_id = get_chat_id_from_key(chat_key)
         global_thread_id = get_thread_id_from_key(chat_key)
         global_message_thread_id = None if global_thread_id == 0 else global_thread_id
         
-        logger.debug(f"тестовый автопилот: chat_id={global_chat_id}, thread_id={global_thread_id}")
+        logger.debug("тестовый автопилот: chat_id=%s, thread_id=%s", global_chat_id, global_thread_id)
         
         # Начинаем с ночной фазы
         game = game_manager.get_game(chat_key)
-        if game:
+        if game and not resume:
             game.phase = GamePhase.NIGHT
             game.current_round = 1
-            logger.info(f"тестовый автопилот: установлена начальная фаза NIGHT для чата {chat_key}")
+            game_manager.touch(chat_key)
+            logger.info("тестовый автопилот: установлена начальная фаза NIGHT для чата %s", chat_key)
         
         while True:
             game = game_manager.get_game(chat_key)
             if not game or game.phase == GamePhase.ENDED or not game.is_test_game:
-                logger.info(f"тестовый автопилот завершен для чата {chat_key}")
+                logger.info("тестовый автопилот завершен для чата %s", chat_key)
                 break
             
-            logger.info(f"тестовый автопилот: === НАЧАЛО ЦИКЛА ===")
-            logger.info(f"тестовый автопилот: фаза: {game.phase}, раунд: {game.current_round}")
-            logger.info(f"тестовый автопилот: живых игроков: {len(game.get_alive_players())}")
-            logger.info(f"тестовый автопилот: всего игроков: {len(game.players)}")
+            logger.info("тестовый автопилот: === НАЧАЛО ЦИКЛА ===")
+            logger.info("тестовый автопилот: фаза: %s, раунд: %s", game.phase, game.current_round)
+            logger.info("тестовый автопилот: живых игроков: %s", len(game.get_alive_players()))
+            logger.info("тестовый автопилот: всего игроков: %s", len(game.players))
             
             # Логируем состояние всех игроков
             for player_id, player in game.players.items():
                 status = "ЖИВ" if player.is_alive else "МЕРТВ"
-                logger.debug(f"тестовый автопилот: игрок {player.first_name} (ID: {player_id}): {status}, роль: {player.role.value}")
+                logger.debug("тестовый автопилот: игрок %s (ID: %s): %s, роль: %s", player.first_name, player_id, status, player.role.value)
             
-            logger.info(f"тестовый автопилот: ===================")
+            logger.info("тестовый автопилот: ===================")
             
             # Ночь
             if game.phase == GamePhase.NIGHT:
-                logger.info(f"тестовый автопилот: ночная фаза в чате {chat_key}")
-                night_message = random.choice(NIGHT_PHASE_MESSAGES)
+                logger.info("тестовый автопилот: ночная фаза в чате %s", chat_key)
+                night_message = game.rng().choice(NIGHT_PHASE_MESSAGES)
                 await bot.send_message(global_chat_id, night_message, message_thread_id=global_message_thread_id)
                 
                 # Ждем немного для имитации размышлений игроков
-                await asyncio.sleep(5)
+                await _test_pause(chat_key, 5)
                 
                 # Автоматически выполняем ночные действия
-                logger.info(f"тестовый автопилот: выполнение ночных действий для раунда {game.current_round}")
+                logger.info("тестовый автопилот: выполнение ночных действий для раунда %s", game.current_round)
                 game_manager.execute_test_night_actions(chat_key)
                 
                 # Проверяем результаты ночных действий
                 game = game_manager.get_game(chat_key)
                 if game:
-                    logger.info(f"тестовый автопилот: === ПРОВЕРКА РЕЗУЛЬТАТОВ НОЧИ {game.current_round} ===")
-                    logger.info(f"тестовый автопилот: Цель мафии: {game.night_kill_target}")
-                    logger.info(f"тестовый автопилот: Спасения доктора: {game.doctor_saves}")
-                    logger.info(f"тестовый автопилот: Проверки комиссара: {game.commissioner_check_results}")
-                    logger.info(f"тестовый автопилот: Отвлечения бабочки: {game.butterfly_distract_target}")
+                    logger.info("тестовый автопилот: === ПРОВЕРКА РЕЗУЛЬТАТОВ НОЧИ %s ===", game.current_round)
+                    logger.info("тестовый автопилот: Цель мафии: %s", game.night_kill_target)
+                    logger.info("тестовый автопилот: Спасения доктора: %s", game.doctor_saves)
+                    logger.info("тестовый автопилот: Проверки комиссара: %s", game.commissioner_check_results)
+                    logger.info("тестовый автопилот: Отвлечения бабочки: %s", game.butterfly_distract_target)
                     
                     # Проверяем, кто выжил
                     alive_after_night = game.get_alive_players()
-                    logger.info(f"тестовый автопилот: После ночи живых игроков: {len(alive_after_night)}")
+                    logger.info("тестовый автопилот: После ночи живых игроков: %s", len(alive_after_night))
                     for player in alive_after_night:
-                        logger.debug(f"тестовый автопилот: жив: {player.first_name} ({player.role.value})")
-                    logger.info(f"тестовый автопилот: ==========================================")
+                        logger.debug("тестовый автопилот: жив: %s (%s)", player.first_name, player.role.value)
+                    logger.info("тестовый автопилот: ==========================================")
                 
                 # Переходим к дню
-                game.phase = GamePhase.DAY
-                game.current_round += 1
-                logger.info(f"тестовый автопилот: переход к дневной фазе, раунд {game.current_round}")
+                game_manager.finish_test_night(chat_key)
+                logger.info("тестовый автопилот: переход к дневной фазе, раунд %s", game.current_round)
                 
                 # Ждем немного перед днем
-                await asyncio.sleep(3)
+                await _test_pause(chat_key, 3)
             
             # День
             elif game.phase == GamePhase.DAY:
-                logger.info(f"тестовый автопилот: дневная фаза в чате {chat_key}")
-                day_message = random.choice(DAY_PHASE_MESSAGES)
+                logger.info("тестовый автопилот: дневная фаза в чате %s", chat_key)
+                day_message = game.rng().choice(DAY_PHASE_MESSAGES)
                 await bot.send_message(global_chat_id, day_message, message_thread_id=global_message_thread_id)
                 
                 # Ждем немного для имитации обсуждения
-                await asyncio.sleep(10)
+                await _test_pause(chat_key, 10)
                 
                 # Переходим к голосованию
-                logger.info(f"тестовый автопилот: попытка начать голосование в чате {chat_key}")
+                logger.info("тестовый автопилот: попытка начать голосование в чате %s", chat_key)
                 if game_manager.start_voting(chat_key):
                     game.phase = GamePhase.VOTING
-                    logger.info(f"тестовый автопилот: голосование начато, фаза изменена на VOTING")
+                    game_manager.touch(chat_key)
+                    logger.info("тестовый автопилот: голосование начато, фаза изменена на VOTING")
                 else:
                     # Если не удалось начать голосование, переходим к ночи
-                    logger.warning(f"тестовый автопилот: не удалось начать голосование, переходим к ночи")
+                    logger.warning("тестовый автопилот: не удалось начать голосование, переходим к ночи")
                     game.phase = GamePhase.NIGHT
+                    game_manager.touch(chat_key)
                     continue
             
             # Голосование
             elif game.phase == GamePhase.VOTING:
-                logger.info(f"тестовый автопилот: голосование в чате {chat_key}")
-                voting_message = random.choice(VOTING_START_MESSAGES)
+                logger.info("тестовый автопилот: голосование в чате %s", chat_key)
+                voting_message = game.rng().choice(VOTING_START_MESSAGES)
                 await bot.send_message(global_chat_id, voting_message, message_thread_id=global_message_thread_id)
                 
                 # Ждем немного для имитации голосования
-                await asyncio.sleep(8)
+                await _test_pause(chat_key, 8)
                 
                 # Автоматически выполняем голосование
-                logger.info(f"тестовый автопилот: выполнение автоматического голосования в чате {chat_key}")
+                logger.info("тестовый автопилот: выполнение автоматического голосования в чате %s", chat_key)
                 game_manager.execute_test_voting(chat_key)
                 
                 # Проверяем результаты голосования
                 game = game_manager.get_game(chat_key)
                 if game:
-                    logger.info(f"тестовый автопилот: === ПРОВЕРКА РЕЗУЛЬТАТОВ ГОЛОСОВАНИЯ ===")
-                    logger.info(f"тестовый автопилот: Всего голосов: {len(game.votes)}")
+                    logger.info("тестовый автопилот: === ПРОВЕРКА РЕЗУЛЬТАТОВ ГОЛОСОВАНИЯ ===")
+                    logger.info("тестовый автопилот: Всего голосов: %s", len(game.votes))
                     for voter_id, target_id in game.votes.items():
                         voter = game.players.get(voter_id)
                         target = game.players.get(target_id)
                         if voter and target:
-                            logger.info(f"тестовый автопилот: голос: {voter.first_name} ({voter.role.value}) → {target.first_name} ({target.role.value})")
-                    logger.info(f"тестовый автопилот: ==========================================")
+                            logger.info("тестовый автопилот: голос: %s (%s) → %s (%s)", voter.first_name, voter.role.value, target.first_name, target.role.value)
+                    logger.info("тестовый автопилот: ==========================================")
                 
                 # Получаем результаты голосования
-                logger.info(f"тестовый автопилот: получение результатов голосования в чате {chat_key}")
+                logger.info("тестовый автопилот: получение результатов голосования в чате %s", chat_key)
                 result_msg, executed_id = game_manager.get_voting_results(chat_key)
                 await bot.send_message(global_chat_id, result_msg, message_thread_id=global_message_thread_id)
                 
                 # Проверяем окончание игры
                 over, winner_msg = game_manager.check_game_over(chat_key)
                 if over:
-                    logger.info(f"тестовый автопилот: игра завершена в чате {chat_key}")
+                    logger.info("тестовый автопилот: игра завершена в чате %s", chat_key)
                     await bot.send_message(global_chat_id, winner_msg, message_thread_id=global_message_thread_id)
                     game_manager.end_game(chat_key)
                     break
@@ -1346,22 +1493,23 @@ async def _test_autopilot_loop(chat_key: str, bot):
                 # Переходим к ночи
                 game.phase = GamePhase.NIGHT
                 game.current_round += 1
-                logger.info(f"тестовый автопилот: переход к ночной фазе, раунд {game.current_round}")
-                await asyncio.sleep(3)
+                game_manager.touch(chat_key)
+                logger.info("тестовый автопилот: переход к ночной фазе, раунд %s", game.current_round)
+                await _test_pause(chat_key, 3)
             
             # Небольшая пауза между циклами
-            await asyncio.sleep(1)
+            await _test_pause(chat_key, 1)
             
     except asyncio.CancelledError:
-        logger.info(f"тестовый автопилот отменен для чата {chat_key}")
+        logger.info("тестовый автопилот отменен для чата %s", chat_key)
         raise
     except Exception as e:
-        logger.exception(f"ошибка тестового автопилота в чате {chat_key}: {e}")
+        logger.exception("ошибка тестового автопилота в чате %s: %s", chat_key, e)
 
 @router.callback_query(F.data == "rules")
 async def show_rules(callback: CallbackQuery):
     """Показывает правила игры"""
-    logger.debug(f"show_rules: показ правил для чата {callback.message.chat.id}")
+    logger.debug("show_rules: показ правил для чата %s", callback.message.chat.id)
     
     rules_text = (
         "📜 ПРАВИЛА ИГРЫ «МАФИЯ МУИВ» 📜\n\n"
@@ -1392,7 +1540,7 @@ async def show_rules(callback: CallbackQuery):
 @router.callback_query(F.data == "how_to_play")
 async def show_how_to_play(callback: CallbackQuery):
     """Показывает инструкцию по игре"""
-    logger.debug(f"show_how_to_play: показ инструкции для чата {callback.message.chat.id}")
+    logger.debug("show_how_to_play: показ инструкции для чата %s", callback.message.chat.id)
     
     how_to_play_text = (
         "❓ КАК ИГРАТЬ ❓\n\n"
@@ -1429,24 +1577,28 @@ async def start_game_lobby(callback: CallbackQuery):
     thread_id = callback.message.message_thread_id or 0
     chat_key = f"{chat_id}_{thread_id}"
     
-    logger.info(f"start_game_lobby: создание лобби для чата {chat_key} пользователем {callback.from_user.first_name} (@{callback.from_user.username})")
+    logger.info("start_game_lobby: создание лобби для чата %s пользователем %s (@%s)", chat_key, callback.from_user.first_name, callback.from_user.username)
+    if game_manager.draining:
+        await callback.answer(DRAINING_TEXT, show_alert=True)
+        return
     
     # Создаем игру, если её нет
     game = game_manager.get_game(chat_key)
     if not game:
-        logger.debug(f"start_game_lobby: игра не найдена, создаем новую")
+        logger.debug("start_game_lobby: игра не найдена, создаем новую")
         game = game_manager.create_game(chat_key)
-        logger.info(f"start_game_lobby: создана новая игра для чата {chat_key}")
+        logger.info("start_game_lobby: создана новая игра для чата %s", chat_key)
     
     # Сохраняем создателя лобби (если еще не установлен)
     if not getattr(game, "lobby_creator_id", None):
         try:
             game.lobby_creator_id = callback.from_user.id
-            logger.debug(f"start_game_lobby: установлен создатель лобби: {callback.from_user.id}")
+            game_manager.touch(chat_key)
+            logger.debug("start_game_lobby: установлен создатель лобби: %s", callback.from_user.id)
         except Exception as e:
-            logger.exception(f"start_game_lobby: ошибка установки создателя лобби: {e}")
+            logger.exception("start_game_lobby: ошибка установки создателя лобби: %s", e)
     
-        logger.debug(f"start_game_lobby: лобби игры для чата {chat_key}, игроков: {len(game.players)}")
+        logger.debug("start_game_lobby: лобби игры для чата %s, игроков: %s", chat_key, len(game.players))
     
         # Формируем список игроков
     player_list = []
@@ -1486,18 +1638,18 @@ async def join_game(callback: CallbackQuery):
     username = callback.from_user.username or "Unknown"
     first_name = callback.from_user.first_name or "Unknown"
     
-    logger.info(f"join_game: игрок {first_name} (@{callback.from_user.username}) присоединяется к игре в чате {chat_key}")
+    logger.info("join_game: игрок %s (@%s) присоединяется к игре в чате %s", first_name, callback.from_user.username, chat_key)
     
     if game_manager.add_player(chat_key, user_id, username, first_name):
-        logger.info(f"join_game: игрок {first_name} успешно присоединился к игре в чате {chat_key}")
+        logger.info("join_game: игрок %s успешно присоединился к игре в чате %s", first_name, chat_key)
         game = game_manager.get_game(chat_key)
         
         # Удаляем старое сообщение лобби
         try:
             await callback.message.delete()
-            logger.debug(f"join_game: удалено старое сообщение лобби")
+            logger.debug("join_game: удалено старое сообщение лобби")
         except TelegramBadRequest as e:
-            logger.debug(f"join_game: не удалось удалить старое сообщение лобби: {e}")
+            logger.debug("join_game: не удалось удалить старое сообщение лобби: %s", e)
         
         # Формируем обновленный список игроков
         player_list = []
@@ -1518,7 +1670,7 @@ async def join_game(callback: CallbackQuery):
             reply_markup=get_lobby_keyboard()
         )
     else:
-        logger.warning(f"join_game: не удалось присоединить игрока {first_name} к игре в чате {chat_key}")
+        logger.warning("join_game: не удалось присоединить игрока %s к игре в чате %s", first_name, chat_key)
         await callback.answer("Не удалось присоединиться к игре!", show_alert=True)
     
     await callback.answer()
@@ -1537,7 +1689,7 @@ async def leave_game(callback: CallbackQuery):
     user_id = callback.from_user.id
     first_name = callback.from_user.first_name or "Unknown"
     
-    logger.info(f"leave_game: игрок {first_name} выходит из игры в чате {chat_key}")
+    logger.info("leave_game: игрок %s выходит из игры в чате %s", first_name, chat_key)
     
     if game_manager.remove_player(chat_key, user_id):
         game = game_manager.get_game(chat_key)
@@ -1546,7 +1698,7 @@ async def leave_game(callback: CallbackQuery):
             await callback.message.delete()
             logger.debug("leave_game: удалено старое сообщение лобби")
         except TelegramBadRequest as e:
-            logger.debug(f"leave_game: не удалось удалить старое сообщение лобби: {e}")
+            logger.debug("leave_game: не удалось удалить старое сообщение лобби: %s", e)
         
         # Формируем обновленный список игроков
         player_list = []
@@ -1563,11 +1715,77 @@ async def leave_game(callback: CallbackQuery):
             reply_markup=get_lobby_keyboard()
         )
     else:
-        logger.warning(f"leave_game: не удалось удалить игрока {first_name} из игры в чате {chat_key}")
+        logger.warning("leave_game: не удалось удалить игрока %s из игры в чате %s", first_name, chat_key)
         await callback.answer("Не удалось выйти из игры!", show_alert=True)
     
     await callback.answer()
 
+async def _send_role_dm(bot, chat_key: str, game, player) -> None:
+    """Роль игрока в ЛС; для активных ролей — сразу с ночной клавиатурой"""
+    role_emoji = {
+        PlayerRole.MAFIA: "😈",
+        PlayerRole.CIVILIAN: "🕊️",
+        PlayerRole.DOCTOR: "💉",
+        PlayerRole.COMMISSIONER: "👮",
+        PlayerRole.BUTTERFLY: "💃"
+    }.get(player.role, "❓")
+
+    role_name = {
+        PlayerRole.MAFIA: "Мафия",
+        PlayerRole.CIVILIAN: "Мирный житель",
+        PlayerRole.DOCTOR: "Доктор",
+        PlayerRole.COMMISSIONER: "Комиссар",
+        PlayerRole.BUTTERFLY: "Ночная бабочка"
+    }.get(player.role, "Неизвестная роль")
+
+    role_description = INSTRUCTIONS_BY_ROLE.get(player.role, "Неизвестная роль")
+
+    # Готовим один текст роли и в том же сообщении прикладываем нужную клавиатуру
+    base_text = (
+        f"🎭 Твоя роль — {role_emoji} {role_name}\n\n"
+        f"{role_description}"
+    )
+    if not getattr(player, "role_info_sent", False):
+        if player.role == PlayerRole.MAFIA:
+            await bot.send_message(
+                player.user_id,
+                base_text + "\n\n😈 Выберите жертву:",
+                reply_markup=get_player_selection_keyboard(list(game.players.values()), "mafia_kill", chat_key, roster_version=game.players.version)
+            )
+            # Сразу после раздачи ролей сообщим мафии о сообщниках
+            try:
+                peers = game_manager.get_mafia_peers(chat_key, exclude_user_id=player.user_id)
+                if peers:
+                    mafia_list = ", ".join([f"@{p.username}" if p.username else p.first_name for p in peers])
+                    await bot.send_message(
+                        player.user_id,
+                        f"🤫 Твои сообщники: {mafia_list}. Можете обсуждать прямо здесь в ЛС — я передам им твои сообщения."
+                    )
+            except Exception as e:
+                logger.exception("не удалось отправить список сообщников мафии игроку %s: %s", player.user_id, e)
+        elif player.role == PlayerRole.DOCTOR:
+            await bot.send_message(
+                player.user_id,
+                base_text + "\n\n💉 Выберите, кого лечить:",
+                reply_markup=get_player_selection_keyboard(list(game.players.values()), "doctor_save", chat_key, roster_version=game.players.version)
+            )
+        elif player.role == PlayerRole.COMMISSIONER:
+            await bot.send_message(
+                player.user_id,
+                base_text + "\n\n👮 Выберите, кого проверить:",
+                reply_markup=get_player_selection_keyboard(list(game.players.values()), "commissioner_check", chat_key, roster_version=game.players.version)
+            )
+        elif player.role == PlayerRole.BUTTERFLY:
+            await bot.send_message(
+                player.user_id,
+                base_text + "\n\n💃 Выберите, кого отвлечь:",
+                reply_markup=get_player_selection_keyboard(list(game.players.values()), "butterfly_distract", chat_key, roster_version=game.players.version)
+            )
+        else:
+            # Мирному просто отправляем роль без клавиатуры
+            await bot.send_message(player.user_id, base_text)
+        player.role_info_sent = True
+
 @router.callback_query(F.data == "ready_to_start")
 async def ready_to_start(callback: CallbackQuery):
     """Админ готов начать игру"""
@@ -1579,10 +1797,13 @@ async def ready_to_start(callback: CallbackQuery):
     chat_key = get_chat_key(callback.message)
     
     logger.debug(
-        f"ready_to_start вызван для чата {chat_key} пользователем: "
-        f"{callback.from_user.first_name} (@{callback.from_user.username}) id={callback.from_user.id}"
+        "ready_to_start вызван для чата %s пользователем: %s (@%s) id=%s", chat_key, callback.from_user.first_name, callback.from_user.username, callback.from_user.id
     )
     
+    if game_manager.draining:
+        await callback.answer(DRAINING_TEXT, show_alert=True)
+        return
+
     if not game_manager.can_start_game(chat_key):
         logger.warning("ready_to_start: игра не может быть начата")
         await callback.answer("Не удалось начать игру! Убедитесь, что есть хотя бы 1 игрок.", show_alert=True)
@@ -1593,7 +1814,7 @@ async def ready_to_start(callback: CallbackQuery):
     
     # Логируем, кто нажал кнопку старта
     user_info = f"{callback.from_user.first_name} (@{callback.from_user.username}) id={callback.from_user.id}"
-    logger.info(f"ready_to_start: кнопка старта нажата пользователем {user_info} в чате {chat_key}")
+    logger.info("ready_to_start: кнопка старта нажата пользователем %s в чате %s", user_info, chat_key)
     
     # Проверяем статус пользователя для информационных целей
     is_creator = getattr(game, "lobby_creator_id", None) == callback.from_user.id if game else False
@@ -1601,19 +1822,19 @@ async def ready_to_start(callback: CallbackQuery):
     try:
         member = await callback.message.bot.get_chat_member(callback.message.chat.id, callback.from_user.id)
         is_admin = member.status in {"administrator", "creator"}
-        logger.debug(f"ready_to_start: статус пользователя - {member.status}, is_admin: {is_admin}, is_creator: {is_creator}")
+        logger.debug("ready_to_start: статус пользователя - %s, is_admin: %s, is_creator: %s", member.status, is_admin, is_creator)
     except TelegramBadRequest as e:
-        logger.debug(f"ready_to_start: не удалось проверить статус пользователя: {e}")
+        logger.debug("ready_to_start: не удалось проверить статус пользователя: %s", e)
     
-    logger.info(f"ready_to_start: запускаем игру, нажал: {user_info}")
+    logger.info("ready_to_start: запускаем игру, нажал: %s", user_info)
     
     if game_manager.start_game(chat_key):
-        logger.info(f"ready_to_start: игра успешно начата в чате {chat_key} с {len(game.players)} игроками")
+        logger.info("ready_to_start: игра успешно начата в чате %s с %s игроками", chat_key, len(game.players))
         game = game_manager.get_game(chat_key)
         
         # Отправляем сообщение в чат
         # Выбираем случайное сообщение о начале игры
-        game_start_message = random.choice(GAME_START_MESSAGES)
+        game_start_message = game.rng().choice(GAME_START_MESSAGES)
         full_game_start_message = (
             game_start_message + "\n\n"
             "📋 Сегодня за этим столом:\n" +
@@ -1631,90 +1852,30 @@ async def ready_to_start(callback: CallbackQuery):
         await callback.message.answer(full_game_start_message)
 
         
-        # Раздаем роли в личные сообщения (одно сообщение с клавиатурой)
+        # Раздаем роли в личные сообщения (одно сообщение с клавиатурой) параллельно
         not_started_dm = []
         players_to_remove = []  # Список ID игроков для удаления
-        logger.info(f"ready_to_start: начинаем раздачу ролей для {len(game.players)} игроков")
-        for player in game.players.values():
-            try:
-                role_emoji = {
-                    PlayerRole.MAFIA: "😈",
-                    PlayerRole.CIVILIAN: "🕊️",
-                    PlayerRole.DOCTOR: "💉",
-                    PlayerRole.COMMISSIONER: "👮",
-                    PlayerRole.BUTTERFLY: "💃"
-                }.get(player.role, "❓")
-                
-                role_name = {
-                    PlayerRole.MAFIA: "Мафия",
-                    PlayerRole.CIVILIAN: "Мирный житель",
-                    PlayerRole.DOCTOR: "Доктор",
-                    PlayerRole.COMMISSIONER: "Комиссар",
-                    PlayerRole.BUTTERFLY: "Ночная бабочка"
-                }.get(player.role, "Неизвестная роль")
-                
-                role_description = INSTRUCTIONS_BY_ROLE.get(player.role, "Неизвестная роль")
-
-                # Готовим один текст роли и в том же сообщении прикладываем нужную клавиатуру
-                base_text = (
-                    f"🎭 Твоя роль — {role_emoji} {role_name}\n\n"
-                    f"{role_description}"
-                )
-                if not getattr(player, "role_info_sent", False):
-                    if player.role == PlayerRole.MAFIA:
-                        await callback.bot.send_message(
-                            player.user_id,
-                            base_text + "\n\n😈 Выберите жертву:",
-                            reply_markup=get_player_selection_keyboard(list(game.players.values()), "mafia_kill", chat_key)
-                        )
-                        # Сразу после раздачи ролей сообщим мафии о сообщниках
-                        try:
-                            peers = game_manager.get_mafia_peers(chat_key, exclude_user_id=player.user_id)
-                            if peers:
-                                mafia_list = ", ".join([f"@{p.username}" if p.username else p.first_name for p in peers])
-                                await callback.bot.send_message(
-                                    player.user_id,
-                                    f"🤫 Твои сообщники: {mafia_list}. Можете обсуждать прямо здесь в ЛС — я передам им твои сообщения."
-                                )
-                        except Exception as e:
-                            logger.exception(f"не удалось отправить список сообщников мафии игроку {player.user_id}: {e}")
-                    elif player.role == PlayerRole.DOCTOR:
-                        await callback.bot.send_message(
-                            player.user_id,
-                            base_text + "\n\n💉 Выберите, кого лечить:",
-                            reply_markup=get_player_selection_keyboard(list(game.players.values()), "doctor_save", chat_key)
-                        )
-                    elif player.role == PlayerRole.COMMISSIONER:
-                        await callback.bot.send_message(
-                            player.user_id,
-                            base_text + "\n\n👮 Выберите, кого проверить:",
-                            reply_markup=get_player_selection_keyboard(list(game.players.values()), "commissioner_check", chat_key)
-                        )
-                    elif player.role == PlayerRole.BUTTERFLY:
-                        await callback.bot.send_message(
-                            player.user_id,
-                            base_text + "\n\n💃 Выберите, кого отвлечь:",
-                            reply_markup=get_player_selection_keyboard(list(game.players.values()), "butterfly_distract", chat_key)
-                        )
-                    else:
-                        # Мирному просто отправляем роль без клавиатуры
-                        await callback.bot.send_message(player.user_id, base_text)
-                    player.role_info_sent = True
-                
-            except TelegramForbiddenError as e:
+        logger.info("ready_to_start: начинаем раздачу ролей для %s игроков", len(game.players))
+        with send_priority(Priority.HIGH):
+            failures = await fan_out(
+                list(game.players.values()),
+                functools.partial(_send_role_dm, callback.bot, chat_key, game),
+            )
+        for player, e in failures:
+            if isinstance(e, TelegramForbiddenError):
                 # Пользователь не начал диалог с ботом
                 uname = f"@{player.username}" if player.username else None
                 disp = f"{player.first_name}{f' ({uname})' if uname else ''}"
                 not_started_dm.append(disp)
                 players_to_remove.append(player.user_id)  # Добавляем в список для удаления
-                logger.warning(f"Роль не доставлена игроку {player.user_id} (нет /start): {e}")
-            except Exception as e:
-                logger.exception(f"Ошибка отправки роли игроку {player.user_id}: {e}")
+                logger.warning("Роль не доставлена игроку %s (нет /start): %s", player.user_id, e)
+            else:
+                logger.error("Ошибка отправки роли игроку %s: %s", player.user_id, e, exc_info=e)
 
         # Удаляем игроков, которые не начали диалог с ботом
         if players_to_remove:
             game_manager.remove_players_without_start(chat_key, players_to_remove)
-            logger.info(f"ready_to_start: удалено {len(players_to_remove)} игроков без /start из игры")
+            logger.info("ready_to_start: удалено %s игроков без /start из игры", len(players_to_remove))
 
         # Мы уже разослали ночные клавиатуры в составе первого сообщения —
         # не даём автопилоту отправлять их повторно в эту ночь
@@ -1722,13 +1883,14 @@ async def ready_to_start(callback: CallbackQuery):
             game.night_prompts_sent = True
         except Exception:
             pass
+        game_manager.touch(chat_key)
         
-        logger.info(f"ready_to_start: раздача ролей завершена, запускаем автопилот для чата {chat_key}")
+        logger.info("ready_to_start: раздача ролей завершена, запускаем автопилот для чата %s", chat_key)
         
         # Сообщим в общий чат, кто не активировал ЛС с ботом
         if not_started_dm:
             # Выбираем случайное сообщение о неактивированных ЛС
-            no_dm_message = random.choice(NO_DM_MESSAGES)
+            no_dm_message = game.rng().choice(NO_DM_MESSAGES)
             players_list = "\n".join([f"• {name}" for name in not_started_dm])
             full_message = no_dm_message.format(players=players_list) + "\n\nОни были удалены из игры. Напишите боту в ЛС команду /start, чтобы участвовать в следующих играх."
             await callback.message.answer(full_message)
@@ -1737,7 +1899,7 @@ async def ready_to_start(callback: CallbackQuery):
         if _autopilot_tasks.get(chat_key) and not _autopilot_tasks[chat_key].done():
             _autopilot_tasks[chat_key].cancel()
         _autopilot_tasks[chat_key] = asyncio.create_task(_autopilot_loop(chat_key, callback.bot))
-        logger.info(f"ready_to_start: автопилот запущен для чата {chat_key}")
+        logger.info("ready_to_start: автопилот запущен для чата %s", chat_key)
     else:
         logger.warning("ready_to_start: start_game вернул False")
         await callback.answer("Не удалось начать игру!", show_alert=True)
@@ -1755,13 +1917,12 @@ async def cancel_game(callback: CallbackQuery):
     chat_key = get_chat_key(callback.message)
     
     logger.debug(
-        f"cancel_game вызван для чата {chat_key} пользователем: "
-        f"{callback.from_user.first_name} (@{callback.from_user.username}) id={callback.from_user.id}"
+        "cancel_game вызван для чата %s пользователем: %s (@%s) id=%s", chat_key, callback.from_user.first_name, callback.from_user.username, callback.from_user.id
     )
     
     # Логируем, кто нажал кнопку отмены
     user_info = f"{callback.from_user.first_name} (@{callback.from_user.username}) id={callback.from_user.id}"
-    logger.info(f"cancel_game: кнопка отмены нажата пользователем {user_info} в чате {chat_key}")
+    logger.info("cancel_game: кнопка отмены нажата пользователем %s в чате %s", user_info, chat_key)
     
     # Останавливаем автопилот если есть
     if _autopilot_tasks.get(chat_key) and not _autopilot_tasks[chat_key].done():
@@ -1777,415 +1938,200 @@ async def cancel_game(callback: CallbackQuery):
         reply_markup=get_new_game_keyboard()
     )
     
-    logger.info(f"cancel_game: игра отменена в чате {chat_key} пользователем {user_info}")
+    logger.info("cancel_game: игра отменена в чате %s пользователем %s", chat_key, user_info)
     await callback.answer()
 
-@router.callback_query(F.data.startswith("mafia_kill:"))
-async def mafia_kill_action(callback: CallbackQuery):
-    """Мафия выбирает жертву"""
-    # Проверяем разрешение на работу в данной теме (для личных сообщений пропускаем)
-    if callback.message.chat.type != "private" and not check_topic_permission(callback.message):
-        await callback.answer("⚠️ Действие разрешено только в теме «Игра в «Мафию»»!", show_alert=True)
-        return
-    
-    user_id = callback.from_user.id
-    parts = callback.data.split(":")
-    group_chat_key = parts[1]  # Теперь это chat_key, а не chat_id
-    target_id = int(parts[2])
-    logger.debug(f"mafia_kill_action: чат {group_chat_key}, пользователь {user_id}, цель {target_id}")
-    
-    # Проверяем, что игра существует и в ночной фазе
-    game = game_manager.get_game(group_chat_key)
+def _mention(player) -> str:
+    if player is None:
+        return "игрок"
+    return f"@{player.username}" if player.username else player.first_name
+
+def _night_choice_command(chat_key: str, user_id: int, role: PlayerRole, action_type: str,
+                          target_id, role_error: str, distracted_error):
+    """Команда актора игры: проверяет и записывает ночной ход.
+
+    Возвращает (текст ошибки или None, получены ли этим ходом все ночные действия).
+    """
+    game = game_manager.get_game(chat_key)
     if not game:
-        await callback.answer("❌ Игра не найдена!", show_alert=True)
-        return
-    
+        return "❌ Игра не найдена!", False
     if game.phase != GamePhase.NIGHT:
-        await callback.answer("❌ Сейчас не ночь!", show_alert=True)
-        return
-    
-    # Проверяем, что игрок жив и имеет роль мафии
+        return "❌ Сейчас не ночь!", False
     player = game.players.get(user_id)
     if not player or not player.is_alive:
-        await callback.answer("❌ Вы мертвы или не участвуете в игре!", show_alert=True)
-        return
-    
-    if player.role != PlayerRole.MAFIA:
-        await callback.answer("❌ У вас нет роли мафии!", show_alert=True)
-        return
-    
+        return "❌ Вы мертвы или не участвуете в игре!", False
+    if player.role != role:
+        return role_error, False
     # Блокируем действие, если игрок отвлечен бабочкой
-    if game.butterfly_distract_target is not None and user_id == game.butterfly_distract_target:
-        await callback.answer("Вы отвлечены ночной бабочкой и не можете действовать этой ночью.", show_alert=True)
-        return
-        
-    if game_manager.process_night_action(group_chat_key, user_id, "mafia_kill", target_id):
-        target = game_manager.get_game(group_chat_key).players.get(target_id)
-        target_mention = f"@{target.username}" if target and target.username else (target.first_name if target else "игрок")
-        await callback.bot.send_message(user_id, f"✅ Жертва выбрана: {target_mention}")
-        
-        # Проверяем, завершены ли все ночные действия (отправляем сообщение только один раз)
-        game = game_manager.get_game(group_chat_key)
-        if game and game_manager.all_night_actions_completed(group_chat_key) and not game.all_actions_notified:
-            game.all_actions_notified = True
-            await callback.bot.send_message(
-                get_chat_id_from_key(group_chat_key),
-                "🌙 Все ночные действия получены. Ночь продолжается до рассвета.",
-                message_thread_id=get_thread_id_from_key(group_chat_key)
-            )
-    else:
-        logger.warning("process_night_action вернул False для мафии")
-        await callback.answer("❌ Не удалось выполнить действие! Проверьте, что игра в ночной фазе и вы живы.", show_alert=True)
-    
-    await callback.answer()
-
-@router.callback_query(F.data.startswith("doctor_save:"))
-async def doctor_save_action(callback: CallbackQuery):
-    """Доктор выбирает, кого лечить"""
+    if distracted_error and game.butterfly_distract_target is not None and user_id == game.butterfly_distract_target:
+        return distracted_error, False
+    if not game_manager.process_night_action(chat_key, user_id, action_type, target_id):
+        logger.warning("process_night_action вернул False для %s", action_type)
+        return "❌ Не удалось выполнить действие! Проверьте, что игра в ночной фазе и вы живы.", False
+    # Сообщение «все действия получены» отправляем только один раз
+    if game_manager.all_night_actions_completed(chat_key) and not game.all_actions_notified:
+        game.all_actions_notified = True
+        return None, True
+    return None, False
+
+async def _handle_night_choice(callback: CallbackQuery, game_callback: GameCallback, role: PlayerRole, action_type: str,
+                               role_error: str, distracted_error, confirm_text: str, skip_text: str = ""):
+    """Общая обработка ночного хода: команда уходит в очередь игры, ответы — после неё"""
     # Проверяем разрешение на работу в данной теме (для личных сообщений пропускаем)
     if callback.message.chat.type != "private" and not check_topic_permission(callback.message):
         await callback.answer("⚠️ Действие разрешено только в теме «Игра в «Мафию»»!", show_alert=True)
         return
-    
-    user_id = callback.from_user.id
-    logger.debug(f"doctor_save_action: callback.data: {callback.data}")
-    parts = callback.data.split(":")
-    group_chat_key = parts[1]
-    target_id = None if parts[2] == "skip" else int(parts[2])
-    logger.debug(f"doctor_save_action: process_night_action params: chat_key={group_chat_key}, user_id={user_id}, action_type='doctor_save', target_id={target_id}")
-
-    # Проверяем, что игра существует и в ночной фазе
-    game = game_manager.get_game(group_chat_key)
-    if not game:
-        await callback.answer("❌ Игра не найдена!", show_alert=True)
-        return
-    
-    if game.phase != GamePhase.NIGHT:
-        await callback.answer("❌ Сейчас не ночь!", show_alert=True)
-        return
-    
-    # Проверяем, что игрок жив и имеет роль доктора
-    player = game.players.get(user_id)
-    if not player or not player.is_alive:
-        await callback.answer("❌ Вы мертвы или не участвуете в игре!", show_alert=True)
-        return
-    
-    if player.role != PlayerRole.DOCTOR:
-        await callback.answer("❌ У вас нет роли доктора!", show_alert=True)
+    if game_callback.stale:
+        await callback.answer(STALE_BUTTON_TEXT, show_alert=True)
         return
-    
-    if game.butterfly_distract_target is not None and user_id == game.butterfly_distract_target:
-        await callback.answer("Вы отвлечены ночной бабочкой и не можете лечить этой ночью.", show_alert=True)
-        return
-        
-    if game_manager.process_night_action(group_chat_key, user_id, "doctor_save", target_id):
-        if target_id:
-            target_player = game_manager.get_game(group_chat_key).players.get(target_id)
-            mention = f"@{target_player.username}" if target_player and target_player.username else (target_player.first_name if target_player else "игрок")
-            await callback.bot.send_message(user_id, f"✅ Вы решили лечить {mention}! Возможно, вы спасёте его от смерти.")
-        else:
-            await callback.bot.send_message(user_id, "✅ Вы решили никого не лечить!")
-        
-        # Проверяем, завершены ли все ночные действия (отправляем сообщение только один раз)
-        game = game_manager.get_game(group_chat_key)
-        if game and game_manager.all_night_actions_completed(group_chat_key) and not game.all_actions_notified:
-            game.all_actions_notified = True
-            await callback.bot.send_message(
-                get_chat_id_from_key(group_chat_key),
-                "🌙 Все ночные действия получены. Ночь продолжается до рассвета.",
-                message_thread_id=get_thread_id_from_key(group_chat_key)
-            )
-    else:
-        logger.warning("process_night_action вернул False для доктора")
-        await callback.answer("❌ Не удалось выполнить действие! Проверьте, что игра в ночной фазе и вы живы.", show_alert=True)
-    
-    await callback.answer()
 
-@router.callback_query(F.data.startswith("commissioner_check:"))
-async def commissioner_check_action(callback: CallbackQuery):
-    """Комиссар проверяет игрока"""
-    # Проверяем разрешение на работу в данной теме (для личных сообщений пропускаем)
-    if callback.message.chat.type != "private" and not check_topic_permission(callback.message):
-        await callback.answer("⚠️ Действие разрешено только в теме «Игра в «Мафию»»!", show_alert=True)
-        return
-    
     user_id = callback.from_user.id
-    parts = callback.data.split(":")
-    group_chat_key = parts[1]
-    target_id = int(parts[2])
-    logger.debug(f"commissioner_check_action: чат {group_chat_key}, пользователь {user_id}, цель {target_id}")
+    group_chat_key = game_callback.chat_key
+    target_id = game_callback.target_id
+    logger.debug("%s: чат %s, пользователь %s, цель %s", action_type, group_chat_key, user_id, target_id)
 
-    # Проверяем, что игра существует и в ночной фазе
-    game = game_manager.get_game(group_chat_key)
-    if not game:
-        await callback.answer("❌ Игра не найдена!", show_alert=True)
-        return
-    
-    if game.phase != GamePhase.NIGHT:
-        await callback.answer("❌ Сейчас не ночь!", show_alert=True)
-        return
-    
-    # Проверяем, что игрок жив и имеет роль комиссара
-    player = game.players.get(user_id)
-    if not player or not player.is_alive:
-        await callback.answer("❌ Вы мертвы или не участвуете в игре!", show_alert=True)
-        return
-    
-    if player.role != PlayerRole.COMMISSIONER:
-        await callback.answer("❌ У вас нет роли комиссара!", show_alert=True)
-        return
-    
-    if game.butterfly_distract_target is not None and user_id == game.butterfly_distract_target:
-        await callback.answer("Вы отвлечены ночной бабочкой и не можете проверять этой ночью.", show_alert=True)
+    error, all_received = await game_actors.call(
+        group_chat_key, _night_choice_command,
+        group_chat_key, user_id, role, action_type, target_id, role_error, distracted_error,
+    )
+    if error:
+        await callback.answer(error, show_alert=True)
         return
-        
-    if game_manager.process_night_action(group_chat_key, user_id, "commissioner_check", target_id):
-        game = game_manager.get_game(group_chat_key)
-        target_player = game.players.get(target_id)
-        
-        # Не показываем результат проверки сразу - только подтверждение действия
-        checked_mention = f"@{target_player.username}" if target_player and target_player.username else (target_player.first_name if target_player else "игрок")
-        await callback.bot.send_message(user_id, f"✅ Вы проверили {checked_mention}. Результат будет объявлен утром.")
-        
-        # Проверяем, завершены ли все ночные действия (отправляем сообщение только один раз)
-        game = game_manager.get_game(group_chat_key)
-        if game and game_manager.all_night_actions_completed(group_chat_key) and not game.all_actions_notified:
-            game.all_actions_notified = True
-            await callback.bot.send_message(
-                get_chat_id_from_key(group_chat_key),
-                "🌙 Все ночные действия получены. Ночь продолжается до рассвета.",
-                message_thread_id=get_thread_id_from_key(group_chat_key)
-            )
+
+    if target_id is None:
+        await callback.bot.send_message(user_id, skip_text)
     else:
-        logger.warning("process_night_action вернул False для комиссара")
-        await callback.answer("❌ Не удалось выполнить действие! Проверьте, что игра в ночной фазе и вы живы.", show_alert=True)
-    
+        snapshot = game_actors.snapshot(group_chat_key)
+        target = snapshot.get_player(target_id) if snapshot else None
+        await callback.bot.send_message(user_id, confirm_text.format(mention=_mention(target)))
+    if all_received:
+        await callback.bot.send_message(
+            get_chat_id_from_key(group_chat_key),
+            "🌙 Все ночные действия получены. Ночь продолжается до рассвета.",
+            message_thread_id=get_thread_id_from_key(group_chat_key)
+        )
     await callback.answer()
 
-@router.callback_query(F.data.startswith("butterfly_distract:"))
-async def butterfly_distract_action(callback: CallbackQuery):
+@router.callback_query(GameAction("mafia_kill"))
+async def mafia_kill_action(callback: CallbackQuery, game_callback: GameCallback):
+    """Мафия выбирает жертву"""
+    await _handle_night_choice(
+        callback, game_callback, PlayerRole.MAFIA, "mafia_kill",
+        "❌ У вас нет роли мафии!",
+        "Вы отвлечены ночной бабочкой и не можете действовать этой ночью.",
+        "✅ Жертва выбрана: {mention}",
+    )
+
+@router.callback_query(GameAction("doctor_save"))
+async def doctor_save_action(callback: CallbackQuery, game_callback: GameCallback):
+    """Доктор выбирает, кого лечить"""
+    await _handle_night_choice(
+        callback, game_callback, PlayerRole.DOCTOR, "doctor_save",
+        "❌ У вас нет роли доктора!",
+        "Вы отвлечены ночной бабочкой и не можете лечить этой ночью.",
+        "✅ Вы решили лечить {mention}! Возможно, вы спасёте его от смерти.",
+        "✅ Вы решили никого не лечить!",
+    )
+
+@router.callback_query(GameAction("commissioner_check"))
+async def commissioner_check_action(callback: CallbackQuery, game_callback: GameCallback):
+    """Комиссар проверяет игрока"""
+    # Не показываем результат проверки сразу - только подтверждение действия
+    await _handle_night_choice(
+        callback, game_callback, PlayerRole.COMMISSIONER, "commissioner_check",
+        "❌ У вас нет роли комиссара!",
+        "Вы отвлечены ночной бабочкой и не можете проверять этой ночью.",
+        "✅ Вы проверили {mention}. Результат будет объявлен утром.",
+    )
+
+@router.callback_query(GameAction("butterfly_distract"))
+async def butterfly_distract_action(callback: CallbackQuery, game_callback: GameCallback):
     """Ночная бабочка отвлекает игрока"""
-    # Проверяем разрешение на работу в данной теме (для личных сообщений пропускаем)
-    if callback.message.chat.type != "private" and not check_topic_permission(callback.message):
-        await callback.answer("⚠️ Действие разрешено только в теме «Игра в «Мафию»»!", show_alert=True)
-        return
-    
-    user_id = callback.from_user.id
-    logger.debug(f"butterfly_distract_action: callback.data: {callback.data}")
-    parts = callback.data.split(":")
-    group_chat_key = parts[1]
-    target_id = None if parts[2] == "skip" else int(parts[2])
+    await _handle_night_choice(
+        callback, game_callback, PlayerRole.BUTTERFLY, "butterfly_distract",
+        "❌ У вас нет роли ночной бабочки!",
+        None,
+        "✅ Вы отвлекли {mention}! У него была бурная ночь.",
+        "✅ Вы решили никого не отвлекать!",
+    )
 
-    # Проверяем, что игра существует и в ночной фазе
-    game = game_manager.get_game(group_chat_key)
-    if not game:
-        await callback.answer("❌ Игра не найдена!", show_alert=True)
-        return
-    
-    if game.phase != GamePhase.NIGHT:
-        await callback.answer("❌ Сейчас не ночь!", show_alert=True)
-        return
-    
-    # Проверяем, что игрок жив и имеет роль ночной бабочки
-    player = game.players.get(user_id)
-    if not player or not player.is_alive:
-        await callback.answer("❌ Вы мертвы или не участвуете в игре!", show_alert=True)
-        return
-    
-    if player.role != PlayerRole.BUTTERFLY:
-        await callback.answer("❌ У вас нет роли ночной бабочки!", show_alert=True)
-        return
+def _schedule_scoreboard(callback: CallbackQuery, chat_key: str, header: str) -> None:
+    thread_id = get_thread_id_from_key(chat_key)
+    voting_scoreboard.schedule(
+        callback.bot,
+        chat_key,
+        callback.message.chat.id,
+        None if thread_id == 0 else thread_id,
+        header,
+    )
 
-    if game_manager.process_night_action(group_chat_key, user_id, "butterfly_distract", target_id):
-        if target_id:
-            target_player = game_manager.get_game(group_chat_key).players.get(target_id)
-            mention = f"@{target_player.username}" if target_player and target_player.username else (target_player.first_name if target_player else "игрок")
-            await callback.bot.send_message(user_id, f"✅ Вы отвлекли {mention}! У него была бурная ночь.")
-        else:
-            await callback.bot.send_message(user_id, "✅ Вы решили никого не отвлекать!")
-        
-        # Проверяем, завершены ли все ночные действия (отправляем сообщение только один раз)
-        game = game_manager.get_game(group_chat_key)
-        if game and game_manager.all_night_actions_completed(group_chat_key) and not game.all_actions_notified:
-            game.all_actions_notified = True
-            await callback.bot.send_message(
-                get_chat_id_from_key(group_chat_key),
-                "🌙 Все ночные действия получены. Ночь продолжается до рассвета.",
-                message_thread_id=get_thread_id_from_key(group_chat_key)
-            )
-    else:
-        logger.warning("process_night_action вернул False для ночной бабочки")
-        await callback.answer("❌ Не удалось выполнить действие! Проверьте, что игра в ночной фазе и вы живы.", show_alert=True)
-    
-    await callback.answer()
+def _vote_command(chat_key: str, user_id: int, target_id):
+    """Команда актора игры: проверяет и записывает голос (target_id=None — пропуск).
 
-@router.callback_query(F.data.startswith("vote_"))
-async def process_vote(callback: CallbackQuery):
-    """Обрабатывает голос игрока"""
-    # Проверяем разрешение на работу в данной теме
-    if not check_topic_permission(callback.message):
-        await callback.answer("⚠️ Действие разрешено только в теме «Игра в «Мафию»»!", show_alert=True)
-        return
-    
-    chat_key = get_chat_key(callback.message)
-    user_id = callback.from_user.id
-    
-    if callback.data == "vote_skip":
-        logger.debug(f"process_vote: игрок {user_id} пропускает голос в чате {chat_key}")
-        game = game_manager.get_game(chat_key)
+    Возвращает (текст ошибки или None, заголовок для табло).
+    """
+    game = game_manager.get_game(chat_key)
+    if target_id is None:
         if not game or game.phase != GamePhase.VOTING:
-            try:
-                await callback.answer("❌ Сейчас не идёт голосование.", show_alert=True)
-            except TelegramBadRequest:
-                pass
-            return
+            return "❌ Сейчас не идёт голосование.", None
         voter = game.players.get(user_id)
         if not voter or not voter.is_alive:
-            try:
-                await callback.answer("❌ Голосовать могут только живые игроки.", show_alert=True)
-            except TelegramBadRequest:
-                pass
-            return
+            return "❌ Голосовать могут только живые игроки.", None
         if voter.has_voted:
-            try:
-                await callback.answer("❌ Вы уже сделали выбор в этом голосовании.", show_alert=True)
-            except TelegramBadRequest:
-                pass
-            return
+            return "❌ Вы уже сделали выбор в этом голосовании.", None
         # Отмечаем пропуск голоса
-        try:
-            game.skipped_voters.add(user_id)
-        except Exception:
-            pass
+        game.skipped_voters.add(user_id)
         voter.has_voted = True
-        # Пересобираем табло
-        vote_counts = {}
-        for tid in game.votes.values():
-            vote_counts[tid] = vote_counts.get(tid, 0) + 1
-        lines = ["🗳️ Текущие голоса:"]
-        for p in game.get_alive_players():
-            cnt = vote_counts.get(p.user_id, 0)
-            uname = f"@{p.username}" if p.username else None
-            disp = f"{p.first_name}{f' ({uname})' if uname else ''}"
-            lines.append(f"- {disp}: {cnt}")
-        # Отдельный блок — кто пропустил голос
-        if game.skipped_voters:
-            skipped_lines = []
-            for uid in sorted(game.skipped_voters):
-                pl = game.players.get(uid)
-                if pl:
-                    uname = f"@{pl.username}" if pl.username else None
-                    disp = f"{pl.first_name}{f' ({uname})' if uname else ''}"
-                    skipped_lines.append(f"• {disp}")
-            if skipped_lines:
-                lines.append("\n🚫 Пропустили голос:")
-                lines.extend(skipped_lines)
-        scoreboard = "\n".join(lines)
-        # Удаляем предыдущее табло
-        try:
-            if getattr(game, "current_voting_message_id", None):
-                await callback.message.bot.delete_message(chat_id=callback.message.chat.id, message_id=game.current_voting_message_id)
-        except TelegramBadRequest as e:
-            logger.debug(f"process_vote(skip): не удалось удалить предыдущее табло: {e}")
-        # Переголосование отключено: клавиатура строится по всем живым
-        alive_for_keyboard = game.get_alive_players()
-        sent = await callback.message.answer(
-            f"✅ Голос пропущен!\n\n" + scoreboard,
-            reply_markup=get_voting_keyboard(alive_for_keyboard)
-        )
-        try:
-            game.current_voting_message_id = sent.message_id
-        except Exception:
-            pass
-        try:
-            await callback.answer()
-        except TelegramBadRequest:
-            pass
-        return
-    
-    target_id = int(callback.data.split("_")[1])
-    
-    logger.debug(f"process_vote: попытка обработать голос игрока {user_id} за {target_id} в чате {chat_key}")
-    
-    # Проверяем, что игра существует и в фазе голосования
-    game = game_manager.get_game(chat_key)
+        if game_manager.log is not None:
+            game_manager.log.vote(game, user_id, None)
+        game_manager.touch(chat_key)
+        if game_manager.all_votes_received(chat_key):
+            phase_scheduler.wake(chat_key)
+        return None, "✅ Голос пропущен!"
+
     if not game:
-        await callback.answer("❌ Игра не найдена!", show_alert=True)
-        return
-    
+        return "❌ Игра не найдена!", None
     if game.phase != GamePhase.VOTING:
-        await callback.answer("❌ Сейчас не идёт голосование!", show_alert=True)
-        return
-    
+        return "❌ Сейчас не идёт голосование!", None
     # Проверяем, что игрок жив и не голосовал
     voter = game.players.get(user_id)
     if not voter or not voter.is_alive:
-        await callback.answer("❌ Голосовать могут только живые игроки!", show_alert=True)
-        return
-    
+        return "❌ Голосовать могут только живые игроки!", None
     if voter.has_voted:
-        await callback.answer("❌ Вы уже сделали выбор в этом голосовании!", show_alert=True)
-        return
-    
-    if game_manager.process_vote(chat_key, user_id, target_id):
-        logger.debug("process_vote: голос обработан успешно")
-        
-        # Обновляем табло голосования: пересобираем список и показываем счет
-        game = game_manager.get_game(chat_key)
-        target_player = game.players.get(target_id)
-        # Считаем текущие голоса
-        vote_counts = {}
-        for tid in game.votes.values():
-            vote_counts[tid] = vote_counts.get(tid, 0) + 1
-        # Формируем строку со счетом
-        lines = ["🗳️ Текущие голоса:"]
-        for p in game.get_alive_players():
-            cnt = vote_counts.get(p.user_id, 0)
-            uname = f"@{p.username}" if p.username else None
-            disp = f"{p.first_name}{f' ({uname})' if uname else ''}"
-            lines.append(f"- {disp}: {cnt}")
-        # Отдельный блок — кто пропустил голос
-        if getattr(game, "skipped_voters", None) and game.skipped_voters:
-            skipped_lines = []
-            for uid in sorted(game.skipped_voters):
-                pl = game.players.get(uid)
-                if pl:
-                    uname = f"@{pl.username}" if pl.username else None
-                    disp = f"{pl.first_name}{f' ({uname})' if uname else ''}"
-                    skipped_lines.append(f"• {disp}")
-            if skipped_lines:
-                lines.append("\n🚫 Пропустили голос:")
-                lines.extend(skipped_lines)
-        scoreboard = "\n".join(lines)
-        
-        # Удаляем предыдущее сообщение с голосованием
-        try:
-            if getattr(game, "current_voting_message_id", None):
-                await callback.message.bot.delete_message(chat_id=callback.message.chat.id, message_id=game.current_voting_message_id)
-        except TelegramBadRequest as e:
-            logger.debug(f"process_vote: не удалось удалить предыдущее сообщение голосования: {e}")
-        
-        # Переголосование отключено: клавиатура строится по всем живым
-        alive_for_keyboard = game.get_alive_players()
-        
-        # Отправляем новое сообщение с обновленным табло
-        target_mention = f"@{target_player.username}" if target_player and target_player.username else (target_player.first_name if target_player else "игрок")
-        sent = await callback.message.answer(
-            f"✅ Голос за {target_mention} учтён!\n\n" + scoreboard,
-            reply_markup=get_voting_keyboard(alive_for_keyboard)
-        )
-        try:
-            game.current_voting_message_id = sent.message_id
-        except Exception:
-            pass
-    else:
+        return "❌ Вы уже сделали выбор в этом голосовании!", None
+    if not game_manager.process_vote(chat_key, user_id, target_id):
         logger.warning("process_vote: голос не обработан")
+        return "❌ Ошибка! Возможно, вы уже голосовали или игра не в фазе голосования.", None
+    logger.debug("process_vote: голос обработан успешно")
+    return None, f"✅ Голос за {_mention(game.players.get(target_id))} учтён!"
+
+@router.callback_query(GameAction("vote"))
+async def process_vote(callback: CallbackQuery, game_callback: GameCallback):
+    """Обрабатывает голос игрока"""
+    # Проверяем разрешение на работу в данной теме
+    if not check_topic_permission(callback.message):
+        await callback.answer("⚠️ Действие разрешено только в теме «Игра в «Мафию»»!", show_alert=True)
+        return
+
+    chat_key = get_chat_key(callback.message)
+    # Кнопка от прошлой игры этого чата (или чужой) не должна голосовать в текущей
+    if game_callback.stale or game_callback.chat_key not in (None, chat_key):
+        await callback.answer(STALE_BUTTON_TEXT, show_alert=True)
+        return
+    user_id = callback.from_user.id
+    target_id = game_callback.target_id
+    logger.debug("process_vote: голос игрока %s за %s в чате %s", user_id, target_id or "пропуск", chat_key)
+
+    error, header = await game_actors.call(chat_key, _vote_command, chat_key, user_id, target_id)
+    if error:
         try:
-            await callback.answer("❌ Ошибка! Возможно, вы уже голосовали или игра не в фазе голосования.", show_alert=True)
+            await callback.answer(error, show_alert=True)
         except TelegramBadRequest:
             pass
         return
 
+    # Обновляем табло голосования на месте (правки нескольких голосов объединяются)
+    _schedule_scoreboard(callback, chat_key, header)
     try:
         await callback.answer()
     except TelegramBadRequest:
@@ -2194,7 +2140,8 @@ async def process_vote(callback: CallbackQuery):
 @router.callback_query(F.data == "back_to_main")
 async def back_to_main_menu(callback: CallbackQuery):
     """Возврат в главное меню"""
-    # Выбираем случайное приветствие из массива
+    # Выбираем случайное приветствие из массива. Жребий игры не трогаем: меню
+    # ничего в ней не меняет, и лишний бросок сдвинул бы её повтор по журналу
     greeting = random.choice(DON_VITTE_GREETINGS)
     
     await callback.message.answer(
@@ -2202,3 +2149,43 @@ async def back_to_main_menu(callback: CallbackQuery):
         reply_markup=get_main_menu_keyboard()
     )
     await callback.answer()
+
+# Куда направить обычное (не командное) сообщение в ЛС
+DM_BROADCAST = "broadcast"
+DM_BROADCAST_ALL = "broadcast_all"
+DM_MAFIA_RELAY = "mafia_relay"
+
+def classify_private_message(user_id: int) -> tuple[Optional[str], Optional[str]]:
+    """Разбирает ЛС один раз: (маршрут, chat_key игры для пересылки мафии) или (None, None)"""
+    mode = _broadcast_waiting.get(user_id)
+    if mode and user_id == ADMIN_USER_ID:
+        return (DM_BROADCAST_ALL if mode == "all" else DM_BROADCAST), None
+    chat_key = game_manager.get_chat_key_for_mafia_user(user_id)
+    if chat_key:
+        return DM_MAFIA_RELAY, chat_key
+    return None, None
+
+# Единственный перехватчик ЛС. Регистрируется последним: aiogram останавливается на первом
+# подходящем хендлере, поэтому команды в ЛС должны успеть попасть в свои хендлеры раньше
+@router.message(F.chat.type == "private")
+async def dispatch_private_message(message: Message):
+    text = message.text
+    if text and text.startswith("/"):
+        return
+    user_id = message.from_user.id
+    route, chat_key = classify_private_message(user_id)
+    if route is None:
+        return
+    logger.debug("dispatch_private_message: ЛС от %s -> %s", user_id, route)
+    if route == DM_MAFIA_RELAY:
+        await _relay_mafia_message(message, chat_key)
+        return
+    # Рассылка админа — только текстом
+    if not text:
+        return
+    # Выходим из режима ожидания до начала отправки
+    _broadcast_waiting.pop(user_id, None)
+    if route == DM_BROADCAST_ALL:
+        await _send_broadcast_all(message, text)
+    else:
+        await _send_broadcast(message, text)
@@ -1,6 +1,8 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from typing import List, Optional, Set
+from collections import OrderedDict
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
 import logging
+from callbacks import encode_callback
 from models import Player
 
 logger = logging.getLogger(__name__)
@@ -73,74 +75,125 @@ def get_lobby_keyboard() -> InlineKeyboardMarkup:
     logger.debug("get_lobby_keyboard: создана клавиатура лобби")
     return keyboard
 
+# Сколько игр держать в кеше клавиатур (давно не использованные вытесняются)
+KEYBOARD_CACHE_GAMES = 4096
+# chat_key -> (версия ростера, {ключ клавиатуры: клавиатура})
+_keyboard_cache: "OrderedDict[str, Tuple[int, Dict[tuple, InlineKeyboardMarkup]]]" = OrderedDict()
+
+def _cached_keyboard(
+    chat_key: Optional[str],
+    roster_version: Optional[int],
+    key: tuple,
+    build: Callable[[], InlineKeyboardMarkup],
+) -> InlineKeyboardMarkup:
+    """Клавиатура из кеша игры; без версии ростера строится заново"""
+    if chat_key is None or roster_version is None:
+        return build()
+    entry = _keyboard_cache.get(chat_key)
+    if entry is None or entry[0] != roster_version:
+        # Кто-то умер или состав изменился — прежние клавиатуры игры не годятся
+        entry = _keyboard_cache[chat_key] = (roster_version, {})
+        if len(_keyboard_cache) > KEYBOARD_CACHE_GAMES:
+            _keyboard_cache.popitem(last=False)
+    _keyboard_cache.move_to_end(chat_key)
+    keyboard = entry[1].get(key)
+    if keyboard is None:
+        keyboard = entry[1][key] = build()
+    else:
+        logger.debug("_cached_keyboard: клавиатура %s для %s взята из кеша", key[0], chat_key)
+    return keyboard
+
 def get_player_selection_keyboard(
     players: List[Player],
     action_type: str,
     group_chat_key: str,
     exclude_user_id: Optional[int] = None,
     exclude_target_ids: Optional[Set[int]] = None,
+    roster_version: Optional[int] = None,
 ) -> InlineKeyboardMarkup:
     """Клавиатура для выбора игрока (ночные действия)
-    callback_data формат: {action_type}:{group_chat_key}:{target_id|skip}
+    callback_data — компактная кнопка игры (callbacks.encode_callback)
     exclude_user_id — не показывать этого игрока (нельзя выбирать себя)
+    roster_version — версия game.players, из которой взяты players: с ней клавиатура кешируется
     """
-    logger.debug(f"get_player_selection_keyboard: создание клавиатуры для действия {action_type}, игроков: {len(players)}, group_chat_key: {group_chat_key}, exclude: {exclude_user_id}")
+    excluded = frozenset(exclude_target_ids or ())
+    key = (action_type, exclude_user_id, excluded)
+    return _cached_keyboard(
+        group_chat_key, roster_version, key,
+        lambda: _build_player_selection_keyboard(players, action_type, group_chat_key, exclude_user_id, excluded),
+    )
+
+def _build_player_selection_keyboard(
+    players: List[Player],
+    action_type: str,
+    group_chat_key: str,
+    exclude_user_id: Optional[int],
+    excluded: FrozenSet[int],
+) -> InlineKeyboardMarkup:
+    logger.debug("get_player_selection_keyboard: создание клавиатуры для действия %s, игроков: %s, group_chat_key: %s, exclude: %s", action_type, len(players), group_chat_key, exclude_user_id)
 
     buttons = []
-    excluded = exclude_target_ids or set()
-    logger.debug(f"get_player_selection_keyboard: исключаемые игроки: {excluded}")
+    logger.debug("get_player_selection_keyboard: исключаемые игроки: %s", excluded)
+    # Поштучные логи кнопок — только при DEBUG, проверяем уровень один раз на клавиатуру
+    debug = logger.isEnabledFor(logging.DEBUG)
     for player in players:
         # Показываем только живых игроков, исключая себя и заблокированные цели
         if (player.is_alive 
             and (exclude_user_id is None or player.user_id != exclude_user_id) 
             and (player.user_id not in excluded)):
-            username = f"@{player.username}" if getattr(player, 'username', None) else None
-            label = f"{player.first_name}{f' ({username})' if username else ''}"
             buttons.append([
                 InlineKeyboardButton(
-                    text=label,
-                    callback_data=f"{action_type}:{group_chat_key}:{player.user_id}"
+                    text=player.label,
+                    callback_data=encode_callback(action_type, group_chat_key, player.user_id)
                 )
             ])
-            logger.debug(f"get_player_selection_keyboard: добавлена кнопка для игрока {player.first_name} (ID: {player.user_id})")
-        else:
-            logger.debug(f"get_player_selection_keyboard: игрок {player.first_name} (ID: {player.user_id}) исключен - жив: {player.is_alive}, exclude_user_id: {exclude_user_id}, в excluded: {player.user_id in excluded}")
+            if debug:
+                logger.debug("get_player_selection_keyboard: добавлена кнопка для игрока %s (ID: %s)", player.first_name, player.user_id)
+        elif debug:
+            logger.debug("get_player_selection_keyboard: игрок %s (ID: %s) исключен - жив: %s, exclude_user_id: %s, в excluded: %s", player.first_name, player.user_id, player.is_alive, exclude_user_id, player.user_id in excluded)
 
     # Добавляем кнопку "Пропустить" для некоторых действий
     if action_type in ["doctor_save", "butterfly_distract"]:
-        buttons.append([InlineKeyboardButton(text="🚫 Пропустить", callback_data=f"{action_type}:{group_chat_key}:skip")])
-        logger.debug(f"get_player_selection_keyboard: добавлена кнопка 'Пропустить' для действия {action_type}")
+        buttons.append([InlineKeyboardButton(text="🚫 Пропустить", callback_data=encode_callback(action_type, group_chat_key, None))])
+        logger.debug("get_player_selection_keyboard: добавлена кнопка 'Пропустить' для действия %s", action_type)
 
     buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")])
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-    logger.debug(f"get_player_selection_keyboard: создана клавиатура с {len(buttons)} кнопками")
+    logger.debug("get_player_selection_keyboard: создана клавиатура с %s кнопками", len(buttons))
 
     return keyboard
 
-def get_voting_keyboard(players: List[Player]) -> InlineKeyboardMarkup:
-    """Клавиатура для голосования"""
-    logger.debug(f"get_voting_keyboard: создание клавиатуры для голосования, игроков: {len(players)}")
+def get_voting_keyboard(
+    players: Sequence[Player],
+    chat_key: Optional[str] = None,
+    roster_version: Optional[int] = None,
+) -> InlineKeyboardMarkup:
+    """Клавиатура для голосования; с chat_key и roster_version берётся из кеша игры"""
+    return _cached_keyboard(chat_key, roster_version, ("vote",), lambda: _build_voting_keyboard(players, chat_key))
+
+def _build_voting_keyboard(players: Sequence[Player], chat_key: Optional[str]) -> InlineKeyboardMarkup:
+    logger.debug("get_voting_keyboard: создание клавиатуры для голосования, игроков: %s", len(players))
     
     buttons = []
+    debug = logger.isEnabledFor(logging.DEBUG)
     for player in players:
         if player.is_alive:
-            username = f"@{player.username}" if getattr(player, 'username', None) else None
-            label = f"{player.first_name}{f' ({username})' if username else ''}"
             buttons.append([
                 InlineKeyboardButton(
-                    text=label,
-                    callback_data=f"vote_{player.user_id}"
+                    text=player.label,
+                    callback_data=encode_callback("vote", chat_key, player.user_id)
                 )
             ])
-            logger.debug(f"get_voting_keyboard: добавлена кнопка для игрока {player.first_name} (ID: {player.user_id})")
+            if debug:
+                logger.debug("get_voting_keyboard: добавлена кнопка для игрока %s (ID: %s)", player.first_name, player.user_id)
     
     # Добавляем кнопку пропуска голоса
-    buttons.append([InlineKeyboardButton(text="🚫 Пропустить голос", callback_data="vote_skip")])
+    buttons.append([InlineKeyboardButton(text="🚫 Пропустить голос", callback_data=encode_callback("vote", chat_key, None))])
     logger.debug("get_voting_keyboard: добавлена кнопка 'Пропустить голос'")
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-    logger.debug(f"get_voting_keyboard: создана клавиатура с {len(buttons)} кнопками")
+    logger.debug("get_voting_keyboard: создана клавиатура с %s кнопками", len(buttons))
     
     return keyboard
 
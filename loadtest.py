@@ -0,0 +1,427 @@
+"""Безголовый прогон игр для нагрузочного и soak-тестирования.
+
+Настоящие handlers и GameManager получают обновления через dp.feed_update,
+а вместо Telegram стоит FakeSession: она записывает вызовы Bot API и отвечает
+правдоподобными объектами. Симулированные игроки нажимают кнопки из
+присланных клавиатур. Все таймеры (фазы, напоминания, «раздумья» игроков)
+идут по виртуальным часам, поэтому тысячи игр проходят за секунды.
+
+FakeSession, как и Telegram, отклоняет слишком длинные тексты и подписи;
+с --mafia-chat мафиози каждую ночь пишут сообщникам длинные сообщения и фото
+с подписью, а отчёт показывает, сколько запросов упёрлось в лимиты.
+
+Пример:
+    BOT_TOKEN=1:x STATE_DB_PATH= python loadtest.py --games 2000 --concurrency 500
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import resource
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import ChatMemberMember, Message, MessageId, Update
+
+import handlers
+from clock import run_virtual
+from gamelog import VerifyingGameLog
+from callbacks import GameCallback, decode_callback
+from game_logic import game_manager
+from models import GamePhase, PlayerRole
+from relay import CAPTION_LIMIT, TEXT_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# Тема, в которой бот разрешает играть (см. handlers.check_topic_permission)
+GAME_THREAD_ID = 39431
+# Заглушка для кнопок, которые не относятся к игре
+_NO_TARGET = GameCallback("", None, None)
+
+
+def _utf16_len(text: Optional[str]) -> int:
+    # Bot API считает длину в единицах UTF-16
+    return len(text.encode("utf-16-le")) // 2 if text else 0
+
+
+def _is_vote(data: str) -> bool:
+    decoded = decode_callback(data)
+    return decoded is not None and decoded.action == "vote"
+
+
+class FakeSession(BaseSession):
+    """Сессия Bot API без сети: считает вызовы и сообщает харнессу об исходящих сообщениях"""
+
+    def __init__(self, harness: "Harness"):
+        super().__init__()
+        self.harness = harness
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1)
+        # Запросы, отклонённые из-за длины текста или подписи
+        self.too_long = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        name = type(method).__name__
+        self.calls[name] += 1
+        if _utf16_len(getattr(method, "text", None)) > TEXT_LIMIT or _utf16_len(getattr(method, "caption", None)) > CAPTION_LIMIT:
+            self.too_long += 1
+            raise TelegramBadRequest(method=method, message="Bad Request: message is too long")
+        if name in ("SendMessage", "EditMessageText"):
+            chat_id = method.chat_id
+            message = {
+                "message_id": getattr(method, "message_id", None) or next(self._message_ids),
+                "date": 1,
+                "chat": self.harness.chat_dict(chat_id),
+                "text": method.text,
+            }
+            if chat_id < 0:
+                message["message_thread_id"] = GAME_THREAD_ID
+                message["is_topic_message"] = True
+            if method.reply_markup is not None:
+                message["reply_markup"] = method.reply_markup.model_dump(exclude_none=True)
+            self.harness.on_bot_message(chat_id, message)
+            if name == "EditMessageText":
+                return True
+            return Message.model_validate(message, context={"bot": bot})
+        if name == "CopyMessage":
+            return MessageId(message_id=next(self._message_ids))
+        if name == "CopyMessages":
+            return [MessageId(message_id=next(self._message_ids)) for _ in method.message_ids]
+        if name == "GetChatMember":
+            return ChatMemberMember.model_validate(
+                {"status": "member", "user": self.harness.user_dict(method.user_id)},
+                context={"bot": bot},
+            )
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        raise NotImplementedError("FakeSession не скачивает файлы")
+        yield b""  # pragma: no cover
+
+    async def close(self) -> None:
+        pass
+
+
+class SimGame:
+    __slots__ = ("index", "chat_id", "chat_key", "user_ids", "voted_round", "lobby_message")
+
+    def __init__(self, index: int, chat_id: int, user_ids: List[int]):
+        self.index = index
+        self.chat_id = chat_id
+        self.chat_key = f"{chat_id}_{GAME_THREAD_ID}"
+        self.user_ids = user_ids
+        self.voted_round: Optional[int] = None
+        self.lobby_message: Optional[dict] = None
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.session = FakeSession(self)
+        self.bot = Bot("123456:HARNESS", session=self.session)
+        self.dp = Dispatcher()
+        self.dp.include_router(handlers.router)
+        self._update_ids = itertools.count(1)
+        self._dm_ids = itertools.count(1)
+        self._games_by_chat: Dict[int, SimGame] = {}
+        self._games_by_user: Dict[int, SimGame] = {}
+        self._background: set = set()
+        self.latencies: List[float] = []
+        self.updates = 0
+        self.finished = 0
+        self.timed_out = 0
+        self.drained = 0
+        self.drain_seconds: Optional[float] = None
+
+    # --- описание чатов и пользователей ---
+
+    def chat_dict(self, chat_id: int) -> dict:
+        if chat_id > 0:
+            return {"id": chat_id, "type": "private", "first_name": f"P{chat_id}"}
+        return {"id": chat_id, "type": "supergroup", "title": f"Game {chat_id}", "is_forum": True}
+
+    def user_dict(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"P{user_id}", "username": f"p{user_id}"}
+
+    # --- подача обновлений ---
+
+    async def feed(self, payload: dict) -> None:
+        payload["update_id"] = next(self._update_ids)
+        update = Update.model_validate(payload, context={"bot": self.bot})
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+            self.updates += 1
+
+    async def send_command(self, game: SimGame, user_id: int, text: str) -> None:
+        await self.feed({"message": {
+            "message_id": 0,
+            "date": 1,
+            "chat": self.chat_dict(game.chat_id),
+            "from": self.user_dict(user_id),
+            "message_thread_id": GAME_THREAD_ID,
+            "is_topic_message": True,
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+        }})
+
+    async def send_private(self, user_id: int, content: dict) -> None:
+        await self.feed({"message": {
+            "message_id": next(self._dm_ids),
+            "date": 1,
+            "chat": self.chat_dict(user_id),
+            "from": self.user_dict(user_id),
+            **content,
+        }})
+
+    async def press(self, user_id: int, message: dict, data: str) -> None:
+        await self.feed({"callback_query": {
+            "id": str(next(self._update_ids)),
+            "from": self.user_dict(user_id),
+            "chat_instance": str(message["chat"]["id"]),
+            "message": message,
+            "data": data,
+        }})
+
+    def _later(self, delay: float, coro) -> None:
+        async def run():
+            await asyncio.sleep(delay)
+            await coro
+        task = asyncio.create_task(run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    # --- реакции симулированных игроков ---
+
+    def on_bot_message(self, chat_id: int, message: dict) -> None:
+        markup = message.get("reply_markup")
+        if not markup:
+            return
+        buttons = [b["callback_data"] for row in markup["inline_keyboard"] for b in row if "callback_data" in b]
+        if chat_id < 0:
+            sim = self._games_by_chat.get(chat_id)
+            if sim is not None and "join_game" in buttons:
+                sim.lobby_message = message
+            if any(_is_vote(d) for d in buttons):
+                self._schedule_votes(chat_id, message, buttons)
+            return
+        # Ночная клавиатура в ЛС: жмём на случайную цель (иногда — «пропустить»)
+        if chat_id not in self._games_by_user:
+            return
+        choices = [d for d in buttons if d != "back_to_main"]
+        targets = [d for d in choices if (decode_callback(d) or _NO_TARGET).target_id is not None]
+        if not choices:
+            return
+        data = self.rng.choice(targets if targets and self.rng.random() > 0.1 else choices)
+        self._later(self.rng.uniform(1, self.args.think_secs), self.press(chat_id, message, data))
+        if self.args.mafia_chat:
+            self._schedule_mafia_chat(chat_id)
+
+    def _schedule_mafia_chat(self, user_id: int) -> None:
+        """Мафиози пишет сообщникам длинный текст или фото с длинной подписью"""
+        sim = self._games_by_user[user_id]
+        game = game_manager.get_game(sim.chat_key)
+        player = game.players.get(user_id) if game else None
+        if player is None or player.role != PlayerRole.MAFIA or game.phase != GamePhase.NIGHT:
+            return
+        line = "Синьоры, план на эту ночь 🍝\n"
+        if self.rng.random() < 0.5:
+            content = {"text": line * self.rng.randint(100, 400)}
+        else:
+            content = {
+                "photo": [{"file_id": "photo", "file_unique_id": "photo", "width": 1, "height": 1}],
+                "caption": line[:-1] * self.rng.randint(20, 70),
+            }
+        self._later(self.rng.uniform(1, self.args.think_secs), self.send_private(user_id, content))
+
+    def _schedule_votes(self, chat_id: int, message: dict, buttons: List[str]) -> None:
+        sim = self._games_by_chat.get(chat_id)
+        game = game_manager.get_game(sim.chat_key) if sim else None
+        if not game or game.phase != GamePhase.VOTING or sim.voted_round == game.current_round:
+            return
+        sim.voted_round = game.current_round
+        votes = {d: decode_callback(d).target_id for d in buttons if _is_vote(d)}
+        for player in game.get_alive_players():
+            # За себя голосовать нельзя — такие нажатия игра всё равно отклонит
+            data = self.rng.choice([d for d, target in votes.items() if target != player.user_id])
+            self._later(self.rng.uniform(1, self.args.think_secs), self.press(player.user_id, message, data))
+
+    # --- одна игра ---
+
+    async def play(self, index: int) -> None:
+        players = self.rng.randint(self.args.min_players, self.args.max_players)
+        chat_id = -(10 ** 12 + index)
+        user_ids = [index * 100 + i + 1 for i in range(players)]
+        sim = SimGame(index, chat_id, user_ids)
+        self._games_by_chat[chat_id] = sim
+        for uid in user_ids:
+            self._games_by_user[uid] = sim
+        try:
+            host = user_ids[0]
+            await self.send_command(sim, host, "/mafia")
+            menu = {"message_id": 0, "date": 1, "chat": self.chat_dict(chat_id),
+                    "message_thread_id": GAME_THREAD_ID, "is_topic_message": True}
+            await self.press(host, menu, "start_game")
+            for uid in user_ids:
+                await asyncio.sleep(self.rng.uniform(0, 2))
+                await self.press(uid, sim.lobby_message or menu, "join_game")
+            await self.press(host, sim.lobby_message or menu, "ready_to_start")
+
+            task = handlers._autopilot_tasks.get(sim.chat_key)
+            if task is None:
+                logger.warning("loadtest: игра %s не запустилась", sim.chat_key)
+                return
+            await self._wait_game(sim.chat_key, task)
+        finally:
+            handlers._autopilot_tasks.pop(sim.chat_key, None)
+            self._games_by_chat.pop(chat_id, None)
+            for uid in user_ids:
+                self._games_by_user.pop(uid, None)
+
+    async def play_test(self, index: int) -> None:
+        """Тестовая игра create_test_game: 10 ботов, ходы делает тестовый автопилот"""
+        chat_key = f"{-(10 ** 12 + index)}_{GAME_THREAD_ID}"
+        game_manager.create_test_game(chat_key)
+        # Как кнопка тестовой игры: автопилот виден drain_autopilots
+        task = handlers._autopilot_tasks[chat_key] = asyncio.create_task(handlers._test_autopilot_loop(chat_key, self.bot))
+        try:
+            await self._wait_game(chat_key, task)
+        finally:
+            handlers._autopilot_tasks.pop(chat_key, None)
+            game_manager.end_game(chat_key)
+
+    async def _wait_game(self, chat_key: str, task: asyncio.Task) -> None:
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout=self.args.max_game_secs)
+            self.finished += 1
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            task.cancel()
+            game_manager.end_game(chat_key)
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise
+            # Автопилот остановила drain_autopilots
+            self.drained += 1
+
+    async def _drain(self) -> None:
+        """Плавная остановка посреди прогона, как перед перезапуском бота"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await handlers.drain_autopilots()
+        self.drain_seconds = loop.time() - started
+
+    async def run(self) -> dict:
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        play = self.play_test if self.args.test_games else self.play
+
+        async def guarded(index: int) -> None:
+            async with semaphore:
+                await play(index)
+
+        loop = asyncio.get_running_loop()
+        started_virtual = loop.time()
+        started_wall = time.perf_counter()
+        if self.args.drain_after is not None:
+            self._later(self.args.drain_after, self._drain())
+        await asyncio.gather(*(guarded(i + 1) for i in range(self.args.games)))
+        wall = time.perf_counter() - started_wall
+        return self.report(wall, loop.time() - started_virtual)
+
+    def report(self, wall: float, virtual: float) -> dict:
+        lat = sorted(self.latencies)
+
+        def pct(q: float) -> float:
+            return lat[min(len(lat) - 1, int(q * len(lat)))] * 1000 if lat else 0.0
+
+        games = max(1, self.args.games)
+        total_calls = sum(self.session.calls.values())
+        result = {
+            "games": self.args.games,
+            "finished": self.finished,
+            "timed_out": self.timed_out,
+            "wall_seconds": round(wall, 3),
+            "virtual_seconds": round(virtual, 1),
+            "updates": self.updates,
+            "updates_per_sec": round(self.updates / wall, 1) if wall else 0.0,
+            "handler_latency_ms": {"p50": round(pct(0.50), 3), "p99": round(pct(0.99), 3), "max": round(pct(1.0), 3)},
+            "api_calls_per_game": round(total_calls / games, 1),
+            "api_calls_by_method_per_game": {k: round(v / games, 2) for k, v in self.session.calls.most_common()},
+            "api_too_long": self.session.too_long,
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+        if self.drain_seconds is not None:
+            result["drained"] = self.drained
+            result["drain_seconds"] = round(self.drain_seconds, 1)
+        if tracemalloc.is_tracing():
+            result["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон игр «Мафии» на фейковом Bot API")
+    parser.add_argument("--games", type=int, default=1000, help="сколько игр сыграть")
+    parser.add_argument("--concurrency", type=int, default=500, help="сколько игр идёт одновременно")
+    parser.add_argument("--min-players", type=int, default=4)
+    parser.add_argument("--max-players", type=int, default=12)
+    parser.add_argument("--think-secs", type=float, default=20, help="максимальное «раздумье» игрока (вирт. сек.)")
+    parser.add_argument("--max-game-secs", type=float, default=3 * 3600, help="таймаут одной игры (вирт. сек.)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--test-games", action="store_true", help="играть тестовые игры (create_test_game) вместо игр с лобби")
+    parser.add_argument("--game-log", action="store_true", help="вести журнал событий игр и сверять его проигрывание с игрой")
+    parser.add_argument("--drain-after", type=float, help="через столько вирт. сек. плавно остановить автопилоты (drain_autopilots)")
+    parser.add_argument("--mafia-chat", action="store_true", help="мафиози по ночам пишут сообщникам длинные сообщения")
+    parser.add_argument("--outbound", action="store_true", help="пропускать вызовы через исходящую очередь с лимитами")
+    parser.add_argument("--tracemalloc", action="store_true", help="считать пиковую память через tracemalloc (медленнее)")
+    parser.add_argument("--log-level", default="ERROR", help="уровень логов бота во время прогона")
+    parser.add_argument("--json", action="store_true", help="вывести отчёт одной строкой JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> dict:
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper())
+    # Зерна жребия игр выводятся из --seed: прогон с тем же зерном повторяет те же игры
+    game_manager.set_rng_seed(args.seed)
+    if args.game_log:
+        game_manager.log = VerifyingGameLog()
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    async def run() -> dict:
+        harness = Harness(args)
+        if args.outbound:
+            from outbound import outbound
+            harness.session.middleware(outbound)
+        return await harness.run()
+
+    report = run_virtual(run)
+    if args.game_log:
+        log = game_manager.log
+        chunks = log.drain()
+        report["game_log"] = {
+            "checked": log.checked,
+            "mismatches": len(log.mismatches),
+            "bytes_per_game": round(sum(len(data) for _, _, data in chunks) / max(1, len(chunks)), 1),
+        }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        for key, value in report.items():
+            print(f"{key}: {value}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
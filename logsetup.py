@@ -0,0 +1,38 @@
+import logging
+from collections import Counter
+
+from config import LOG_LEVEL, LOG_SAMPLE_EVERY
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает каждую every-ю запись одного шаблона уровня ниже max_level.
+
+    Отладочные логи тиков автопилота и построения клавиатур повторяются
+    тысячами с одним и тем же шаблоном; выборка оставляет представление о них,
+    не забивая вывод. Шаблон — это record.msg до подстановки аргументов,
+    поэтому счётчиков столько, сколько разных строк логов в коде.
+    Записи INFO и выше проходят всегда.
+    """
+
+    def __init__(self, every: int, max_level: int = logging.INFO):
+        super().__init__()
+        self.every = max(1, every)
+        self.max_level = max_level
+        self._seen: Counter = Counter()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every == 1 or record.levelno >= self.max_level:
+            return True
+        key = (record.name, record.msg)
+        seen = self._seen[key]
+        self._seen[key] = seen + 1
+        return seen % self.every == 0
+
+
+def setup_logging(level: str = LOG_LEVEL, sample_every: int = LOG_SAMPLE_EVERY) -> None:
+    """Настраивает корневой логгер: уровень из LOG_LEVEL и выборка отладочных записей"""
+    logging.basicConfig(level=getattr(logging, level, logging.INFO))
+    if sample_every > 1:
+        # Фильтр вешаем на обработчики: фильтры логгера не видят записи дочерних логгеров
+        for handler in logging.getLogger().handlers:
+            handler.addFilter(SamplingFilter(sample_every))
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from config import LOOP_WATCHDOG_INTERVAL_SECS, LOOP_STALL_THRESHOLD_SECS, LOOP_STALL_HISTORY
+from metrics import loop_lag, loop_stalls
+
+logger = logging.getLogger(__name__)
+
+# Кадры из файлов проекта интереснее кадров asyncio/aiogram — по ним и ищем виновника.
+# Модули проекта лежат прямо в его каталоге, поэтому venv/ или .venv/ внутри него
+# (и их site-packages) к проекту не относятся
+_PROJECT_DIR = os.path.dirname(os.path.realpath(__file__))
+# Обвязка (сам сторож, middleware метрик) виновником не бывает
+_SKIP_FILES = {os.path.realpath(__file__), os.path.join(_PROJECT_DIR, "metrics.py")}
+_STACK_DEPTH = 8
+# co_filename -> файл проекта или нет
+_project_files: Dict[str, bool] = {}
+
+
+def _is_project_file(filename: str) -> bool:
+    result = _project_files.get(filename)
+    if result is None:
+        # "<string>", "<frozen ...>" — не файлы, их путь считался бы от текущего каталога
+        path = None if filename.startswith("<") else os.path.realpath(filename)
+        result = path is not None and os.path.dirname(path) == _PROJECT_DIR and path not in _SKIP_FILES
+        _project_files[filename] = result
+    return result
+
+
+class Stall(NamedTuple):
+    # Время (time.time()) возврата цикла после зависания
+    at: float
+    # Насколько позже срока проснулся тик сторожа, сек.
+    lag: float
+    # «файл:функция» внешнего кадра проекта (хендлер или корутина автопилота) или "?"
+    where: str
+    # Кадры проекта от внешнего к внутреннему: «файл:строка функция»
+    stack: Tuple[str, ...]
+
+
+def _project_frames(frame) -> List[str]:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        if _is_project_file(code.co_filename):
+            frames.append((os.path.basename(code.co_filename), frame.f_lineno, code.co_name))
+        frame = frame.f_back
+    # Внешний кадр (виновник) оставляем всегда, из остальных — самые глубокие
+    if len(frames) > _STACK_DEPTH:
+        frames = frames[:_STACK_DEPTH - 1] + frames[-1:]
+    return [f"{name}:{line} {func}" for name, line, func in reversed(frames)]
+
+
+class LoopWatchdog:
+    """Сторож задержки цикла событий.
+
+    Все игры живут в одном цикле событий, поэтому любой синхронный участок
+    останавливает таймеры и ответы на кнопки во всех чатах. Тик раз в interval
+    секунд меряет, насколько позже срока он проснулся (гистограмма в /metrics).
+    Фоновый поток следит за тиками и, если цикл не отвечает дольше threshold,
+    снимает стек потока цикла — так видно, какой хендлер или корутина его держит.
+    Сам зависший участок поток не трогает: запись появляется, когда цикл вернётся.
+    """
+
+    def __init__(
+        self,
+        interval: float = LOOP_WATCHDOG_INTERVAL_SECS,
+        threshold: float = LOOP_STALL_THRESHOLD_SECS,
+        history: int = LOOP_STALL_HISTORY,
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls: Deque[Stall] = deque(maxlen=history)
+        self.stall_count = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        # Когда (time.monotonic()) тик должен проснуться; пишет только цикл событий
+        self._due = 0.0
+        # Стек, снятый потоком во время текущего зависания; забирает тик
+        self._captured: Optional[Tuple[str, Tuple[str, ...]]] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._due = time.monotonic() + self.interval
+        self._stop.clear()
+        self._task = asyncio.create_task(self._tick())
+        if self.threshold > 0:
+            self._thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+            self._thread.start()
+        logger.info("watchdog: слежу за циклом событий (тик %s сек., порог %s сек.)", self.interval, self.threshold)
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    async def _tick(self) -> None:
+        while True:
+            self._due = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - self._due)
+            captured, self._captured = self._captured, None
+            self.last_lag = lag
+            if lag > self.max_lag:
+                self.max_lag = lag
+            loop_lag.observe(lag)
+            if self.threshold > 0 and lag >= self.threshold:
+                self._record(lag, captured)
+
+    def _record(self, lag: float, captured) -> None:
+        where, stack = captured or ("?", ())
+        self.stall_count += 1
+        self.stalls.append(Stall(time.time(), lag, where, stack))
+        loop_stalls.inc(where)
+        logger.warning("watchdog: цикл событий стоял %.0f мс, виновник: %s; стек: %s",
+                       lag * 1000, where, " <- ".join(reversed(stack)) or "не снят")
+
+    def _monitor(self) -> None:
+        # Опрашиваем чаще порога, чтобы успеть застать зависший участок
+        poll = max(0.01, self.threshold / 2)
+        while not self._stop.wait(poll):
+            if self._captured is not None or time.monotonic() - self._due < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = tuple(_project_frames(frame))
+            if stack:
+                name, _, func = stack[0].partition(" ")
+                where = f"{name.split(':')[0]}:{func}"
+            else:
+                where = "?"
+            self._captured = (where, stack)
+
+    def snapshot(self) -> dict:
+        """Сводка для админ-команды"""
+        return {
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+            "stalls": self.stall_count,
+            "threshold": self.threshold,
+            "recent": list(self.stalls),
+        }
+
+
+# Глобальный сторож цикла событий
+loop_watchdog = LoopWatchdog()
@@ -1,42 +1,138 @@
 import os
 import asyncio
 import logging
+import signal
+from contextlib import suppress
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from config import BOT_TOKEN, BOT_WORK_TIMEOUT_HOURS
-from handlers import router
+from config import (
+    BOT_TOKEN, BOT_WORK_TIMEOUT_HOURS, BOT_MODE, TELEGRAM_API_BASE,
+    STATE_DB_PATH, STATE_FLUSH_INTERVAL_SECS, STATE_SNAPSHOT_INTERVAL_SECS, GAME_LOG_ENABLED, STATS_ENABLED, SHARD_COUNT,
+    METRICS_PORT,
+)
+from game_logic import game_manager
+from logsetup import setup_logging
+from outbound import outbound
+from metrics import MetricsServer, api_metrics
+from loopwatch import loop_watchdog
+from sharding import ShardFront
+from handlers import router, drain_autopilots, resume_autopilots
+from gamelog import GameLog
+from stats import player_stats
+from storage import GameStore, StatePersister
+from webhook import run_polling, run_webhook
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Настройка логирования (LOG_LEVEL, LOG_SAMPLE_EVERY)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 async def main():
     """Главная функция бота"""
-    bot = Bot(token=BOT_TOKEN)
+    # Для локального/фейкового Bot API подменяем адрес сервера
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_BASE)) if TELEGRAM_API_BASE else None
+    bot = Bot(token=BOT_TOKEN, session=session)
+    # Все запросы к Bot API идут через общую очередь с лимитами Telegram
+    bot.session.middleware(outbound)
+    # Счётчики Bot API по методам; внутри outbound — видно каждую попытку
+    bot.session.middleware(api_metrics)
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
     
     dp.include_router(router)
     
+    # Шардированный режим: этот процесс только раздаёт обновления воркерам
+    front = None
+    if SHARD_COUNT > 1:
+        front = ShardFront(SHARD_COUNT, dp.resolve_used_update_types())
+        await front.start()
+
+    # Восстанавливаем игры, прерванные перезапуском бота
+    persister = None
+    persister_task = None
+    if STATE_DB_PATH and front is None:
+        store = GameStore(STATE_DB_PATH)
+        game_manager.restore_games(store.load())
+        # Таймеры фаз, переданные прошлым запуском при плавной остановке
+        game_manager.resume_phase_timers(store.take_handoff())
+        if GAME_LOG_ENABLED:
+            # Журнал событий пишет тот же persister, что и состояние игр
+            game_manager.log = GameLog()
+        if STATS_ENABLED:
+            # Итоги игр пишет тот же persister, /stats читает их из того же хранилища
+            player_stats.store = store
+            game_manager.stats = player_stats
+        persister = StatePersister(store, game_manager, STATE_FLUSH_INTERVAL_SECS, STATE_SNAPSHOT_INTERVAL_SECS)
+        persister_task = asyncio.create_task(persister.run())
+        resumed = resume_autopilots(bot)
+        if resumed:
+            logger.info("♻️ Возобновлено автопилотов: %s", resumed)
+    
+    # Задержка цикла событий и стеки зависаний (/loop_lag, /metrics)
+    loop_watchdog.start()
+
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = MetricsServer()
+        await metrics_server.start()
+
+    run_bot = run_webhook if BOT_MODE == "webhook" else run_polling
+    # Останавливаемся по SIGTERM/SIGINT (pkill, kill из CI, Ctrl+C) или по таймауту работы
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+    work_timeout = BOT_WORK_TIMEOUT_HOURS * 60 * 60 if BOT_WORK_TIMEOUT_HOURS and BOT_WORK_TIMEOUT_HOURS > 0 else None
+
+    bot_task = None
+    handoff = None
     try:
-        logger.info("🤖 Бот запускается...")
-        if BOT_WORK_TIMEOUT_HOURS and BOT_WORK_TIMEOUT_HOURS > 0:
-            logger.info(f"⏰ Бот будет работать {BOT_WORK_TIMEOUT_HOURS} часов (таймаут включен)")
-            # Запускаем бота с таймером
-            bot_task = asyncio.create_task(dp.start_polling(bot))
-            await asyncio.wait_for(bot_task, timeout=BOT_WORK_TIMEOUT_HOURS*60*60)
+        logger.info("🤖 Бот запускается (режим: %s)...", BOT_MODE)
+        if work_timeout:
+            logger.info("⏰ Бот будет работать %s часов (таймаут включен)", BOT_WORK_TIMEOUT_HOURS)
         else:
             logger.info("♾️ Таймаут отключен (Render/прод). Бот будет работать без ограничения времени.")
-            await dp.start_polling(bot)
-        
-    except asyncio.TimeoutError:
-        logger.info(f"⏰ Время работы истекло ({BOT_WORK_TIMEOUT_HOURS} часов), завершаем...")
-        # Останавливаем бота
-        await dp.stop_polling()
+        bot_task = asyncio.create_task(run_bot(bot, front or dp))
+        stop_task = asyncio.create_task(stop.wait())
+        done, _ = await asyncio.wait({bot_task, stop_task}, timeout=work_timeout, return_when=asyncio.FIRST_COMPLETED)
+        stop_task.cancel()
+        if bot_task in done:
+            bot_task.result()
+        else:
+            if stop.is_set():
+                logger.info("🛑 Получен сигнал остановки, завершаем плавно...")
+            else:
+                logger.info("⏰ Время работы истекло (%s часов), завершаем...", BOT_WORK_TIMEOUT_HOURS)
+            # Обновления ещё принимаются: новые игры не начинаем, а текущим даём
+            # дойти до ожидания таймера фазы и передаём остатки таймеров следующему запуску
+            if persister is not None:
+                game_manager.draining = True
+                handoff = await drain_autopilots()
+
     except Exception as e:
-        logger.error(f"❌ Ошибка: {e}")
+        logger.error("❌ Ошибка: %s", e)
     finally:
+        if bot_task is not None and not bot_task.done():
+            bot_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await bot_task
+            # polling мог успеть остановиться сам
+            if BOT_MODE != "webhook" and front is None:
+                with suppress(RuntimeError):
+                    await dp.stop_polling()
+        if front is not None:
+            await front.stop()
+        if persister is not None:
+            persister_task.cancel()
+            await persister.close(handoff)
+            logger.info("💾 Состояние игр сохранено")
+        logger.info("📤 Исходящая очередь: %s", outbound.snapshot_metrics())
+        if metrics_server is not None:
+            await metrics_server.stop()
+        await loop_watchdog.stop()
         await bot.session.close()
         logger.info("🔒 Сессия бота закрыта")
 
@@ -0,0 +1,297 @@
+"""Метрики бота в текстовом формате Prometheus.
+
+Счётчики и гистограммы — обычные словари, которые меняются только из потока
+событийного цикла, поэтому обновление метрики стоит одну-две операции со
+словарём без блокировок. Значения, которые и так хранятся в других объектах
+(число игр, глубина исходящей очереди), не дублируются: у таких Gauge есть
+функция, которая вызывается только при чтении /metrics.
+"""
+import bisect
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин по умолчанию (секунды): от миллисекунды до десяти секунд
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+Labels = Tuple[str, ...]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Текущее значение; с function значение считается только при чтении.
+
+    function возвращает число (метрика без меток) или словарь {метки: значение}.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Labels, float] = {}
+        self._function: Optional[Callable[[], object]] = None
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def set_function(self, function: Callable[[], object]) -> None:
+        self._function = function
+
+    def samples(self) -> List[str]:
+        values = self._values
+        if self._function is not None:
+            try:
+                result = self._function()
+            except Exception as e:
+                logger.warning("metrics: не удалось посчитать %s: %s", self.name, e)
+                return []
+            values = result if isinstance(result, dict) else {(): result}
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами.
+
+    На каждое наблюдение — поиск корзины и три инкремента в списке серии;
+    накопительные суммы по корзинам считаются только при выдаче /metrics.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счётчики корзин..., счётчик сверх последней корзины, сумма, количество]
+        self._series: Dict[Labels, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return series[-1] if series else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        bounds = [*self.buckets, float("inf")]
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, hits in zip(bounds, series):
+                cumulative += hits
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            suffix = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{suffix} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{suffix} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Глобальный реестр метрик процесса
+registry = Registry()
+
+handler_latency = registry.histogram(
+    "mafia_handler_duration_seconds", "Время обработки апдейта хендлером", ("handler",)
+)
+handler_errors = registry.counter(
+    "mafia_handler_errors_total", "Исключения, вылетевшие из хендлеров", ("handler",)
+)
+games_active = registry.gauge(
+    "mafia_games_active", "Активные игры по фазам", ("phase",)
+)
+autopilot_lag = registry.histogram(
+    "mafia_autopilot_lag_seconds", "Опоздание пробуждения автопилота относительно дедлайна", buckets=LAG_BUCKETS
+)
+api_requests = registry.counter(
+    "mafia_api_requests_total", "Запросы к Bot API (с повторами)", ("method",)
+)
+api_errors = registry.counter(
+    "mafia_api_errors_total", "Запросы к Bot API, завершившиеся ошибкой", ("method",)
+)
+api_retry_after = registry.counter(
+    "mafia_api_retry_after_total", "Ответы 429 (TelegramRetryAfter) от Bot API", ("method",)
+)
+api_latency = registry.histogram(
+    "mafia_api_request_duration_seconds", "Время запроса к Bot API без ожидания в очереди", ("method",)
+)
+loop_lag = registry.histogram(
+    "mafia_event_loop_lag_seconds", "Опоздание тика сторожа цикла событий", buckets=LAG_BUCKETS
+)
+loop_stalls = registry.counter(
+    "mafia_event_loop_stalls_total", "Зависания цикла событий дольше порога по месту в коде", ("where",)
+)
+outbound_queue_depth = registry.gauge(
+    "mafia_outbound_queue_depth", "Запросы, ждущие лимитов в исходящей очереди"
+)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware роутера: время работы сработавшего хендлера.
+
+    Вешается на router.message/router.callback_query как inner middleware,
+    поэтому вызывается только для хендлера, чьи фильтры прошли, и видит его
+    в data["handler"].
+    """
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - started, name)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: счётчики и время запросов по методам Bot API.
+
+    Подключается после outbound, то есть внутри него: считается каждая реальная
+    попытка, включая повторы после 429, а ожидание в очереди в время не входит.
+    """
+
+    async def __call__(self, make_request, bot, method):
+        name = getattr(method, "__api_method__", type(method).__name__)
+        api_requests.inc(name)
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            api_retry_after.inc(name)
+            api_errors.inc(name)
+            raise
+        except Exception:
+            api_errors.inc(name)
+            raise
+        finally:
+            api_latency.observe(time.perf_counter() - started, name)
+
+
+class MetricsServer:
+    """HTTP-эндпоинт /metrics для Prometheus на отдельном (по умолчанию локальном) порту"""
+
+    def __init__(self, host: str = METRICS_HOST, port: int = METRICS_PORT, registry_: Registry = registry):
+        self.host = host
+        self.port = port
+        self.registry = registry_
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.registry.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info("metrics: эндпоинт http://%s:%s/metrics", self.host, self.port)
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# Глобальные middleware метрик
+handler_metrics = HandlerMetricsMiddleware()
+api_metrics = ApiMetricsMiddleware()
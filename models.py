@@ -1,6 +1,7 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from typing import Dict, List, Optional, Set
 from enum import Enum
+import itertools
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,7 +20,12 @@ class PlayerRole(Enum):
     COMMISSIONER = "комиссар"
     BUTTERFLY = "ночная_бабочка"
 
-@dataclass
+# Поля игрока, от которых зависят индексы PlayerRoster
+_INDEXED_PLAYER_FIELDS = frozenset(("is_alive", "role"))
+# Версии ростеров берутся из общего счётчика: у разных игр они не совпадают
+_ROSTER_VERSIONS = itertools.count(1)
+
+@dataclass(slots=True)
 class Player:
     user_id: int
     username: str
@@ -33,63 +39,315 @@ class Player:
     role_info_sent: bool = False
     # Для доктора: может один раз за игру лечить себя
     doctor_self_save_used: bool = False
+    # Раунд, в котором игрок погиб (0 — жив); для статистики выживания
+    died_round: int = 0
+    # Ростер игры, которому игрок сообщает о смене is_alive/role (служебное поле)
+    _roster: Optional["PlayerRoster"] = field(default=None, init=False, repr=False, compare=False)
+    # Подпись для кнопок и табло, считается при первом обращении (служебное поле)
+    _label: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def label(self) -> str:
+        """Имя игрока для кнопок и табло: «Имя (@username)»"""
+        label = self._label
+        if label is None:
+            label = f"{self.first_name}{f' (@{self.username})' if self.username else ''}"
+            object.__setattr__(self, "_label", label)
+        return label
+
+    def __setattr__(self, name, value):
+        roster = getattr(self, "_roster", None) if name in _INDEXED_PLAYER_FIELDS else None
+        if roster is None:
+            object.__setattr__(self, name, value)
+            return
+        old = getattr(self, name)
+        object.__setattr__(self, name, value)
+        if old != value:
+            roster._player_changed(self, name)
+
+class PlayerRoster(dict):
+    """Словарь игроков user_id -> Player с инкрементальными индексами.
+
+    Держит живых игроков и живых по ролям, обновляя их при добавлении/удалении
+    игрока и при изменении его is_alive/role (Player сообщает об этом сам),
+    поэтому выборки живых и подсчёт ролей не проходят по всем игрокам.
+    version меняется при каждом изменении состава и уникальна среди всех
+    ростеров процесса — по ней можно кешировать, в том числе между играми.
+    Порядок выборок совпадает с порядком игроков в словаре.
+    """
+
+    __slots__ = ("version", "_alive", "_alive_by_role", "_stale")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.version = next(_ROSTER_VERSIONS)
+        self._alive: Dict[int, "Player"] = {}
+        self._alive_by_role: Dict[PlayerRole, Dict[int, "Player"]] = {}
+        # Изменения, ломающие порядок (воскрешение, смена роли), — пересборка при чтении
+        self._stale = False
+        self.update(*args, **kwargs)
+
+    # --- изменение состава ---
+
+    def __setitem__(self, user_id: int, player: "Player") -> None:
+        replaced = user_id in self
+        if replaced:
+            self._detach(user_id, dict.__getitem__(self, user_id))
+        dict.__setitem__(self, user_id, player)
+        object.__setattr__(player, "_roster", self)
+        if replaced:
+            self._stale = True
+        elif not self._stale and player.is_alive:
+            self._alive[user_id] = player
+            if player.role is not None:
+                self._alive_by_role.setdefault(player.role, {})[user_id] = player
+        self.version = next(_ROSTER_VERSIONS)
+
+    def __delitem__(self, user_id: int) -> None:
+        player = dict.__getitem__(self, user_id)
+        dict.__delitem__(self, user_id)
+        self._detach(user_id, player)
+        self.version = next(_ROSTER_VERSIONS)
+
+    def pop(self, user_id, *default):
+        if user_id not in self:
+            if default:
+                return default[0]
+            raise KeyError(user_id)
+        player = dict.__getitem__(self, user_id)
+        del self[user_id]
+        return player
+
+    def popitem(self):
+        user_id = next(reversed(self))
+        return user_id, self.pop(user_id)
+
+    def setdefault(self, user_id, player=None):
+        if user_id not in self:
+            self[user_id] = player
+        return dict.__getitem__(self, user_id)
+
+    def update(self, *args, **kwargs):
+        for user_id, player in dict(*args, **kwargs).items():
+            self[user_id] = player
+
+    def clear(self) -> None:
+        for player in dict.values(self):
+            object.__setattr__(player, "_roster", None)
+        dict.clear(self)
+        self._alive.clear()
+        self._alive_by_role.clear()
+        self._stale = False
+        self.version = next(_ROSTER_VERSIONS)
+
+    def _detach(self, user_id: int, player: "Player") -> None:
+        if player._roster is self:
+            object.__setattr__(player, "_roster", None)
+        self._alive.pop(user_id, None)
+        if player.role is not None:
+            by_role = self._alive_by_role.get(player.role)
+            if by_role is not None:
+                by_role.pop(player.user_id, None)
+
+    def _player_changed(self, player: "Player", name: str) -> None:
+        self.version = next(_ROSTER_VERSIONS)
+        if self._stale:
+            return
+        if name == "is_alive" and not player.is_alive:
+            # Смерть не меняет порядок оставшихся — просто убираем из индексов
+            self._alive.pop(player.user_id, None)
+            if player.role is not None:
+                self._alive_by_role.get(player.role, {}).pop(player.user_id, None)
+        else:
+            self._stale = True
+
+    def _rebuild(self) -> None:
+        self._alive = {uid: p for uid, p in dict.items(self) if p.is_alive}
+        self._alive_by_role = {}
+        for uid, p in self._alive.items():
+            if p.role is not None:
+                self._alive_by_role.setdefault(p.role, {})[uid] = p
+        self._stale = False
+
+    # --- выборки ---
+
+    def alive_players(self) -> List["Player"]:
+        if self._stale:
+            self._rebuild()
+        return list(self._alive.values())
+
+    def alive_count(self) -> int:
+        if self._stale:
+            self._rebuild()
+        return len(self._alive)
+
+    def alive_with_role(self, role: PlayerRole) -> List["Player"]:
+        if self._stale:
+            self._rebuild()
+        return list(self._alive_by_role.get(role, {}).values())
 
-@dataclass
+    def count_alive_with_role(self, role: PlayerRole) -> int:
+        if self._stale:
+            self._rebuild()
+        return len(self._alive_by_role.get(role, ()))
+
+    def alive_roles(self) -> Set[PlayerRole]:
+        """Роли, у которых остался хотя бы один живой игрок"""
+        if self._stale:
+            self._rebuild()
+        return {role for role, members in self._alive_by_role.items() if members}
+
+_MASK64 = (1 << 64) - 1
+_GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+
+
+class GameRandom:
+    """Поток жребия игры: splitmix64 над (rng_seed, rng_step) игры.
+
+    Всё состояние генератора — два числа в GameState, поэтому оно сохраняется
+    вместе с игрой, а бросок не требует ни отдельного объекта random.Random
+    (его инициализация в разы дороже самого броска), ни его сериализации.
+    Одинаковые зерно и порядок бросков дают одинаковую игру, в том числе
+    после восстановления из базы.
+    """
+
+    __slots__ = ("game",)
+
+    def __init__(self, game: "GameState"):
+        self.game = game
+
+    def _next(self) -> int:
+        game = self.game
+        game.rng_step += 1
+        z = (game.rng_seed + game.rng_step * _GOLDEN_GAMMA) & _MASK64
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+        return z ^ (z >> 31)
+
+    def _randbelow(self, n: int) -> int:
+        # Отбрасывание, как в random.Random: без перекоса в сторону младших индексов
+        shift = 64 - n.bit_length()
+        r = self._next() >> shift
+        while r >= n:
+            r = self._next() >> shift
+        return r
+
+    def random(self) -> float:
+        return (self._next() >> 11) * (1.0 / (1 << 53))
+
+    def choice(self, seq):
+        if not seq:
+            raise IndexError("Cannot choose from an empty sequence")
+        return seq[self._randbelow(len(seq))]
+
+    def shuffle(self, x: list) -> None:
+        for i in reversed(range(1, len(x))):
+            j = self._randbelow(i + 1)
+            x[i], x[j] = x[j], x[i]
+
+# Значение по умолчанию для контейнеров GameState, которые создаются при первом обращении
+_LAZY = object()
+
+def lazy_container(factory):
+    """Поле-контейнер GameState, которое не занимает память, пока к нему не обратились"""
+    return field(default=_LAZY, metadata={"lazy_factory": factory})
+
+@dataclass(slots=True)
 class GameState:
     chat_id: str  # Теперь это chat_key
     # Кто создал лобби: только он (или администраторы чата) могут раздать роли
     lobby_creator_id: Optional[int] = None
     phase: GamePhase = GamePhase.LOBBY
-    players: Dict[int, Player] = field(default_factory=dict)
+    players: Dict[int, Player] = field(default_factory=PlayerRoster)
     current_round: int = 0
     night_kill_target: Optional[int] = None
     # Ночные действия (мульти-роли поддерживаются)
-    doctor_saves: Dict[int, Optional[int]] = field(default_factory=dict)  # doctor_id -> target_id|None
+    doctor_saves: Dict[int, Optional[int]] = lazy_container(dict)  # doctor_id -> target_id|None
     butterfly_distract_target: Optional[int] = None
-    commissioner_checks: Dict[int, int] = field(default_factory=dict)  # commissioner_id -> target_id
-    commissioner_check_results: Dict[int, bool] = field(default_factory=dict)  # commissioner_id -> is_mafia
-    votes: Dict[int, int] = field(default_factory=dict)  # player_id -> target_id
-    mafia_votes: Dict[int, int] = field(default_factory=dict)  # mafia_player_id -> target_id
+    commissioner_checks: Dict[int, int] = lazy_container(dict)  # commissioner_id -> target_id
+    commissioner_check_results: Dict[int, bool] = lazy_container(dict)  # commissioner_id -> is_mafia
+    votes: Dict[int, int] = lazy_container(dict)  # player_id -> target_id
+    mafia_votes: Dict[int, int] = lazy_container(dict)  # mafia_player_id -> target_id
     game_started: bool = False
-    night_actions_completed: Set[str] = field(default_factory=set)
+    night_actions_completed: Set[str] = lazy_container(set)
     # Для дневных объявлений: сохраняем итоги прошлой ночи
-    last_doctor_save_targets: List[int] = field(default_factory=list)
+    last_doctor_save_targets: List[int] = lazy_container(list)
     last_butterfly_distract_target: Optional[int] = None
-    last_commissioner_checks: List[tuple] = field(default_factory=list)  # (commissioner_id, target_id, is_mafia)
+    last_commissioner_checks: List[tuple] = lazy_container(list)  # (commissioner_id, target_id, is_mafia)
     # Чтобы не дублировать ночные клавиатуры
     night_prompts_sent: bool = False
     # Ограничение врача: нельзя лечить одного и того же игрока две ночи подряд (кроме одноразового самолечения)
-    doctor_last_save_target: Dict[int, Optional[int]] = field(default_factory=dict)  # doctor_id -> last non-None target_id
+    doctor_last_save_target: Dict[int, Optional[int]] = lazy_container(dict)  # doctor_id -> last non-None target_id
     # Флаг для предотвращения дублирования сообщения "все действия получены"
     all_actions_notified: bool = False
     # ID текущего сообщения с голосованием/табло, чтобы удалять старое
     current_voting_message_id: Optional[int] = None
     # Множество игроков, которые выбрали "пропустить голос"
-    skipped_voters: Set[int] = field(default_factory=set)
+    skipped_voters: Set[int] = lazy_container(set)
     # Флаг: первое дневное голосование пропущено (после самой первой ночи)
     first_voting_skipped: bool = False
     # Флаг: идёт переголосование (после ничьей)
     revote_active: bool = False
     # Кандидаты переголосования (IDs игроков с равным числом голосов)
-    revote_candidates: Set[int] = field(default_factory=set)
+    revote_candidates: Set[int] = lazy_container(set)
     # Игроки, которых уже отвлекала ночная бабочка (нельзя отвлекать повторно)
-    butterfly_distracted_players: Set[int] = field(default_factory=set)
+    butterfly_distracted_players: Set[int] = lazy_container(set)
     # Флаг тестовой игры
     is_test_game: bool = False
+    # Короткий токен игры в callback_data кнопок (выдаёт GameManager)
+    callback_token: int = 0
+    # Когда (time.time()) истекает таймер текущей фазы и для какой фазы он заведён
+    # ("night:2"); по ним автопилот после перезапуска продолжает фазу, а не начинает заново
+    phase_deadline_ts: float = 0.0
+    phase_deadline_for: str = ""
+    # Жребий игры: зерно и номер следующего шага потока. Сохраняются вместе с игрой,
+    # поэтому её раздачу ролей, ничьи и фразы ведущего можно воспроизвести
+    rng_seed: int = 0
+    rng_step: int = 0
     
+    def __post_init__(self):
+        if not isinstance(self.players, PlayerRoster):
+            self.players = PlayerRoster(self.players)
+
+    def __setattr__(self, name, value):
+        # Контейнер по умолчанию не создаём — слот остаётся пустым до первого обращения
+        if value is not _LAZY:
+            object.__setattr__(self, name, value)
+
+    def __getattr__(self, name):
+        # Вызывается только для пустого слота: создаём контейнер фазы по требованию
+        factory = LAZY_CONTAINER_FIELDS.get(name)
+        if factory is None:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        value = factory()
+        object.__setattr__(self, name, value)
+        return value
+
+    def is_allocated(self, name: str) -> bool:
+        """Создан ли уже ленивый контейнер (проверка без его создания)"""
+        try:
+            object.__getattribute__(self, name)
+        except AttributeError:
+            return False
+        return True
+
+    def rng(self) -> "GameRandom":
+        """Жребий игры (раздача ролей, ничьи, фразы ведущего)"""
+        return GameRandom(self)
+
     def get_alive_players(self) -> List[Player]:
-        alive_players = [p for p in self.players.values() if p.is_alive]
-        logger.debug(f"get_alive_players: найдено {len(alive_players)} живых игроков из {len(self.players)}")
+        alive_players = self.players.alive_players()
+        logger.debug("get_alive_players: найдено %s живых игроков из %s", len(alive_players), len(self.players))
         return alive_players
     
     def get_players_by_role(self, role: PlayerRole) -> List[Player]:
-        players_with_role = [p for p in self.players.values() if p.role == role and p.is_alive]
-        logger.debug(f"get_players_by_role: найдено {len(players_with_role)} игроков с ролью {role}")
+        players_with_role = self.players.alive_with_role(role)
+        logger.debug("get_players_by_role: найдено %s игроков с ролью %s", len(players_with_role), role)
         return players_with_role
     
     def count_alive_by_role(self, role: PlayerRole) -> int:
-        count = len(self.get_players_by_role(role))
-        logger.debug(f"count_alive_by_role: количество живых игроков с ролью {role}: {count}")
+        count = self.players.count_alive_with_role(role)
+        logger.debug("count_alive_by_role: количество живых игроков с ролью %s: %s", role, count)
         return count
     
     def is_game_over(self) -> tuple[bool, Optional[str]]:
@@ -101,20 +359,22 @@ class GameState:
         
         total_civilians = alive_civilians + alive_doctors + alive_commissioners + alive_butterflies
         
-        logger.debug(f"is_game_over: мафия: {alive_mafia}, мирные: {total_civilians}")
+        logger.debug("is_game_over: мафия: %s, мирные: %s", alive_mafia, total_civilians)
         
         # Мафия побеждает, если их количество больше или равно мирных
         if alive_mafia >= total_civilians:
-            logger.debug(f"is_game_over: мафия побеждает")
+            logger.debug("is_game_over: мафия побеждает")
             return True, "mafia"
         
         # Мирные побеждают, если вся мафия убита
         if alive_mafia == 0:
-            logger.debug(f"is_game_over: мирные побеждают")
+            logger.debug("is_game_over: мирные побеждают")
             return True, "civilians"
         
-        logger.debug(f"is_game_over: игра продолжается")
+        logger.debug("is_game_over: игра продолжается")
         return False, ""
 
-
-
+# Ленивые контейнеры GameState: имя поля -> фабрика (dict/set/list)
+LAZY_CONTAINER_FIELDS = {
+    f.name: f.metadata["lazy_factory"] for f in fields(GameState) if "lazy_factory" in f.metadata
+}
@@ -0,0 +1,340 @@
+"""Пакетное подведение итогов ночи на NumPy.
+
+То же, что GameManager.process_night_results, но для тысяч игр сразу:
+ночные действия укладываются в массивы (строка — игра, столбец — место
+игрока в порядке game.players), а убийство, лечение, отвлечение и проверки
+комиссара считаются несколькими векторными операциями. Нужен симулятору
+баланса и массовым переигровкам; боту NumPy не требуется.
+
+Жребий (ничья в голосах мафии, случайная жертва, если мафия не голосовала)
+задаётся явно: tie_break[i] из [0, 1) выбирает seq[int(u * len(seq))] —
+так же, как это сделал бы жребий игры (GameState.rng), если его подменить.
+На этом держится дифференциальная проверка против скалярного пути:
+
+    BOT_TOKEN=1:x python nightbatch.py --games 200000
+"""
+import argparse
+import copy
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import ROLE_DISTRIBUTION
+from game_logic import GameManager
+from models import GamePhase, GameState, Player, PlayerRole
+
+# Коды ролей в массиве roles; -1 — пустое место
+ROLE_CODES = {role: code for code, role in enumerate(PlayerRole)}
+MAFIA = ROLE_CODES[PlayerRole.MAFIA]
+NO_SLOT = -1
+
+
+@dataclass
+class NightBatch:
+    """Ночные действия пачки игр; цели — номера мест, NO_SLOT — нет цели"""
+    alive: np.ndarray               # bool [G, N]
+    roles: np.ndarray               # int8 [G, N]
+    kill_target: np.ndarray         # int16 [G] — зафиксированная цель мафии
+    mafia_votes: np.ndarray         # int16 [G, M] — голоса мафии в порядке подачи
+    doctor_saves: np.ndarray        # int16 [G, D]
+    commissioner_checks: np.ndarray  # int16 [G, C]
+    butterfly_target: np.ndarray    # int16 [G]
+    tie_break: np.ndarray           # float64 [G] из [0, 1)
+
+    def __len__(self) -> int:
+        return len(self.kill_target)
+
+
+@dataclass
+class NightOutcome:
+    killed: np.ndarray              # int16 [G] — место убитого или NO_SLOT
+    saved: np.ndarray               # bool [G] — жертву мафии спас доктор
+    alive: np.ndarray               # bool [G, N] — живые после ночи
+    check_valid: np.ndarray         # bool [G, C] — проверка попадает в last_commissioner_checks
+    check_is_mafia: np.ndarray      # bool [G, C]
+    distracted: np.ndarray          # int16 [G] — кого бабочка отвлекла (блокирует голос днём)
+
+
+def _take(matrix: np.ndarray, slots: np.ndarray) -> np.ndarray:
+    """matrix[i, slots[i]] для каждой строки; slots уже без NO_SLOT"""
+    return matrix[np.arange(len(slots)), slots]
+
+
+def _nth_true(mask: np.ndarray, u: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Номер места int(u * k)-го True в строке (k — число True) и признак, что True есть"""
+    count = mask.sum(1)
+    k = np.minimum((u * count).astype(np.int64), np.maximum(count - 1, 0))
+    cumulative = np.cumsum(mask, 1)
+    return np.argmax(cumulative > k[:, None], 1), count > 0
+
+
+def resolve_nights(batch: NightBatch) -> NightOutcome:
+    """Итоги ночи для всей пачки; повторяет ветки process_night_results"""
+    alive = batch.alive.copy()
+    roles = batch.roles
+    games, slots = alive.shape
+    rows = np.arange(games)
+
+    saved_mask = np.zeros((games, slots), dtype=bool)
+    has_save = batch.doctor_saves >= 0
+    saved_mask[np.repeat(rows, batch.doctor_saves.shape[1])[has_save.ravel()], batch.doctor_saves[has_save]] = True
+
+    # Ветка 1: цель зафиксирована, когда проголосовала вся мафия
+    has_target = batch.kill_target >= 0
+
+    # Ветка 2: голоса есть, цели нет — большинство, при ничьей жребий в порядке первых голосов
+    votes = batch.mafia_votes
+    has_votes = (votes >= 0).any(1)
+    mafia_alive = ((roles == MAFIA) & alive).any(1)
+    use_votes = ~has_target & has_votes & mafia_alive
+    onehot = votes[:, :, None] == np.arange(slots)[None, None, :]
+    counts = onehot.sum(1)
+    first_vote = np.where(onehot.any(1), onehot.argmax(1), votes.shape[1])
+    leaders = (counts == counts.max(1, keepdims=True)) & (counts > 0)
+    order = np.argsort(np.where(leaders, first_vote, slots + votes.shape[1]), axis=1, kind="stable")
+    k = np.minimum((batch.tie_break * leaders.sum(1)).astype(np.int64), np.maximum(leaders.sum(1) - 1, 0))
+    by_votes = order[rows, k]
+
+    target = np.where(has_target, batch.kill_target, np.where(use_votes, by_votes, NO_SLOT))
+    safe_target = np.maximum(target, 0)
+    saved = (target >= 0) & _take(alive, safe_target) & _take(saved_mask, safe_target)
+    killed = np.where((target >= 0) & _take(alive, safe_target) & ~saved, target, NO_SLOT)
+    hit = killed >= 0
+    alive[rows[hit], killed[hit]] = False
+
+    # Ветка 3: живая мафия вообще не голосовала — случайная жертва среди живых не-мафиози
+    mafia_alive = ((roles == MAFIA) & alive).any(1)
+    random_pick = ~hit & mafia_alive & ~has_votes
+    candidates = alive & (roles != MAFIA) & random_pick[:, None]
+    picked, has_candidate = _nth_true(candidates, batch.tie_break)
+    random_pick &= has_candidate
+    random_saved = random_pick & _take(saved_mask, picked)
+    random_kill = random_pick & ~random_saved
+    killed = np.where(random_kill, picked, killed)
+    saved |= random_saved
+    alive[rows[random_kill], picked[random_kill]] = False
+
+    checks = batch.commissioner_checks
+    check_valid = checks >= 0
+    check_roles = np.take_along_axis(roles, np.maximum(checks, 0), 1)
+    check_valid &= check_roles >= 0
+    return NightOutcome(
+        killed=killed.astype(np.int16),
+        saved=saved,
+        alive=alive,
+        check_valid=check_valid,
+        check_is_mafia=check_valid & (check_roles == MAFIA),
+        distracted=batch.butterfly_target,
+    )
+
+
+def _pad(rows: List[List[int]]) -> np.ndarray:
+    width = max((len(r) for r in rows), default=0) or 1
+    out = np.full((len(rows), width), NO_SLOT, dtype=np.int16)
+    for i, r in enumerate(rows):
+        out[i, :len(r)] = r
+    return out
+
+
+def pack_games(games: Sequence[GameState], tie_break: Sequence[float]) -> Tuple[NightBatch, List[List[int]]]:
+    """Укладывает ночные действия игр в массивы; второй результат — user_id по местам.
+
+    Последний столбец всегда пустой: в него попадают цели, которых нет в игре
+    (скалярный путь такие цели просто не убивает и не проверяет).
+    """
+    slots = max((len(g.players) for g in games), default=0) + 1
+    absent = slots - 1
+    alive = np.zeros((len(games), slots), dtype=bool)
+    roles = np.full((len(games), slots), -1, dtype=np.int8)
+    kill_target = np.full(len(games), NO_SLOT, dtype=np.int16)
+    butterfly_target = np.full(len(games), NO_SLOT, dtype=np.int16)
+    mafia_votes, doctor_saves, checks, user_ids = [], [], [], []
+    for i, game in enumerate(games):
+        ids = list(game.players)
+        index = {uid: slot for slot, uid in enumerate(ids)}
+        for slot, player in enumerate(game.players.values()):
+            alive[i, slot] = player.is_alive
+            roles[i, slot] = ROLE_CODES.get(player.role, -1)
+        # Как и `if game.night_kill_target:` — нулевой id целью не считается
+        if game.night_kill_target:
+            kill_target[i] = index.get(game.night_kill_target, absent)
+        if game.butterfly_distract_target is not None:
+            butterfly_target[i] = index.get(game.butterfly_distract_target, absent)
+        mafia_votes.append([index.get(t, absent) for t in game.mafia_votes.values()])
+        doctor_saves.append([index.get(t, absent) if t is not None else NO_SLOT for t in game.doctor_saves.values()])
+        checks.append([index.get(t, absent) for t in game.commissioner_checks.values()])
+        user_ids.append(ids)
+    batch = NightBatch(
+        alive=alive, roles=roles, kill_target=kill_target, mafia_votes=_pad(mafia_votes),
+        doctor_saves=_pad(doctor_saves), commissioner_checks=_pad(checks),
+        butterfly_target=butterfly_target, tie_break=np.asarray(tie_break, dtype=np.float64),
+    )
+    return batch, user_ids
+
+
+def apply_outcome(manager: GameManager, chat_keys: Sequence[str], outcome: NightOutcome,
+                  user_ids: List[List[int]]) -> List[Optional[int]]:
+    """Переносит итоги в GameState так же, как process_night_results (без текста сводки).
+
+    Возвращает user_id убитых — второй элемент результата process_night_results.
+    """
+    killed_ids: List[Optional[int]] = []
+    for i, chat_key in enumerate(chat_keys):
+        game = manager.active_games[chat_key]
+        checks = list(game.commissioner_checks.items())
+        game.last_doctor_save_targets = list(game.doctor_saves.values())
+        game.last_butterfly_distract_target = game.butterfly_distract_target
+        game.last_commissioner_checks = [
+            (cid, tid, bool(outcome.check_is_mafia[i, j]))
+            for j, (cid, tid) in enumerate(checks) if outcome.check_valid[i, j]
+        ]
+        slot = int(outcome.killed[i])
+        killed_id = None
+        if slot >= 0:
+            killed_id = user_ids[i][slot]
+            game.players[killed_id].is_alive = False
+            manager._refresh_mafia_mapping(chat_key)
+        killed_ids.append(killed_id)
+
+        game.doctor_saves.clear()
+        game.butterfly_distract_target = None
+        game.commissioner_checks.clear()
+        game.commissioner_check_results.clear()
+        game.night_kill_target = None
+        game.mafia_votes.clear()
+        game.night_actions_completed.clear()
+        game.all_actions_notified = False
+        game.night_prompts_sent = False
+        game.phase = GamePhase.DAY
+        manager.touch(chat_key)
+    return killed_ids
+
+
+# --- дифференциальная проверка и замер ---
+
+class _FixedChoice:
+    """Подмена жребия игры (GameState.rng): choice берёт int(u * len) — как tie_break"""
+
+    def __init__(self, u: float):
+        self.u = u
+
+    def choice(self, seq):
+        return seq[int(self.u * len(seq))]
+
+
+def random_night(rng: random.Random, chat_key: str) -> GameState:
+    """Случайная ночь, включая редкие состояния (цель без голосов, мёртвые и чужие цели)"""
+    n = rng.randint(4, 20)
+    roles = []
+    for name, count in ROLE_DISTRIBUTION[n].items():
+        roles += [PlayerRole(name)] * count
+    rng.shuffle(roles)
+    game = GameState(chat_id=chat_key, phase=GamePhase.NIGHT, game_started=True)
+    for uid, role in enumerate(roles, start=1):
+        player = Player(user_id=uid, username=f"u{uid}", first_name=f"U{uid}", role=role)
+        player.is_alive = rng.random() > 0.3
+        game.players[uid] = player
+    alive = [p.user_id for p in game.get_alive_players()] or [1]
+    everyone = list(game.players) + [999]
+    pick = lambda: rng.choice(alive if rng.random() < 0.9 else everyone)
+    voters = [p.user_id for p in game.get_players_by_role(PlayerRole.MAFIA)]
+    rng.shuffle(voters)
+    for uid in voters[:rng.randint(0, len(voters))]:
+        game.mafia_votes[uid] = pick()
+    if game.mafia_votes and rng.random() < 0.5 or rng.random() < 0.05:
+        game.night_kill_target = pick()
+    for doctor in game.get_players_by_role(PlayerRole.DOCTOR):
+        if rng.random() < 0.8:
+            game.doctor_saves[doctor.user_id] = pick() if rng.random() < 0.85 else None
+    for commissioner in game.get_players_by_role(PlayerRole.COMMISSIONER):
+        if rng.random() < 0.8:
+            game.commissioner_checks[commissioner.user_id] = pick()
+    if rng.random() < 0.6:
+        game.butterfly_distract_target = pick()
+    return game
+
+
+def _state(game: GameState) -> tuple:
+    return (
+        tuple((uid, p.is_alive) for uid, p in game.players.items()),
+        tuple(game.last_doctor_save_targets), game.last_butterfly_distract_target,
+        tuple(game.last_commissioner_checks), game.phase, game.night_kill_target,
+        dict(game.mafia_votes), dict(game.doctor_saves), dict(game.commissioner_checks),
+    )
+
+
+def differential_check(games: int, seed: int) -> int:
+    """Сравнивает пакетный путь со скалярным; возвращает число расхождений"""
+    rng = random.Random(seed)
+    nights = [random_night(rng, f"n_{i}") for i in range(games)]
+    tie_break = [rng.random() for _ in range(games)]
+    chat_keys = [g.chat_id for g in nights]
+
+    scalar, batched = GameManager(), GameManager()
+    for game in nights:
+        scalar.active_games[game.chat_id] = copy.deepcopy(game)
+        batched.active_games[game.chat_id] = copy.deepcopy(game)
+
+    original_rng = GameState.rng
+    expected = []
+    try:
+        for chat_key, u in zip(chat_keys, tie_break):
+            fixed = _FixedChoice(u)
+            GameState.rng = lambda self: fixed
+            expected.append(scalar.process_night_results(chat_key)[1])
+    finally:
+        GameState.rng = original_rng
+
+    batch, user_ids = pack_games([batched.active_games[k] for k in chat_keys], tie_break)
+    got = apply_outcome(batched, chat_keys, resolve_nights(batch), user_ids)
+
+    mismatches = 0
+    for chat_key, want, have in zip(chat_keys, expected, got):
+        if want != have or _state(scalar.active_games[chat_key]) != _state(batched.active_games[chat_key]):
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"расхождение {chat_key}: скалярно убит {want}, пакетно {have}")
+    if scalar.mafia_user_to_chat_key != batched.mafia_user_to_chat_key:
+        mismatches += 1
+        print("расхождение в маппинге мафии")
+    return mismatches
+
+
+def main(argv=None) -> int:
+    import logging
+    parser = argparse.ArgumentParser(description="Проверка и замер пакетного подведения итогов ночи")
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    logging.disable(logging.CRITICAL)
+
+    mismatches = differential_check(min(args.games, 50000), args.seed)
+    print(f"сверка со скалярным путём: расхождений {mismatches}")
+
+    rng = random.Random(args.seed)
+    nights = [random_night(rng, f"n_{i}") for i in range(args.games)]
+    tie_break = [rng.random() for _ in range(args.games)]
+    started = time.perf_counter()
+    batch, _ = pack_games(nights, tie_break)
+    packed = time.perf_counter()
+    resolve_nights(batch)
+    resolved = time.perf_counter()
+    print(f"упаковка: {args.games / (packed - started):.0f} ночей/с")
+    print(f"подведение итогов: {args.games / (resolved - packed):.0f} ночей/с ({args.games} ночей)")
+
+    manager = GameManager()
+    sample = nights[:min(args.games, 20000)]
+    for game in sample:
+        manager.active_games[game.chat_id] = game
+    started = time.perf_counter()
+    for game in sample:
+        manager.process_night_results(game.chat_id)
+    print(f"скалярный process_night_results: {len(sample) / (time.perf_counter() - started):.0f} ночей/с")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
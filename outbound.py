@@ -0,0 +1,409 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+from enum import IntEnum
+from typing import Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from metrics import outbound_queue_depth
+
+from config import (
+    OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_BURST,
+    OUTBOUND_PRIVATE_RATE, OUTBOUND_PRIVATE_BURST,
+    OUTBOUND_GROUP_RATE, OUTBOUND_GROUP_BURST,
+    OUTBOUND_MAX_RETRIES, DM_FANOUT_CONCURRENCY,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Классы приоритета исходящих запросов: меньше — раньше"""
+    HIGH = 0    # ночные клавиатуры, роли — без них игра стоит
+    NORMAL = 1  # объявления фаз, ответы на действия
+    LOW = 2     # напоминания, рассылки
+
+
+_current_priority: ContextVar[Priority] = ContextVar("outbound_priority", default=Priority.NORMAL)
+
+
+@contextmanager
+def send_priority(level: Priority):
+    """Задаёт приоритет всех запросов к Bot API внутри блока (и в созданных в нём задачах)"""
+    token = _current_priority.set(level)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def with_priority(level: Priority):
+    """Декоратор: все запросы корутины уходят с приоритетом level"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with send_priority(level):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+T = TypeVar("T")
+
+
+async def fan_out(
+    items: Iterable[T],
+    send: Callable[[T], Awaitable[None]],
+    limit: int = DM_FANOUT_CONCURRENCY,
+) -> List[Tuple[T, BaseException]]:
+    """Параллельная рассылка: send(item) для каждого item, не больше limit одновременно.
+
+    Ошибки не прерывают рассылку — возвращается список (item, исключение)
+    для тех получателей, кому отправить не удалось.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+    failures: List[Tuple[T, BaseException]] = []
+
+    async def run(item: T) -> None:
+        async with semaphore:
+            try:
+                await send(item)
+            except Exception as e:
+                failures.append((item, e))
+
+    await asyncio.gather(*(run(item) for item in items))
+    return failures
+
+
+# Недостача токена меньше этой считается ошибкой округления
+_TOKEN_EPSILON = 1e-9
+# Самое короткое ожидание токена, сек.: заметно больше шага loop.time()
+_MIN_DELAY = 1e-3
+
+
+class TokenBucket:
+    """Классическое ведро токенов: rate токенов в секунду, не больше burst в запасе"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Сколько секунд ждать до появления токена (0 — можно слать сейчас).
+
+        Пополнение копит ошибку округления: токенов может оказаться 0.9999999999999998,
+        и ждать осталось меньше шага времени цикла (now + delay == now) — очередь
+        крутилась бы на месте, не отправляя. Такой остаток считаем целым токеном,
+        а любое настоящее ожидание — не короче _MIN_DELAY.
+        """
+        self._refill(now)
+        if self.tokens >= 1 - _TOKEN_EPSILON:
+            return 0.0
+        return max(_MIN_DELAY, (1 - self.tokens) / self.rate)
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _Pending:
+    __slots__ = ("chat_id", "future", "enqueued", "seq")
+
+    def __init__(self, chat_id, future: asyncio.Future, enqueued: float, seq: int):
+        self.chat_id = chat_id
+        self.future = future
+        self.enqueued = enqueued
+        # Номер в общем порядке поступления: среди готовых чатов первым идёт более старый запрос
+        self.seq = seq
+
+
+class OutboundDispatcher(BaseRequestMiddleware):
+    """Единая очередь исходящих запросов к Bot API.
+
+    Подключается как middleware сессии бота, поэтому через неё проходят все
+    send_message/edit/delete из хендлеров без изменения мест вызова.
+    Запросы без chat_id (getUpdates, answerCallbackQuery) идут мимо очереди.
+    Отправка разрешается, когда есть токен в глобальном ведре и в ведре чата;
+    среди готовых первым уходит запрос с более высоким приоритетом.
+    На TelegramRetryAfter чат ставится на паузу и запрос повторяется.
+
+    У каждого приоритета своя очередь на чат и две кучи чатов: готовые
+    (по номеру первого запроса) и ждущие токен или конец паузы (по времени
+    готовности). Выбор следующего запроса смотрит только вершины куч, а не всю
+    очередь, поэтому большой хвост запросов к чатам на лимите не замедляет отправку.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = OUTBOUND_GLOBAL_RATE,
+        global_burst: float = OUTBOUND_GLOBAL_BURST,
+        private_rate: float = OUTBOUND_PRIVATE_RATE,
+        private_burst: float = OUTBOUND_PRIVATE_BURST,
+        group_rate: float = OUTBOUND_GROUP_RATE,
+        group_burst: float = OUTBOUND_GROUP_BURST,
+        max_retries: int = OUTBOUND_MAX_RETRIES,
+    ):
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+
+        # Приоритет -> chat_id -> запросы чата в порядке поступления
+        self._queues: Dict[Priority, Dict[object, Deque[_Pending]]] = {p: {} for p in Priority}
+        # Приоритет -> куча (номер первого запроса, chat_id) чатов, которые могут быть готовы
+        self._ready: Dict[Priority, List[Tuple[int, object]]] = {p: [] for p in Priority}
+        # Приоритет -> куча (не раньше какого loop.time() чат готов, номер, chat_id).
+        # У чата с очередью ровно одна запись в одной из куч. Готовность только
+        # отодвигается (токен потрачен, пауза 429), поэтому чат проверяется на вершине
+        self._waiting: Dict[Priority, List[Tuple[float, int, object]]] = {p: [] for p in Priority}
+        self._seq = itertools.count()
+        self._depth = 0
+        self._global_bucket: Optional[TokenBucket] = None
+        self._chat_buckets: Dict[object, TokenBucket] = {}
+        # chat_id -> момент loop.time(), до которого Telegram просил не писать
+        self._paused_until: Dict[object, float] = {}
+        self._wakeup = asyncio.Event()
+        self._pump_task: Optional[asyncio.Task] = None
+
+        self.metrics = {
+            "requests": 0,
+            "bypassed": 0,
+            "retry_after": 0,
+            "failed_after_retries": 0,
+            "queue_depth_peak": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "by_priority": {p.name.lower(): 0 for p in Priority},
+        }
+
+    # --- ведра ---
+
+    def _chat_bucket(self, chat_id, now: float) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательные id — группы и каналы, у них лимит заметно жёстче
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.private_rate, self.private_burst, now)
+            else:
+                bucket = TokenBucket(self.group_rate, self.group_burst, now)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _chat_delay(self, chat_id, now: float) -> float:
+        delay = self._chat_bucket(chat_id, now).delay(now)
+        paused = self._paused_until.get(chat_id)
+        if paused is not None:
+            if paused > now:
+                delay = max(delay, paused - now)
+            else:
+                del self._paused_until[chat_id]
+        return delay
+
+    def _forget_idle_buckets(self, now: float) -> None:
+        # Полные вёдра ничем не отличаются от новых — не держим их в памяти
+        idle = [cid for cid, b in self._chat_buckets.items() if b.delay(now) == 0 and b.tokens >= b.burst]
+        for cid in idle:
+            del self._chat_buckets[cid]
+
+    # --- очередь ---
+
+    def queue_depth(self) -> int:
+        return self._depth
+
+    async def _acquire(self, chat_id, priority: Priority) -> None:
+        loop = asyncio.get_running_loop()
+        if self._global_bucket is None:
+            self._global_bucket = TokenBucket(self.global_rate, self.global_burst, loop.time())
+        pending = _Pending(chat_id, loop.create_future(), loop.time(), next(self._seq))
+        chats = self._queues[priority]
+        queue = chats.get(chat_id)
+        if queue is None:
+            queue = chats[chat_id] = deque()
+            heapq.heappush(self._ready[priority], (pending.seq, chat_id))
+        queue.append(pending)
+        self._depth += 1
+        depth = self._depth
+        if depth > self.metrics["queue_depth_peak"]:
+            self.metrics["queue_depth_peak"] = depth
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        self._wakeup.set()
+        await pending.future
+
+        waited = loop.time() - pending.enqueued
+        self.metrics["wait_seconds_total"] += waited
+        if waited > self.metrics["wait_seconds_max"]:
+            self.metrics["wait_seconds_max"] = waited
+        self.metrics["by_priority"][priority.name.lower()] += 1
+
+    def _pick_ready(self, now: float):
+        """Снимает с очереди первый готовый к отправке запрос с учётом приоритета.
+
+        Возвращает (запрос, None) или (None, время до ближайшей готовности).
+        Запросы одного чата уходят по порядку: следующий не обгоняет ждущий.
+        """
+        next_in = None
+        for priority in Priority:
+            ready = self._ready[priority]
+            waiting = self._waiting[priority]
+            chats = self._queues[priority]
+            while waiting and waiting[0][0] <= now:
+                chat_id = heapq.heappop(waiting)[2]
+                heapq.heappush(ready, (chats[chat_id][0].seq, chat_id))
+            while ready:
+                seq, chat_id = ready[0]
+                queue = chats[chat_id]
+                # Отправитель отменён — запись просто выбросим
+                while queue and queue[0].future.done():
+                    queue.popleft()
+                    self._depth -= 1
+                if not queue:
+                    heapq.heappop(ready)
+                    del chats[chat_id]
+                    continue
+                if queue[0].seq != seq:
+                    heapq.heapreplace(ready, (queue[0].seq, chat_id))
+                    continue
+                delay = self._chat_delay(chat_id, now)
+                if delay > 0:
+                    heapq.heappop(ready)
+                    heapq.heappush(waiting, (now + delay, seq, chat_id))
+                    continue
+                pending = queue.popleft()
+                self._depth -= 1
+                if queue:
+                    heapq.heapreplace(ready, (queue[0].seq, chat_id))
+                else:
+                    heapq.heappop(ready)
+                    del chats[chat_id]
+                return pending, None
+            if waiting and (next_in is None or waiting[0][0] - now < next_in):
+                next_in = waiting[0][0] - now
+        return None, next_in
+
+    async def _pump(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._depth:
+            self._wakeup.clear()
+            now = loop.time()
+            global_delay = self._global_bucket.delay(now)
+            if global_delay > 0:
+                await asyncio.sleep(global_delay)
+                continue
+
+            pending, next_in = self._pick_ready(now)
+            if pending is not None:
+                if not pending.future.done():
+                    self._global_bucket.take(now)
+                    self._chat_bucket(pending.chat_id, now).take(now)
+                    pending.future.set_result(None)
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=next_in)
+            except asyncio.TimeoutError:
+                pass
+        self._forget_idle_buckets(loop.time())
+
+    # --- middleware ---
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            self.metrics["bypassed"] += 1
+            return await make_request(bot, method)
+
+        priority = _current_priority.get()
+        self.metrics["requests"] += 1
+        attempt = 0
+        while True:
+            await self._acquire(chat_id, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self.metrics["retry_after"] += 1
+                pause_until = asyncio.get_running_loop().time() + e.retry_after
+                if pause_until > self._paused_until.get(chat_id, 0):
+                    self._paused_until[chat_id] = pause_until
+                if attempt > self.max_retries:
+                    self.metrics["failed_after_retries"] += 1
+                    logger.warning("outbound: %s в чат %s не отправлен после %s попыток (RetryAfter %s сек.)", type(method).__name__, chat_id, attempt, e.retry_after)
+                    raise
+                logger.info("outbound: RetryAfter %s сек. для чата %s, попытка %s/%s", e.retry_after, chat_id, attempt, self.max_retries)
+
+    def snapshot_metrics(self) -> dict:
+        """Копия метрик с текущей глубиной очереди — для логов и админ-команд"""
+        data = dict(self.metrics)
+        data["by_priority"] = dict(self.metrics["by_priority"])
+        data["queue_depth"] = self.queue_depth()
+        data["tracked_chats"] = len(self._chat_buckets)
+        return data
+
+
+# Глобальный диспетчер исходящих запросов
+outbound = OutboundDispatcher()
+outbound_queue_depth.set_function(outbound.queue_depth)
+
+
+def _self_check() -> int:
+    """Регрессия: очередь не зависает на остатке токена от ошибки округления"""
+    import random
+
+    from clock import run_virtual
+
+    # Ведро с недостачей меньше шага времени: раньше delay() был ~1e-16 и now + delay == now
+    now = 1e6
+    bucket = TokenBucket(30, 30, now)
+    bucket.tokens = 1 - 2 ** -52
+    delay = bucket.delay(now)
+    stuck = 0 < delay and now + delay == now
+    print(f"ведро с остатком 1 - 2^-52: delay={delay!r}, " + ("ЗАВИСАНИЕ" if stuck else "ок"))
+
+    class _Method:
+        def __init__(self, chat_id):
+            self.chat_id = chat_id
+
+    async def make_request(bot, method):
+        return method.chat_id
+
+    async def drain(requests: int) -> int:
+        dispatcher = OutboundDispatcher(
+            global_rate=30, global_burst=30, group_rate=1, group_burst=3, private_rate=1, private_burst=1,
+        )
+        rng = random.Random(1)
+        sends = [dispatcher(make_request, None, _Method(-rng.randrange(1, 300))) for _ in range(requests)]
+        # Лимит 30 в секунду: 2000 запросов уходят за ~70 вирт. сек.; 600 — с запасом
+        done = await asyncio.wait_for(asyncio.gather(*sends), timeout=600)
+        return len(done)
+
+    requests = 2000
+    try:
+        sent = run_virtual(lambda: drain(requests))
+    except asyncio.TimeoutError:
+        sent = 0
+    print(f"очередь на виртуальных часах: отправлено {sent} из {requests}")
+    return 1 if stuck or sent != requests else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_self_check())
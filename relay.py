@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from aiogram.types import Message
+
+from config import MAFIA_RELAY_COALESCE_SECS
+from game_logic import game_manager
+from outbound import fan_out
+
+logger = logging.getLogger(__name__)
+
+# Типы сообщений, у которых есть подпись: в неё можно вписать имя отправителя
+_CAPTIONED = ("photo", "video", "audio", "document", "voice", "animation")
+
+# Лимиты Bot API на длину текста сообщения и подписи — в единицах UTF-16
+TEXT_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+
+def _cut(text: str, limit: int) -> int:
+    """Сколько символов text влезает в limit единиц UTF-16"""
+    units = 0
+    for index, char in enumerate(text):
+        units += 2 if ord(char) > 0xFFFF else 1
+        if units > limit:
+            return index
+    return len(text)
+
+
+def split_text(text: str, limit: int = TEXT_LIMIT) -> List[str]:
+    """Режет текст на сообщения не длиннее limit, по возможности по переводу строки"""
+    chunks = []
+    while text:
+        end = max(1, _cut(text, limit))
+        if end < len(text):
+            newline = text.rfind("\n", 0, end)
+            if newline > end // 2:
+                end = newline + 1
+        chunks.append(text[:end])
+        text = text[end:]
+    return chunks
+
+
+def fit_caption(caption: str, limit: int = CAPTION_LIMIT) -> str:
+    """Обрезает подпись до limit с многоточием в конце"""
+    end = _cut(caption, limit)
+    if end == len(caption):
+        return caption
+    return caption[:_cut(caption, limit - 1)] + "…"
+
+
+class _RelayBuffer:
+    __slots__ = ("bot", "chat_key", "sender_name", "messages", "task")
+
+    def __init__(self, bot, chat_key: str, sender_name: str):
+        self.bot = bot
+        self.chat_key = chat_key
+        self.sender_name = sender_name
+        self.messages: List[Message] = []
+        self.task: Optional[asyncio.Task] = None
+
+
+class MafiaRelay:
+    """Пересылка ЛС мафии сообщникам.
+
+    Сообщения одного мафиози, пришедшие в течение window секунд после
+    первого, уходят одной пачкой: текст — одним сообщением (длинный режется
+    на несколько по лимиту Bot API), остальное (голосовые, фото, стикеры) —
+    серверным copyMessage(s), без повторной загрузки файлов; подпись с именем
+    отправителя обрезается до лимита. Сообщники получают пачку параллельно.
+    """
+
+    def __init__(self, window: float = MAFIA_RELAY_COALESCE_SECS):
+        self.window = window
+        self._buffers: Dict[int, _RelayBuffer] = {}
+
+    def add(self, message: Message, chat_key: str) -> None:
+        """Ставит сообщение мафиози в пачку и планирует её отправку"""
+        sender_id = message.from_user.id
+        buffer = self._buffers.get(sender_id)
+        if buffer is None or buffer.chat_key != chat_key:
+            buffer = self._buffers[sender_id] = _RelayBuffer(
+                message.bot, chat_key, message.from_user.first_name or "Мафия"
+            )
+        buffer.messages.append(message)
+        if buffer.task is None:
+            buffer.task = asyncio.create_task(self._delayed_flush(sender_id, buffer))
+
+    async def _delayed_flush(self, sender_id: int, buffer: _RelayBuffer) -> None:
+        if self.window > 0:
+            await asyncio.sleep(self.window)
+        if self._buffers.get(sender_id) is buffer:
+            del self._buffers[sender_id]
+        await self._send(sender_id, buffer)
+
+    async def _send(self, sender_id: int, buffer: _RelayBuffer) -> None:
+        # Состав мафии берём на момент отправки: за окно кто-то мог погибнуть
+        peers = game_manager.get_mafia_peers(buffer.chat_key, exclude_user_id=sender_id)
+        if not peers:
+            return
+        messages = buffer.messages
+        header = f"😈 {buffer.sender_name}"
+
+        async def send(peer) -> None:
+            bot = buffer.bot
+            if all(m.text is not None for m in messages):
+                text = "\n".join(m.text for m in messages)
+                for chunk in split_text(f"{header}: {text}"):
+                    await bot.send_message(peer.user_id, chunk)
+            elif len(messages) == 1 and messages[0].content_type in _CAPTIONED:
+                m = messages[0]
+                caption = fit_caption(f"{header}: {m.caption}") if m.caption else header
+                await bot.copy_message(peer.user_id, sender_id, m.message_id, caption=caption)
+            else:
+                await bot.send_message(peer.user_id, f"{header}:")
+                await bot.copy_messages(peer.user_id, sender_id, sorted(m.message_id for m in messages))
+
+        try:
+            failures = await fan_out(peers, send)
+            for peer, e in failures:
+                logger.debug("relay: не удалось переслать мафии %s: %s", peer.user_id, e)
+            if len(failures) < len(peers):
+                await messages[-1].reply("📨 Сообщение отправлено сообщникам")
+        except Exception as e:
+            logger.exception("relay: ошибка пересылки от %s: %s", sender_id, e)
+
+    def pending(self) -> int:
+        return sum(len(b.messages) for b in self._buffers.values())
+
+
+# Глобальная пересылка сообщений мафии
+mafia_relay = MafiaRelay()
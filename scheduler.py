@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+from clock import clock
+from metrics import autopilot_lag
+
+logger = logging.getLogger(__name__)
+
+# Отметки напоминаний: за сколько секунд до конца фазы писать в чат
+REMINDER_MARKS = (30, 15, 5)
+
+# Результаты ожидания: сработал таймер или игру разбудили досрочно
+_TIMER_FIRED = True
+_WOKEN = False
+
+
+def _fire(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(_TIMER_FIRED)
+
+
+class PhaseScheduler:
+    """Планировщик фаз автопилота на дедлайнах.
+
+    Вместо опроса раз в секунду на каждую игру держится ровно один таймер
+    до ближайшего события (напоминание 30/15/5 сек. или конец фазы).
+    Игровая логика будит ожидание через wake(), когда фаза может закончиться
+    досрочно, поэтому нагрузка растёт с числом событий, а не с числом игр.
+    """
+
+    def __init__(self):
+        # chat_key -> future текущего ожидания автопилота
+        self._waiters: Dict[str, asyncio.Future] = {}
+
+    def wake(self, chat_key: str) -> None:
+        """Будит автопилот игры, чтобы он перепроверил условие досрочного завершения"""
+        waiter = self._waiters.get(chat_key)
+        if waiter is not None and not waiter.done():
+            logger.debug("scheduler: автопилот %s разбужен досрочно", chat_key)
+            waiter.set_result(_WOKEN)
+
+    def is_waiting(self, chat_key: str) -> bool:
+        return chat_key in self._waiters
+
+    async def run_phase(
+        self,
+        chat_key: str,
+        duration: float,
+        can_finish: Optional[Callable[[], bool]] = None,
+        on_reminder: Optional[Callable[[int], Awaitable[None]]] = None,
+        reminders: Iterable[int] = REMINDER_MARKS,
+    ) -> bool:
+        """Ждёт окончания фазы длительностью duration секунд.
+
+        can_finish проверяется только при старте, после напоминаний и после wake().
+        Возвращает True, если фаза завершилась досрочно, и False по дедлайну.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = clock.monotonic() + duration
+        marks = sorted((m for m in reminders if 0 < m < duration), reverse=True)
+        logger.debug("scheduler: фаза %s на %s сек., напоминания: %s", chat_key, duration, marks)
+
+        while True:
+            if can_finish is not None and can_finish():
+                return True
+
+            fire_at = deadline - marks[0] if marks else deadline
+            waiter = loop.create_future()
+            self._waiters[chat_key] = waiter
+            handle = loop.call_at(fire_at, _fire, waiter)
+            try:
+                fired = await waiter
+            finally:
+                handle.cancel()
+                if self._waiters.get(chat_key) is waiter:
+                    del self._waiters[chat_key]
+
+            if not fired:
+                # Разбудили — перепроверяем условие и ждём то же событие дальше
+                continue
+            # Насколько позже дедлайна цикл событий дошёл до автопилота
+            autopilot_lag.observe(max(0.0, clock.monotonic() - fire_at))
+            if not marks:
+                return False
+            remaining = marks.pop(0)
+            if on_reminder is not None:
+                await on_reminder(remaining)
+
+
+# Глобальный планировщик фаз
+phase_scheduler = PhaseScheduler()
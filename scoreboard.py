@@ -0,0 +1,178 @@
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from aiogram.exceptions import TelegramBadRequest
+
+from config import SCOREBOARD_EDIT_DEBOUNCE_SECS
+from actors import GameSnapshot, game_actors
+from game_logic import game_manager
+from keyboards import get_voting_keyboard
+
+logger = logging.getLogger(__name__)
+
+
+def build_scoreboard_text(game: GameSnapshot) -> str:
+    """Текущий счёт голосования и список пропустивших (по срезу игры)"""
+    vote_counts = {}
+    for tid in game.votes.values():
+        vote_counts[tid] = vote_counts.get(tid, 0) + 1
+    lines = ["🗳️ Текущие голоса:"]
+    for p in game.get_alive_players():
+        lines.append(f"- {p.label}: {vote_counts.get(p.user_id, 0)}")
+    # Отдельный блок — кто пропустил голос
+    if game.skipped_voters:
+        skipped = (game.get_player(uid) for uid in sorted(game.skipped_voters))
+        skipped_lines = [f"• {p.label}" for p in skipped if p is not None]
+        if skipped_lines:
+            lines.append("\n🚫 Пропустили голос:")
+            lines.extend(skipped_lines)
+    return "\n".join(lines)
+
+
+class _BoardState:
+    __slots__ = ("bot", "chat_id", "thread_id", "header", "dirty", "rendering", "last_edit", "task", "lock", "final", "drawn")
+
+    def __init__(self, bot, chat_id: int, thread_id: Optional[int]):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.thread_id = thread_id
+        self.header = ""
+        self.dirty = False
+        # Правка уже ушла в Bot API: отменять её нельзя, только дождаться
+        self.rendering = False
+        self.last_edit = float("-inf")
+        self.task: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+        # Срез с окончательными голосами, который рисует flush(), и (текст, roster_version)
+        # последнего отправленного табло
+        self.final: Optional[GameSnapshot] = None
+        self.drawn: Optional[tuple] = None
+
+
+class VotingScoreboard:
+    """Табло голосования, которое редактируется на месте.
+
+    Каждый голос лишь помечает табло устаревшим; правка сообщения уходит
+    не чаще раза в debounce секунд (первая — сразу), так что пачка голосов
+    превращается в одну editMessageText. Перед подсчётом итогов автопилот
+    вызывает flush(), чтобы в чате остался окончательный счёт: отложенная
+    правка отменяется, а уже идущая — дожидается, после чего flush рисует
+    голоса, пришедшие за это время.
+    """
+
+    def __init__(self, debounce: float = SCOREBOARD_EDIT_DEBOUNCE_SECS):
+        self.debounce = debounce
+        self._boards: Dict[str, _BoardState] = {}
+
+    def schedule(self, bot, chat_key: str, chat_id: int, thread_id: Optional[int], header: str) -> None:
+        """Помечает табло устаревшим и планирует отложенную правку"""
+        state = self._boards.get(chat_key)
+        if state is None:
+            state = self._boards[chat_key] = _BoardState(bot, chat_id, thread_id)
+        state.header = header
+        state.dirty = True
+        if state.task is None:
+            state.task = asyncio.create_task(self._delayed_render(chat_key, state))
+
+    async def flush(self, chat_key: str, final: Optional[GameSnapshot] = None) -> None:
+        """Немедленно применяет отложенную правку и забывает табло игры.
+
+        final — срез игры на момент закрытия голосования: табло рисуется по нему,
+        даже если к этому времени итоги уже подведены и голоса очищены.
+        """
+        state = self._boards.pop(chat_key, None)
+        if state is None:
+            return
+        task = state.task
+        if task is not None:
+            if not state.rendering:
+                task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if final is not None:
+            # Если этот счёт уже нарисован, _send не будет править сообщение
+            state.final = final
+            state.dirty = True
+        await self._render(chat_key, state)
+
+    def discard(self, chat_key: str) -> None:
+        state = self._boards.pop(chat_key, None)
+        if state is not None and state.task is not None:
+            state.task.cancel()
+
+    async def _delayed_render(self, chat_key: str, state: _BoardState) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                delay = state.last_edit + self.debounce - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await self._render(chat_key, state)
+                # Голоса, пришедшие во время правки, — следующей правкой через debounce;
+                # табло, которое забрал flush(), дорисует он сам
+                if not state.dirty or self._boards.get(chat_key) is not state:
+                    return
+        finally:
+            if state.task is asyncio.current_task():
+                state.task = None
+
+    async def _render(self, chat_key: str, state: _BoardState) -> None:
+        async with state.lock:
+            if not state.dirty:
+                return
+            state.dirty = False
+            state.rendering = True
+            try:
+                await self._send(chat_key, state)
+            except asyncio.CancelledError:
+                # Правку прервали — счёт в чате остался старым, его нужно дорисовать
+                state.dirty = True
+                raise
+            finally:
+                state.rendering = False
+
+    async def _send(self, chat_key: str, state: _BoardState) -> None:
+        state.last_edit = asyncio.get_running_loop().time()
+        snapshot = state.final or game_actors.snapshot(chat_key)
+        if snapshot is None:
+            # Игра закончилась, пока правка ждала своей очереди
+            if self._boards.get(chat_key) is state:
+                del self._boards[chat_key]
+            return
+        text = f"{state.header}\n\n{build_scoreboard_text(snapshot)}"
+        drawn = (text, snapshot.roster_version)
+        if drawn == state.drawn and snapshot.current_voting_message_id:
+            return
+        keyboard = get_voting_keyboard(snapshot.get_alive_players(), chat_key, snapshot.roster_version)
+        message_id = snapshot.current_voting_message_id
+        try:
+            if message_id:
+                await state.bot.edit_message_text(
+                    text, chat_id=state.chat_id, message_id=message_id, reply_markup=keyboard
+                )
+                state.drawn = drawn
+                return
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                state.drawn = drawn
+                return
+            logger.debug("scoreboard: не удалось отредактировать табло %s: %s", chat_key, e)
+        except Exception as e:
+            logger.warning("scoreboard: ошибка правки табло %s: %s", chat_key, e)
+            return
+        # Сообщения с голосованием нет (удалено или не отправлено) — публикуем заново
+        try:
+            sent = await state.bot.send_message(
+                state.chat_id, text, reply_markup=keyboard, message_thread_id=state.thread_id
+            )
+            state.drawn = drawn
+            game = game_manager.get_game(chat_key)
+            if game:
+                game.current_voting_message_id = sent.message_id
+                game_manager.touch(chat_key)
+        except Exception as e:
+            logger.warning("scoreboard: не удалось отправить табло %s: %s", chat_key, e)
+
+
+# Глобальное табло голосований
+voting_scoreboard = VotingScoreboard()
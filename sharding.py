@@ -0,0 +1,471 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+import threading
+import zlib
+from collections import OrderedDict, deque
+from contextlib import suppress
+from typing import Deque, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Update
+
+from config import (
+    BOT_TOKEN, TELEGRAM_API_BASE, STATE_DB_PATH, STATE_FLUSH_INTERVAL_SECS, STATE_SNAPSHOT_INTERVAL_SECS,
+    OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_BURST, SHARD_METRICS_INTERVAL_SECS, SHARD_RESTART_DELAY_SECS,
+    METRICS_PORT, DRAIN_TIMEOUT_SECS, GAME_LOG_ENABLED, STATS_ENABLED,
+)
+from actors import game_actors
+from callbacks import token_of
+from game_logic import game_manager
+from handlers import router, drain_autopilots, resume_autopilots
+from logsetup import setup_logging
+from outbound import outbound
+from metrics import MetricsServer, api_metrics
+from loopwatch import loop_watchdog
+from gamelog import GameLog
+from stats import player_stats
+from storage import GameStore, StatePersister
+
+logger = logging.getLogger(__name__)
+
+# Долгий опрос getUpdates во фронте, сек.
+POLL_TIMEOUT_SECS = 30
+# Сколько последних update_id воркер помнит, чтобы отбросить повторную доставку
+SEEN_UPDATES_LIMIT = 10000
+
+
+def shard_for(key: str, count: int) -> int:
+    """Номер шарда для ключа; crc32 стабилен между процессами и перезапусками"""
+    return zlib.crc32(key.encode()) % count
+
+
+def _is_chat_key(value: str) -> bool:
+    chat_id, sep, thread_id = value.partition("_")
+    return bool(sep) and chat_id.lstrip("-").isdigit() and thread_id.isdigit()
+
+
+def route_key(data: dict, user_routes: Dict[int, str]) -> str:
+    """Ключ маршрутизации сырого обновления: chat_key игры или user:<id> для ЛС.
+
+    Групповые сообщения и нажатия идут по chat_key темы. Нажатия ночных
+    клавиатур старого формата несут chat_key игры в callback_data (компактные
+    кнопки фронт маршрутизирует по токену раньше). Остальные личные
+    сообщения мафии идут в шард её игры (user_routes), прочие — в «домашний»
+    шард пользователя.
+    """
+    message = data.get("message")
+    if message is None and "callback_query" in data:
+        callback = data["callback_query"]
+        parts = (callback.get("data") or "").split(":")
+        if len(parts) > 1 and _is_chat_key(parts[1]):
+            return parts[1]
+        message = callback.get("message")
+        user_id = callback["from"]["id"]
+    else:
+        user_id = (message or {}).get("from", {}).get("id", 0)
+    if message is not None and message.get("chat", {}).get("type") != "private":
+        return f"{message['chat']['id']}_{message.get('message_thread_id') or 0}"
+    return user_routes.get(user_id) or f"user:{user_id}"
+
+
+class _ShardLink:
+    """Связь фронта с одним шардом: текущий процесс, его каналы и неподтверждённые обновления"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[multiprocessing.process.BaseProcess] = None
+        # Фронтовые концы каналов текущего воплощения воркера
+        self.inbox = None
+        self.events = None
+        # Очередь отправки (поток-отправитель пишет в канал, не блокируя цикл событий)
+        self.outbox: "queue.Queue" = queue.Queue()
+        # update_id -> обновление: отправлено, но воркер ещё не подтвердил обработку
+        self.unacked: "OrderedDict[int, dict]" = OrderedDict()
+        self.sender: Optional[threading.Thread] = None
+
+    def send_loop(self) -> None:
+        while True:
+            data = self.outbox.get()
+            try:
+                self.inbox.send(data)
+            except (OSError, ValueError):
+                # Воркер умер: обновление осталось в unacked и уйдёт новому воркеру
+                pass
+            if data is None:
+                return
+
+
+class ShardFront:
+    """Фронт шардированного режима: принимает обновления и раздаёт их воркерам.
+
+    Для run_polling/run_webhook выглядит как Dispatcher (feed_update,
+    start_polling, resolve_used_update_types). У каждого воплощения воркера
+    свои каналы (Pipe) — общих с упавшим процессом блокировок нет. Фронт
+    помнит обновления, которые воркер ещё не подтвердил (воркер подтверждает
+    обновление, когда его изменения записаны в хранилище); если воркер упал,
+    фронт поднимает новый, тот восстанавливает игры шарда из общего хранилища,
+    а фронт досылает ему неподтверждённые обновления (дубли воркер отбрасывает
+    по update_id). Воркеры сообщают изменения ЛС-маппинга мафии и метрики;
+    snapshot_metrics() отдаёт их сумму по шардам.
+    """
+
+    def __init__(self, count: int, update_types: List[str]):
+        self.count = count
+        # Типы обновлений, на которые подписан роутер (считает Dispatcher фронта)
+        self.update_types = update_types
+        self._ctx = multiprocessing.get_context("spawn")
+        self._links = [_ShardLink(index) for index in range(count)]
+        self._user_routes: Dict[int, str] = {}
+        self._shard_metrics: Dict[int, dict] = {}
+        self._watcher: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.metrics = {"routed": 0, "restarts": 0, "redelivered": 0}
+
+    # --- интерфейс Dispatcher для run_polling/run_webhook ---
+
+    def resolve_used_update_types(self) -> List[str]:
+        return self.update_types
+
+    async def feed_update(self, bot: Bot, update: Update) -> None:
+        self.route(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+
+    async def start_polling(self, bot: Bot, **kwargs) -> None:
+        allowed = self.resolve_used_update_types()
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset, timeout=POLL_TIMEOUT_SECS, allowed_updates=allowed,
+                    request_timeout=POLL_TIMEOUT_SECS + 30,
+                )
+            except Exception as e:
+                logger.error("shards: не удалось получить обновления: %s", e)
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                await self.feed_update(bot, update)
+
+    # --- маршрутизация и воркеры ---
+
+    def route(self, data: dict) -> int:
+        # Компактная кнопка игры несёт токен, а токен — номер шарда, который его выдал
+        token = token_of(data["callback_query"].get("data")) if "callback_query" in data else 0
+        index = token % self.count if token else shard_for(route_key(data, self._user_routes), self.count)
+        link = self._links[index]
+        link.unacked[data["update_id"]] = data
+        link.outbox.put(data)
+        self.metrics["routed"] += 1
+        return link.index
+
+    async def start(self) -> None:
+        for link in self._links:
+            self._spawn(link)
+        self._watcher = asyncio.create_task(self._watch_workers())
+        logger.info("shards: запущено воркеров: %s", self.count)
+
+    def _spawn(self, link: _ShardLink) -> None:
+        inbox_reader, link.inbox = self._ctx.Pipe(duplex=False)
+        link.events, events_writer = self._ctx.Pipe(duplex=False)
+        link.process = self._ctx.Process(
+            target=worker_main,
+            args=(link.index, self.count, inbox_reader, events_writer),
+            name=f"mafia-shard-{link.index}",
+            daemon=True,
+        )
+        link.process.start()
+        # Концы воркера в процессе фронта не нужны: иначе не увидим EOF при его смерти
+        inbox_reader.close()
+        events_writer.close()
+        asyncio.get_running_loop().add_reader(link.events.fileno(), self._read_events, link, link.events)
+        if link.sender is None or not link.sender.is_alive():
+            link.sender = threading.Thread(target=link.send_loop, name=f"shard-sender-{link.index}", daemon=True)
+            link.sender.start()
+
+    def _restart(self, link: _ShardLink) -> None:
+        # Сначала убираем из очереди отправки всё, что ещё не ушло, — оно есть в unacked
+        with suppress(queue.Empty):
+            while True:
+                link.outbox.get_nowait()
+        link.inbox.close()
+        self._spawn(link)
+        for data in link.unacked.values():
+            link.outbox.put(data)
+        self.metrics["restarts"] += 1
+        self.metrics["redelivered"] += len(link.unacked)
+
+    async def _watch_workers(self) -> None:
+        while True:
+            await asyncio.sleep(SHARD_RESTART_DELAY_SECS)
+            for link in self._links:
+                if self._stopping or link.process is None or link.process.is_alive():
+                    continue
+                logger.warning(
+                    "shards: воркер %s завершился с кодом %s, перезапускаем (неподтверждённых обновлений: %s)",
+                    link.index, link.process.exitcode, len(link.unacked),
+                )
+                self._restart(link)
+
+    def _read_events(self, link: _ShardLink, conn) -> None:
+        try:
+            event = conn.recv()
+        except (EOFError, OSError):
+            # Воркер завершился — дальше его поднимет _watch_workers
+            asyncio.get_running_loop().remove_reader(conn.fileno())
+            conn.close()
+            return
+        kind = event[0]
+        if kind == "ack":
+            for update_id in event[1]:
+                link.unacked.pop(update_id, None)
+        elif kind == "route":
+            _, user_id, chat_key, active = event
+            if active:
+                self._user_routes[user_id] = chat_key
+            elif self._user_routes.get(user_id) == chat_key:
+                del self._user_routes[user_id]
+        elif kind == "metrics":
+            self._shard_metrics[link.index] = event[1]
+
+    def snapshot_metrics(self) -> dict:
+        """Метрики фронта и сумма числовых метрик воркеров"""
+        total: Dict[str, float] = {}
+        for data in self._shard_metrics.values():
+            for name, value in data.items():
+                if isinstance(value, (int, float)):
+                    total[name] = total.get(name, 0) + value
+        return {
+            **self.metrics,
+            "workers_alive": sum(1 for link in self._links if link.process is not None and link.process.is_alive()),
+            "unacked": sum(len(link.unacked) for link in self._links),
+            "mafia_routes": len(self._user_routes),
+            "total": total,
+            "shards": dict(self._shard_metrics),
+        }
+
+    async def stop(self, timeout: float = DRAIN_TIMEOUT_SECS + 30) -> None:
+        """Останавливает воркеры: они дообрабатывают очередь и сохраняют игры"""
+        self._stopping = True
+        if self._watcher is not None:
+            self._watcher.cancel()
+        for link in self._links:
+            link.outbox.put(None)
+        loop = asyncio.get_running_loop()
+        for link in self._links:
+            if link.process is None:
+                continue
+            await loop.run_in_executor(None, link.process.join, timeout)
+            if link.process.is_alive():
+                logger.warning("shards: воркер %s не остановился за %s сек., завершаем принудительно", link.index, timeout)
+                link.process.terminate()
+        # Дочитываем последние события (подтверждения, финальные метрики) до EOF
+        for link in self._links:
+            while not link.events.closed and link.events.poll():
+                self._read_events(link, link.events)
+            if not link.events.closed:
+                loop.remove_reader(link.events.fileno())
+                link.events.close()
+        logger.info("shards: воркеры остановлены, метрики: %s", self.snapshot_metrics())
+
+
+def worker_main(index: int, count: int, inbox, events) -> None:
+    """Точка входа процесса-воркера"""
+    setup_logging()
+    with suppress(KeyboardInterrupt):
+        asyncio.run(_run_worker(index, count, inbox, events))
+
+
+async def _run_worker(index: int, count: int, inbox, events) -> None:
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_BASE)) if TELEGRAM_API_BASE else None
+    bot = Bot(token=BOT_TOKEN, session=session)
+    # Глобальный лимит Telegram общий для бота — делим его между воркерами
+    outbound.global_rate = OUTBOUND_GLOBAL_RATE / count
+    outbound.global_burst = max(1.0, OUTBOUND_GLOBAL_BURST / count)
+    bot.session.middleware(outbound)
+    bot.session.middleware(api_metrics)
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.include_router(router)
+
+    # Токены кнопок этого шарда: по остатку от деления фронт вернёт нажатие сюда
+    game_manager.set_token_shard(index, count)
+    # Фронт должен знать, в какой шард слать ЛС мафии
+    game_manager.on_mafia_route = lambda user_id, chat_key, active: events.send(("route", user_id, chat_key, active))
+
+    persister = None
+    persister_task = None
+    if STATE_DB_PATH:
+        store = GameStore(STATE_DB_PATH)
+        owns = lambda chat_key: shard_for(chat_key, count) == index
+        game_manager.restore_games(store.load(owns=owns))
+        game_manager.resume_phase_timers(store.take_handoff(owns=owns))
+        if GAME_LOG_ENABLED:
+            # Журнал событий пишет тот же persister, что и состояние игр
+            game_manager.log = GameLog()
+        if STATS_ENABLED:
+            # Итоги игр пишет тот же persister, /stats читает их из того же хранилища
+            player_stats.store = store
+            game_manager.stats = player_stats
+        persister = StatePersister(store, game_manager, STATE_FLUSH_INTERVAL_SECS, STATE_SNAPSHOT_INTERVAL_SECS)
+        # Фронт забывает подтверждённое обновление, поэтому подтверждаем только записанные:
+        # если воркер упадёт до сброса, фронт дошлёт обновление новому воркеру
+        persister.on_flushed = lambda update_ids: events.send(("ack", update_ids))
+        persister_task = asyncio.create_task(persister.run())
+        resume_autopilots(bot)
+    logger.info("shard %s: воркер запущен, игр: %s", index, len(game_manager.active_games))
+
+    processed = 0
+    pending = set()
+    # Недавние update_id: после перезапуска фронт может прислать обновление повторно
+    seen_ids: Deque[int] = deque(maxlen=SEEN_UPDATES_LIMIT)
+    seen_set = set()
+
+    def report() -> None:
+        events.send(("metrics", {
+            "updates": processed,
+            "games": len(game_manager.active_games),
+            "actor_queue": game_actors.queue_depth(),
+            "handlers_running": len(pending),
+            **{k: v for k, v in outbound.snapshot_metrics().items() if isinstance(v, (int, float))},
+        }))
+
+    async def report_loop() -> None:
+        while True:
+            await asyncio.sleep(SHARD_METRICS_INTERVAL_SECS)
+            report()
+
+    async def handle(data: dict) -> None:
+        nonlocal processed
+        try:
+            await dp.feed_update(bot, Update.model_validate(data, context={"bot": bot}))
+        except Exception as e:
+            logger.exception("shard %s: ошибка обработки обновления: %s", index, e)
+        processed += 1
+        if persister is not None:
+            persister.ack_after_flush(data["update_id"])
+        else:
+            events.send(("ack", [data["update_id"]]))
+
+    # У каждого воркера свой реестр метрик — и свой порт рядом с портом фронта
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = MetricsServer(port=METRICS_PORT + 1 + index)
+        await metrics_server.start()
+    loop_watchdog.start()
+
+    reporter = asyncio.create_task(report_loop())
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                data = await loop.run_in_executor(None, inbox.recv)
+            except EOFError:
+                break
+            if data is None:
+                break
+            update_id = data["update_id"]
+            if update_id in seen_set:
+                continue
+            if len(seen_ids) == seen_ids.maxlen:
+                seen_set.discard(seen_ids[0])
+            seen_ids.append(update_id)
+            seen_set.add(update_id)
+            task = asyncio.create_task(handle(data))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    finally:
+        if pending:
+            await asyncio.wait(pending, timeout=10)
+        reporter.cancel()
+        if persister is not None:
+            # Фронт уже не шлёт обновления: доводим игры до ожидания таймера фазы
+            # и передаём остатки таймеров следующему запуску
+            game_manager.draining = True
+            handoff = await drain_autopilots()
+            persister_task.cancel()
+            await persister.close(handoff)
+        report()
+        if metrics_server is not None:
+            await metrics_server.stop()
+        await loop_watchdog.stop()
+        await bot.session.close()
+        logger.info("shard %s: воркер остановлен, обработано обновлений: %s", index, processed)
+
+
+def _self_check() -> int:
+    """Воркер падает после обработки обновления, но до сброса состояния: игра не теряется.
+
+    Один шард, сброс раз в час — изменения лежат только в памяти воркера.
+    Обновление /mafia обработано, воркер убит; фронт должен дослать его новому
+    воркеру, а тот при остановке — записать игру в хранилище.
+    """
+    import os
+    import tempfile
+    import time
+
+    path = os.path.join(tempfile.mkdtemp(), "shard_check.db")
+    # Воркеры (spawn) читают настройки из окружения при импорте config
+    os.environ.update({
+        "STATE_DB_PATH": path,
+        "STATE_FLUSH_INTERVAL_SECS": "3600",
+        "SHARD_METRICS_INTERVAL_SECS": "0.2",
+        "SHARD_RESTART_DELAY_SECS": "0.2",
+        # Bot API недоступен: ответы бота падают, но состояние игры меняется до них
+        "TELEGRAM_API_BASE": "http://127.0.0.1:9",
+        "LOG_LEVEL": "CRITICAL",
+    })
+    chat_id, thread_id = -1001234567890, 39431
+    update = {"update_id": 1, "message": {
+        "message_id": 1, "date": 1, "text": "/mafia",
+        "chat": {"id": chat_id, "type": "supergroup", "title": "check", "is_forum": True},
+        "from": {"id": 1, "is_bot": False, "first_name": "P1"},
+        "message_thread_id": thread_id, "is_topic_message": True,
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    }}
+
+    async def wait_until(condition, timeout: float = 60) -> bool:
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                return False
+            await asyncio.sleep(0.1)
+        return True
+
+    async def run() -> List[str]:
+        front = ShardFront(1, ["message", "callback_query"])
+        await front.start()
+        link = front._links[0]
+        front.route(update)
+        handled = await wait_until(lambda: front._shard_metrics.get(0, {}).get("updates", 0) >= 1)
+        acked_before_flush = update["update_id"] not in link.unacked
+        link.process.kill()
+        front._shard_metrics.pop(0, None)
+        await wait_until(lambda: front.metrics["restarts"] >= 1)
+        # Новый воркер поднялся и обработал досланное (если было что досылать)
+        await wait_until(lambda: front._shard_metrics.get(0, {}).get("updates", 0) >= front.metrics["redelivered"], timeout=30)
+        await front.stop()
+        problems = []
+        if not handled:
+            problems.append("воркер не обработал обновление")
+        if acked_before_flush:
+            problems.append("обновление подтверждено до записи состояния")
+        if front.metrics["redelivered"] != 1:
+            problems.append(f"дослано обновлений: {front.metrics['redelivered']}, ожидалось 1")
+        return problems
+
+    problems = asyncio.run(run())
+    store = GameStore(path)
+    saved = f"{chat_id}_{thread_id}" in store.load()
+    store.close()
+    if not saved:
+        problems.append("игра не попала в хранилище")
+    print("падение воркера между обработкой и сбросом: " + ("; ".join(problems) if problems else "игра сохранена"))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_self_check())
@@ -0,0 +1,359 @@
+"""Монте-Карло симулятор баланса ROLE_DISTRIBUTION.
+
+Игры идут через настоящие правила GameManager (ночные действия, лечение,
+отвлечение бабочкой, голосование с жребием при ничьей), но без Telegram и
+таймеров: за игроков ходят стратегии-боты. Партии раскладываются по ядрам
+через пул процессов, итог — таблица побед по числу игроков.
+
+Примеры:
+    BOT_TOKEN=1:x python simulate.py --games 100000
+    BOT_TOKEN=1:x python simulate.py --players 8-12 --strategy smart --games 50000
+    BOT_TOKEN=1:x python simulate.py --distribution my_roles.json --json
+
+Файл --distribution — JSON вида {"10": {"мафия": 3, "мирный": 4, ...}}:
+указанные размеры стола заменяют строки config.ROLE_DISTRIBUTION.
+Своя стратегия подключается как --strategy module:Class (наследник Strategy).
+"""
+import argparse
+import importlib
+import json
+import logging
+import math
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+import game_logic
+from game_logic import GameManager
+from models import GamePhase, GameState, Player, PlayerRole
+
+# Ключ единственной игры внутри процесса-воркера
+SIM_CHAT_KEY = "sim_0"
+# Предохранитель от зацикленных партий (в раундах)
+MAX_ROUNDS = 200
+
+
+class Strategy:
+    """Поведение ботов в одной партии; экземпляр создаётся на каждую игру.
+
+    Варианты целей уже отфильтрованы так же, как их фильтруют клавиатуры
+    бота, поэтому стратегии остаётся только выбрать. None — пропуск хода.
+    """
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+
+    def night_target(self, game: GameState, player: Player, action: str, options: List[int]) -> Optional[int]:
+        return self.rng.choice(options) if options else None
+
+    def vote(self, game: GameState, player: Player, options: List[int]) -> Optional[int]:
+        return self.rng.choice(options) if options else None
+
+
+class RandomStrategy(Strategy):
+    """Все выбирают равновероятно из того, что предлагает клавиатура"""
+
+
+class SmartStrategy(Strategy):
+    """Осмысленная игра: мафия знает своих, комиссар делится найденной мафией.
+
+    Мафия бьёт и голосует только по мирным и голосует дружно; комиссар не
+    проверяет одного игрока дважды; бабочка не отвлекает повторно; доктор
+    бережёт самолечение на случай, когда в игре остаётся мало живых. Город
+    голосует за мафию, найденную живым комиссаром, иначе — наугад.
+    """
+
+    def __init__(self, rng: random.Random):
+        super().__init__(rng)
+        self.checked: Set[int] = set()
+        self.exposed: Set[int] = set()
+        self.mafia_day_target: Optional[Tuple[int, int]] = None
+
+    def night_target(self, game, player, action, options):
+        if not options:
+            return None
+        if action == "mafia_kill":
+            town = [uid for uid in options if game.players[uid].role != PlayerRole.MAFIA]
+            # Ночная цель мафии одна на всех — иначе жребий между голосами
+            return min(town, key=lambda uid: (uid * 7919 + game.current_round) % 101) if town else None
+        if action == "commissioner_check":
+            fresh = [uid for uid in options if uid not in self.checked]
+            return self.rng.choice(fresh or options)
+        if action == "butterfly_distract":
+            fresh = [uid for uid in options if uid not in game.butterfly_distracted_players]
+            return self.rng.choice(fresh) if fresh else None
+        if action == "doctor_save":
+            others = [uid for uid in options if uid != player.user_id]
+            if player.user_id in options and (not others or game.players.alive_count() <= 4):
+                return player.user_id
+            return self.rng.choice(others) if others else None
+        return self.rng.choice(options)
+
+    def _learn(self, game: GameState) -> None:
+        for commissioner_id, target_id, is_mafia in game.last_commissioner_checks:
+            self.checked.add(target_id)
+            if is_mafia:
+                self.exposed.add(target_id)
+
+    def vote(self, game, player, options):
+        self._learn(game)
+        if not options:
+            return None
+        if player.role == PlayerRole.MAFIA:
+            if self.mafia_day_target is None or self.mafia_day_target[0] != game.current_round \
+                    or self.mafia_day_target[1] not in options:
+                town = [uid for uid in options if game.players[uid].role != PlayerRole.MAFIA]
+                if not town:
+                    return self.rng.choice(options)
+                self.mafia_day_target = (game.current_round, self.rng.choice(town))
+            return self.mafia_day_target[1]
+        commissioner_alive = game.count_alive_by_role(PlayerRole.COMMISSIONER) > 0
+        exposed = [uid for uid in options if uid in self.exposed]
+        if exposed and (commissioner_alive or player.role == PlayerRole.COMMISSIONER):
+            return exposed[0]
+        return self.rng.choice(options)
+
+
+STRATEGIES = {
+    "random": RandomStrategy,
+    "smart": SmartStrategy,
+}
+
+
+def load_strategy(name: str) -> type:
+    """Стратегия по имени из STRATEGIES или по пути module:Class"""
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    module_name, _, class_name = name.partition(":")
+    if not class_name:
+        raise ValueError(f"неизвестная стратегия {name!r}: {', '.join(STRATEGIES)} или module:Class")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def _night_options(game: GameState, player: Player, action: str, alive_ids: List[int], checked_tonight) -> List[int]:
+    # Те же исключения, что в handlers._send_night_action_keyboards
+    last_distracted = game.last_butterfly_distract_target
+    if action == "doctor_save":
+        options = [uid for uid in alive_ids if uid != last_distracted]
+        last_saved = game.doctor_last_save_target.get(player.user_id)
+        if player.doctor_self_save_used:
+            options = [uid for uid in options if uid != player.user_id]
+        return [uid for uid in options if uid != last_saved or uid == player.user_id]
+    options = [uid for uid in alive_ids if uid != player.user_id]
+    if action in ("mafia_kill", "commissioner_check"):
+        options = [uid for uid in options if uid != last_distracted]
+    if action == "commissioner_check":
+        options = [uid for uid in options if uid not in checked_tonight]
+    return options
+
+
+_ACTION_BY_ROLE = {
+    PlayerRole.MAFIA: "mafia_kill",
+    PlayerRole.DOCTOR: "doctor_save",
+    PlayerRole.COMMISSIONER: "commissioner_check",
+    PlayerRole.BUTTERFLY: "butterfly_distract",
+}
+
+
+def play_game(manager: GameManager, player_count: int, strategy: Strategy, rng: random.Random) -> Counter:
+    """Одна партия от раздачи ролей до победы; возвращает счётчики исходов"""
+    stats = Counter()
+    chat_key = SIM_CHAT_KEY
+    game = manager.create_game(chat_key)
+    for uid in range(1, player_count + 1):
+        manager.add_player(chat_key, uid, f"u{uid}", f"U{uid}")
+    manager.start_game(chat_key)
+
+    winner = None
+    while winner is None:
+        if game.current_round > MAX_ROUNDS:
+            winner = "stalled"
+            break
+
+        # Ночь: роли ходят в случайном порядке, как живые игроки в ЛС
+        actors = [p for p in game.get_alive_players() if p.role in _ACTION_BY_ROLE]
+        rng.shuffle(actors)
+        alive_ids = [p.user_id for p in game.get_alive_players()]
+        for player in actors:
+            if game.butterfly_distract_target == player.user_id:
+                stats["blocked_by_butterfly"] += 1
+                continue
+            action = _ACTION_BY_ROLE[player.role]
+            options = _night_options(game, player, action, alive_ids, game.commissioner_checks.values())
+            target = strategy.night_target(game, player, action, options)
+            if target is None and action in ("mafia_kill", "commissioner_check"):
+                continue
+            if action == "doctor_save" and target == player.user_id:
+                stats["doctor_self_saves"] += 1
+            manager.process_night_action(chat_key, player.user_id, action, target)
+
+        _, killed_id = manager.process_night_results(chat_key)
+        # Живая мафия убивает каждую ночь, так что ночь без трупа — это спасение доктором
+        if killed_id is None and game.count_alive_by_role(PlayerRole.MAFIA):
+            stats["doctor_saves"] += 1
+        over, _ = manager.check_game_over(chat_key)
+        if over:
+            winner = _winner(game)
+            break
+
+        # День: первое голосование после самой первой ночи пропускается
+        if not game.first_voting_skipped and game.current_round <= 1:
+            game.phase = GamePhase.NIGHT
+            game.current_round += 1
+            game.first_voting_skipped = True
+            continue
+
+        manager.start_voting(chat_key)
+        alive = game.get_alive_players()
+        voters = [p for p in alive if not p.has_voted]
+        rng.shuffle(voters)
+        for voter in voters:
+            options = [p.user_id for p in alive if p.user_id != voter.user_id]
+            target = strategy.vote(game, voter, options)
+            if target is not None:
+                manager.process_vote(chat_key, voter.user_id, target)
+        tally = Counter(game.votes.values())
+        if tally:
+            top = tally.most_common()
+            if len(top) > 1 and top[0][1] == top[1][1]:
+                stats["vote_ties"] += 1
+        manager.get_voting_results(chat_key)
+        over, _ = manager.check_game_over(chat_key)
+        if over:
+            winner = _winner(game)
+
+    stats[winner] += 1
+    stats["rounds"] += game.current_round
+    manager.end_game(chat_key)
+    manager.dirty_games.clear()
+    return stats
+
+
+def _winner(game: GameState) -> str:
+    return "mafia" if game.is_game_over()[1] == "mafia" else "civilians"
+
+
+_worker_manager: Optional[GameManager] = None
+
+
+def _init_worker(distribution: Dict[int, Dict[str, int]]) -> None:
+    global _worker_manager
+    # Логи правил на миллионах партий — основной расход CPU, выключаем их целиком
+    logging.disable(logging.CRITICAL)
+    game_logic.ROLE_DISTRIBUTION.update(distribution)
+    _worker_manager = GameManager()
+
+
+def run_batch(player_count: int, games: int, strategy_name: str, seed: str) -> Tuple[int, Counter]:
+    """Пачка партий одного размера стола в процессе-воркере"""
+    rng = random.Random(seed)
+    # Жребий игр (раздача ролей, ничьи) идёт от зерна, которое выдаёт GameManager
+    _worker_manager.set_rng_seed(rng.getrandbits(63))
+    strategy_cls = load_strategy(strategy_name)
+    total = Counter()
+    for _ in range(games):
+        total.update(play_game(_worker_manager, player_count, strategy_cls(rng), rng))
+    return player_count, total
+
+
+def simulate(player_counts: List[int], games: int, strategy: str, seed: int, workers: Optional[int],
+             batch: int, distribution: Dict[int, Dict[str, int]]) -> Dict[int, Counter]:
+    load_strategy(strategy)  # ошибку в имени показываем до запуска пула
+    results: Dict[int, Counter] = {n: Counter() for n in player_counts}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(distribution,)) as pool:
+        futures = []
+        for n in player_counts:
+            for index, start in enumerate(range(0, games, batch)):
+                size = min(batch, games - start)
+                futures.append(pool.submit(run_batch, n, size, strategy, f"{seed}:{n}:{index}"))
+        for future in futures:
+            n, counts = future.result()
+            results[n].update(counts)
+    return results
+
+
+def _parse_players(spec: str) -> List[int]:
+    counts = []
+    for part in spec.split(","):
+        low, _, high = part.partition("-")
+        counts.extend(range(int(low), int(high or low) + 1))
+    return counts
+
+
+def _load_distribution(path: Optional[str]) -> Dict[int, Dict[str, int]]:
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return {int(n): roles for n, roles in json.load(f).items()}
+
+
+def build_report(results: Dict[int, Counter]) -> Dict[int, dict]:
+    report = {}
+    for n, c in sorted(results.items()):
+        games = c["mafia"] + c["civilians"] + c["stalled"]
+        if not games:
+            continue
+        share = c["mafia"] / games
+        report[n] = {
+            "games": games,
+            "mafia_win": round(share, 4),
+            # 95% доверительный интервал (нормальное приближение)
+            "mafia_win_ci95": round(1.96 * math.sqrt(share * (1 - share) / games), 4),
+            "civilians_win": round(c["civilians"] / games, 4),
+            "stalled": c["stalled"],
+            "avg_rounds": round(c["rounds"] / games, 2),
+            "vote_ties_per_game": round(c["vote_ties"] / games, 3),
+            "doctor_saves_per_game": round(c["doctor_saves"] / games, 3),
+            "doctor_self_saves_per_game": round(c["doctor_self_saves"] / games, 3),
+            "butterfly_blocks_per_game": round(c["blocked_by_butterfly"] / games, 3),
+        }
+    return report
+
+
+def print_table(report: Dict[int, dict]) -> None:
+    print(f"{'игроков':>7} {'партий':>9} {'мафия':>14} {'мирные':>7} {'раундов':>8} "
+          f"{'ничьи':>6} {'спас.':>6} {'самолеч.':>8} {'бабочка':>8}")
+    for n, r in report.items():
+        mafia = f"{r['mafia_win'] * 100:5.1f}% ±{r['mafia_win_ci95'] * 100:.1f}"
+        print(f"{n:>7} {r['games']:>9} {mafia:>14} {r['civilians_win'] * 100:6.1f}% {r['avg_rounds']:>8} "
+              f"{r['vote_ties_per_game']:>6} {r['doctor_saves_per_game']:>6} "
+              f"{r['doctor_self_saves_per_game']:>8} {r['butterfly_blocks_per_game']:>8}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Монте-Карло симулятор баланса ролей «Мафии»")
+    parser.add_argument("--players", default="4-20", help="размеры стола: 4-20, 8,10,12")
+    parser.add_argument("--games", type=int, default=10000, help="партий на каждый размер стола")
+    parser.add_argument("--strategy", default="random", help=f"{', '.join(STRATEGIES)} или module:Class")
+    parser.add_argument("--distribution", help="JSON с заменой строк ROLE_DISTRIBUTION")
+    parser.add_argument("--workers", type=int, default=None, help="процессов в пуле (по умолчанию — все ядра)")
+    parser.add_argument("--batch", type=int, default=2000, help="партий в одной задаче пула")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="вывести отчёт одной строкой JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> Dict[int, dict]:
+    args = parse_args(argv)
+    player_counts = _parse_players(args.players)
+    started = time.perf_counter()
+    results = simulate(
+        player_counts, args.games, args.strategy, args.seed, args.workers or os.cpu_count(),
+        args.batch, _load_distribution(args.distribution),
+    )
+    elapsed = time.perf_counter() - started
+    report = build_report(results)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        print_table(report)
+        total = sum(r["games"] for r in report.values())
+        print(f"\n{total} партий за {elapsed:.1f} с ({total / elapsed:.0f} партий/с), стратегия: {args.strategy}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
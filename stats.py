@@ -0,0 +1,134 @@
+"""Статистика игроков: сыгранные игры, победы по ролям, выживание.
+
+Когда check_game_over фиксирует итог, PlayerStats.record() снимает с игры
+строку на каждого игрока: роль, победил ли, дожил ли до конца, сколько раундов
+прожил. Строки копятся в памяти и уходят в SQLite вместе с очередным сбросом
+StatePersister — той же транзакцией, что и состояние игр. В базе хранятся
+только накопленные счётчики (игрок × чат × роль), поэтому /stats и таблица
+лидеров читают несколько строк по индексу, сколько бы игр ни было сыграно.
+
+Заполнение базы синтетическими итогами и замер запросов /stats:
+
+    BOT_TOKEN=1:x python stats.py --games 1000000
+
+Без --db база создаётся во временном каталоге и удаляется после замера.
+"""
+import argparse
+import time
+from typing import List
+
+from models import GameState, PlayerRole
+
+# Сколько игроков показывать в таблице лидеров чата
+LEADERBOARD_SIZE = 10
+
+
+class PlayerStats:
+    """Итоги сыгранных игр, ещё не записанные в хранилище, и доступ к накопленной статистике"""
+
+    def __init__(self):
+        # (chat_key, победитель, [(user_id, username, first_name, роль, победа, выжил, раунды), ...])
+        self._pending: List[tuple] = []
+        # Хранилище со статистикой (storage.GameStore); None — статистика не ведётся
+        self.store = None
+
+    def record(self, game: GameState, winner: str) -> None:
+        players = []
+        for p in game.players.values():
+            if p.role is None:
+                continue
+            is_mafia = p.role == PlayerRole.MAFIA
+            won = is_mafia if winner == "mafia" else not is_mafia
+            rounds = p.died_round if not p.is_alive and p.died_round else game.current_round
+            players.append((p.user_id, p.username or "", p.first_name or "", p.role.value, won, p.is_alive, rounds))
+        if players:
+            self._pending.append((game.chat_id, winner, players))
+
+    def drain(self) -> List[tuple]:
+        pending, self._pending = self._pending, []
+        return pending
+
+    def requeue(self, results: List[tuple]) -> None:
+        """Возвращает итоги, которые не удалось записать, в начало очереди"""
+        self._pending[:0] = results
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+
+# Глобальная статистика игроков
+player_stats = PlayerStats()
+
+
+def _bench(args) -> None:
+    import os
+    import shutil
+    import tempfile
+
+    if args.db:
+        if os.path.exists(args.db):
+            os.remove(args.db)
+        _fill_and_query(args, args.db)
+        return
+    tmpdir = tempfile.mkdtemp(prefix="stats_bench_")
+    try:
+        _fill_and_query(args, os.path.join(tmpdir, "stats_bench.db"))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def _fill_and_query(args, path: str) -> None:
+    import random
+
+    from storage import GameStore
+
+    store = GameStore(path)
+    rng = random.Random(args.seed)
+    roles = [r.value for r in PlayerRole]
+    chats = [f"-100{1000000 + i}_39431" for i in range(args.chats)]
+    started = time.perf_counter()
+    batch = []
+    for index in range(args.games):
+        chat_index = rng.randrange(args.chats)
+        base = chat_index * args.players
+        winner = rng.choice(("mafia", "civilians"))
+        players = []
+        for user_id in rng.sample(range(base, base + args.players), rng.randint(4, 20)):
+            role = rng.choice(roles)
+            alive = rng.random() < 0.4
+            won = (role == "мафия") == (winner == "mafia")
+            players.append((user_id, f"u{user_id}", f"U{user_id}", role, won, alive, rng.randint(1, 6)))
+        batch.append((chats[chat_index], winner, players))
+        if len(batch) == 1000:
+            store.append([], (), batch)
+            batch = []
+    if batch:
+        store.append([], (), batch)
+    print(f"записано игр: {args.games} за {time.perf_counter() - started:.1f} с")
+
+    queries = 1000
+    started = time.perf_counter()
+    for _ in range(queries):
+        chat_index = rng.randrange(args.chats)
+        user_id = chat_index * args.players + rng.randrange(args.players)
+        store.player_stats(user_id, chats[chat_index])
+        store.player_stats(user_id)
+        store.chat_games(chats[chat_index])
+        store.leaderboard(chats[chat_index], LEADERBOARD_SIZE)
+    elapsed = (time.perf_counter() - started) / queries
+    print(f"/stats (игрок в чате, по всем чатам, таблица лидеров): {elapsed * 1000:.2f} мс на запрос")
+    store.close()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--games", type=int, default=1000000, help="сколько синтетических игр записать")
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--players", type=int, default=300, help="игроков в каждом чате")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="файл базы (перезаписывается и остаётся); по умолчанию — временный")
+    _bench(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
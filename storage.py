@@ -0,0 +1,412 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+from dataclasses import fields
+from enum import Enum
+from typing import Callable, Dict, List, Optional, Tuple
+
+from models import GameState, Player, PlayerRole, GamePhase, LAZY_CONTAINER_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Версия формата записи игры в журнале/снапшоте
+RECORD_VERSION = 1
+
+# Типы контейнеров GameState — по ним восстанавливаем dict/set/list из JSON
+_CONTAINER_FIELDS = LAZY_CONTAINER_FIELDS
+# Служебные поля (с подчёркиванием) не сохраняем
+_PLAYER_FIELDS = tuple(f.name for f in fields(Player) if not f.name.startswith("_"))
+
+
+def _encode_value(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, dict):
+        # У JSON ключи только строковые, поэтому словари с int-ключами храним парами
+        return [[k, _encode_value(v)] for k, v in value.items()]
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, (list, tuple)):
+        return [_encode_value(v) for v in value]
+    return value
+
+
+def _decode_container(factory, value):
+    if factory is dict:
+        return {k: v for k, v in value}
+    if factory is set:
+        return set(value)
+    # Списки кортежей (last_commissioner_checks) приходят из JSON списками
+    return [tuple(v) if isinstance(v, list) else v for v in value]
+
+
+def player_to_dict(player: Player) -> dict:
+    return {name: _encode_value(getattr(player, name)) for name in _PLAYER_FIELDS}
+
+
+def player_from_dict(data: dict) -> Player:
+    data = dict(data)
+    if data.get("role") is not None:
+        data["role"] = PlayerRole(data["role"])
+    return Player(**data)
+
+
+def game_to_dict(game: GameState) -> dict:
+    data = {"v": RECORD_VERSION}
+    for f in fields(GameState):
+        if f.name in _CONTAINER_FIELDS and not game.is_allocated(f.name):
+            # Контейнер ещё не создавался — он пуст, в записи не нужен
+            continue
+        value = getattr(game, f.name)
+        if f.name == "players":
+            data["players"] = [player_to_dict(p) for p in value.values()]
+        else:
+            data[f.name] = _encode_value(value)
+    return data
+
+
+def game_from_dict(data: dict) -> GameState:
+    data = dict(data)
+    version = data.pop("v", None)
+    if version != RECORD_VERSION:
+        raise ValueError(f"неизвестная версия записи игры: {version}")
+    players = [player_from_dict(p) for p in data.pop("players", [])]
+    kwargs = {}
+    for f in fields(GameState):
+        if f.name not in data:
+            continue
+        value = data[f.name]
+        if f.name == "phase":
+            value = GamePhase(value)
+        elif f.name in _CONTAINER_FIELDS:
+            value = _decode_container(_CONTAINER_FIELDS[f.name], value)
+        kwargs[f.name] = value
+    game = GameState(**kwargs)
+    for player in players:
+        game.players[player.user_id] = player
+    return game
+
+
+def game_to_record(game: GameState) -> str:
+    return json.dumps(game_to_dict(game), ensure_ascii=False, separators=(",", ":"))
+
+
+def game_from_record(record: str) -> GameState:
+    return game_from_dict(json.loads(record))
+
+
+class GameStore:
+    """Хранилище состояния игр в SQLite.
+
+    journal — append-only журнал: на каждый сброс пишется актуальное состояние
+    изменённой игры (payload) или NULL, если игра удалена.
+    snapshot — компактный снимок: последняя запись по каждой игре.
+    compact() сворачивает журнал в снимок, load() = снимок + хвост журнала.
+    game_events — куски журналов событий игр (gamelog), в снимок не сворачиваются.
+    player_stats, player_totals, chat_games — накопленная статистика игроков (stats):
+    на каждую сыгранную игру счётчики увеличиваются на месте, поэтому размер таблиц
+    зависит от числа игроков, а не игр. Чтение статистики идёт через отдельное
+    соединение и не ждёт записи в потоке; вызывать его стоит тоже из потока —
+    при занятой базе sqlite ждёт блокировку до timeout.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Запись идёт из asyncio.to_thread, но всегда последовательно; в шардированном
+        # режиме файл общий для воркеров — ждём чужую транзакцию, а не падаем
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS journal ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, chat_key TEXT NOT NULL, payload TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshot (chat_key TEXT PRIMARY KEY, payload TEXT NOT NULL)"
+        )
+        # Передача при плавной остановке: сколько секунд оставалось таймеру фазы игры
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS handoff (chat_key TEXT PRIMARY KEY, remaining REAL NOT NULL)"
+        )
+        # Журналы событий игр: игра — chat_key и зерно жребия, куски склеиваются по seq
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS game_events ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, chat_key TEXT NOT NULL, "
+            "game_seed INTEGER NOT NULL, data BLOB NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS game_events_game ON game_events (chat_key, game_seed, seq)"
+        )
+        # Статистика по ролям: игрок в чате (chat_key) за каждую роль
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS player_stats ("
+            "chat_key TEXT NOT NULL, user_id INTEGER NOT NULL, role TEXT NOT NULL, "
+            "games INTEGER NOT NULL, wins INTEGER NOT NULL, survived INTEGER NOT NULL, rounds INTEGER NOT NULL, "
+            "PRIMARY KEY (chat_key, user_id, role)) WITHOUT ROWID"
+        )
+        # Итоги игрока в чате по всем ролям — по ним строится таблица лидеров
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS player_totals ("
+            "chat_key TEXT NOT NULL, user_id INTEGER NOT NULL, username TEXT NOT NULL, first_name TEXT NOT NULL, "
+            "games INTEGER NOT NULL, wins INTEGER NOT NULL, survived INTEGER NOT NULL, rounds INTEGER NOT NULL, "
+            "PRIMARY KEY (chat_key, user_id)) WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS player_totals_top ON player_totals (chat_key, wins DESC, games)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS player_totals_user ON player_totals (user_id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_games ("
+            "chat_key TEXT PRIMARY KEY, games INTEGER NOT NULL, mafia_wins INTEGER NOT NULL) WITHOUT ROWID"
+        )
+        # Соединение для чтения статистики (из asyncio.to_thread): в WAL читатель не ждёт
+        # писателя. Запросы /stats могут идти параллельно — соединение берём по очереди
+        self._reader = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._reader_lock = threading.Lock()
+        logger.info("storage: открыто хранилище состояния %s", path)
+
+    def load(self, owns: Optional[Callable[[str], bool]] = None) -> Dict[str, GameState]:
+        """Восстанавливает активные игры: снимок плюс записи журнала поверх него.
+
+        owns — фильтр по chat_key: воркер шарда поднимает только свои игры.
+        """
+        records: Dict[str, str] = dict(self._conn.execute("SELECT chat_key, payload FROM snapshot"))
+        replayed = 0
+        for chat_key, payload in self._conn.execute("SELECT chat_key, payload FROM journal ORDER BY seq"):
+            replayed += 1
+            if payload is None:
+                records.pop(chat_key, None)
+            else:
+                records[chat_key] = payload
+
+        games: Dict[str, GameState] = {}
+        for chat_key, payload in records.items():
+            if owns is not None and not owns(chat_key):
+                continue
+            try:
+                game = game_from_record(payload)
+            except Exception as e:
+                logger.warning("storage: не удалось восстановить игру %s: %s", chat_key, e)
+                continue
+            if game.phase == GamePhase.ENDED:
+                continue
+            games[chat_key] = game
+        logger.info("storage: загружено игр: %s (записей журнала: %s)", len(games), replayed)
+        return games
+
+    def append(
+        self,
+        records: List[Tuple[str, Optional[str]]],
+        events: List[Tuple[str, int, bytes]] = (),
+        results: List[tuple] = (),
+    ) -> None:
+        """Дописывает пачку записей в журнал, куски журналов событий и итоги игр одной транзакцией"""
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT INTO journal (chat_key, payload) VALUES (?, ?)", records)
+            if events:
+                self._conn.executemany(
+                    "INSERT INTO game_events (chat_key, game_seed, data) VALUES (?, ?, ?)", events
+                )
+            if results:
+                self._add_results(results)
+
+    def _add_results(self, results: List[tuple]) -> None:
+        """Прибавляет итоги игр к статистике.
+
+        results — (chat_key, победитель, [(user_id, username, first_name, роль, победа, выжил, раунды), ...])
+        """
+        chats: Dict[Tuple[str, int], int] = {}
+        rows = []
+        for chat_key, winner, players in results:
+            key = (chat_key, 1 if winner == "mafia" else 0)
+            chats[key] = chats.get(key, 0) + 1
+            for user_id, username, first_name, role, won, survived, rounds in players:
+                rows.append((chat_key, user_id, username, first_name, role, int(won), int(survived), rounds))
+        self._conn.executemany(
+            "INSERT INTO chat_games (chat_key, games, mafia_wins) VALUES (?, ?, ?) "
+            "ON CONFLICT (chat_key) DO UPDATE SET "
+            "games = games + excluded.games, mafia_wins = mafia_wins + excluded.mafia_wins",
+            [(chat_key, count, count * mafia) for (chat_key, mafia), count in chats.items()],
+        )
+        self._conn.executemany(
+            "INSERT INTO player_stats (chat_key, user_id, role, games, wins, survived, rounds) "
+            "VALUES (?1, ?2, ?5, 1, ?6, ?7, ?8) "
+            "ON CONFLICT (chat_key, user_id, role) DO UPDATE SET "
+            "games = games + 1, wins = wins + excluded.wins, "
+            "survived = survived + excluded.survived, rounds = rounds + excluded.rounds",
+            rows,
+        )
+        self._conn.executemany(
+            "INSERT INTO player_totals (chat_key, user_id, username, first_name, games, wins, survived, rounds) "
+            "VALUES (?1, ?2, ?3, ?4, 1, ?6, ?7, ?8) "
+            "ON CONFLICT (chat_key, user_id) DO UPDATE SET "
+            "username = excluded.username, first_name = excluded.first_name, "
+            "games = games + 1, wins = wins + excluded.wins, "
+            "survived = survived + excluded.survived, rounds = rounds + excluded.rounds",
+            rows,
+        )
+
+    def player_stats(self, user_id: int, chat_key: Optional[str] = None) -> Dict[str, Tuple[int, int, int, int]]:
+        """Статистика игрока по ролям: роль -> (игр, побед, выжил, раундов); без chat_key — по всем чатам"""
+        with self._reader_lock:
+            if chat_key is None:
+                rows = self._reader.execute(
+                    "SELECT s.role, SUM(s.games), SUM(s.wins), SUM(s.survived), SUM(s.rounds) "
+                    "FROM player_totals t JOIN player_stats s ON s.chat_key = t.chat_key AND s.user_id = t.user_id "
+                    "WHERE t.user_id = ? GROUP BY s.role",
+                    (user_id,),
+                )
+            else:
+                rows = self._reader.execute(
+                    "SELECT role, games, wins, survived, rounds FROM player_stats WHERE chat_key = ? AND user_id = ?",
+                    (chat_key, user_id),
+                )
+            return {role: (games, wins, survived, rounds) for role, games, wins, survived, rounds in rows}
+
+    def leaderboard(self, chat_key: str, limit: int) -> List[Tuple[int, str, str, int, int]]:
+        """Лучшие игроки чата по победам (по индексу): (user_id, username, first_name, игр, побед)"""
+        with self._reader_lock:
+            return self._reader.execute(
+                "SELECT user_id, username, first_name, games, wins FROM player_totals "
+                "WHERE chat_key = ? ORDER BY wins DESC, games LIMIT ?",
+                (chat_key, limit),
+            ).fetchall()
+
+    def chat_games(self, chat_key: str) -> Tuple[int, int]:
+        """Сколько игр сыграно в чате и сколько из них выиграла мафия"""
+        with self._reader_lock:
+            row = self._reader.execute("SELECT games, mafia_wins FROM chat_games WHERE chat_key = ?", (chat_key,)).fetchone()
+        return row or (0, 0)
+
+    def game_log(self, chat_key: str, seed: int) -> bytes:
+        """Журнал событий одной игры целиком (для gamelog.replay)"""
+        rows = self._conn.execute(
+            "SELECT data FROM game_events WHERE chat_key = ? AND game_seed = ? ORDER BY seq", (chat_key, seed)
+        )
+        return b"".join(data for (data,) in rows)
+
+    def compact(self) -> None:
+        """Сворачивает журнал в снимок и очищает журнал"""
+        latest = "SELECT MAX(seq) FROM journal GROUP BY chat_key"
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO snapshot (chat_key, payload) "
+                f"SELECT chat_key, payload FROM journal WHERE seq IN ({latest}) AND payload IS NOT NULL"
+            )
+            self._conn.execute(
+                "DELETE FROM snapshot WHERE chat_key IN "
+                f"(SELECT chat_key FROM journal WHERE seq IN ({latest}) AND payload IS NULL)"
+            )
+            self._conn.execute("DELETE FROM journal")
+
+    def write_handoff(self, remaining: Dict[str, float]) -> None:
+        """Записывает остатки таймеров фаз для следующего запуска"""
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO handoff (chat_key, remaining) VALUES (?, ?)", remaining.items()
+            )
+
+    def take_handoff(self, owns: Optional[Callable[[str], bool]] = None) -> Dict[str, float]:
+        """Забирает (и удаляет) остатки таймеров, записанные при плавной остановке"""
+        with self._conn:
+            self._conn.execute("BEGIN")
+            rows = [
+                (chat_key, remaining)
+                for chat_key, remaining in self._conn.execute("SELECT chat_key, remaining FROM handoff")
+                if owns is None or owns(chat_key)
+            ]
+            self._conn.executemany("DELETE FROM handoff WHERE chat_key = ?", [(k,) for k, _ in rows])
+        return dict(rows)
+
+    def close(self) -> None:
+        self._reader.close()
+        self._conn.close()
+
+
+class StatePersister:
+    """Фоновый сброс изменённых игр из GameManager в GameStore"""
+
+    def __init__(self, store: GameStore, manager, flush_interval: float, snapshot_interval: float):
+        self.store = store
+        self.manager = manager
+        self.flush_interval = flush_interval
+        self.snapshot_interval = snapshot_interval
+        # Обработанные обновления, чьи изменения ещё не на диске, и кому о них сообщить
+        # после записи (воркер шарда подтверждает их фронту только тогда)
+        self._pending_acks: List[object] = []
+        self.on_flushed: Optional[Callable[[List[object]], None]] = None
+
+    def ack_after_flush(self, token) -> None:
+        """Отдаёт token в on_flushed после ближайшего сброса, который запишет текущие изменения"""
+        self._pending_acks.append(token)
+
+    def _acked(self, acks: List[object]) -> None:
+        if acks and self.on_flushed is not None:
+            self.on_flushed(acks)
+
+    async def flush(self) -> int:
+        # Всё, что сделали обработанные до этого момента обновления, сериализуется ниже
+        acks, self._pending_acks = self._pending_acks, []
+        dirty = self.manager.dirty_games
+        log = self.manager.log
+        events = log.drain() if log is not None else []
+        stats = self.manager.stats
+        results = stats.drain() if stats is not None else []
+        if not dirty and not events and not results:
+            self._acked(acks)
+            return 0
+        self.manager.dirty_games = set()
+        # Сериализуем в цикле событий (состояние согласовано), пишем на диск в потоке
+        records = []
+        for chat_key in dirty:
+            game = self.manager.active_games.get(chat_key)
+            records.append((chat_key, game_to_record(game) if game else None))
+        try:
+            await asyncio.to_thread(self.store.append, records, events, results)
+        except Exception:
+            # Не теряем изменения — попробуем записать их при следующем сбросе
+            self.manager.dirty_games |= dirty
+            if events:
+                log.requeue(events)
+            if results:
+                stats.requeue(results)
+            self._pending_acks[:0] = acks
+            raise
+        logger.debug("storage: в журнал записано игр: %s", len(records))
+        self._acked(acks)
+        return len(records)
+
+    async def compact(self) -> None:
+        await asyncio.to_thread(self.store.compact)
+        logger.debug("storage: журнал свёрнут в снимок")
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        last_compact = loop.time()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if loop.time() - last_compact >= self.snapshot_interval:
+                    await self.compact()
+                    last_compact = loop.time()
+            except Exception as e:
+                logger.exception("storage: ошибка сохранения состояния: %s", e)
+
+    async def close(self, handoff: Optional[Dict[str, float]] = None) -> None:
+        """Финальный сброс и снимок перед остановкой бота; handoff — остатки таймеров фаз"""
+        try:
+            await self.flush()
+            await self.compact()
+            if handoff:
+                await asyncio.to_thread(self.store.write_handoff, handoff)
+                logger.info("storage: записаны таймеры фаз для следующего запуска: %s", len(handoff))
+        except Exception as e:
+            logger.exception("storage: ошибка финального сохранения: %s", e)
+        finally:
+            self.store.close()
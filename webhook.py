@@ -0,0 +1,145 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from config import (
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT,
+    WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS, WEBHOOK_MAX_CONNECTIONS, WEBHOOK_KEEPALIVE_SECS,
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Приём обновлений через вебхук на встроенном aiohttp-сервере.
+
+    Хендлер HTTP только проверяет секрет и кладёт Update в ограниченную очередь,
+    отвечая Telegram сразу; обработку ведут WEBHOOK_WORKERS воркеров через
+    dp.feed_update. Если очередь полна — отвечаем 503, и Telegram повторит
+    доставку позже, вместо того чтобы копить обновления в памяти.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        dp: Dispatcher,
+        path: str = WEBHOOK_PATH,
+        secret: str = WEBHOOK_SECRET,
+        host: str = WEBHOOK_HOST,
+        port: int = WEBHOOK_PORT,
+        queue_size: int = WEBHOOK_QUEUE_SIZE,
+        workers: int = WEBHOOK_WORKERS,
+        keepalive_secs: float = WEBHOOK_KEEPALIVE_SECS,
+    ):
+        self.bot = bot
+        self.dp = dp
+        self.path = path
+        self.secret = secret
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self.keepalive_secs = keepalive_secs
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._runner: Optional[web.AppRunner] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self.metrics = {"received": 0, "processed": 0, "rejected_full": 0, "rejected_auth": 0, "failed": 0}
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self._handle_update)
+        app.router.add_get("/healthz", self._handle_health)
+        return app
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.build_app(), keepalive_timeout=self.keepalive_secs, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info("webhook: сервер слушает %s:%s%s, воркеров: %s", self.host, self.port, self.path, self.workers)
+
+    async def stop(self, drain_timeout: float = 10) -> None:
+        """Перестаёт принимать запросы и дообрабатывает то, что уже в очереди"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("webhook: не успели обработать %s обновлений при остановке", self._queue.qsize())
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        logger.info("webhook: сервер остановлен, метрики: %s", self.metrics)
+
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        if self.secret and request.headers.get(SECRET_HEADER) != self.secret:
+            self.metrics["rejected_auth"] += 1
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning("webhook: некорректное обновление: %s", e)
+            return web.Response(status=400)
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.metrics["rejected_full"] += 1
+            logger.warning("webhook: очередь обновлений заполнена, просим Telegram повторить позже")
+            return web.Response(status=503)
+        self.metrics["received"] += 1
+        return web.Response(status=200)
+
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({"ok": True, "queue": self._queue.qsize()})
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+                self.metrics["processed"] += 1
+            except Exception as e:
+                self.metrics["failed"] += 1
+                logger.exception("webhook: ошибка обработки обновления %s: %s", update.update_id, e)
+            finally:
+                self._queue.task_done()
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """Регистрирует вебхук у Telegram и обслуживает его до отмены задачи"""
+    if not WEBHOOK_URL:
+        raise ValueError("Для BOT_MODE=webhook нужен WEBHOOK_URL (публичный адрес бота)")
+    server = WebhookServer(bot, dp)
+    await server.start()
+    try:
+        # Не сбрасываем накопившиеся обновления: при переключении с polling ничего не теряем
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=False,
+        )
+        logger.info("webhook: вебхук зарегистрирован на %s%s", WEBHOOK_URL.rstrip('/'), WEBHOOK_PATH)
+        # Сигналы обрабатывает main: он сначала плавно останавливает игры, потом отменяет эту задачу
+        await asyncio.Event().wait()
+    finally:
+        # Вебхук не удаляем: пока бот перезапускается, Telegram копит обновления у себя
+        await server.stop()
+
+
+async def run_polling(bot: Bot, dp: Dispatcher) -> None:
+    """Long polling; если раньше работал вебхук — снимаем его, не теряя обновлений"""
+    info = await bot.get_webhook_info()
+    if info.url:
+        logger.info("polling: снимаем вебхук %s", info.url)
+        await bot.delete_webhook(drop_pending_updates=False)
+    # Сигналы обрабатывает main (плавная остановка игр), aiogram их не перехватывает
+    await dp.start_polling(bot, handle_signals=False)